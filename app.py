@@ -7,9 +7,12 @@ import json
 import boto3
 from pathlib import Path
 from config import bot_configs
-from ui_utils import invoke_agent
+from ui_utils import invoke_agent, render_working_memory_panel
 from utils.bedrock_agent import agents_helper
+from utils.logging_utils import get_logger
+from utils.session_store import SessionMemory, SpillStore
 
+logger = get_logger("app")
 
 boto3.setup_default_session()
 
@@ -18,11 +21,28 @@ os.environ['AWS_ACCESS_KEY_ID'] = ""
 os.environ['AWS_SECRET_ACCESS_KEY'] = ""
 os.environ['AWS_SESSION_TOKEN']=""
 
+# Messages / conversations rendered per page; older ones are loaded on demand
+MESSAGE_PAGE_SIZE = 20
+CONVERSATION_PAGE_SIZE = 5
+
+@st.cache_resource
+def get_spill_store():
+    """Spill file shared by every session of this server process."""
+    return SpillStore()
+
+def show_earlier(window_key, page_size):
+    """Widens a history window by one page."""
+    st.session_state[window_key] += page_size
+
 def initialize_session():
     """Initialize session state and bot configuration."""
     if 'count' not in st.session_state:
         st.session_state['count'] = 1
-        st.session_state['conversations'] = []  # List of conversation groups
+        # Bounded history: the oldest records are spilled to disk when over budget or idle
+        st.session_state['session_memory'] = SessionMemory(str(uuid.uuid4()), get_spill_store())
+        st.session_state['conversations'] = st.session_state['session_memory'].log('conversations')  # List of conversation groups
+        st.session_state['message_window'] = MESSAGE_PAGE_SIZE
+        st.session_state['conversation_window'] = CONVERSATION_PAGE_SIZE
         st.session_state['current_conversation'] = None
 
         # Refresh agent IDs and aliases
@@ -33,7 +53,7 @@ def initialize_session():
                 bot_configs[idx]['agent_id'] = agent_id
                 bot_configs[idx]['agent_alias_id'] = agent_alias_id
             except Exception as e:
-                print(f"Could not find agent named:{config['agent_name']}, skipping...")
+                logger.warning("Could not find agent named:%s, skipping...", config['agent_name'])
                 continue
 
         # Get bot configuration
@@ -57,12 +77,50 @@ def initialize_session():
             
             # Initialize messages if not exists
             if 'messages' not in st.session_state:
-                st.session_state.messages = []
+                st.session_state.messages = st.session_state['session_memory'].log('messages')
+
+
+def respond(user_query, turn_id=None):
+    """Stream the assistant answer of a turn into the chat and record it in the chat history."""
+    response = ""
+    with st.chat_message("assistant"):
+        try:
+            session_id = st.session_state['session_id']
+            # Handle streaming response from invoke_agent
+            table_name = st.session_state.get('current_table_name')
+            
+            response_chunks = []
+            for chunk_text, chunk_table_name, token_info in invoke_agent(
+                user_query, 
+                session_id, 
+                st.session_state['task_yaml_content'],
+                turn_id=turn_id
+            ):
+                st.write(chunk_text)
+                response_chunks.append(chunk_text)
+                if chunk_table_name:
+                    table_name = chunk_table_name
+            
+            response = "".join(response_chunks)
+            
+            # Store table name in session state for persistence
+            if table_name:
+                st.session_state['current_table_name'] = table_name
+                            
+        except Exception as e:
+            logger.exception("Error: %s", e)
+            st.error(f"An error occurred: {str(e)}")  # Show error in UI
+            response = "I encountered an error processing your request. Please try again."
+
+    # Update chat history; the turn is finished once its answer is recorded
+    st.session_state.messages.append({"role": "assistant", "content": response})
+    st.session_state.pop('active_turn', None)
 
 
 def main():
     """Main application flow."""
     initialize_session()
+    st.session_state['session_memory'].touch()
 
     # Display chat interface in main area
     st.title(f"🚀 {st.session_state['bot_config']['bot_name']}")
@@ -71,7 +129,8 @@ def main():
     # Display status panel in sidebar
     with st.sidebar:
         st.title("Status & Results")
-        for conv_idx, conv in enumerate(reversed(st.session_state.get('conversations', [])), 1):
+        conversations = st.session_state['conversations']
+        for conv_idx, conv in enumerate(reversed(conversations.tail(st.session_state['conversation_window'])), 1):
             with st.expander(f"{conv['question']}", expanded=True):
                 for agent in conv['agents']:
                     container1 = st.container(border=True)
@@ -87,12 +146,28 @@ def main():
                     container.write(f"Input Tokens: **{conv['tokens']['input']}**")
                     container.write(f"Output Tokens: **{conv['tokens']['output']}**")
                     container.write(f"LLM Calls: **{conv['tokens']['llm_calls']}**")
+        if len(conversations) > st.session_state['conversation_window']:
+            st.button("Show earlier questions", on_click=show_earlier,
+                      args=('conversation_window', CONVERSATION_PAGE_SIZE))
+
+        # Working memory written by the collaborators, refreshed live while the agent runs
+        st.session_state['working_memory_placeholder'] = st.empty()
+        render_working_memory_panel()
         
-    # Display existing messages
-    for message in st.session_state.messages:
+    # Display existing messages, reading earlier pages back from disk on demand
+    messages = st.session_state.messages
+    if len(messages) > st.session_state['message_window']:
+        st.button(f"Show earlier messages ({len(messages) - st.session_state['message_window']})",
+                  on_click=show_earlier, args=('message_window', MESSAGE_PAGE_SIZE))
+    for message in messages.tail(st.session_state['message_window']):
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
 
+    # A rerun interrupted the previous answer while its worker kept running: replay it
+    if st.session_state.get('active_turn'):
+        respond(st.session_state['current_conversation']['question'],
+                turn_id=st.session_state['active_turn'])
+
     # Handle user input
     if 'user_input' not in st.session_state:
         next_prompt = st.session_state['bot_config']['start_prompt']
@@ -117,43 +192,14 @@ def main():
             st.session_state['conversations'].append(current_conv)
 
             # Get and display assistant response
-            response = ""
-            with st.chat_message("assistant"):
-                try:
-                    session_id = st.session_state['session_id']
-                    # Handle streaming response from invoke_agent
-                    table_name = st.session_state.get('current_table_name')
-                    
-                    response_chunks = []
-                    for chunk_text, chunk_table_name, token_info in invoke_agent(
-                        user_query, 
-                        session_id, 
-                        st.session_state['task_yaml_content']
-                    ):
-                        st.write(chunk_text)
-                        response_chunks.append(chunk_text)
-                        if chunk_table_name:
-                            table_name = chunk_table_name
-                    
-                    response = "".join(response_chunks)
-                    
-                    # Store table name in session state for persistence
-                    if table_name:
-                        st.session_state['current_table_name'] = table_name
-                                    
-                except Exception as e:
-                    print(f"Error: {e}")  # Keep logging for debugging
-                    st.error(f"An error occurred: {str(e)}")  # Show error in UI
-                    response = "I encountered an error processing your request. Please try again."
-
-            # Update chat history
-            st.session_state.messages.append({"role": "assistant", "content": response})
+            respond(user_query)
 
         # Reset input
         user_query = st.chat_input(placeholder=" ", key="user_input")
 
     # Update session count
     st.session_state['count'] = st.session_state.get('count', 1) + 1
+    st.session_state['session_memory'].enforce_budget()
 
 if __name__ == "__main__":
     main()
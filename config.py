@@ -7,7 +7,10 @@ bot_configs = [
         "agent_name": "agent-quick-start-2025",
         "agent_id": "ADSSKE7HGL",
         "agent_alias_id": "CUTZ6N2T2A",
-        "start_prompt": "에너지 소비, 예측, 피크 사용량, 운영에 대해 문의하세요"
+        "start_prompt": "에너지 소비, 예측, 피크 사용량, 운영에 대해 문의하세요",
+        "response_cache": {
+            "ttl_seconds": 900
+        }
     },
     {
         "bot_name": "Marketing Advisor",
@@ -0,0 +1,202 @@
+"""
+Offline evaluation of a local router (utils/learned_router.py) against logged routing decisions.
+
+Trains a LearnedRouter on the older part of a routing decision log and replays the rest: every
+held-out request is routed locally and compared with what the routing classifier LLM chose. For
+each confidence threshold the report shows how many requests would bypass the supervisor, how
+often the bypass agrees with the LLM, and the routing latency and tokens saved, net of the local
+router's own time, which it spends on every request.
+
+    python eval_router.py --log .cache/routing_decisions.jsonl
+    python eval_router.py --log decisions.jsonl --supervisor ADSSKE7HGL --save .cache/router.npz --output eval.json
+
+Decisions are logged by AgentsForAmazonBedrock.invoke(routing_log=...), by SupervisorAgent.invoke and
+by the Streamlit app when AGENT_ROUTING_LOG is set. "keep_previous_agent" decisions depend on the
+conversation rather than the request and, like decisions logged without a text or classification,
+are left out of training and evaluation.
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from typing import Dict, List
+
+from utils.bedrock_agent_helper import UNDECIDABLE_CLASSIFICATION
+from utils.learned_router import (
+    DEFAULT_ROUTING_LOG_PATH,
+    LearnedRouter,
+    RoutingLog,
+    routable_examples,
+)
+
+DEFAULT_THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95)
+DEFAULT_HOLDOUT = 0.2
+
+
+def split_examples(
+    examples: List[Dict], holdout: float, shuffle: bool = False, seed: int = None
+):
+    """Splits examples into (train, test); by default the newest decisions are held out."""
+    _examples = list(examples)
+    if shuffle:
+        random.Random(seed).shuffle(_examples)
+    _cut = max(int(len(_examples) * (1 - holdout)), 1)
+    return _examples[:_cut], _examples[_cut:]
+
+
+def evaluate(router: LearnedRouter, test: List[Dict], thresholds: List[float]) -> Dict:
+    """Replays held-out decisions through a router.
+
+    Returns:
+        Dict: accuracy, per-label accuracy, the local routing time per request, and one entry per
+        threshold with bypass counts, agreement and savings
+    """
+    _predictions = []
+    _started = time.perf_counter()
+    for _example in test:
+        _predictions.append(router.predict(_example["input_text"]))
+    _router_seconds = (time.perf_counter() - _started) / max(len(test), 1)
+
+    _by_label = {}
+    for _example, (_label, _) in zip(test, _predictions):
+        _stats = _by_label.setdefault(
+            _example["classification"], {"requests": 0, "correct": 0}
+        )
+        _stats["requests"] += 1
+        _stats["correct"] += _label == _example["classification"]
+
+    _routing_seconds = sum(_e.get("duration_seconds") or 0 for _e in test)
+    _report = {
+        "requests": len(test),
+        "accuracy": sum(_s["correct"] for _s in _by_label.values()) / max(len(test), 1),
+        "labels": {
+            _label: dict(_stats, accuracy=_stats["correct"] / _stats["requests"])
+            for _label, _stats in sorted(_by_label.items())
+        },
+        "llm_routing_seconds_mean": _routing_seconds / max(len(test), 1),
+        "local_routing_seconds_mean": _router_seconds,
+        "thresholds": [],
+    }
+    for _threshold in thresholds:
+        _bypassed = [
+            (_example, _label)
+            for _example, (_label, _confidence) in zip(test, _predictions)
+            if _confidence >= _threshold and _label != UNDECIDABLE_CLASSIFICATION
+        ]
+        _agreed = sum(
+            _label == _example["classification"] for _example, _label in _bypassed
+        )
+        _saved = sum(_example.get("duration_seconds") or 0 for _example, _ in _bypassed)
+        _report["thresholds"].append(
+            {
+                "threshold": _threshold,
+                "bypassed": len(_bypassed),
+                "bypass_rate": len(_bypassed) / max(len(test), 1),
+                "bypass_agreement": _agreed / len(_bypassed) if _bypassed else None,
+                "misroutes": len(_bypassed) - _agreed,
+                "llm_calls_saved": len(_bypassed),
+                "seconds_saved": _saved - _router_seconds * len(test),
+                "seconds_saved_per_request": (_saved - _router_seconds * len(test))
+                / max(len(test), 1),
+                "tokens_saved": sum(
+                    (_example.get("input_tokens") or 0)
+                    + (_example.get("output_tokens") or 0)
+                    for _example, _ in _bypassed
+                ),
+            }
+        )
+    return _report
+
+
+def print_report(report: Dict, train_size: int, skipped: int) -> None:
+    print(
+        f"Trained on {train_size} decisions, evaluated on {report['requests']}"
+        f" ({skipped} non-routable or incomplete decisions left out)"
+    )
+    print(f"  accuracy vs. the routing classifier: {report['accuracy']:.1%}")
+    for _label, _stats in report["labels"].items():
+        print(f"    {_label:<30} {_stats['accuracy']:7.1%} of {_stats['requests']}")
+    print(
+        f"  routing classifier: {report['llm_routing_seconds_mean']:.2f}s per request,"
+        f" local router: {report['local_routing_seconds_mean'] * 1000:.2f}ms"
+    )
+    print(
+        f"  {'threshold':>9} {'bypassed':>9} {'agree':>7} {'misroutes':>9} {'saved':>9} {'per req':>8} {'tokens':>8}"
+    )
+    for _row in report["thresholds"]:
+        _agreement = (
+            "-"
+            if _row["bypass_agreement"] is None
+            else f"{_row['bypass_agreement']:.1%}"
+        )
+        print(
+            f"  {_row['threshold']:>9.2f} {_row['bypass_rate']:>9.1%} {_agreement:>7}"
+            f" {_row['misroutes']:>9} {_row['seconds_saved']:>8.1f}s"
+            f" {_row['seconds_saved_per_request']:>7.2f}s {_row['tokens_saved']:>8,}"
+        )
+
+
+def main(argv: List[str] = None) -> None:
+    _parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    _parser.add_argument(
+        "--log",
+        default=os.environ.get("AGENT_ROUTING_LOG", DEFAULT_ROUTING_LOG_PATH),
+        help="Routing decision log (JSONL)",
+    )
+    _parser.add_argument(
+        "--supervisor", help="Only use the decisions of this supervisor agent id"
+    )
+    _parser.add_argument(
+        "--holdout", type=float, default=DEFAULT_HOLDOUT, help="Fraction evaluated"
+    )
+    _parser.add_argument(
+        "--shuffle",
+        action="store_true",
+        help="Hold out a random sample instead of the newest",
+    )
+    _parser.add_argument("--seed", type=int)
+    _parser.add_argument(
+        "--thresholds",
+        default=",".join(str(_t) for _t in DEFAULT_THRESHOLDS),
+        help="Comma-separated confidence thresholds",
+    )
+    _parser.add_argument(
+        "--save",
+        help="Retrain on every decision and write the router to this .npz file",
+    )
+    _parser.add_argument("--output", help="Write the report as JSON")
+    _args = _parser.parse_args(argv)
+
+    _records = list(RoutingLog(_args.log).read(_args.supervisor))
+    _examples = routable_examples(_records)
+    if len(_examples) < 2:
+        _parser.error(
+            f"{_args.log} has {len(_examples)} usable routing decisions, at least 2 are needed"
+        )
+    _train, _test = split_examples(_examples, _args.holdout, _args.shuffle, _args.seed)
+    if not _test:
+        _parser.error("nothing held out, raise --holdout")
+
+    _router = LearnedRouter.train(
+        [_e["input_text"] for _e in _train], [_e["classification"] for _e in _train]
+    )
+    _thresholds = [float(_t) for _t in _args.thresholds.split(",")]
+    _report = evaluate(_router, _test, _thresholds)
+    print_report(_report, len(_train), len(_records) - len(_examples))
+
+    if _args.save:
+        LearnedRouter.train(
+            [_e["input_text"] for _e in _examples],
+            [_e["classification"] for _e in _examples],
+        ).save(_args.save)
+        print(f"Wrote {_args.save}")
+    if _args.output:
+        with open(_args.output, "w", encoding="utf-8") as _file:
+            json.dump(dict(_report, train_size=len(_train)), _file, indent=2)
+        print(f"Wrote {_args.output}")
+
+
+if __name__ == "__main__":
+    main()
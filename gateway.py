@@ -0,0 +1,371 @@
+"""
+Server-sent events gateway for the agents of config.bot_configs, for clients other than the Streamlit app.
+
+    POST /v1/turns  {"bot_name": "...", "session_id": "...", "text": "..."}
+
+streams one turn as text/event-stream. The events are "chunk" ({"text"}), "trace" (one reducer
+entry, see utils/trace_reducer.py), "tokens" ({"input", "output", "llm_calls"}) when the totals
+change, and finally "done" ({"answer", "tokens", "agents", "elapsed_seconds"}) or "error"
+({"message"}). Comment lines are sent while the agent is quiet so that proxies keep the connection
+open, and a client that disconnects cancels its turn. GET /healthz reports the turns in flight.
+
+    python gateway.py --port 8080 [--endpoint-url http://localhost:4010]
+
+--endpoint-url points both Bedrock clients at a local fake service, and --local serves them
+in-process from utils/local_bedrock_agents.py (optionally with agents loaded from a YAML file).
+Task-based bots receive the text as-is, since the task prompt is assembled by the Streamlit app.
+"""
+
+import argparse
+import dataclasses
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+import boto3
+from botocore.config import Config
+
+from config import bot_configs
+from utils.bedrock_agent_helper import (
+    list_agent_alias_summaries,
+    list_agent_ids_by_name,
+)
+from utils.local_bedrock_agents import install_from_env
+from utils.logging_utils import get_logger
+from utils.trace_reducer import AnswerChunk, TurnState, reduce_event
+
+logger = get_logger("gateway")
+
+DEFAULT_PORT = 8080
+DEFAULT_KEEPALIVE_SECONDS = 15
+DEFAULT_MAX_CONCURRENT_TURNS = 64
+MAX_REQUEST_BYTES = 64 * 1024
+
+_END = object()
+
+
+def _sse(event: str, data: Dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n".encode(
+        "utf-8"
+    )
+
+
+def _entry_event(entry) -> Dict:
+    return dict(dataclasses.asdict(entry), type=type(entry).__name__)
+
+
+class AgentGateway:
+    """Resolves bots and runs their turns against bedrock-agent-runtime."""
+
+    def __init__(
+        self,
+        runtime_client=None,
+        agent_client=None,
+        bots: List[Dict] = None,
+        endpoint_url: str = None,
+        max_concurrent_turns: int = DEFAULT_MAX_CONCURRENT_TURNS,
+        keepalive_seconds: float = DEFAULT_KEEPALIVE_SECONDS,
+    ):
+        """Constructs an instance.
+
+        Args:
+            runtime_client (optional): bedrock-agent-runtime client. Defaults to a new client on endpoint_url.
+            agent_client (optional): bedrock-agent client, used to resolve agent names. Defaults to a new
+            client on endpoint_url.
+            bots (List[Dict], optional): Bot configurations. Defaults to config.bot_configs.
+            endpoint_url (str, optional): Endpoint of the default clients, e.g. a local fake service.
+            max_concurrent_turns (int, optional): Turns streamed at once; further requests get a 503.
+            Defaults to DEFAULT_MAX_CONCURRENT_TURNS.
+            keepalive_seconds (float, optional): Quiet time after which a keep-alive comment is sent.
+            Defaults to DEFAULT_KEEPALIVE_SECONDS.
+        """
+        if runtime_client is None:
+            runtime_client = boto3.client(
+                "bedrock-agent-runtime",
+                endpoint_url=endpoint_url,
+                config=Config(
+                    read_timeout=600, max_pool_connections=max_concurrent_turns
+                ),
+            )
+        if agent_client is None:
+            agent_client = boto3.client("bedrock-agent", endpoint_url=endpoint_url)
+        self._runtime_client = runtime_client
+        self._agent_client = agent_client
+        self._bots = {_bot["bot_name"]: _bot for _bot in (bots or bot_configs)}
+        self._slots = threading.BoundedSemaphore(max_concurrent_turns)
+        self.keepalive_seconds = keepalive_seconds
+        self._agent_names = {}
+        self._lock = threading.Lock()
+        self.turns_in_flight = 0
+
+    def resolve_bot(self, bot_name: str) -> Dict:
+        """Returns the bot configuration with agent_id and agent_alias_id filled in.
+
+        Raises:
+            KeyError: No bot has this name, or its agent does not exist or has no alias
+        """
+        if bot_name not in self._bots:
+            raise KeyError(f"Unknown bot {bot_name}")
+        _bot = self._bots[bot_name]
+        if not _bot.get("agent_id") or not _bot.get("agent_alias_id"):
+            with self._lock:
+                _agent_id = list_agent_ids_by_name(self._agent_client).get(
+                    _bot["agent_name"]
+                )
+                if _agent_id is None:
+                    raise KeyError(
+                        f"Agent {_bot['agent_name']} of bot {bot_name} not found"
+                    )
+                _aliases = list_agent_alias_summaries(self._agent_client, _agent_id)
+                if not _aliases:
+                    raise KeyError(
+                        f"Agent {_bot['agent_name']} of bot {bot_name} has no alias"
+                    )
+                _latest = max(_aliases, key=lambda _a: _a["createdAt"])
+                _bot = dict(
+                    _bot, agent_id=_agent_id, agent_alias_id=_latest["agentAliasId"]
+                )
+                self._bots[bot_name] = _bot
+        return _bot
+
+    def agent_name(self, agent_id: str) -> str:
+        if agent_id not in self._agent_names:
+            self._agent_names[agent_id] = self._agent_client.get_agent(
+                agentId=agent_id
+            )["agent"]["agentName"]
+        return self._agent_names[agent_id]
+
+    def try_acquire(self) -> bool:
+        if not self._slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            self.turns_in_flight += 1
+        return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.turns_in_flight -= 1
+        self._slots.release()
+
+    def start_turn(self, bot: Dict, session_id: str, text: str):
+        """Invokes the agent of a bot and returns its completion event stream."""
+        _kwargs = {
+            "agentId": bot["agent_id"],
+            "agentAliasId": bot["agent_alias_id"],
+            "sessionId": session_id,
+            "inputText": text,
+            "enableTrace": True,
+        }
+        if "session_attributes" in bot:
+            _kwargs["sessionState"] = bot["session_attributes"]
+        return self._runtime_client.invoke_agent(**_kwargs)["completion"]
+
+
+def _pump(completion, events: queue.Queue, cancelled: threading.Event) -> None:
+    """Moves completion events to the queue until the stream ends or the turn is cancelled."""
+    try:
+        for _event in completion:
+            if cancelled.is_set():
+                break
+            events.put(_event)
+    except Exception as e:
+        if not cancelled.is_set():
+            events.put(e)
+    finally:
+        events.put(_END)
+
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    server_version = "AgentGateway/1.0"
+    gateway: AgentGateway = None
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _send_json(self, status: int, body: Dict) -> None:
+        _payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(_payload)))
+        self.end_headers()
+        self.wfile.write(_payload)
+
+    def do_GET(self):
+        if self.path != "/healthz":
+            self._send_json(404, {"message": "Not found"})
+            return
+        self._send_json(
+            200, {"status": "ok", "turns_in_flight": self.gateway.turns_in_flight}
+        )
+
+    def do_POST(self):
+        if self.path != "/v1/turns":
+            self._send_json(404, {"message": "Not found"})
+            return
+        _length = int(self.headers.get("Content-Length", 0))
+        if _length > MAX_REQUEST_BYTES:
+            self._send_json(413, {"message": "Request too large"})
+            return
+        try:
+            _request = json.loads(self.rfile.read(_length) or b"{}")
+            _text = _request["text"]
+            _bot_name = _request["bot_name"]
+        except (ValueError, KeyError) as e:
+            self._send_json(400, {"message": f"Bad request: {e}"})
+            return
+        try:
+            _bot = self.gateway.resolve_bot(_bot_name)
+        except KeyError as e:
+            self._send_json(404, {"message": e.args[0]})
+            return
+        _session_id = _request.get("session_id") or str(uuid.uuid4())
+
+        if not self.gateway.try_acquire():
+            self._send_json(503, {"message": "Too many turns in flight, retry later"})
+            return
+        try:
+            self._stream_turn(_bot, _session_id, _text)
+        finally:
+            self.gateway.release()
+
+    def _stream_turn(self, bot: Dict, session_id: str, text: str) -> None:
+        _started = time.monotonic()
+        try:
+            _completion = self.gateway.start_turn(bot, session_id, text)
+        except Exception as e:
+            logger.error("Error invoking agent of %s: %s", bot["bot_name"], e)
+            self._send_json(502, {"message": f"{type(e).__name__}: {e}"})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.send_header("X-Session-Id", session_id)
+        self.end_headers()
+        self.close_connection = True
+
+        _events = queue.Queue()
+        _cancelled = threading.Event()
+        threading.Thread(
+            target=_pump, args=(_completion, _events, _cancelled), daemon=True
+        ).start()
+        state = TurnState()
+        try:
+            while True:
+                try:
+                    _event = _events.get(timeout=self.gateway.keepalive_seconds)
+                except queue.Empty:
+                    self.wfile.write(b": keep-alive\n\n")
+                    self.wfile.flush()
+                    continue
+                if _event is _END:
+                    break
+                if isinstance(_event, Exception):
+                    self.wfile.write(
+                        _sse("error", {"message": f"{type(_event).__name__}: {_event}"})
+                    )
+                    return
+
+                _agent_name = None
+                if "trace" in _event and "agentId" in _event["trace"]:
+                    _agent_name = self.gateway.agent_name(_event["trace"]["agentId"])
+                previous = state
+                state = reduce_event(state, _event, agent_name=_agent_name)
+                _out = []
+                for _entry in state.entries[len(previous.entries) :]:
+                    if isinstance(_entry, AnswerChunk):
+                        _out.append(_sse("chunk", {"text": _entry.text}))
+                    else:
+                        _out.append(_sse("trace", _entry_event(_entry)))
+                if state.tokens != previous.tokens:
+                    _out.append(_sse("tokens", state.tokens))
+                if _out:
+                    self.wfile.write(b"".join(_out))
+                    self.wfile.flush()
+
+            self.wfile.write(
+                _sse(
+                    "done",
+                    {
+                        "answer": state.answer,
+                        "tokens": state.tokens,
+                        "agents": [dataclasses.asdict(_a) for _a in state.agents],
+                        "elapsed_seconds": time.monotonic() - _started,
+                    },
+                )
+            )
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            logger.info(
+                "Client of session %s disconnected, cancelling the turn", session_id
+            )
+        except Exception as e:
+            # the 200 is already sent, so the failure is reported in the stream, which then ends
+            logger.error("Error streaming the turn of session %s: %s", session_id, e)
+            try:
+                self.wfile.write(_sse("error", {"message": f"{type(e).__name__}: {e}"}))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+        finally:
+            _cancelled.set()
+            # closing the event stream stops the pump thread and releases the HTTP connection
+            if hasattr(_completion, "close"):
+                _completion.close()
+
+
+def make_server(
+    gateway: AgentGateway, host: str = "127.0.0.1", port: int = DEFAULT_PORT
+) -> ThreadingHTTPServer:
+    """Builds the HTTP server of a gateway; each connection is served on its own thread."""
+    _handler = type("BoundGatewayHandler", (GatewayHandler,), {"gateway": gateway})
+    _server = ThreadingHTTPServer((host, port), _handler)
+    _server.daemon_threads = True
+    _server.request_queue_size = 128
+    return _server
+
+
+def main(argv: List[str] = None) -> None:
+    _parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    _parser.add_argument("--host", default="127.0.0.1")
+    _parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    _parser.add_argument(
+        "--endpoint-url", help="Bedrock endpoint, e.g. a local fake service"
+    )
+    _parser.add_argument("--max-turns", type=int, default=DEFAULT_MAX_CONCURRENT_TURNS)
+    _parser.add_argument("--keepalive", type=float, default=DEFAULT_KEEPALIVE_SECONDS)
+    _parser.add_argument(
+        "--local",
+        nargs="?",
+        const="1",
+        metavar="AGENTS_YAML",
+        help="Serve Bedrock in-process from utils/local_bedrock_agents.py, with agents from this file",
+    )
+    _args = _parser.parse_args(argv)
+    if _args.local:
+        os.environ["BEDROCK_AGENTS_LOCAL"] = _args.local
+        install_from_env()
+
+    _gateway = AgentGateway(
+        endpoint_url=_args.endpoint_url,
+        max_concurrent_turns=_args.max_turns,
+        keepalive_seconds=_args.keepalive,
+    )
+    _server = make_server(_gateway, _args.host, _args.port)
+    logger.info("Agent gateway listening on http://%s:%d", _args.host, _args.port)
+    try:
+        _server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        _server.server_close()
+
+
+if __name__ == "__main__":
+    main()
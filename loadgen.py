@@ -0,0 +1,479 @@
+"""
+Concurrent load generator for the agents of config.bot_configs.
+
+Replays a prompt corpus through AgentsForAmazonBedrock.invoke, either closed-loop (a fixed number
+of virtual users, each sending its next prompt as soon as the previous answer arrives) or
+open-loop (Poisson arrivals at a target rate, whatever the response times). Every request records
+its time to first token, total latency, tokens, LLM calls, retries and throttled attempts, and the
+run is reported as p50/p95/p99 statistics with an error breakdown, on the terminal and as JSON.
+
+    python loadgen.py --bot "Energy Agent" --prompts prompts.txt --concurrency 8 --requests 200
+    python loadgen.py --bot "Energy Agent" --prompts prompts.jsonl --rate 2 --duration 300 --output run.json
+
+The corpus is a text file with one prompt per line, or a JSONL file with a "text" field. With
+--endpoint-url, every Bedrock and STS client created by the run talks to that endpoint instead of
+AWS (e.g. a local stub), and placeholder credentials are used when none are configured. With
+--local, the run is served in-process by utils/local_bedrock_agents.py, optionally loading agents
+from a YAML file, and needs neither AWS nor a network.
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from termcolor import colored
+
+from config import bot_configs
+from utils.logging_utils import configure_logging
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_IN_FLIGHT = 64
+PERCENTILES = (50, 95, 99)
+
+_STUBBED_SERVICES = ("BEDROCK_AGENT", "BEDROCK_AGENT_RUNTIME", "STS")
+
+
+@dataclass
+class RequestRecord:
+    """Measurements of one request of a run. Offsets are seconds since the start of the run."""
+
+    index: int
+    prompt_index: int
+    scheduled_at: float
+    started_at: float = None
+    finished_at: float = None
+    time_to_first_token: Optional[float] = None
+    latency: Optional[float] = None
+    input_tokens: int = 0
+    output_tokens: int = 0
+    llm_calls: int = 0
+    retries: int = 0
+    throttles: int = 0
+    cached: bool = False
+    error: Optional[str] = None
+
+    @property
+    def queue_delay(self) -> float:
+        return self.started_at - self.scheduled_at
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Returns the q-th percentile of values, interpolating linearly between ranks."""
+    if not values:
+        return None
+    _sorted = sorted(values)
+    _rank = (len(_sorted) - 1) * q / 100
+    _low = int(_rank)
+    _high = min(_low + 1, len(_sorted) - 1)
+    return _sorted[_low] + (_sorted[_high] - _sorted[_low]) * (_rank - _low)
+
+
+def load_prompts(path: str) -> List[str]:
+    """Reads a corpus: one prompt per line, or JSONL objects with a "text" field. Blank lines are skipped."""
+    _prompts = []
+    with open(path, "r", encoding="utf-8") as _file:
+        for _line in _file:
+            _line = _line.strip()
+            if not _line:
+                continue
+            _prompts.append(
+                json.loads(_line)["text"] if path.endswith(".jsonl") else _line
+            )
+    if not _prompts:
+        raise ValueError(f"No prompts in {path}")
+    return _prompts
+
+
+def use_endpoint(endpoint_url: str) -> None:
+    """Points the Bedrock agent and STS clients created from now on at endpoint_url."""
+    for _service in _STUBBED_SERVICES:
+        os.environ[f"AWS_ENDPOINT_URL_{_service}"] = endpoint_url
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+    if not os.environ.get("AWS_ACCESS_KEY_ID"):
+        os.environ["AWS_ACCESS_KEY_ID"] = "stub"
+        os.environ["AWS_SECRET_ACCESS_KEY"] = "stub"
+
+
+def error_type(error: Exception) -> str:
+    """Returns the AWS error code of a failed call, or the exception class name."""
+    # invoke() wraps errors raised while streaming as Exception("Unexpected exception: ", e)
+    if len(error.args) == 2 and isinstance(error.args[1], Exception):
+        error = error.args[1]
+    _response = getattr(error, "response", None)
+    if isinstance(_response, dict) and "Error" in _response:
+        return _response["Error"].get("Code") or type(error).__name__
+    return type(error).__name__
+
+
+class ThrottleCounter:
+    """Counts throttled attempts of InvokeAgent calls, per calling thread, from botocore retry events."""
+
+    def __init__(self, runtime_client):
+        self._local = threading.local()
+        runtime_client.meta.events.register_first(
+            "needs-retry.bedrock-agent-runtime.InvokeAgent", self._on_attempt
+        )
+
+    def _on_attempt(self, response=None, **kwargs):
+        if response is None:
+            return None
+        _http, _parsed = response
+        _code = _parsed.get("Error", {}).get("Code", "")
+        if _http.status_code == 429 or "Throttl" in _code:
+            self._local.count = self.count + 1
+        return None
+
+    @property
+    def count(self) -> int:
+        return getattr(self._local, "count", 0)
+
+    def reset(self) -> None:
+        self._local.count = 0
+
+
+@dataclass
+class LoadRun:
+    """Settings and results of a run."""
+
+    bot_name: str
+    mode: str
+    concurrency: int = None
+    rate: float = None
+    records: List[RequestRecord] = field(default_factory=list)
+    elapsed: float = 0.0
+
+
+class LoadGenerator:
+    """Sends the prompts of a corpus to one bot and records every request."""
+
+    def __init__(
+        self,
+        agents_helper,
+        bot: Dict,
+        prompts: List[str],
+        sticky_sessions: bool = False,
+        stream_final_response: bool = True,
+        seed: int = None,
+    ):
+        """Constructs an instance.
+
+        Args:
+            agents_helper (AgentsForAmazonBedrock): Helper whose invoke() sends the requests
+            bot (Dict): Bot configuration, with agent_id and agent_alias_id
+            prompts (List[str]): Corpus, replayed in order and wrapped around
+            sticky_sessions (bool, optional): Reuse one agent session per virtual user (closed-loop) instead of a
+            new session per request. Defaults to False.
+            stream_final_response (bool, optional): Stream the final answer, which makes time to first token
+            meaningful. Defaults to True.
+            seed (int, optional): Seed of the open-loop arrival process. Defaults to None.
+        """
+        self._agents_helper = agents_helper
+        self._bot = bot
+        self._prompts = prompts
+        self._sticky_sessions = sticky_sessions
+        self._stream_final_response = stream_final_response
+        self._random = random.Random(seed)
+        self._throttles = ThrottleCounter(agents_helper._bedrock_agent_runtime_client)
+        self._lock = threading.Lock()
+        self._next_index = 0
+        self._start = None
+
+    def _now(self) -> float:
+        return time.monotonic() - self._start
+
+    def _claim(self, stop_at: float, max_requests: int) -> Optional[int]:
+        with self._lock:
+            if max_requests is not None and self._next_index >= max_requests:
+                return None
+            if stop_at is not None and self._now() >= stop_at:
+                return None
+            self._next_index += 1
+            return self._next_index - 1
+
+    def _send(self, record: RequestRecord, session_id: str) -> RequestRecord:
+        _session_state = {}
+        if "session_attributes" in self._bot:
+            _session_state = self._bot["session_attributes"]
+        _metrics = {}
+        self._throttles.reset()
+        record.started_at = self._now()
+        try:
+            self._agents_helper.invoke(
+                self._prompts[record.prompt_index],
+                self._bot["agent_id"],
+                agent_alias_id=self._bot["agent_alias_id"],
+                session_id=session_id,
+                session_state=_session_state,
+                enable_trace=True,
+                trace_level="none",
+                stream_final_response=self._stream_final_response,
+                metrics=_metrics,
+            )
+        except Exception as e:
+            record.error = error_type(e)
+        record.finished_at = self._now()
+        record.latency = record.finished_at - record.started_at
+        record.time_to_first_token = _metrics.get("time_to_first_token_seconds")
+        record.input_tokens = _metrics.get("input_tokens", 0)
+        record.output_tokens = _metrics.get("output_tokens", 0)
+        record.llm_calls = _metrics.get("llm_calls", 0)
+        record.retries = _metrics.get("retry_attempts", 0)
+        record.throttles = self._throttles.count
+        record.cached = _metrics.get("cached", False)
+        return record
+
+    def run_closed(
+        self, concurrency: int, max_requests: int = None, duration: float = None
+    ) -> LoadRun:
+        """Runs concurrency virtual users back to back until max_requests were sent or duration elapsed."""
+        _run = LoadRun(self._bot["bot_name"], "closed", concurrency=concurrency)
+        self._start = time.monotonic()
+
+        def _user():
+            _session_id = str(uuid.uuid4())
+            while True:
+                _index = self._claim(duration, max_requests)
+                if _index is None:
+                    return
+                if not self._sticky_sessions:
+                    _session_id = str(uuid.uuid4())
+                _record = RequestRecord(
+                    _index, _index % len(self._prompts), self._now()
+                )
+                self._send(_record, _session_id)
+                with self._lock:
+                    _run.records.append(_record)
+
+        _users = [
+            threading.Thread(target=_user, daemon=True) for _ in range(concurrency)
+        ]
+        for _thread in _users:
+            _thread.start()
+        for _thread in _users:
+            _thread.join()
+        _run.elapsed = time.monotonic() - self._start
+        return _run
+
+    def run_open(
+        self,
+        rate: float,
+        max_requests: int = None,
+        duration: float = None,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    ) -> LoadRun:
+        """Sends requests at Poisson arrival times averaging rate per second, whatever the response times.
+
+        Requests that find max_in_flight requests running wait for a slot; the wait shows as queue delay,
+        and the reported latency is measured from the send, not from the scheduled arrival.
+        """
+        _run = LoadRun(self._bot["bot_name"], "open", rate=rate)
+        self._start = time.monotonic()
+        _futures = []
+        with ThreadPoolExecutor(max_workers=max_in_flight) as _executor:
+            _next_arrival = 0.0
+            while duration is None or _next_arrival < duration:
+                _index = self._claim(None, max_requests)
+                if _index is None:
+                    break
+                _delay = _next_arrival - self._now()
+                if _delay > 0:
+                    time.sleep(_delay)
+                _record = RequestRecord(
+                    _index, _index % len(self._prompts), _next_arrival
+                )
+                _futures.append(
+                    _executor.submit(self._send, _record, str(uuid.uuid4()))
+                )
+                _next_arrival += self._random.expovariate(rate)
+        _run.records = sorted((_f.result() for _f in _futures), key=lambda _r: _r.index)
+        _run.elapsed = time.monotonic() - self._start
+        return _run
+
+
+def summarize(run: LoadRun) -> Dict:
+    """Returns the aggregate statistics of a run."""
+    _ok = [_r for _r in run.records if _r.error is None]
+    _errors = {}
+    for _record in run.records:
+        if _record.error is not None:
+            _errors[_record.error] = _errors.get(_record.error, 0) + 1
+
+    def _stats(values):
+        _stats_dict = {f"p{_q}": percentile(values, _q) for _q in PERCENTILES}
+        _stats_dict["mean"] = sum(values) / len(values) if values else None
+        _stats_dict["max"] = max(values) if values else None
+        return _stats_dict
+
+    return {
+        "bot_name": run.bot_name,
+        "mode": run.mode,
+        "concurrency": run.concurrency,
+        "target_rate": run.rate,
+        "elapsed_seconds": run.elapsed,
+        "requests": len(run.records),
+        "succeeded": len(_ok),
+        "failed": len(run.records) - len(_ok),
+        "throughput_rps": len(_ok) / run.elapsed if run.elapsed else 0.0,
+        "latency_seconds": _stats([_r.latency for _r in _ok]),
+        "time_to_first_token_seconds": _stats(
+            [_r.time_to_first_token for _r in _ok if _r.time_to_first_token is not None]
+        ),
+        "queue_delay_seconds": _stats([_r.queue_delay for _r in run.records]),
+        "input_tokens": sum(_r.input_tokens for _r in _ok),
+        "output_tokens": sum(_r.output_tokens for _r in _ok),
+        "llm_calls": _stats([_r.llm_calls for _r in _ok]),
+        "cached": sum(_r.cached for _r in _ok),
+        "retries": sum(_r.retries for _r in run.records),
+        "throttles": sum(_r.throttles for _r in run.records),
+        "errors": _errors,
+    }
+
+
+def print_summary(summary: Dict) -> None:
+    def _fmt(value, unit="s"):
+        return "-" if value is None else f"{value:,.2f}{unit}"
+
+    _load = (
+        f"{summary['concurrency']} users"
+        if summary["mode"] == "closed"
+        else f"{summary['target_rate']} req/s"
+    )
+    print(colored(f"{summary['bot_name']}: {summary['mode']}-loop, {_load}", "cyan"))
+    print(
+        f"  {summary['requests']} requests in {summary['elapsed_seconds']:,.1f}s, "
+        f"{summary['succeeded']} ok, {summary['failed']} failed, "
+        f"{summary['throughput_rps']:,.2f} req/s"
+    )
+    print(
+        f"  {'':<22}"
+        + "".join(f"{_k:>10}" for _k in ("p50", "p95", "p99", "mean", "max"))
+    )
+    for _label, _key, _unit in (
+        ("latency", "latency_seconds", "s"),
+        ("time to first token", "time_to_first_token_seconds", "s"),
+        ("queue delay", "queue_delay_seconds", "s"),
+        ("llm calls", "llm_calls", ""),
+    ):
+        _stats = summary[_key]
+        print(
+            f"  {_label:<22}"
+            + "".join(
+                f"{_fmt(_stats[_k], _unit):>10}"
+                for _k in ("p50", "p95", "p99", "mean", "max")
+            )
+        )
+    print(
+        f"  tokens in: {summary['input_tokens']:,}, out: {summary['output_tokens']:,}, "
+        f"cached answers: {summary['cached']}, retries: {summary['retries']}, throttled attempts: {summary['throttles']}"
+    )
+    for _code, _count in sorted(summary["errors"].items(), key=lambda _e: -_e[1]):
+        print(colored(f"  {_code}: {_count}", "red"))
+
+
+def resolve_bot(agents_helper, bot_name: str) -> Dict:
+    _bot = next((_b for _b in bot_configs if _b["bot_name"] == bot_name), None)
+    if _bot is None:
+        raise ValueError(
+            f"Unknown bot {bot_name}, expected one of {[_b['bot_name'] for _b in bot_configs]}"
+        )
+    _bot = dict(_bot)
+    if not _bot.get("agent_id") or not _bot.get("agent_alias_id"):
+        _bot["agent_id"] = agents_helper.get_agent_id_by_name(_bot["agent_name"])
+        if _bot["agent_id"] is None:
+            raise ValueError(f"Agent {_bot['agent_name']} not found")
+        _bot["agent_alias_id"] = agents_helper.get_agent_latest_alias_id(
+            _bot["agent_id"]
+        )
+    return _bot
+
+
+def main(argv: List[str] = None) -> None:
+    _parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    _parser.add_argument(
+        "--bot", required=True, help="bot_name from config.bot_configs"
+    )
+    _parser.add_argument(
+        "--prompts", required=True, help="Text (one prompt per line) or JSONL corpus"
+    )
+    _load = _parser.add_mutually_exclusive_group()
+    _load.add_argument("--concurrency", type=int, help="Closed-loop virtual users")
+    _load.add_argument("--rate", type=float, help="Open-loop arrivals per second")
+    _parser.add_argument("--requests", type=int, help="Stop after this many requests")
+    _parser.add_argument(
+        "--duration", type=float, help="Stop sending after this many seconds"
+    )
+    _parser.add_argument("--max-in-flight", type=int, default=DEFAULT_MAX_IN_FLIGHT)
+    _parser.add_argument("--sticky-sessions", action="store_true")
+    _parser.add_argument(
+        "--no-stream", action="store_true", help="Do not stream the final response"
+    )
+    _parser.add_argument("--seed", type=int)
+    _parser.add_argument(
+        "--endpoint-url",
+        help="Send every Bedrock call to this endpoint, e.g. a local stub",
+    )
+    _parser.add_argument(
+        "--local",
+        nargs="?",
+        const="1",
+        metavar="AGENTS_YAML",
+        help="Serve Bedrock in-process from utils/local_bedrock_agents.py, with agents from this file",
+    )
+    _parser.add_argument(
+        "--output", help="Write the summary and per-request records as JSON"
+    )
+    _args = _parser.parse_args(argv)
+    if _args.requests is None and _args.duration is None:
+        _parser.error("one of --requests or --duration is required")
+
+    # the per-call trace summaries of invoke() would drown the report
+    configure_logging(level=os.environ.get("AGENT_LOG_LEVEL", "WARNING"))
+    if _args.endpoint_url:
+        use_endpoint(_args.endpoint_url)
+    if _args.local:
+        os.environ["BEDROCK_AGENTS_LOCAL"] = _args.local
+        from utils.local_bedrock_agents import install_from_env
+
+        install_from_env()
+    # imported here so that the endpoint override applies to the clients the helper creates
+    from utils.bedrock_agent_helper import AgentsForAmazonBedrock
+
+    _helper = AgentsForAmazonBedrock()
+    _generator = LoadGenerator(
+        _helper,
+        resolve_bot(_helper, _args.bot),
+        load_prompts(_args.prompts),
+        sticky_sessions=_args.sticky_sessions,
+        stream_final_response=not _args.no_stream,
+        seed=_args.seed,
+    )
+    if _args.rate is not None:
+        _run = _generator.run_open(
+            _args.rate, _args.requests, _args.duration, _args.max_in_flight
+        )
+    else:
+        _run = _generator.run_closed(
+            _args.concurrency or DEFAULT_CONCURRENCY, _args.requests, _args.duration
+        )
+
+    _summary = summarize(_run)
+    print_summary(_summary)
+    if _args.output:
+        with open(_args.output, "w", encoding="utf-8") as _file:
+            json.dump(
+                {"summary": _summary, "records": [asdict(_r) for _r in _run.records]},
+                _file,
+                indent=2,
+            )
+        print(f"Wrote {_args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,76 @@
 import boto3
 import streamlit as st
 import datetime
-import json
-import math
-from utils.bedrock_agent import Task
+from utils.bedrock_agent import Task, agents_helper
+from utils.response_cache import AgentResponseCache, make_cache_key
+from utils.logging_utils import get_logger
+from utils.invocation_workers import DEFAULT_EVENT_TIMEOUT_SECONDS, InvocationError, get_invocation_pool
+from utils.learned_router import RoutingLog
+from utils.trace_reducer import (
+    AnswerChunk, CodeInvocation, CodeResult, FinalResponse, KnowledgeBaseQuery, KnowledgeBaseResults,
+    Rationale, RoutingDecision, RoutingStarted, ToolInvocation, ToolResponse, TurnState, reduce_event
+)
+from utils.working_memory import WorkingMemoryView
+
+logger = get_logger("ui_utils")
+
+_response_cache = None
+_agent_names = {}
+# routing classifier decisions, to train a LearnedRouter from; only kept when AGENT_ROUTING_LOG is set
+_routing_log = RoutingLog.from_env()
+
+
+def get_response_cache():
+    """Return the process-wide agent response cache, creating it on first use."""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = AgentResponseCache()
+    return _response_cache
+
+def get_working_memory_view(table_name):
+    """Return the cached working-memory view of a table for this Streamlit session."""
+    views = st.session_state.setdefault('working_memory_views', {})
+    if table_name not in views:
+        views[table_name] = WorkingMemoryView(
+            table_name,
+            agents_helper.scan_dynamodb,
+            agents_helper.get_dynamodb_key_attributes(table_name),
+        )
+    return views[table_name]
+
+
+def render_working_memory_panel(force=False, redraw=True):
+    """Refresh and draw the working-memory panel in the sidebar placeholder, if a table is known.
+
+    Reads are rate-limited by the view unless force is set. With redraw=False the panel is only
+    drawn again when the read found changes.
+    """
+    table_name = st.session_state.get('current_table_name')
+    placeholder = st.session_state.get('working_memory_placeholder')
+    if not table_name or placeholder is None:
+        return
+
+    try:
+        view = get_working_memory_view(table_name)
+        changed = view.refresh(force=force)
+    except Exception as e:
+        logger.error("Error reading working memory table %s: %s", table_name, e)
+        return
+    if not redraw and not changed:
+        return  # nothing new since the panel was last drawn
+
+    with placeholder.container():
+        st.subheader("Working Memory")
+        st.caption(f"`{table_name}` · {len(view.items)} keys · {view.reads} reads")
+        for key, item in sorted(view.items.items()):
+            label = f"{key} :orange[(updated)]" if key in view.changed_keys else key
+            with st.expander(label, expanded=key in view.changed_keys):
+                value = item.get('value', item)
+                if isinstance(value, str):
+                    st.write(value.replace('$', '\\$'))
+                else:
+                    st.json(value)
+
 
 def make_full_prompt(tasks, additional_instructions, processing_type="allow_parallel"):
     """Build a full prompt from tasks and instructions."""
@@ -30,205 +97,195 @@ def make_full_prompt(tasks, additional_instructions, processing_type="allow_para
 
     return prompt
 
-def process_routing_trace(event, step, _sub_agent_name, _time_before_routing=None):
-    """Process routing classifier trace events."""
-   
-    _route = event['trace']['trace']['routingClassifierTrace']
-    
-    if 'modelInvocationInput' in _route:
-        container = st.container(border=True)                            
-        container.markdown(f"""🔍 요청에 맞는 collaborator를 선택 중입니다...""")
-        return datetime.datetime.now(), step, _sub_agent_name, None, None
-        
-    if 'modelInvocationOutput' in _route and _time_before_routing:
-        _llm_usage = _route['modelInvocationOutput']['metadata']['usage']
-        inputTokens = _llm_usage.get('inputTokens', 0)
-        outputTokens = _llm_usage['outputTokens']
-        
-        _route_duration = datetime.datetime.now() - _time_before_routing
+def get_agent_name(agent_client, agent_id):
+    """Return the display name of an agent, looking each id up once per process."""
+    if agent_id not in _agent_names:
+        _agent_names[agent_id] = agent_client.get_agent(agentId=agent_id)["agent"]["agentName"]
+    return _agent_names[agent_id]
 
-        _raw_resp_str = _route['modelInvocationOutput']['rawResponse']['content']
-        _raw_resp = json.loads(_raw_resp_str)
-        _classification = _raw_resp['content'][0]['text'].replace('<a>', '').replace('</a>', '')
 
-        if _classification == "undecidable":
+def render_trace_entry(entry):
+    """Draw one entry produced by the trace reducer; answer chunks are drawn by the caller."""
+    if isinstance(entry, RoutingStarted):
+        container = st.container(border=True)
+        container.markdown(f"""🔍 요청에 맞는 collaborator를 선택 중입니다...""")
+
+    elif isinstance(entry, RoutingDecision):
+        if entry.outcome == "undecidable":
             text = f"❌ 일치하는 collaborator가 없습니다. `SUPERVISOR` 모드로 전환합니다."
-        elif _classification in (_sub_agent_name, 'keep_previous_agent'):
-            step = math.floor(step + 1)
+        elif entry.outcome == "keep_previous":
             text = f"➡️ 이전 collaborator와 대화를 이어가세요."
         else:
-            _sub_agent_name = _classification
-            step = math.floor(step + 1)
-            text = f"✅ **Collaborator**: `{_sub_agent_name}`"
-
-        time_text = f"- **Intent classifier** took {_route_duration.total_seconds():,.1f}s"
-        container = st.container(border=True)                            
+            text = f"✅ **Collaborator**: `{entry.collaborator}`"
+        container = st.container(border=True)
         container.write(text)
-        container.write(time_text)
-        
-        return step, _sub_agent_name, inputTokens, outputTokens
+        container.write(f"- **Intent classifier** took {entry.duration_seconds:,.1f}s")
 
-def process_orchestration_trace(event, agentClient, step):
-    """Process orchestration trace events."""
-    _orch = event['trace']['trace']['orchestrationTrace']
-    inputTokens = 0
-    outputTokens = 0
-    
-    if "invocationInput" in _orch:
-        _input = _orch['invocationInput']
+    elif isinstance(entry, KnowledgeBaseQuery):
+        with st.expander("Using knowledge base", True, icon=":material/plumbing:"):
+            st.write("**knowledge base id**: " + entry.knowledge_base_id)
+            st.write("**query**: " + entry.text.replace('$', '\\$'))
 
-        print(_input)
-        
-        if 'knowledgeBaseLookupInput' in _input:
-            with st.expander("Using knowledge base", True, icon=":material/plumbing:"):
-                st.write("**knowledge base id**: " + _input["knowledgeBaseLookupInput"]["knowledgeBaseId"])
-                st.write("**query**: " + _input["knowledgeBaseLookupInput"]["text"].replace('$', '\\$'))
-                
-        if "actionGroupInvocationInput" in _input:
-            function = _input["actionGroupInvocationInput"]["function"]
-            with st.expander(f"Invoking Tool - `{function}`", True, icon=":material/plumbing:"):
-                st.write(f"- **Function:** `{function}`")
-                st.write(f"- **Type:** `{_input.get('actionGroupInvocationInput', {}).get('executionType', '')}`")
-                if 'parameters' in _input["actionGroupInvocationInput"]:
-                    st.write("- **Parameters**")
-                    params = _input["actionGroupInvocationInput"]["parameters"]
-                    st.table({
-                        'Parameter Name': [p["name"] for p in params],
-                        'Parameter Value': [p["value"] for p in params]
-                    })
-                    
-                    # Monitor DynamoDB operations
-                    if function in ['set_value_for_key', 'get_key_value']:
-                        table_param = next((p for p in params if p["name"] == "table_name"), None)
-                        if table_param:
-                            table_name = table_param["value"]
-                            print(f"DynamoDB operation: {function} on table: {table_name}")  # Debug log
-                            # Store table name in session state
-                            st.session_state['current_table_name'] = table_name
-
-        if 'codeInterpreterInvocationInput' in _input:
-            with st.expander("Code interpreter tool usage", True, icon=":material/psychology:"):
-                gen_code = _input['codeInterpreterInvocationInput']['code']
-                st.code(gen_code, language="python")
-                    
-    if "modelInvocationOutput" in _orch:
-        if "usage" in _orch["modelInvocationOutput"]["metadata"]:
-            inputTokens = _orch["modelInvocationOutput"]["metadata"]["usage"].get("inputTokens", 0)
-            outputTokens = _orch["modelInvocationOutput"]["metadata"]["usage"]["outputTokens"]
-                    
-    # Initialize agent data when we first see the agent
-    if "agentId" in event["trace"] and 'current_conversation' in st.session_state:
-        current_conv = st.session_state['current_conversation']
-        agentData = agentClient.get_agent(agentId=event["trace"]["agentId"])
-        agentName = agentData["agent"]["agentName"]
-        
-        # Find or create agent data in current conversation
-        agent_data = next(
-            (agent for agent in current_conv['agents'] if agent['name'] == agentName),
-            None
+    elif isinstance(entry, ToolInvocation):
+        with st.expander(f"Invoking Tool - `{entry.function}`", True, icon=":material/plumbing:"):
+            st.write(f"- **Function:** `{entry.function}`")
+            st.write(f"- **Type:** `{entry.execution_type}`")
+            if entry.has_parameters:
+                st.write("- **Parameters**")
+                st.table({
+                    'Parameter Name': [name for name, _ in entry.parameters],
+                    'Parameter Value': [value for _, value in entry.parameters]
+                })
+        if entry.table_name:
+            # Monitor DynamoDB operations
+            logger.debug("DynamoDB operation: %s on table: %s", entry.function, entry.table_name)
+            st.session_state['current_table_name'] = entry.table_name
+            # The rate-limited refresh on the event loop picks up what the tool wrote
+            render_working_memory_panel(redraw=False)
+
+    elif isinstance(entry, CodeInvocation):
+        with st.expander("Code interpreter tool usage", True, icon=":material/psychology:"):
+            st.code(entry.code, language="python")
+
+    elif isinstance(entry, Rationale):
+        container = st.container(border=True)
+        if entry.is_sub_agent:
+            container.markdown(f"""###### Step {round(entry.step,2)} Sub-Agent  :red[{entry.agent}]""")
+            container.markdown(entry.text.replace('$', '\\$'))
+        else:
+            container.markdown(f"""#### Step  :blue[{round(entry.step,2)}]""")
+            container.write(entry.text.replace('$', '\\$'))
+
+    elif isinstance(entry, KnowledgeBaseResults):
+        with st.expander(":green[Knowledge Base Results]", True, icon=":material/psychology:"):
+            st.write(f"{len(entry.references)} references")
+            for i, text in enumerate(entry.references, 1):
+                st.write(f"  ({i}) {text[0:200]}...")
+
+    elif isinstance(entry, ToolResponse):
+        with st.expander(":green[Tool Response]", False, icon=":material/psychology:"):
+            st.write(entry.text.replace('$', '\\$'))
+
+    elif isinstance(entry, CodeResult):
+        with st.expander(":green[Code interpreter]", True, icon=":material/psychology:"):
+            if entry.output is not None:
+                st.code(entry.output)
+            if entry.error is not None:
+                st.write(f"Code interpretation error: {entry.error}")
+            if entry.files is not None:
+                st.write(f"Code interpretation files generated:\n{list(entry.files)}")
+
+    elif isinstance(entry, FinalResponse):
+        with st.expander(":blue[Agent Response]", True, icon=":material/psychology:"):
+            st.write(entry.text.replace('$', '\\$'))
+
+
+def update_conversation(current_conv, state):
+    """Mirror the agents and token totals of a turn state into its conversation record."""
+    current_conv['agents'] = [
+        {
+            'name': agent.name,
+            'time': datetime.datetime.fromtimestamp(agent.first_seen),
+            'step': agent.step,
+            'tools_used': set(agent.tools_used)  # Use set to avoid duplicates
+        }
+        for agent in state.agents
+    ]
+    current_conv['tokens'] = state.tokens
+
+
+def summarize_conversation_trace(current_conv, table_name=None):
+    """Build the condensed trace summary that is stored alongside a cached answer."""
+    summary = {'agents': [], 'tokens': {}, 'table_name': table_name}
+    if current_conv:
+        summary['agents'] = [
+            {'name': agent['name'], 'tools_used': sorted(agent.get('tools_used', []))}
+            for agent in current_conv.get('agents', [])
+        ]
+        summary['tokens'] = dict(current_conv.get('tokens', {}))
+    return summary
+
+
+def replay_cached_response(cached):
+    """Replay a cached answer and its trace summary through the invoke_agent streaming interface."""
+    summary = cached['trace_summary']
+    cached_at = datetime.datetime.fromtimestamp(cached['created_at'])
+
+    container = st.container(border=True)
+    container.markdown(f"⚡ 캐시된 응답입니다. (저장 시각: {cached_at.strftime('%Y-%m-%d %H:%M:%S')})")
+    for agent in summary.get('agents', []):
+        container.markdown(f"- **Collaborator**: `{agent['name']}`")
+        for tool in agent['tools_used']:
+            container.markdown(f"  - {tool}")
+    original_tokens = summary.get('tokens', {})
+    if original_tokens:
+        container.write(
+            f"- 원래 실행: Input Tokens **{original_tokens.get('input', 0)}**, "
+            f"Output Tokens **{original_tokens.get('output', 0)}**, "
+            f"LLM Calls **{original_tokens.get('llm_calls', 0)}**"
         )
-        
-        if not agent_data:
-            agent_data = {
-                'name': agentName,
+
+    # A cache hit makes no LLM calls, so the conversation is charged nothing
+    token_info = {'input': 0, 'output': 0, 'llm_calls': 0}
+    if 'current_conversation' in st.session_state and st.session_state['current_conversation']:
+        current_conv = st.session_state['current_conversation']
+        for agent in summary.get('agents', []):
+            current_conv['agents'].append({
+                'name': agent['name'],
                 'time': datetime.datetime.now(),
-                'step': step,
-                'tools_used': set()  # Use set to avoid duplicates
-            }
-            current_conv['agents'].append(agent_data)
-        
-        # Track tool usage throughout the trace
-        if "invocationInput" in _orch:
-            _input = _orch['invocationInput']
-            
-            if 'knowledgeBaseLookupInput' in _input:
-                print(f"Agent {agentName} using Knowledge Base")
-                agent_data['tools_used'].add('Knowledge Base')
-            
-            if 'actionGroupInvocationInput' in _input:
-                function = _input['actionGroupInvocationInput']['function']
-                print(f"Agent {agentName} using Tool: {function}")
-                agent_data['tools_used'].add(f'{function}')
-            
-            if 'codeInterpreterInvocationInput' in _input:
-                print(f"Agent {agentName} using Code Interpreter")
-                agent_data['tools_used'].add('Code Interpreter')
-
-        # Also track tools from observations
-        if "observation" in _orch:
-            _obs = _orch['observation']
-            
-            if 'knowledgeBaseLookupOutput' in _obs:
-                print(f"Agent {agentName} completed Knowledge Base lookup")
-                agent_data['tools_used'].add('Knowledge Base')
-                
-            if 'actionGroupInvocationOutput' in _obs:
-                print(f"Agent {agentName} completed Tool invocation")
-                
-            if 'codeInterpreterInvocationOutput' in _obs:
-                print(f"Agent {agentName} completed Code Interpreter execution")
-                agent_data['tools_used'].add('Code Interpreter')
-        
-        # Display step information
-        if "rationale" in _orch:
-            chain = event["trace"]["callerChain"]
-            container = st.container(border=True)
-            
-            if len(chain) <= 1:
-                step = math.floor(step + 1)
-                container.markdown(f"""#### Step  :blue[{round(step,2)}]""")
-            else:
-                step = step + 0.1
-                container.markdown(f"""###### Step {round(step,2)} Sub-Agent  :red[{agentName}]""")
-            
-            # Update step in agent data
-            agent_data['step'] = step
-            
-            # Add matching indentation for the content
-            if len(chain) <= 1:
-                container.write(_orch["rationale"]["text"].replace('$', '\\$'))
-            else:
-                container.markdown(_orch["rationale"]["text"].replace('$', '\\$'))
-
-    if "observation" in _orch:
-        _obs = _orch['observation']
+                'step': 0,
+                'tools_used': set(agent['tools_used'])
+            })
+        current_conv['tokens'] = dict(token_info)
+
+    yield cached['answer'], summary.get('table_name'), token_info
+
+
+def stream_turn_events(turn_id):
+    """Yield the completion events of a turn from the invocation pool, forgetting the turn if it failed, stalled or expired."""
+    try:
+        yield from get_invocation_pool().subscribe(turn_id, timeout=DEFAULT_EVENT_TIMEOUT_SECONDS)
+    except (InvocationError, KeyError, TimeoutError):
+        st.session_state.pop('active_turn', None)
+        raise
+
+
+def invoke_agent(input_text, session_id, task_yaml_content, turn_id=None):
+    """Main agent invocation and response processing.
+
+    The agent runs in a worker process of the invocation pool; this only renders the events of the
+    turn. Passing the turn_id of a turn interrupted by a rerun (st.session_state['active_turn'])
+    replays it from its first event instead of invoking the agent again.
+    """
+    # Process tasks if any
+    _tasks = []
+    _bot_config = st.session_state['bot_config']
+    for _task_name in task_yaml_content.keys():
+        _curr_task = Task(_task_name, task_yaml_content, _bot_config['inputs'])
+        _tasks.append(_curr_task)
         
-        if 'knowledgeBaseLookupOutput' in _obs:
-            with st.expander(":green[Knowledge Base Results]", True, icon=":material/psychology:"):
-                _refs = _obs['knowledgeBaseLookupOutput']['retrievedReferences']
-                _ref_count = len(_refs)
-                st.write(f"{_ref_count} references")
-                for i, _ref in enumerate(_refs, 1):
-                    st.write(f"  ({i}) {_ref['content']['text'][0:200]}...")
-
-        if 'actionGroupInvocationOutput' in _obs:
-            with st.expander(":green[Tool Response]", False, icon=":material/psychology:"):
-                st.write(_obs['actionGroupInvocationOutput']['text'].replace('$', '\\$'))
-
-        if 'codeInterpreterInvocationOutput' in _obs:
-            with st.expander(":green[Code interpreter]", True, icon=":material/psychology:"):
-                if 'executionOutput' in _obs['codeInterpreterInvocationOutput']:
-                    raw_output = _obs['codeInterpreterInvocationOutput']['executionOutput']
-                    st.code(raw_output)
-
-                if 'executionError' in _obs['codeInterpreterInvocationOutput']:
-                    error_text = _obs['codeInterpreterInvocationOutput']['executionError']
-                    st.write(f"Code interpretation error: {error_text}")
-
-                if 'files' in _obs['codeInterpreterInvocationOutput']:
-                    files_generated = _obs['codeInterpreterInvocationOutput']['files']
-                    st.write(f"Code interpretation files generated:\n{files_generated}")
-
-        if 'finalResponse' in _obs:
-            with st.expander(":blue[Agent Response]", True, icon=":material/psychology:"):
-                st.write(_obs['finalResponse']['text'].replace('$', '\\$'))
-            
-    return step, inputTokens, outputTokens
-
-
-def invoke_agent(input_text, session_id, task_yaml_content):
-    """Main agent invocation and response processing."""
-    client = boto3.client('bedrock-agent-runtime')
+    if len(_tasks) > 0:
+        additional_instructions = _bot_config.get('additional_instructions')
+        messagesStr = make_full_prompt(_tasks, additional_instructions, processing_type="allow_parallel")
+    else:
+        messagesStr = input_text
+
+    # Serve repeated questions from the response cache when the bot opts in
+    _cache_config = _bot_config.get('response_cache')
+    _cache_key = None
+    if _cache_config and turn_id is None:
+        _cache_key = make_cache_key(
+            _bot_config['agent_id'],
+            _bot_config['agent_alias_id'],
+            messagesStr,
+            _bot_config.get('session_attributes', {}).get('sessionAttributes'),
+            _cache_config.get('session_attribute_keys')
+        )
+        _cached = get_response_cache().get(_cache_key)
+        if _cached:
+            yield from replay_cached_response(_cached)
+            return
+
     agentClient = boto3.client('bedrock-agent')
     region = boto3.session.Session().region_name
     account_id = boto3.client('sts').get_caller_identity()['Account']
@@ -309,124 +366,74 @@ def invoke_agent(input_text, session_id, task_yaml_content):
         },
     }
     
-    # Process tasks if any
-    _tasks = []
-    _bot_config = st.session_state['bot_config']
-    for _task_name in task_yaml_content.keys():
-        _curr_task = Task(_task_name, task_yaml_content, _bot_config['inputs'])
-        _tasks.append(_curr_task)
-        
-    if len(_tasks) > 0:
-        additional_instructions = _bot_config.get('additional_instructions')
-        messagesStr = make_full_prompt(_tasks, additional_instructions, processing_type="allow_parallel")
-    else:
-        messagesStr = input_text
-
-    # Invoke agent
-    try:
+    # Invoke agent in a worker process, unless resuming a turn that is already running there
+    if turn_id is None:
+        _request = {
+            'agent_id': _bot_config['agent_id'],
+            'agent_alias_id': _bot_config['agent_alias_id'],
+            'session_id': session_id,
+            'input_text': messagesStr
+        }
         if 'session_attributes' in _bot_config:
             session_state = {
                 "sessionAttributes": _bot_config['session_attributes']['sessionAttributes']
             }
             if 'promptSessionAttributes' in _bot_config['session_attributes']:
                 session_state['promptSessionAttributes'] = _bot_config['session_attributes']['promptSessionAttributes']
+            _request['session_state'] = session_state
+        turn_id = get_invocation_pool().submit(_request)
+    st.session_state['active_turn'] = turn_id
 
-            response = client.invoke_agent(
-                agentId=_bot_config['agent_id'],
-                agentAliasId=_bot_config['agent_alias_id'],
-                sessionId=session_id,
-                sessionState=session_state,
-                inputText=messagesStr,
-                enableTrace=True
-            )
-        else:
-            response = client.invoke_agent(
-                agentId=_bot_config['agent_id'],
-                agentAliasId=_bot_config['agent_alias_id'],
-                sessionId=session_id,
-                inputText=messagesStr,
-                enableTrace=True
-            )
-    except Exception as e:
-        print(f"Error invoking agent: {e}")
-        raise e
-
-    # Process response
-    step = 0.0
-    _sub_agent_name = " "
-    _time_before_routing = None
-    inputTokens = 0
-    outputTokens = 0
-    _total_llm_calls = 0
+    # Process response: the reducer keeps the turn state, this only draws what each event added
+    state = TurnState()
+    current_conv = st.session_state.get('current_conversation')
     
     with st.spinner("Processing ....."):
-        for event in response.get("completion"):
-            if "chunk" in event:
-                chunk_text = event["chunk"]["bytes"].decode("utf-8").replace('$', '\\$')
-                # Try to extract table name if it's in the response
-                table_name = None
-                try:
-                    # Look for table name in various formats
-                    lower_text = chunk_text.lower()
-                    if "table name:" in lower_text:
-                        table_name = lower_text.split("table name:")[1].split()[0].strip()
-                    elif "table:" in lower_text:
-                        table_name = lower_text.split("table:")[1].split()[0].strip()
-                    elif "dynamodb table:" in lower_text:
-                        table_name = lower_text.split("dynamodb table:")[1].split()[0].strip()
-                    elif "using table" in lower_text:
-                        table_name = lower_text.split("using table")[1].split()[0].strip()
-                        
-                    # Clean up any punctuation
-                    if table_name:
-                        table_name = table_name.strip(".,!?()[]{}'\"`")
-                        print(f"Found table name: {table_name}")  # Debug log
-                except Exception as e:
-                    print(f"Error extracting table name: {e}")  # Debug log
-                    pass
-                # Include current token counts with each chunk
-                token_info = {
-                    'input': inputTokens,
-                    'output': outputTokens,
-                    'llm_calls': _total_llm_calls
-                }
-                yield chunk_text, table_name, token_info
-                
-            if "trace" in event:
-                if 'routingClassifierTrace' in event['trace']['trace']:
-                    #print("Processing routing trace...")
-                    result = process_routing_trace(event, step, _sub_agent_name, _time_before_routing)
-                    if result:
-                        if len(result) == 5:  # Initial invocation
-                            #print("Initial routing invocation")
-                            _time_before_routing, step, _sub_agent_name, in_tokens, out_tokens = result
-                            if in_tokens and out_tokens:
-                                inputTokens += in_tokens
-                                outputTokens += out_tokens
-                                _total_llm_calls += 1
-                        else:  # Subsequent invocation
-                            #print("Subsequent routing invocation")
-                            step, _sub_agent_name, in_tokens, out_tokens = result
-                            if in_tokens and out_tokens:
-                                inputTokens += in_tokens
-                                outputTokens += out_tokens
-                                _total_llm_calls += 1
-
-                        
-                if "orchestrationTrace" in event["trace"]["trace"]:
-                    result = process_orchestration_trace(event, agentClient, step)
-                    if result:
-                        step, in_tokens, out_tokens = result
-                        if in_tokens and out_tokens:
-                            inputTokens += in_tokens
-                            outputTokens += out_tokens
-                            _total_llm_calls += 1
+        for event in stream_turn_events(turn_id):
+            agent_name = None
+            if "trace" in event and "agentId" in event["trace"]:
+                agent_name = get_agent_name(agentClient, event["trace"]["agentId"])
+            previous = state
+            state = reduce_event(state, event, agent_name=agent_name)
+
+            for entry in state.entries[len(previous.entries):]:
+                if isinstance(entry, AnswerChunk):
+                    if entry.table_name:
+                        logger.debug("Found table name: %s", entry.table_name)
+                    # Include current token counts with each chunk
+                    yield entry.text.replace('$', '\\$'), entry.table_name, state.tokens
+                else:
+                    render_trace_entry(entry)
+
+            if current_conv and state.agents is not previous.agents:
+                update_conversation(current_conv, state)
+
+            if "trace" in event and "orchestrationTrace" in event["trace"]["trace"]:
+                # Pick up what collaborators wrote, rate-limited by the working-memory view
+                render_working_memory_panel(redraw=False)
 
         # Update token information in current conversation
-        if 'current_conversation' in st.session_state and st.session_state['current_conversation']:
-            current_conv = st.session_state['current_conversation']
-            current_conv['tokens'] = {
-                'input': inputTokens,
-                'output': outputTokens,
-                'llm_calls': _total_llm_calls
-            }
+        if current_conv:
+            update_conversation(current_conv, state)
+
+        # Remember the answer so the next identical question can be replayed
+        if _cache_key and state.answer_chunks:
+            get_response_cache().put(
+                _cache_key,
+                state.answer.replace('$', '\\$'),
+                trace_summary=summarize_conversation_trace(current_conv, state.table_name),
+                ttl_seconds=_cache_config.get('ttl_seconds'),
+                bot_name=_bot_config['bot_name'],
+                agent_id=_bot_config['agent_id'],
+                agent_alias_id=_bot_config['agent_alias_id']
+            )
+
+        # Only the script run that reads a turn to its end gets here, so each turn is logged once
+        if _routing_log is not None:
+            for entry in state.entries:
+                if isinstance(entry, RoutingDecision):
+                    _routing_log.append(messagesStr, entry.classification,
+                                        supervisor=_bot_config['agent_id'],
+                                        duration_seconds=entry.duration_seconds,
+                                        input_tokens=entry.input_tokens,
+                                        output_tokens=entry.output_tokens)
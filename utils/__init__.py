@@ -0,0 +1,7 @@
+import os
+
+# offline runs: serve the Bedrock agent clients of this process from utils/local_bedrock_agents.py
+if os.environ.get("BEDROCK_AGENTS_LOCAL"):
+    from utils.local_bedrock_agents import install_from_env
+
+    install_from_env()
@@ -33,11 +33,21 @@ from dataclasses import dataclass
 from typing import Self, Callable, Union
 from enum import Enum
 import yaml
-from utils.bedrock_agent_helper import AgentsForAmazonBedrock
+from utils.bedrock_agent_helper import (
+    MEMO_TABLE_PK,
+    MEMO_TABLE_SK,
+    AgentsForAmazonBedrock,
+)
+from utils.lambda_profiles import LambdaProfile
+from utils.learned_router import DEFAULT_ROUTER_THRESHOLD, LearnedRouter, RoutingLog
+from utils.logging_utils import get_logger
+import inspect
 import json
 
 print(f"boto3 version: {boto3.__version__}")
 
+logger = get_logger("bedrock_agent")
+
 # Clients
 s3_client = boto3.client("s3")
 sts_client = boto3.client("sts")
@@ -192,12 +202,18 @@ class Tool:
     """A tool that can be attached to an agent."""
 
     def __init__(
-        self, name: str, description: str, code_file_or_arn: str, schema_dict: Dict
+        self,
+        name: str,
+        description: str,
+        code_file_or_arn: str,
+        schema_dict: Dict,
+        lambda_profile: Union[Dict, LambdaProfile] = None,
     ):
         self.name = name
         self.code_file = code_file_or_arn
         self.description = description
         self._schema_dict = schema_dict
+        self.lambda_profile = LambdaProfile.from_value(lambda_profile)
 
     @classmethod
     def create(
@@ -206,6 +222,7 @@ class Tool:
         code_file: str,
         schema: Union[Dict, ParameterSchema],
         description: str = None,
+        lambda_profile: Union[Dict, LambdaProfile] = None,
     ) -> "Tool":
         if isinstance(schema, ParameterSchema):
             schema_dict = schema.to_dict()
@@ -215,7 +232,7 @@ class Tool:
             raise TypeError(
                 f"schema must be either a dict or ParameterSchema object, not {type(schema)}"
             )
-        return cls(name, description, code_file, schema_dict)
+        return cls(name, description, code_file, schema_dict, lambda_profile)
 
     def delete(self):
         """Delete this tool."""
@@ -292,8 +309,11 @@ class Agent:
         kb_descr: str = " ",
         llm: str = None,
         verbose: bool = False,
+        force_recreate: bool = None,
     ):
         self.name = name
+        if force_recreate is None:
+            force_recreate = Agent.default_force_recreate
 
         self.role = yaml_content[name]["role"]
         self.goal = yaml_content[name]["goal"]
@@ -329,7 +349,12 @@ class Agent:
         else:
             self.llm = DEFAULT_AGENT_MODEL
 
-        if not Agent.default_force_recreate:
+        # optional deployment profile (memory, architecture, concurrency, alias) of the tool Lambdas
+        self.lambda_profile = LambdaProfile.from_value(
+            yaml_content[name].get("lambda_profile")
+        )
+
+        if not force_recreate:
             # if the agent already exists, get its agent_id and move on.
             try:
                 self.agent_id = agents_helper.get_agent_id_by_name(self.name)
@@ -353,9 +378,10 @@ class Agent:
                 f"\nDeleting existing agent and corresponding lambda for: {self.name}..."
             )
             try:
-                agents_helper.delete_lambda(f"{self.name}_ag")
-                agents_helper.delete_agent(self.name, verbose=True)
-                time.sleep(4)
+                # tool Lambdas are kept, create_lambda redeploys them only if their code changed
+                agents_helper.delete_agents(
+                    [self.name], delete_lambdas=False, verbose=True
+                )
             except:
                 pass
 
@@ -408,6 +434,7 @@ class Agent:
                     f"Set of functions for {self.name}",
                     self.additional_function_iam_policy,
                     verbose=verbose,
+                    lambda_profile=self.lambda_profile,
                 )
 
             elif tools is None and self.tool_code == "ROC":
@@ -423,35 +450,36 @@ class Agent:
                 for _tool in tools:
                     print(f"Adding tool: {_tool['definition']['name']}...")
                     # print(f"Adding action group for tool: {str(_tool.definition['name'])}...")
+                    # each tool gets its own function, since create_lambda updates an existing one in place
                     resp = agents_helper.add_action_group_with_lambda(
                         self.name,
-                        f"{self.name}_ag",
+                        (
+                            f"{self.name}_ag"
+                            if len(tools) == 1
+                            else f"{self.name}_ag_{_tool_num}"
+                        ),
                         _tool["code"],
                         [_tool["definition"]],
                         f"actions_{_tool_num}_{self.name}",
                         f"Set of functions for {self.name}",
                         self.additional_function_iam_policy,
+                        lambda_profile=LambdaProfile.from_value(
+                            _tool.get("lambda_profile", self.lambda_profile)
+                        ),
                     )
                     _tool_num += 1
 
         # Add an agent alias so that this agent can be used as a sub agent by a supervisor.
 
-        agents_helper.wait_agent_status_update(
-            self.agent_id
-        )  # wait to be out of "Versioning" state
+        # prepare() waits for the agent to settle first and returns once it is PREPARED
         agents_helper.prepare(self.name)
-        agents_helper.wait_agent_status_update(self.agent_id)
         _agent_alias = agents_helper._bedrock_agent_client.create_agent_alias(
             agentAliasName="with-code-ag", agentId=self.agent_id
         )
         self.agent_alias_id = _agent_alias["agentAlias"]["agentAliasId"]
         self.agent_alias_arn = _agent_alias["agentAlias"]["agentAliasArn"]
 
-        agents_helper.wait_agent_status_update(
-            self.agent_id
-        )  # wait to be out of "Versioning" state
         agents_helper.prepare(self.name)
-        agents_helper.wait_agent_status_update(self.agent_id)
 
         print(
             f"DONE: Agent: {self.name}, id: {self.agent_id}, alias id: {self.agent_alias_id}\n"
@@ -485,7 +513,6 @@ class Agent:
         print("Preparing agent")
         if self.needs_preparation():
             agents_helper.prepare(self.name)
-            agents_helper.wait_agent_status_update(self.agent_id)
             _agent_alias = agents_helper._bedrock_agent_client.create_agent_alias(
                 agentAliasName=alias, agentId=self.agent_id
             )
@@ -547,6 +574,7 @@ class Agent:
         llm: str = None,
         code_interpreter: bool = False,
         verbose: bool = False,
+        lambda_profile: Union[Dict, LambdaProfile] = None,
     ):
         """Create an agent, or attach to an existing one"""
         _yaml_content = {
@@ -562,6 +590,8 @@ class Agent:
             _yaml_content[name]["llm"] = llm
         if code_interpreter:
             _yaml_content[name]["code_interpreter"] = code_interpreter
+        if lambda_profile is not None:
+            _yaml_content[name]["lambda_profile"] = lambda_profile
         return cls(
             name,
             _yaml_content,
@@ -695,12 +725,85 @@ class Agent:
             tool_defs,  # One function for now, generalize to handle groups later
             tool.name,  # Using tool name as the action group name
             f"actions for {tool.description}",
+            lambda_profile=tool.lambda_profile,
         )
         # self._status = Agent.Status.NOT_PREPARED  # Force preparation on next invoke
 
-    def attach_tool_from_function(self, func: Callable):
-        """Attach the supplied code to this agent as a Tool"""
+    def attach_tool_from_function(self, func: Callable, memoize: bool = False):
+        """Attach the supplied code to this agent as a Tool, optionally caching its results in the Lambda"""
+
+        name = func.__name__
+        _definition = self._function_to_tool_definition(func)
+
+        # Write a lambda around the code and persist it (for inline_agents, this will have to be different)
+        lambda_file = agents_helper.create_lambda_file(func, memoize=memoize)
+        tool = Tool.create(
+            name,
+            code_file=lambda_file,
+            schema=_definition["parameters"],
+            description=_definition["description"],
+        )
+        return self.attach_tool(tool)
+
+    def attach_tools_from_functions(
+        self,
+        funcs: List[Callable],
+        action_group_name: str = None,
+        lambda_profile: Union[Dict, LambdaProfile] = None,
+        memoize: bool = False,
+        memo_table: str = None,
+    ) -> None:
+        """Attach several functions to this agent as one action group served by a single Lambda.
+
+        Args:
+            funcs (List[Callable]): Functions with type hints and docstrings, as for attach_tool_from_function()
+            action_group_name (str, optional): Name of the action group and of its Lambda function.
+            Defaults to tools_<agent name>.
+            lambda_profile (Union[Dict, LambdaProfile], optional): Deployment profile of the Lambda. Defaults to None.
+            memoize (bool, optional): Whether the Lambda caches results of identical calls. Only use it for
+            functions without side effects. Defaults to False.
+            memo_table (str, optional): DynamoDB table that shares cached results across containers and users.
+            Created if needed. Defaults to None, meaning an in-container cache only.
+        """
+        _group_name = action_group_name or f"tools_{self.name}"
+
+        instructions = agents_helper.get_agent_instructions_by_name(self.name)
+        if Agent.NO_TOOL_USE_INSTRUCTION in instructions:
+            print(f"Replacing instructions to not use tools...")
+            instructions = instructions.replace(
+                Agent.NO_TOOL_USE_INSTRUCTION, Agent.TOOL_USE_INSTRUCTION
+            )
+            self.update(new_instructions=instructions)
+
+        if self.has_action_group(_group_name):
+            print(f"Action group {_group_name} already exists, skipping...")
+            return
 
+        _dynamo_args = None
+        if memoize and memo_table is not None:
+            agents_helper.create_memo_table(memo_table)
+            _dynamo_args = [memo_table, MEMO_TABLE_PK, MEMO_TABLE_SK]
+
+        tool_defs = [self._function_to_tool_definition(_func) for _func in funcs]
+        lambda_file = agents_helper.create_multi_function_lambda_file(
+            funcs,
+            file_name=f"lambda_{_group_name}.py",
+            memoize=memoize,
+            memo_dynamodb=_dynamo_args is not None,
+        )
+        agents_helper.add_action_group_with_lambda(
+            self.name,
+            _group_name,
+            lambda_file,
+            tool_defs,
+            _group_name,
+            f"actions for {', '.join(_tool_def['name'] for _tool_def in tool_defs)}",
+            dynamo_args=_dynamo_args,
+            lambda_profile=LambdaProfile.from_value(lambda_profile),
+        )
+
+    def _function_to_tool_definition(self, func: Callable) -> Dict:
+        """Builds the action group function definition of a Python function from its type hints"""
         name = func.__name__
         # Use the docstring for the description
         description = func.__doc__ or f"Tool based on function {name}"
@@ -712,22 +815,19 @@ class Agent:
         if "return" not in type_hints:
             raise ValueError("Function must have a return type hint")
 
-        # Create parameter schema
+        # Create parameter schema, parameters with a default value are optional
+        signature_params = inspect.signature(func).parameters
         parameters = {}
         for param_name, param_type in type_hints.items():
             if param_name != "return":
                 parameters[param_name] = {
                     "type": self._python_type_to_schema_type(param_type),
                     "description": f"Parameter {param_name} of type {param_type.__name__}",
-                    "required": True,
+                    "required": signature_params[param_name].default
+                    is inspect.Parameter.empty,
                 }
 
-        # Write a lambda around the code and persist it (for inline_agents, this will have to be different)
-        lambda_file = agents_helper.create_lambda_file(func)
-        tool = Tool.create(
-            name, code_file=lambda_file, schema=parameters, description=description
-        )
-        return self.attach_tool(tool)
+        return {"name": name, "description": description, "parameters": parameters}
 
     @staticmethod
     def _python_type_to_schema_type(py_type) -> str:
@@ -798,8 +898,11 @@ class SupervisorAgent:
         kb_descr: str = " ",
         llm: str = None,
         verbose: bool = False,
+        force_recreate: bool = None,
     ):
         self.name = name
+        if force_recreate is None:
+            force_recreate = Agent.default_force_recreate
 
         if "collaboration_type" in yaml_content[name]:
             self.collaboration_type = yaml_content[name]["collaboration_type"]
@@ -835,7 +938,7 @@ class SupervisorAgent:
         self.supervisor_agent_alias_id = None
         self.supervisor_agent_alias_arn = None
 
-        if not Agent.default_force_recreate:
+        if not force_recreate:
             # if the supervisor agent already exists, get its agent_id and move on.
             try:
                 if verbose:
@@ -916,9 +1019,7 @@ class SupervisorAgent:
                 )
 
         # clean up existing supervisor if needed
-        agents_helper.delete_lambda(f"{name}_lambda")
-        agents_helper.delete_agent(name, verbose=True)
-        time.sleep(4)
+        agents_helper.delete_agents([name], delete_lambdas=False, verbose=True)
 
         # create the supervisor
         if llm is not None:
@@ -975,13 +1076,7 @@ class SupervisorAgent:
                 f"Set of functions for {self.name}",
                 verbose=verbose,
             )
-            agents_helper.wait_agent_status_update(
-                self.supervisor_agent_id
-            )  # wait to be out of "Versioning" state
             agents_helper.prepare(self.name)
-            agents_helper.wait_agent_status_update(
-                self.supervisor_agent_id
-            )  # wait to be out of "Preparing" state
         # if self.tool_code is not None and self.tool_defs is not None:
         #     agents_helper.add_tools_to_agent(self.supervisor_agent_id, self.tool_code, self.tool_defs)
 
@@ -1079,6 +1174,35 @@ class SupervisorAgent:
         # print(f"  did not find name, returning None")
         return None
 
+    def route_locally(
+        self,
+        input_text: str,
+        router: LearnedRouter,
+        threshold: float = DEFAULT_ROUTER_THRESHOLD,
+    ) -> Optional[str]:
+        """Picks a collaborator for a request with a local router instead of the routing classifier.
+
+        Args:
+            input_text (str): The request
+            router (LearnedRouter): Router trained on the routing decisions of this supervisor
+            threshold (float, optional): Confidence needed to pick a collaborator. Defaults to DEFAULT_ROUTER_THRESHOLD.
+
+        Returns:
+            Optional[str]: "agentId/aliasId" of the collaborator (a key of multi_agent_names), or None when the
+            supervisor should route the request
+        """
+        _classification, _confidence = router.predict(input_text)
+        if _confidence < threshold or _classification == self.name:
+            return None
+        return next(
+            (
+                _ids
+                for _ids, _name in self.multi_agent_names.items()
+                if _name == _classification
+            ),
+            None,
+        )
+
     def invoke(
         self,
         input_text: str,
@@ -1087,18 +1211,39 @@ class SupervisorAgent:
         trace_level: str = "core",
         session_state: dict = {},
         multi_agent_names: dict = {},
+        router: LearnedRouter = None,
+        router_threshold: float = DEFAULT_ROUTER_THRESHOLD,
+        routing_log: RoutingLog = None,
     ):
+        """Invokes the supervisor, or the collaborator a local router is confident about.
+
+        With a router, a request it routes with at least router_threshold confidence goes straight to
+        that collaborator's alias, saving the routing classifier call; the collaborator then does not
+        see the supervisor's conversation history of this session. Other requests go to the supervisor,
+        whose routing decisions are appended to routing_log, if given, to retrain the router from.
+        """
         if multi_agent_names == {}:
             multi_agent_names = self.multi_agent_names
+        _agent_id = self.supervisor_agent_id
+        _agent_alias_id = self.supervisor_agent_alias_id
+        if router is not None:
+            _target = self.route_locally(input_text, router, router_threshold)
+            if _target is not None:
+                _agent_id, _agent_alias_id = _target.split("/")
+                logger.info(
+                    "Local router sent the request to %s, skipping the supervisor",
+                    multi_agent_names.get(_target, _target),
+                )
         return agents_helper.invoke(
             input_text,
-            self.supervisor_agent_id,
-            agent_alias_id=self.supervisor_agent_alias_id,
+            _agent_id,
+            agent_alias_id=_agent_alias_id,
             session_id=session_id,
             enable_trace=enable_trace,
             session_state=session_state,
             trace_level=trace_level,
             multi_agent_names=multi_agent_names,
+            routing_log=routing_log,
         )
 
     def invoke_with_tasks(
@@ -1162,7 +1307,6 @@ be sure to include the details as input to the task.\n\n"""
         return result
 
 
-import inspect
 from pydantic import create_model
 
 
@@ -8,24 +8,27 @@ It includes methods for creating, updating, and invoking Agents, as well as mana
 IAM roles and Lambda functions for action groups.
 """
 import copy
+import queue
+import random
+import threading
 
 import boto3
 import json
 import time
 import uuid
-import zipfile
 from dateutil.tz import tzutc
 import os
 import datetime
-from io import BytesIO
 from typing import List, Dict, Tuple
 import re
 from boto3.session import Session
 from botocore.config import Config
 from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
 import inspect
 from typing import Callable
 from textwrap import dedent
+from concurrent.futures import ThreadPoolExecutor
 
 # import matplotlib.pyplot as plt
 # import matplotlib.image as mpimg
@@ -35,6 +38,20 @@ from termcolor import colored
 from rich.console import Console
 from rich.markdown import Markdown
 
+from utils.lambda_packaging import build_lambda_package
+from utils.lambda_profiles import LambdaProfile, apply_lambda_profile
+from utils.learned_router import RoutingLog
+from utils.logging_utils import LazyJson, get_logger
+from utils.response_cache import AgentResponseCache, make_cache_key
+from utils.resource_waiter import (
+    ResourceWaiter,
+    WaitTarget,
+    agent_alias_target,
+    agent_target,
+    is_transitional_status,
+    lambda_function_target,
+)
+
 
 PYTHON_TIMEOUT = 180
 PYTHON_RUNTIME = "python3.12"
@@ -43,6 +60,15 @@ DEFAULT_CI_ACTION_GROUP_NAME = "CodeInterpreterAction"
 UNDECIDABLE_CLASSIFICATION = "undecidable"
 ROUTER_MODEL = "us.anthropic.claude-3-haiku-20240307-v1:0"
 TRACE_TRUNCATION_LENGTH = 300
+TEARDOWN_MAX_WORKERS = 8
+DYNAMODB_BATCH_SIZE = 25
+DYNAMODB_MAX_WORKERS = 8
+DYNAMODB_MAX_RETRIES = 8
+MEMO_MAX_ENTRIES = 256
+MEMO_TTL_SECONDS = 300
+MEMO_TABLE_PK = "cache_key"
+MEMO_TABLE_SK = "function_name"
+MEMO_TABLE_TTL_ATTRIBUTE = "expires_at"
 
 # TODO: Take advantage of a default execution role so that we do not need to have lengthy
 # waiting times when creating a new Agent or new Lambda to give time for the IAM role to
@@ -119,16 +145,46 @@ DEFAULT_AGENT_IAM_POLICY = {
     ],
 }
 
-# # setting logger
-# logging.basicConfig(format='[%(asctime)s] p%(process)s {%(filename)s:%(lineno)d} %(levelname)s - %(message)s', level=logging.INFO)
-# logger = logging.getLogger(__name__)
+# trace output of the invoke methods, logged at INFO; trace_level selects what is emitted
+_trace_log = get_logger("bedrock_agent_helper")
+
+
+def list_agent_ids_by_name(bedrock_agent_client) -> Dict[str, str]:
+    """Returns the ids of all agents in the account, keyed by agent name, following pagination."""
+    _ids = {}
+    _kwargs = {"maxResults": 100}
+    while True:
+        _resp = bedrock_agent_client.list_agents(**_kwargs)
+        for _agent in _resp["agentSummaries"]:
+            _ids[_agent["agentName"]] = _agent["agentId"]
+        if "nextToken" not in _resp:
+            return _ids
+        _kwargs["nextToken"] = _resp["nextToken"]
+
+
+def list_agent_alias_summaries(bedrock_agent_client, agent_id: str) -> List[Dict]:
+    """Returns the summaries of all aliases of an agent, following pagination."""
+    _summaries = []
+    _kwargs = {"agentId": agent_id, "maxResults": 100}
+    while True:
+        _resp = bedrock_agent_client.list_agent_aliases(**_kwargs)
+        _summaries.extend(_resp["agentAliasSummaries"])
+        if "nextToken" not in _resp:
+            return _summaries
+        _kwargs["nextToken"] = _resp["nextToken"]
 
 
 class AgentsForAmazonBedrock:
     """Provides an easy to use wrapper for Agents for Amazon Bedrock."""
 
-    def __init__(self):
-        """Constructs an instance."""
+    def __init__(self, waiter: ResourceWaiter = None):
+        """Constructs an instance.
+
+        Args:
+            waiter (ResourceWaiter, optional): Engine used to poll agents and aliases until they are ready.
+            Defaults to a ResourceWaiter on the system clock.
+        """
+        self._waiter = waiter if waiter is not None else ResourceWaiter()
         self._boto_session = Session()
         self._region = self._boto_session.region_name
         self._account_id = boto3.client("sts").get_caller_identity()["Account"]
@@ -307,15 +363,18 @@ class AgentsForAmazonBedrock:
             _curr_update = _summary["updatedAt"]
             if _curr_update > _latest_update:
                 _latest_alias_id = _summary["agentAliasId"]
-                self.wait_agent_alias_status_update(
-                    agent_id, _latest_alias_id, verbose=False
-                )
                 _latest_update = _curr_update
                 _alias_name = _summary["agentAliasName"]
                 # skip routing config since issue w/ version being blank
                 # print(f"agent id: {agent_id}, routing config: {_summary['routingConfiguration']}")
                 # _alias_version = _summary['routingConfiguration'][0]['agentVersion']
 
+        # only the alias we are returning needs to be ready
+        if _latest_alias_id:
+            self.wait_agent_alias_status_update(
+                agent_id, _latest_alias_id, verbose=False
+            )
+
         if verbose:
             print(f"for id: {agent_id}, picked latest alias: {_latest_alias_id}")
             print(f"  updated at: {_latest_update}")
@@ -409,13 +468,19 @@ class AgentsForAmazonBedrock:
         _instructions = _get_agent_resp["agent"]["instruction"]
         return _instructions
 
-    def _allow_agent_lambda(self, agent_id: str, lambda_function_name: str) -> None:
+    def _allow_agent_lambda(
+        self, agent_id: str, lambda_function_name: str, qualifier: str = None
+    ) -> None:
         """Allows the specified Agent to invoke the specified Lambda function by adding the appropriate permission.
 
         Args:
             agent_id (str): Id of the agent
             lambda_function_name (str): Name of the Lambda function
+            qualifier (str, optional): Alias of the function the agent invokes. Defaults to None.
         """
+        _kwargs = {}
+        if qualifier is not None:
+            _kwargs["Qualifier"] = qualifier
         # Create allow invoke permission on lambda
         _permission_resp = self._lambda_client.add_permission(
             FunctionName=lambda_function_name,
@@ -423,6 +488,7 @@ class AgentsForAmazonBedrock:
             Action="lambda:InvokeFunction",
             Principal="bedrock.amazonaws.com",
             SourceArn=f"arn:aws:bedrock:{self._region}:{self._account_id}:agent/{agent_id}",
+            **_kwargs,
         )
 
     def _make_agent_string(self, agent_arns: List[str] = None) -> str:
@@ -447,8 +513,12 @@ class AgentsForAmazonBedrock:
         additional_function_iam_policy: Dict = None,
         sub_agent_arns: List[str] = None,
         dynamo_args: List[str] = None,
+        dependency_files: List[str] = None,
+        lambda_profile: LambdaProfile = None,
     ) -> str:
         """Creates a new Lambda function that implements a set of actions for an Agent Action Group.
+        If a function with the same name already exists, its code is only updated when the
+        packaged content differs from the deployed CodeSha256.
 
         Args:
             agent_name (str): Name of the existing Agent that this Lambda will support.
@@ -457,9 +527,12 @@ class AgentsForAmazonBedrock:
             Must be a local file, and use underscores, not hyphens.
             additional_function_iam_policy (Dict, Optional): Additional IAM policy to attach to the Lambda function. Defaults to None.
             sub_agent_arns (List[str], Optional): List of ARNs of the sub-agents that this Lambda is allowed to invoke.
+            dependency_files (List[str], Optional): Additional local files to package with the source code. Defaults to None.
+            lambda_profile (LambdaProfile, Optional): Memory, architecture, concurrency and alias settings,
+            applied idempotently after deployment. Defaults to None.
 
         Returns:
-            str: ARN of the new Lambda function
+            str: ARN of the new Lambda function, qualified with the profile alias if there is one
         """
 
         _agent_id = self.get_agent_id_by_name(agent_name)
@@ -468,12 +541,10 @@ class AgentsForAmazonBedrock:
 
         _base_filename = source_code_file.split(".py")[0]
 
-        # Package up the lambda function code
-        s = BytesIO()
-        z = zipfile.ZipFile(s, "w")
-        z.write(f"{source_code_file}")
-        z.close()
-        zip_content = s.getvalue()
+        # Package up the lambda function code, reusing the locally cached zip if the inputs are unchanged
+        zip_content, _code_sha256 = build_lambda_package(
+            source_code_file, dependency_files
+        )
         # TODO: make this an optional keyword arg. only supply it when sub-agent-arns are provided or DynamoDB variables are provided
         if sub_agent_arns:
             env_variables = {
@@ -481,6 +552,27 @@ class AgentsForAmazonBedrock:
             }
         else:
             env_variables = {"Variables": {}}
+
+        try:
+            _existing = self._lambda_client.get_function(
+                FunctionName=lambda_function_name
+            )["Configuration"]
+        except self._lambda_client.exceptions.ResourceNotFoundException:
+            _existing = None
+
+        if _existing is not None:
+            self._update_lambda(
+                _existing,
+                zip_content,
+                _code_sha256,
+                f"{_base_filename}.lambda_handler",
+                env_variables,
+                dynamo_args,
+            )
+            return self._finish_lambda_deployment(
+                _agent_id, lambda_function_name, zip_content, lambda_profile
+            )
+
         if dynamo_args:
             # add DynamoDB Table permissions to the Lambda Function
             lambda_role = self._create_lambda_iam_role(
@@ -494,20 +586,113 @@ class AgentsForAmazonBedrock:
         else:
             lambda_role = self._create_lambda_iam_role(agent_name, sub_agent_arns)
 
+        _profile_kwargs = (
+            lambda_profile.creation_kwargs() if lambda_profile is not None else {}
+        )
+        _profile_kwargs.setdefault("Timeout", PYTHON_TIMEOUT)
+
         # Create Lambda Function
         _lambda_function = self._lambda_client.create_function(
             FunctionName=lambda_function_name,
             Runtime=PYTHON_RUNTIME,
-            Timeout=PYTHON_TIMEOUT,
             Role=lambda_role,
             Code={"ZipFile": zip_content},
             Handler=f"{_base_filename}.lambda_handler",
             Environment=env_variables,
+            **_profile_kwargs,
         )
+        self._waiter.wait(
+            lambda_function_target(self._lambda_client, lambda_function_name)
+        )
+
+        return self._finish_lambda_deployment(
+            _agent_id, lambda_function_name, zip_content, lambda_profile
+        )
+
+    def _finish_lambda_deployment(
+        self,
+        agent_id: str,
+        lambda_function_name: str,
+        zip_content: bytes,
+        lambda_profile: LambdaProfile = None,
+    ) -> str:
+        """Applies the deployment profile of a tool Lambda and lets the agent invoke it.
+
+        Returns:
+            str: ARN the action group should invoke
+        """
+        _qualifier = None
+        if lambda_profile is not None:
+            _function_arn = apply_lambda_profile(
+                self._lambda_client,
+                lambda_function_name,
+                lambda_profile,
+                zip_content=zip_content,
+                waiter=self._waiter,
+            )
+            _qualifier = lambda_profile.alias
+        else:
+            _function_arn = self._lambda_client.get_function(
+                FunctionName=lambda_function_name
+            )["Configuration"]["FunctionArn"]
+
+        try:
+            self._allow_agent_lambda(agent_id, lambda_function_name, _qualifier)
+        except self._lambda_client.exceptions.ResourceConflictException:
+            pass  # this agent is already allowed to invoke the function
+
+        return _function_arn
 
-        self._allow_agent_lambda(_agent_id, lambda_function_name)
+    def _update_lambda(
+        self,
+        configuration: Dict,
+        zip_content: bytes,
+        code_sha256: str,
+        handler: str,
+        env_variables: Dict,
+        dynamo_args: List[str] = None,
+    ) -> str:
+        """Brings an existing tool Lambda up to date, touching only what changed.
 
-        return _lambda_function["FunctionArn"]
+        Args:
+            configuration (Dict): Configuration of the deployed function, as returned by get_function
+            zip_content (bytes): The freshly built deployment package
+            code_sha256 (str): CodeSha256 of zip_content
+            handler (str): Handler of the function
+            env_variables (Dict): Environment of the function
+            dynamo_args (List[str], optional): DynamoDB table name, partition key and sort key. Defaults to None.
+        """
+        _function_name = configuration["FunctionName"]
+        if dynamo_args:
+            self.create_dynamodb(dynamo_args[0], dynamo_args[1], dynamo_args[2])
+            env_variables["Variables"]["dynamodb_table"] = dynamo_args[0]
+            env_variables["Variables"]["dynamodb_pk"] = dynamo_args[1]
+            env_variables["Variables"]["dynamodb_sk"] = dynamo_args[2]
+
+        if configuration["CodeSha256"] == code_sha256:
+            print(f"Lambda {_function_name} code is unchanged, skipping deployment")
+        else:
+            print(f"Updating code of Lambda {_function_name}")
+            self._lambda_client.update_function_code(
+                FunctionName=_function_name, ZipFile=zip_content
+            )
+            self._waiter.wait(
+                lambda_function_target(self._lambda_client, _function_name)
+            )
+
+        if (
+            configuration.get("Handler") != handler
+            or configuration.get("Environment", {}).get("Variables", {})
+            != env_variables["Variables"]
+        ):
+            self._lambda_client.update_function_configuration(
+                FunctionName=_function_name,
+                Handler=handler,
+                Environment=env_variables,
+            )
+            self._waiter.wait(
+                lambda_function_target(self._lambda_client, _function_name)
+            )
 
     def delete_lambda(
         self, lambda_function_name: str, delete_role_flag: bool = True
@@ -577,90 +762,214 @@ class AgentsForAmazonBedrock:
             delete_role_flag (bool, Optional): Flag indicating whether to delete the IAM role associated with the agent.
             Defaults to True.
         """
-
-        # first find the agent ID from the agent Name
-        _get_agents_resp = self._bedrock_agent_client.list_agents(maxResults=100)
-        _agents_json = _get_agents_resp["agentSummaries"]
-        _target_agent = next(
-            (agent for agent in _agents_json if agent["agentName"] == agent_name), None
+        _report = self.delete_agents(
+            [agent_name],
+            delete_role_flag=delete_role_flag,
+            delete_lambdas=False,
+            verbose=verbose,
         )
-
-        if _target_agent is None:
+        if _report.get(f"agent:{agent_name}") == "NOT_FOUND":
             print(f"Agent {agent_name} not found")
-            return
+        return
 
-        if _target_agent is not None and verbose:
-            print(
-                f"Found target agent, name: {agent_name}, id: {_target_agent['agentId']}"
+    def _list_agent_ids_by_name(self) -> Dict[str, str]:
+        """Returns the ids of all agents in the account, keyed by agent name."""
+        return list_agent_ids_by_name(self._bedrock_agent_client)
+
+    def _list_action_group_lambda_names(self, agent_id: str) -> List[str]:
+        """Returns the names of the Lambda functions behind the DRAFT action groups of an agent."""
+        _names = []
+        _kwargs = {"agentId": agent_id, "agentVersion": "DRAFT", "maxResults": 100}
+        while True:
+            _resp = self._bedrock_agent_client.list_agent_action_groups(**_kwargs)
+            for _group in _resp["actionGroupSummaries"]:
+                _details = self._bedrock_agent_client.get_agent_action_group(
+                    agentId=agent_id,
+                    agentVersion="DRAFT",
+                    actionGroupId=_group["actionGroupId"],
+                )["agentActionGroup"]
+                _lambda_arn = _details.get("actionGroupExecutor", {}).get("lambda")
+                if _lambda_arn:
+                    _names.append(_lambda_arn.split(":function:")[-1].split(":")[0])
+            if "nextToken" not in _resp:
+                return _names
+            _kwargs["nextToken"] = _resp["nextToken"]
+
+    def _delete_agent_role(self, agent_name: str) -> str:
+        """Deletes every inline policy of an agent's execution role, then the role itself."""
+        _role_name = f"AmazonBedrockExecutionRoleForAgents_{agent_name}"
+        try:
+            _policy_names = self._iam_client.list_role_policies(RoleName=_role_name)[
+                "PolicyNames"
+            ]
+        except self._iam_client.exceptions.NoSuchEntityException:
+            return "NOT_FOUND"
+
+        with ThreadPoolExecutor(max_workers=TEARDOWN_MAX_WORKERS) as _executor:
+            list(
+                _executor.map(
+                    lambda _policy: self._iam_client.delete_role_policy(
+                        PolicyName=_policy, RoleName=_role_name
+                    ),
+                    _policy_names,
+                )
             )
+        self._iam_client.delete_role(RoleName=_role_name)
+        return "DELETED"
 
-        # Delete the agent aliases
-        if _target_agent is not None:
-            _agent_id = _target_agent["agentId"]
+    def _teardown_agent(
+        self,
+        agent_name: str,
+        agent_id: str,
+        delete_role_flag: bool,
+        delete_lambdas: bool,
+        extra_lambda_names: List[str],
+        verbose: bool,
+    ) -> Dict[str, str]:
+        """Deletes one agent with its aliases, and optionally its Lambdas and IAM role."""
+        _report = {}
+
+        def _run(resource: str, fn: Callable[[], str]) -> None:
+            try:
+                _report[resource] = fn() or "DELETED"
+            except Exception as e:
+                _report[resource] = f"FAILED: {e}"
 
-            if verbose:
-                print(f"Deleting aliases for agent {_agent_id}...")
+        def _delete_lambda(lambda_name: str) -> str:
+            self.delete_lambda(lambda_name, delete_role_flag=delete_role_flag)
+            return "DELETED"
 
-            try:
-                _agent_aliases = self._bedrock_agent_client.list_agent_aliases(
-                    agentId=_agent_id, maxResults=100
+        def _delete_alias(alias_id: str) -> str:
+            self._bedrock_agent_client.delete_agent_alias(
+                agentAliasId=alias_id, agentId=agent_id
+            )
+            return self.wait_agent_alias_status_update(agent_id, alias_id)
+
+        def _delete_agent() -> str:
+            self._bedrock_agent_client.delete_agent(agentId=agent_id)
+            return self.wait_agent_status_update(agent_id)
+
+        _lambda_names = list(extra_lambda_names) if delete_lambdas else []
+        _resource_name = f"agent:{agent_name}"
+
+        with ThreadPoolExecutor(max_workers=TEARDOWN_MAX_WORKERS) as _executor:
+            _side_tasks = []
+            if delete_role_flag:
+                _side_tasks.append(
+                    _executor.submit(
+                        _run,
+                        f"role:AmazonBedrockExecutionRoleForAgents_{agent_name}",
+                        lambda: self._delete_agent_role(agent_name),
+                    )
                 )
-                for alias in _agent_aliases["agentAliasSummaries"]:
-                    alias_id = alias["agentAliasId"]
-                    print(f"Deleting alias {alias_id} from agent {_agent_id}")
-                    response = self._bedrock_agent_client.delete_agent_alias(
-                        agentAliasId=alias_id, agentId=_agent_id
+
+            if agent_id is None:
+                _report[_resource_name] = "NOT_FOUND"
+            else:
+                if delete_lambdas:
+                    try:
+                        _lambda_names.extend(
+                            self._list_action_group_lambda_names(agent_id)
+                        )
+                    except Exception as e:
+                        print(f"Error listing action groups of {agent_name}: {e}")
+
+                if verbose:
+                    print(f"Deleting aliases for agent {agent_id}...")
+                try:
+                    _aliases = list_agent_alias_summaries(
+                        self._bedrock_agent_client, agent_id
                     )
-            except Exception as e:
-                print(f"Error deleting aliases: {e}")
-                pass
+                except Exception as e:
+                    print(f"Error listing aliases of {agent_name}: {e}")
+                    _aliases = []
+                _alias_tasks = [
+                    _executor.submit(
+                        _run,
+                        f"alias:{agent_name}/{_alias['agentAliasId']}",
+                        lambda _alias_id=_alias["agentAliasId"]: _delete_alias(
+                            _alias_id
+                        ),
+                    )
+                    for _alias in _aliases
+                ]
 
-        # if the agent exists, delete the agent
-        if _target_agent is not None:
-            _agent_id = _target_agent["agentId"]
+            # Lambdas and role policies do not depend on the agent, so they go while aliases are deleted
+            for _lambda_name in dict.fromkeys(_lambda_names):
+                _side_tasks.append(
+                    _executor.submit(
+                        _run,
+                        f"lambda:{_lambda_name}",
+                        lambda _lambda_name=_lambda_name: _delete_lambda(_lambda_name),
+                    )
+                )
 
-            if verbose:
-                print(f"Deleting agent: {_agent_id}...")
-            time.sleep(5)
-            self._bedrock_agent_client.delete_agent(agentId=_agent_id)
-            time.sleep(5)
+            if agent_id is not None:
+                for _task in _alias_tasks:
+                    _task.result()
+                if verbose:
+                    print(f"Deleting agent: {agent_id}...")
+                _run(_resource_name, _delete_agent)
 
-        # TODO: add delete_lambda_flag parameter to optionall take care of
-        # deleting the lambda function associated with the agent.
+            for _task in _side_tasks:
+                _task.result()
 
-        # delete Agent IAM role if desired
-        if delete_role_flag:
-            _agent_role_name = f"AmazonBedrockExecutionRoleForAgents_{agent_name}"
-            if verbose:
-                print(f"Deleting IAM role: {_agent_role_name}...")
+        return _report
 
-            try:
-                self._iam_client.delete_role_policy(
-                    PolicyName="bedrock_gr_allow_policy", RoleName=_agent_role_name
-                )
-            except Exception as e:
-                pass
+    def delete_agents(
+        self,
+        agent_names: List[str],
+        delete_role_flag: bool = True,
+        delete_lambdas: bool = True,
+        extra_lambda_names: Dict[str, List[str]] = None,
+        max_workers: int = TEARDOWN_MAX_WORKERS,
+        verbose: bool = False,
+    ) -> Dict[str, str]:
+        """Deletes a set of agents concurrently, together with their aliases, action group Lambdas and IAM roles.
 
-            try:
-                self._iam_client.delete_role_policy(
-                    PolicyName="bedrock_allow_policy", RoleName=_agent_role_name
-                )
-            except Exception as e:
-                pass
+        Aliases, Lambdas and role policies are deleted in parallel, and the agents are polled until
+        they are gone instead of sleeping for a fixed time.
 
-            try:
-                self._iam_client.delete_role_policy(
-                    PolicyName="bedrock_kb_allow_policy", RoleName=_agent_role_name
-                )
-            except Exception as e:
-                pass
+        Args:
+            agent_names (List[str]): Names of the agents to delete
+            delete_role_flag (bool, optional): Whether to delete the agent and Lambda IAM roles. Defaults to True.
+            delete_lambdas (bool, optional): Whether to delete the Lambda functions behind the agents' action groups.
+            Defaults to True.
+            extra_lambda_names (Dict[str, List[str]], optional): Additional Lambda names to delete per agent name,
+            e.g. functions left behind by a failed creation. Defaults to None.
+            max_workers (int, optional): Maximum number of agents torn down at once. Defaults to TEARDOWN_MAX_WORKERS.
+            verbose (bool, optional): Whether to print progress. Defaults to False.
 
-            try:
-                self._iam_client.delete_role(RoleName=_agent_role_name)
-            except Exception as e:
-                pass
+        Returns:
+            Dict[str, str]: Outcome per resource (e.g. "agent:my_agent", "alias:my_agent/ABC123",
+            "lambda:my_agent_ag", "role:..."), one of DELETED, NOT_FOUND or FAILED: <reason>
+        """
+        if not agent_names:
+            return {}
+
+        _agent_ids = self._list_agent_ids_by_name()
+        _extra_lambda_names = extra_lambda_names or {}
+        _report = {}
+        with ThreadPoolExecutor(
+            max_workers=min(max_workers, len(agent_names))
+        ) as _executor:
+            for _agent_report in _executor.map(
+                lambda _name: self._teardown_agent(
+                    _name,
+                    _agent_ids.get(_name),
+                    delete_role_flag,
+                    delete_lambdas,
+                    _extra_lambda_names.get(_name, []),
+                    verbose,
+                ),
+                agent_names,
+            ):
+                _report.update(_agent_report)
 
-        return
+        if verbose:
+            for _resource, _outcome in _report.items():
+                print(f"  {_resource}: {_outcome}")
+        return _report
 
     def _create_agent_role(
         self,
@@ -811,62 +1120,152 @@ class AgentsForAmazonBedrock:
             return _agent_role["Role"]["Arn"]
 
     def wait_agent_status_update(self, agent_id):
-        response = self._bedrock_agent_client.get_agent(agentId=agent_id)
-        agent_status = response["agent"]["agentStatus"]
-        _waited_at_least_once = False
-        while agent_status.endswith("ING"):
-            print(f"Waiting for agent status to change. Current status {agent_status}")
-            time.sleep(5)
-            _waited_at_least_once = True
-            try:
-                response = self._bedrock_agent_client.get_agent(agentId=agent_id)
-                agent_status = response["agent"]["agentStatus"]
-            except self._bedrock_agent_client.exceptions.ResourceNotFoundException:
-                agent_status = "DELETED"
-        if _waited_at_least_once:
-            print(f"Agent id {agent_id} current status: {agent_status}")
+        """Waits until the agent is no longer in a transitional (CREATING, PREPARING, VERSIONING, ...) state.
+
+        Args:
+            agent_id (str): Id of the agent
+
+        Returns:
+            str: The final agent status, or "DELETED" if the agent no longer exists
+        """
+        _target = agent_target(self._bedrock_agent_client, agent_id)
+        _agent_status = self._waiter.wait(_target)
+        if _target.polls > 1:
+            print(f"Agent id {agent_id} current status: {_agent_status}")
+        return _agent_status
 
     def wait_agent_alias_status_update(self, agent_id, agent_alias_id, verbose=False):
-        response = self._bedrock_agent_client.get_agent_alias(
-            agentId=agent_id, agentAliasId=agent_alias_id
+        """Waits until the agent alias is no longer in a transitional (CREATING, UPDATING, ...) state.
+
+        Args:
+            agent_id (str): Id of the agent
+            agent_alias_id (str): Id of the agent alias
+            verbose (bool, optional): Whether to print the final status. Defaults to False.
+
+        Returns:
+            str: The final alias status, or "DELETED" if the alias no longer exists
+        """
+        _agent_alias_status = self._waiter.wait(
+            agent_alias_target(self._bedrock_agent_client, agent_id, agent_alias_id)
         )
-        agent_alias_status = response["agentAlias"]["agentAliasStatus"]
-        while agent_alias_status.endswith("ING"):
-            if verbose:
-                print(
-                    f"Waiting for agent ALIAS status to change. Current status {agent_alias_status}"
-                )
-            time.sleep(5)
-            try:
-                response = self._bedrock_agent_client.get_agent_alias(
-                    agentId=agent_id, agentAliasId=agent_alias_id
-                )
-                agent_alias_status = response["agentAlias"]["agentAliasStatus"]
-            except self._bedrock_agent_client.exceptions.ResourceNotFoundException:
-                agent_status = "DELETED"
         if verbose:
             print(
-                f"Agent id {agent_id}, Alias {agent_alias_id} current status: {agent_alias_status}"
+                f"Agent id {agent_id}, Alias {agent_alias_id} current status: {_agent_alias_status}"
             )
+        return _agent_alias_status
+
+    def wait_resources(self, targets: List[WaitTarget]) -> Dict[str, str]:
+        """Waits for several agents, aliases or other resources at once, polling them concurrently.
+
+        Args:
+            targets (List[WaitTarget]): Resources to wait for, see utils.resource_waiter
+
+        Returns:
+            Dict[str, str]: Final status of each target, keyed by target name
+        """
+        return self._waiter.wait_all(targets)
+
+    def list_agent_collaborators(
+        self, agent_id: str, agent_version: str = "DRAFT"
+    ) -> List[Dict]:
+        """Lists the collaborators associated with a supervisor agent version.
+
+        Args:
+            agent_id (str): Id of the supervisor agent
+            agent_version (str, optional): Agent version to inspect. Defaults to "DRAFT".
+
+        Returns:
+            List[Dict]: agentCollaboratorSummaries from every page of the response
+        """
+        _collaborators = []
+        _kwargs = {"agentId": agent_id, "agentVersion": agent_version}
+        while True:
+            _resp = self._bedrock_agent_client.list_agent_collaborators(**_kwargs)
+            _collaborators.extend(_resp.get("agentCollaboratorSummaries", []))
+            if "nextToken" not in _resp:
+                return _collaborators
+            _kwargs["nextToken"] = _resp["nextToken"]
 
     def associate_sub_agents(self, supervisor_agent_id, sub_agents_list):
+        """Associates collaborators with a supervisor agent, then prepares it once and creates its alias.
+
+        All collaborators are written to the DRAFT version before a single prepare, instead of one
+        prepare cycle per collaborator. Collaborators that are already associated with the same alias,
+        instruction and relay setting are skipped, and changed ones are updated in place.
+
+        Args:
+            supervisor_agent_id (str): Id of the supervisor agent
+            sub_agents_list (List[Dict]): Collaborators, each with sub_agent_alias_arn, sub_agent_instruction,
+            sub_agent_association_name and optionally relay_conversation_history
+
+        Returns:
+            Tuple[str, str]: Id and ARN of the new "multi-agent" alias of the supervisor, or of the
+            existing one when no collaborator changed
+        """
+        self.wait_agent_status_update(
+            supervisor_agent_id
+        )  # Be sure agent is not still in CREATING state
+
+        _existing = {
+            _collab["collaboratorName"]: _collab
+            for _collab in self.list_agent_collaborators(supervisor_agent_id)
+        }
+
+        _changed = 0
         for sub_agent in sub_agents_list:
-            self.wait_agent_status_update(
-                supervisor_agent_id
-            )  # Be sure agent is not still in CREATING state
-            association_response = (
-                self._bedrock_agent_client.associate_agent_collaborator(
-                    agentId=supervisor_agent_id,
-                    agentVersion="DRAFT",
-                    agentDescriptor={"aliasArn": sub_agent["sub_agent_alias_arn"]},
-                    collaboratorName=sub_agent["sub_agent_association_name"],
-                    collaborationInstruction=sub_agent["sub_agent_instruction"],
-                    relayConversationHistory=sub_agent["relay_conversation_history"],
+            _name = sub_agent["sub_agent_association_name"]
+            _relay = sub_agent.get("relay_conversation_history", "DISABLED")
+            _request = dict(
+                agentId=supervisor_agent_id,
+                agentVersion="DRAFT",
+                agentDescriptor={"aliasArn": sub_agent["sub_agent_alias_arn"]},
+                collaboratorName=_name,
+                collaborationInstruction=sub_agent["sub_agent_instruction"],
+                relayConversationHistory=_relay,
+            )
+
+            _current = _existing.get(_name)
+            if _current is None:
+                self._bedrock_agent_client.associate_agent_collaborator(**_request)
+            elif (
+                _current["agentDescriptor"].get("aliasArn")
+                == sub_agent["sub_agent_alias_arn"]
+                and _current["collaborationInstruction"]
+                == sub_agent["sub_agent_instruction"]
+                and _current["relayConversationHistory"] == _relay
+            ):
+                print(f"Collaborator {_name} already associated, skipping")
+                continue
+            else:
+                self._bedrock_agent_client.update_agent_collaborator(
+                    collaboratorId=_current["collaboratorId"], **_request
                 )
+            _changed += 1
+
+        if _changed == 0:
+            # nothing to prepare: reuse the alias of the previous run, if there is one
+            _alias = next(
+                (
+                    _summary
+                    for _summary in list_agent_alias_summaries(
+                        self._bedrock_agent_client, supervisor_agent_id
+                    )
+                    if _summary["agentAliasName"] == "multi-agent"
+                ),
+                None,
             )
-            self.wait_agent_status_update(supervisor_agent_id)
-            self._bedrock_agent_client.prepare_agent(agentId=supervisor_agent_id)
-            self.wait_agent_status_update(supervisor_agent_id)
+            if _alias is not None:
+                print(
+                    f"All {len(sub_agents_list)} collaborators already associated, keeping alias {_alias['agentAliasId']}"
+                )
+                return _alias["agentAliasId"], self.get_agent_alias_arn(
+                    supervisor_agent_id, _alias["agentAliasId"]
+                )
+
+        print(
+            f"Associated {_changed} of {len(sub_agents_list)} collaborators, preparing supervisor once"
+        )
+        self._prepare_agent(supervisor_agent_id)
 
         supervisor_agent_alias = self._bedrock_agent_client.create_agent_alias(
             agentAliasName="multi-agent", agentId=supervisor_agent_id
@@ -1021,10 +1420,31 @@ class AgentsForAmazonBedrock:
         if _agent_id is None:
             return "Agent not found"
 
-        _resp = self._bedrock_agent_client.prepare_agent(agentId=_agent_id)
-        time.sleep(5)  # make sure agent is ready to be invoked as soon as we return
+        self._prepare_agent(_agent_id)
         return
 
+    def _prepare_agent(self, agent_id: str) -> str:
+        """Prepares an agent once it is settled, and waits until it is PREPARED or FAILED.
+
+        A describe call right after prepare_agent can still return the previous status, so the
+        wait starts from the status in the prepare_agent response and only stops on an outcome
+        of the preparation.
+
+        Returns:
+            str: The final agent status
+        """
+        self.wait_agent_status_update(agent_id)
+        _resp = self._bedrock_agent_client.prepare_agent(agentId=agent_id)
+        if not is_transitional_status(_resp["agentStatus"]):
+            return _resp["agentStatus"]
+        # make sure agent is ready to be invoked as soon as we return
+        _target = agent_target(
+            self._bedrock_agent_client,
+            agent_id,
+            is_done=lambda status: status in ("PREPARED", "FAILED", "DELETED"),
+        )
+        return self._waiter.wait(_target)
+
     def create_agent_alias(self, agent_id: str, alias_name: str) -> Tuple[str, str]:
         """Creates an agent alias. This is required to use the agent as a sub-agent for
         multi-agent collaboration.
@@ -1080,6 +1500,8 @@ class AgentsForAmazonBedrock:
         sub_agent_arns: List[str] = None,
         dynamo_args: List[str] = None,
         verbose: bool = False,
+        dependency_files: List[str] = None,
+        lambda_profile: LambdaProfile = None,
     ) -> None:
         """Adds an action group to an existing agent, creates a Lambda function to
         implement that action group, and prepares the agent so it is ready to be
@@ -1094,6 +1516,8 @@ class AgentsForAmazonBedrock:
             agent_action_group_description (str): description of the agent action group
             additional_function_iam_policy (Dict, Optional): additional IAM policy to attach to the Lambda function
             sub_agent_arns (List[str], Optional): list of ARNs of sub-agents (if any) to permit the Lambda to invoke
+            dependency_files (List[str], Optional): additional local files to package with the source code
+            lambda_profile (LambdaProfile, Optional): deployment profile of the Lambda function
         """
 
         _agent_id = self.get_agent_id_by_name(agent_name)
@@ -1110,6 +1534,8 @@ class AgentsForAmazonBedrock:
                 additional_function_iam_policy=additional_function_iam_policy,
                 sub_agent_arns=sub_agent_arns,
                 dynamo_args=dynamo_args,
+                dependency_files=dependency_files,
+                lambda_profile=lambda_profile,
             )
 
         self.wait_agent_status_update(_agent_id)
@@ -1426,27 +1852,27 @@ class AgentsForAmazonBedrock:
         )
 
         if _agent_resp["ResponseMetadata"]["RetryAttempts"] > 0:
-            print(
-                colored(
-                    f"  ** invokeAgent boto3 retries executed: {_agent_resp['ResponseMetadata']['RetryAttempts']}",
-                    "red",
-                )
+            _trace_log.warning(
+                "  ** invokeAgent boto3 retries executed: %s",
+                _agent_resp["ResponseMetadata"]["RetryAttempts"],
+                extra={"color": "red"},
             )
 
         if enable_trace:
             if trace_level == "all":
-                print(f"invokeAgent API response object: {_agent_resp}")
+                _trace_log.info("invokeAgent API response object: %s", _agent_resp)
             else:
-                print(
-                    f"invokeAgent API request ID: {_agent_resp['ResponseMetadata']['RequestId']}"
+                _trace_log.info(
+                    "invokeAgent API request ID: %s",
+                    _agent_resp["ResponseMetadata"]["RequestId"],
                 )
-                print(f"invokeAgent API session ID: {session_id}")
+                _trace_log.info("invokeAgent API session ID: %s", session_id)
 
         # Return error message if invoke was unsuccessful
         if _agent_resp["ResponseMetadata"]["HTTPStatusCode"] != 200:
             _error_message = f"API Response was not 200: {_agent_resp}"
             if enable_trace and trace_level == "all":
-                print(_error_message)
+                _trace_log.info(_error_message)
             return _error_message
 
         _total_in_tokens = 0
@@ -1472,8 +1898,10 @@ class AgentsForAmazonBedrock:
                     _tmp_agent_answer = _data.decode("utf8")
                     if enable_trace and trace_level == "all":
                         # print(f"tmp answer: '{_tmp_agent_answer}', streaming: {stream_final_response}, trace: {enable_trace}")
-                        print(
-                            f"tmp answer: '{_tmp_agent_answer}', trace: {enable_trace}"
+                        _trace_log.info(
+                            "tmp answer: '%s', trace: %s",
+                            _tmp_agent_answer,
+                            enable_trace,
                         )
 
                     # continue to build up the full answer
@@ -1493,8 +1921,9 @@ class AgentsForAmazonBedrock:
                     # print all keys in _event["chunk"] dictionary if more than just 'bytes' provided
                     if enable_trace and trace_level == "all":
                         if len(_event["chunk"].keys()) > 1:
-                            print(
-                                f"chunk keys beyond just 'bytes': {list(_event['chunk'].keys())}"
+                            _trace_log.info(
+                                "chunk keys beyond just 'bytes': %s",
+                                list(_event["chunk"].keys()),
                             )
 
                     # remember the citations, if any are provided
@@ -1503,14 +1932,16 @@ class AgentsForAmazonBedrock:
                             _citations_event = copy.deepcopy(_event)
                             _citations = _event["chunk"]["attribution"]["citations"]
                             if enable_trace and trace_level == "all":
-                                print(colored(f"Citations: {_citations}", "blue"))
+                                _trace_log.info(
+                                    "Citations: %s", _citations, extra={"color": "blue"}
+                                )
 
                 elif "returnControl" in _event:
                     _agent_answer = _event["returnControl"]
 
                 if "trace" in _event and enable_trace:
                     if trace_level == "all":
-                        print("---")
+                        _trace_log.info("---")
                     else:
                         if "callerChain" in _event["trace"]:
                             if len(_event["trace"]["callerChain"]) > 1:
@@ -1528,13 +1959,15 @@ class AgentsForAmazonBedrock:
 
                         if "modelInvocationInput" in _route:
                             _orch_step += 1
-                            print(colored(f"---- Step {_orch_step} ----", "green"))
+                            _trace_log.info(
+                                "---- Step %s ----",
+                                _orch_step,
+                                extra={"color": "green"},
+                            )
                             _time_before_routing = datetime.datetime.now()
-                            print(
-                                colored(
-                                    "Classifying request to immediately route to one collaborator if possible.",
-                                    "blue",
-                                )
+                            _trace_log.info(
+                                "Classifying request to immediately route to one collaborator if possible.",
+                                extra={"color": "blue"},
                             )
 
                         if "modelInvocationOutput" in _route:
@@ -1563,40 +1996,36 @@ class AgentsForAmazonBedrock:
                             )
 
                             if _classification == UNDECIDABLE_CLASSIFICATION:
-                                print(
-                                    colored(
-                                        f"Routing classifier did not find a matching collaborator. Reverting to 'SUPERVISOR' mode.",
-                                        "magenta",
-                                    )
+                                _trace_log.info(
+                                    "Routing classifier did not find a matching collaborator. Reverting to 'SUPERVISOR' mode.",
+                                    extra={"color": "magenta"},
                                 )
                             elif _classification == "keep_previous_agent":
-                                print(
-                                    colored(
-                                        f"Continuing conversation with previous collaborator.",
-                                        "magenta",
-                                    )
+                                _trace_log.info(
+                                    "Continuing conversation with previous collaborator.",
+                                    extra={"color": "magenta"},
                                 )
                             else:
                                 _sub_agent_name = _classification
-                                print(
-                                    colored(
-                                        f"Routing classifier chose collaborator: '{_classification}'",
-                                        "magenta",
-                                    )
-                                )
-                            print(
-                                colored(
-                                    f"Routing classifier took {_route_duration.total_seconds():,.1f}s, using {_in_tokens+_out_tokens} tokens (in: {_in_tokens}, out: {_out_tokens}).\n",
-                                    "yellow",
+                                _trace_log.info(
+                                    "Routing classifier chose collaborator: '%s'",
+                                    _classification,
+                                    extra={"color": "magenta"},
                                 )
+                            _trace_log.info(
+                                "Routing classifier took %.1fs, using %s tokens (in: %s, out: %s).\n",
+                                _route_duration.total_seconds(),
+                                _in_tokens + _out_tokens,
+                                _in_tokens,
+                                _out_tokens,
+                                extra={"color": "yellow"},
                             )
 
                     if "failureTrace" in _event["trace"]["trace"]:
-                        print(
-                            colored(
-                                f"Agent error: {_event['trace']['trace']['failureTrace']['failureReason']}",
-                                "red",
-                            )
+                        _trace_log.warning(
+                            "Agent error: %s",
+                            _event["trace"]["trace"]["failureTrace"]["failureReason"],
+                            extra={"color": "red"},
                         )
 
                     if "orchestrationTrace" in _event["trace"]["trace"]:
@@ -1605,7 +2034,9 @@ class AgentsForAmazonBedrock:
                         if trace_level in ["core", "outline"]:
                             if "rationale" in _orch:
                                 _rationale = _orch["rationale"]
-                                print(colored(f"{_rationale['text']}", "blue"))
+                                _trace_log.info(
+                                    "%s", _rationale["text"], extra={"color": "blue"}
+                                )
 
                             if "invocationInput" in _orch:
                                 # NOTE: when agent determines invocations should happen in parallel
@@ -1614,29 +2045,30 @@ class AgentsForAmazonBedrock:
 
                                 if "actionGroupInvocationInput" in _input:
                                     if trace_level == "outline":
-                                        print(
-                                            colored(
-                                                f"Using tool: {_input['actionGroupInvocationInput']['function']}",
-                                                "magenta",
-                                            )
+                                        _trace_log.info(
+                                            "Using tool: %s",
+                                            _input["actionGroupInvocationInput"][
+                                                "function"
+                                            ],
+                                            extra={"color": "magenta"},
                                         )
                                     else:
                                         if (
                                             "function"
                                             not in _input["actionGroupInvocationInput"]
                                         ):
-                                            print(
-                                                colored(
-                                                    f"EXPECTING to capture 'Using tool', but 'function' not found\n{_input['actionGroupInvocationInput']}",
-                                                    "red",
-                                                )
+                                            _trace_log.warning(
+                                                "EXPECTING to capture 'Using tool', but 'function' not found\n%s",
+                                                _input["actionGroupInvocationInput"],
+                                                extra={"color": "red"},
                                             )
                                         else:
-                                            print(
-                                                colored(
-                                                    f"Using tool: {_input['actionGroupInvocationInput']['function']} with these inputs:",
-                                                    "magenta",
-                                                )
+                                            _trace_log.info(
+                                                "Using tool: %s with these inputs:",
+                                                _input["actionGroupInvocationInput"][
+                                                    "function"
+                                                ],
+                                                extra={"color": "magenta"},
                                             )
                                             if (
                                                 "parameters"
@@ -1655,25 +2087,25 @@ class AgentsForAmazonBedrock:
                                                     ]["parameters"][0]["name"]
                                                     == "input_text"
                                                 ):
-                                                    print(
-                                                        colored(
-                                                            f"{_input['actionGroupInvocationInput']['parameters'][0]['value']}",
-                                                            "magenta",
-                                                        )
+                                                    _trace_log.info(
+                                                        "%s",
+                                                        _input[
+                                                            "actionGroupInvocationInput"
+                                                        ]["parameters"][0]["value"],
+                                                        extra={"color": "magenta"},
                                                     )
                                                 else:
-                                                    print(
-                                                        colored(
-                                                            f"{_input['actionGroupInvocationInput']['parameters']}\n",
-                                                            "magenta",
-                                                        )
+                                                    _trace_log.info(
+                                                        "%s\n",
+                                                        _input[
+                                                            "actionGroupInvocationInput"
+                                                        ]["parameters"],
+                                                        extra={"color": "magenta"},
                                                     )
                                             else:
-                                                print(
-                                                    colored(
-                                                        f"    no input parameters being sent\n",
-                                                        "magenta",
-                                                    )
+                                                _trace_log.info(
+                                                    "    no input parameters being sent\n",
+                                                    extra={"color": "magenta"},
                                                 )
 
                                 elif "agentCollaboratorInvocationInput" in _input:
@@ -1690,32 +2122,32 @@ class AgentsForAmazonBedrock:
                                     _collab_ids = _collab_arn.split("/", 1)[1]
 
                                     if trace_level == "outline":
-                                        print(
-                                            colored(
-                                                f"Using sub-agent collaborator: '{_collab_name} [{_collab_ids}]'",
-                                                "magenta",
-                                            )
+                                        _trace_log.info(
+                                            "Using sub-agent collaborator: '%s [%s]'",
+                                            _collab_name,
+                                            _collab_ids,
+                                            extra={"color": "magenta"},
                                         )
                                     else:
-                                        print(
-                                            colored(
-                                                f"Using sub-agent collaborator: '{_collab_name} [{_collab_ids}]' passing input text:",
-                                                "magenta",
-                                            )
+                                        _trace_log.info(
+                                            "Using sub-agent collaborator: '%s [%s]' passing input text:",
+                                            _collab_name,
+                                            _collab_ids,
+                                            extra={"color": "magenta"},
                                         )
-                                        print(
-                                            colored(
-                                                f"{_collab_input_text[0:TRACE_TRUNCATION_LENGTH]}\n",
-                                                "magenta",
-                                            )
+                                        _trace_log.info(
+                                            "%s\n",
+                                            _collab_input_text[
+                                                0:TRACE_TRUNCATION_LENGTH
+                                            ],
+                                            extra={"color": "magenta"},
                                         )
 
                                 elif "codeInterpreterInvocationInput" in _input:
                                     if trace_level == "outline":
-                                        print(
-                                            colored(
-                                                f"Using code interpreter", "magenta"
-                                            )
+                                        _trace_log.info(
+                                            "Using code interpreter",
+                                            extra={"color": "magenta"},
                                         )
                                     else:
                                         console = Console()
@@ -1730,8 +2162,9 @@ class AgentsForAmazonBedrock:
 
                                 elif "knowledgeBaseLookupInput" in _input:
                                     if trace_level == "outline":
-                                        print(
-                                            colored(f"Using knowledge base", "magenta")
+                                        _trace_log.info(
+                                            "Using knowledge base",
+                                            extra={"color": "magenta"},
                                         )
                                     else:
                                         _kb_id = _input["knowledgeBaseLookupInput"][
@@ -1740,23 +2173,27 @@ class AgentsForAmazonBedrock:
                                         _kb_query = _input["knowledgeBaseLookupInput"][
                                             "text"
                                         ]
-                                        print(
-                                            colored(
-                                                f"Using knowledge base id: {_kb_id} to search for:",
-                                                "magenta",
-                                            )
+                                        _trace_log.info(
+                                            "Using knowledge base id: %s to search for:",
+                                            _kb_id,
+                                            extra={"color": "magenta"},
+                                        )
+                                        _trace_log.info(
+                                            "  %s\n",
+                                            _kb_query,
+                                            extra={"color": "magenta"},
                                         )
-                                        print(colored(f"  {_kb_query}\n", "magenta"))
 
                             if "observation" in _orch:
                                 if trace_level == "core":
                                     _output = _orch["observation"]
                                     if "actionGroupInvocationOutput" in _output:
-                                        print(
-                                            colored(
-                                                f"--tool outputs:\n{_output['actionGroupInvocationOutput']['text'][0:TRACE_TRUNCATION_LENGTH]}...\n",
-                                                "magenta",
-                                            )
+                                        _trace_log.info(
+                                            "--tool outputs:\n%s...\n",
+                                            _output["actionGroupInvocationOutput"][
+                                                "text"
+                                            ][0:TRACE_TRUNCATION_LENGTH],
+                                            extra={"color": "magenta"},
                                         )
 
                                     if "agentCollaboratorInvocationOutput" in _output:
@@ -1766,11 +2203,11 @@ class AgentsForAmazonBedrock:
                                         _collab_output_text = _output[
                                             "agentCollaboratorInvocationOutput"
                                         ]["output"]["text"][0:TRACE_TRUNCATION_LENGTH]
-                                        print(
-                                            colored(
-                                                f"\n----sub-agent {_collab_name} output text:\n{_collab_output_text}...\n",
-                                                "magenta",
-                                            )
+                                        _trace_log.info(
+                                            "\n----sub-agent %s output text:\n%s...\n",
+                                            _collab_name,
+                                            _collab_output_text,
+                                            extra={"color": "magenta"},
                                         )
 
                                     if "codeInterpreterInvocationOutput" in _output:
@@ -1783,11 +2220,10 @@ class AgentsForAmazonBedrock:
                                             _err = _output[
                                                 "codeInterpreterInvocationOutput"
                                             ]["executionError"]
-                                            print(
-                                                colored(
-                                                    f"--- Code interpreter execution ERROR:\n{_err}\n---\n",
-                                                    "red",
-                                                )
+                                            _trace_log.warning(
+                                                "--- Code interpreter execution ERROR:\n%s\n---\n",
+                                                _err,
+                                                extra={"color": "red"},
                                             )
                                         elif (
                                             "executionOutput"
@@ -1798,11 +2234,10 @@ class AgentsForAmazonBedrock:
                                             _output = _output[
                                                 "codeInterpreterInvocationOutput"
                                             ]["executionOutput"]
-                                            print(
-                                                colored(
-                                                    f"--- Code interpreter execution OUTPUT:\n{_output}\n---\n",
-                                                    "magenta",
-                                                )
+                                            _trace_log.info(
+                                                "--- Code interpreter execution OUTPUT:\n%s\n---\n",
+                                                _output,
+                                                extra={"color": "magenta"},
                                             )
 
                                     if "knowledgeBaseLookupOutput" in _output:
@@ -1810,43 +2245,51 @@ class AgentsForAmazonBedrock:
                                             "retrievedReferences"
                                         ]
                                         _ref_count = len(_refs)
-                                        print(
-                                            colored(
-                                                f"Knowledge base lookup output, {_ref_count} references:\n",
-                                                "magenta",
-                                            )
+                                        _trace_log.info(
+                                            "Knowledge base lookup output, %s references:\n",
+                                            _ref_count,
+                                            extra={"color": "magenta"},
                                         )
                                         _curr = 1
                                         for _ref in _refs:
-                                            print(
-                                                colored(
-                                                    f"  ({_curr}) {_ref['content']['text'][0:TRACE_TRUNCATION_LENGTH]}...\n",
-                                                    "magenta",
-                                                )
+                                            _trace_log.info(
+                                                "  (%s) %s...\n",
+                                                _curr,
+                                                _ref["content"]["text"][
+                                                    0:TRACE_TRUNCATION_LENGTH
+                                                ],
+                                                extra={"color": "magenta"},
                                             )
                                             _curr += 1
 
                                     if "finalResponse" in _output:
-                                        print(
-                                            colored(
-                                                f"Final response:\n{_output['finalResponse']['text'][0:TRACE_TRUNCATION_LENGTH]}...",
-                                                "cyan",
-                                            )
+                                        _trace_log.info(
+                                            "Final response:\n%s...",
+                                            _output["finalResponse"]["text"][
+                                                0:TRACE_TRUNCATION_LENGTH
+                                            ],
+                                            extra={"color": "cyan"},
                                         )
 
                         if "modelInvocationOutput" in _orch:
                             if _sub_agent_alias_id is not None:
                                 _sub_step += 1
-                                print(
-                                    colored(
-                                        f"---- Step {_orch_step}.{_sub_step} [using sub-agent name:{_sub_agent_name}, id:{_sub_agent_alias_id}] ----",
-                                        "green",
-                                    )
+                                _trace_log.info(
+                                    "---- Step %s.%s [using sub-agent name:%s, id:%s] ----",
+                                    _orch_step,
+                                    _sub_step,
+                                    _sub_agent_name,
+                                    _sub_agent_alias_id,
+                                    extra={"color": "green"},
                                 )
                             else:
                                 _orch_step += 1
                                 _sub_step = 0
-                                print(colored(f"---- Step {_orch_step} ----", "green"))
+                                _trace_log.info(
+                                    "---- Step %s ----",
+                                    _orch_step,
+                                    extra={"color": "green"},
+                                )
 
                             _total_llm_calls += 1
                             _orch_duration = (
@@ -1863,18 +2306,19 @@ class AgentsForAmazonBedrock:
                                 _out_tokens = _llm_usage["outputTokens"]
                                 _total_out_tokens += _out_tokens
 
-                                print(
-                                    colored(
-                                        f"Took {_orch_duration.total_seconds():,.1f}s, using {_in_tokens+_out_tokens} tokens (in: {_in_tokens}, out: {_out_tokens}) to complete prior action, observe, orchestrate.",
-                                        "yellow",
-                                    )
+                                _trace_log.info(
+                                    "Took %.1fs, using %s tokens (in: %s, out: %s) to complete prior action, observe, orchestrate.",
+                                    _orch_duration.total_seconds(),
+                                    _in_tokens + _out_tokens,
+                                    _in_tokens,
+                                    _out_tokens,
+                                    extra={"color": "yellow"},
                                 )
                             else:
-                                print(
-                                    colored(
-                                        f"Took {_orch_duration.total_seconds():,.1f}s [token count metadata was not returned] to complete prior action, observe, orchestrate.",
-                                        "yellow",
-                                    )
+                                _trace_log.info(
+                                    "Took %.1fs [token count metadata was not returned] to complete prior action, observe, orchestrate.",
+                                    _orch_duration.total_seconds(),
+                                    extra={"color": "yellow"},
                                 )
 
                             # restart the clock for next step/sub-step
@@ -1894,17 +2338,15 @@ class AgentsForAmazonBedrock:
 
                             _total_llm_calls += 1
 
-                            print(
-                                colored(
-                                    "Pre-processing trace, agent came up with an initial plan.",
-                                    "yellow",
-                                )
+                            _trace_log.info(
+                                "Pre-processing trace, agent came up with an initial plan.",
+                                extra={"color": "yellow"},
                             )
-                            print(
-                                colored(
-                                    f"Used LLM tokens, in: {_in_tokens}, out: {_out_tokens}",
-                                    "yellow",
-                                )
+                            _trace_log.info(
+                                "Used LLM tokens, in: %s, out: %s",
+                                _in_tokens,
+                                _out_tokens,
+                                extra={"color": "yellow"},
                             )
 
                     elif "postProcessingTrace" in _event["trace"]["trace"]:
@@ -1920,16 +2362,19 @@ class AgentsForAmazonBedrock:
                             _total_out_tokens += _out_tokens
 
                             _total_llm_calls += 1
-                            print(colored("Agent post-processing complete.", "yellow"))
-                            print(
-                                colored(
-                                    f"Used LLM tokens, in: {_in_tokens}, out: {_out_tokens}",
-                                    "yellow",
-                                )
+                            _trace_log.info(
+                                "Agent post-processing complete.",
+                                extra={"color": "yellow"},
+                            )
+                            _trace_log.info(
+                                "Used LLM tokens, in: %s, out: %s",
+                                _in_tokens,
+                                _out_tokens,
+                                extra={"color": "yellow"},
                             )
 
                     if trace_level == "all":
-                        print(json.dumps(_event["trace"], indent=2))
+                        _trace_log.info("%s", LazyJson(_event["trace"], indent=2))
 
                 if "files" in _event.keys() and enable_trace:
                     console = Console()
@@ -1938,7 +2383,7 @@ class AgentsForAmazonBedrock:
 
                     files_list = files_event["files"]
                     for this_file in files_list:
-                        print(f"{this_file['name']} ({this_file['type']})")
+                        _trace_log.info("%s (%s)", this_file["name"], this_file["type"])
                         file_bytes = this_file["bytes"]
 
                         # save bytes to file, given the name of file and the bytes
@@ -1954,18 +2399,19 @@ class AgentsForAmazonBedrock:
                 duration = datetime.datetime.now() - _time_before_call
 
                 if trace_level in ["core", "outline"]:
-                    print(
-                        colored(
-                            f"Agent made a total of {_total_llm_calls} LLM calls, "
-                            + f"using {_total_in_tokens+_total_out_tokens} tokens "
-                            + f"(in: {_total_in_tokens}, out: {_total_out_tokens})"
-                            + f", and took {duration.total_seconds():,.1f} total seconds",
-                            "yellow",
-                        )
+                    _trace_log.info(
+                        "Agent made a total of %s LLM calls, using %s tokens (in: %s, out: %s)"
+                        ", and took %.1f total seconds",
+                        _total_llm_calls,
+                        _total_in_tokens + _total_out_tokens,
+                        _total_in_tokens,
+                        _total_out_tokens,
+                        duration.total_seconds(),
+                        extra={"color": "yellow"},
                     )
 
                 if trace_level == "all":
-                    print(f"Returning agent answer as: {_agent_answer}")
+                    _trace_log.info("Returning agent answer as: %s", _agent_answer)
 
             # if stream_final_response and enable_trace and trace_level == "all":
             #     print(f"\nagent answer: ^^^{_agent_answer}^^^\n")
@@ -1977,12 +2423,14 @@ class AgentsForAmazonBedrock:
             return _agent_answer
 
         except Exception as e:
-            print(f"Caught exception while processing input to invokeAgent:\n")
-            print(f"  for input text:\n{request_params['inputText']}\n")
-            print(
-                f"  request ID: {_agent_resp['ResponseMetadata']['RequestId']}, retries: {_agent_resp['ResponseMetadata']['RetryAttempts']}\n"
+            _trace_log.info("Caught exception while processing input to invokeAgent:\n")
+            _trace_log.info("  for input text:\n%s\n", request_params["inputText"])
+            _trace_log.info(
+                "  request ID: %s, retries: %s\n",
+                _agent_resp["ResponseMetadata"]["RequestId"],
+                _agent_resp["ResponseMetadata"]["RetryAttempts"],
             )
-            print(f"Error: {e}")
+            _trace_log.info("Error: %s", e)
             raise Exception("Unexpected exception: ", e)
 
     def invoke(
@@ -1997,6 +2445,10 @@ class AgentsForAmazonBedrock:
         trace_level: str = "core",
         multi_agent_names: dict = {},
         stream_final_response: bool = False,
+        response_cache: AgentResponseCache = None,
+        cache_ttl_seconds: int = None,
+        metrics: dict = None,
+        routing_log: RoutingLog = None,
     ):
         """Invokes an agent with a given input text, while optional parameters
         also let you leverage an agent session, or target a specific agent alias.
@@ -2010,12 +2462,54 @@ class AgentsForAmazonBedrock:
             enable_trace (bool, optional): Whether to enable trace. Defaults to False.
             end_session (bool, optional): Whether to end the session. Defaults to False.
             trace_level (str, optional): The level of trace. Defaults to "none". Possible values are "none", "all", "core".
+            response_cache (AgentResponseCache, optional): Cache to answer repeated questions from. Defaults to None (no caching).
+            cache_ttl_seconds (int, optional): Lifetime of a newly cached answer. Defaults to the cache default TTL.
+            metrics (dict, optional): If given, filled in with the measurements of this call: cached, request_id,
+            retry_attempts, time_to_first_token_seconds (from the call, None without chunks), duration_seconds,
+            input_tokens, output_tokens and llm_calls. Defaults to None.
+            routing_log (RoutingLog, optional): If given, the routing classifier decision of a SUPERVISOR_ROUTER
+            agent is appended to it, to train a LearnedRouter from, at any trace_level. The trace is requested
+            for it even when enable_trace is False. Defaults to None.
 
         Returns:
             str: The answer from the agent.
         """
 
         _time_before_call = datetime.datetime.now()
+        if metrics is not None:
+            metrics.update(cached=False, time_to_first_token_seconds=None)
+
+        _cache_key = None
+        if response_cache is not None:
+            _cache_key = make_cache_key(
+                agent_id,
+                agent_alias_id,
+                input_text,
+                session_state.get("sessionAttributes"),
+            )
+            _cached = response_cache.get(_cache_key)
+            if _cached is not None:
+                if metrics is not None:
+                    metrics.update(
+                        cached=True,
+                        duration_seconds=(
+                            datetime.datetime.now() - _time_before_call
+                        ).total_seconds(),
+                    )
+                if enable_trace:
+                    _summary = _cached["trace_summary"]
+                    _trace_log.info(
+                        "Returning cached answer for agent id: %s, alias id: %s. "
+                        "Original run made %s LLM calls (in: %s, out: %s) and took %.1fs",
+                        agent_id,
+                        agent_alias_id,
+                        _summary.get("llm_calls", 0),
+                        _summary.get("input_tokens", 0),
+                        _summary.get("output_tokens", 0),
+                        _summary.get("duration_seconds", 0),
+                        extra={"color": "yellow"},
+                    )
+                return _cached["answer"]
 
         _agent_resp = self._bedrock_agent_runtime_client.invoke_agent(
             inputText=input_text,
@@ -2023,26 +2517,35 @@ class AgentsForAmazonBedrock:
             agentAliasId=agent_alias_id,
             sessionId=session_id,
             sessionState=session_state,
-            enableTrace=enable_trace,
+            # the routing classifier decision only comes with the trace
+            enableTrace=enable_trace or routing_log is not None,
             endSession=end_session,
             streamingConfigurations={"streamFinalResponse": stream_final_response},
         )
+        if metrics is not None:
+            metrics.update(
+                request_id=_agent_resp["ResponseMetadata"]["RequestId"],
+                retry_attempts=_agent_resp["ResponseMetadata"].get("RetryAttempts", 0),
+            )
 
         if enable_trace:
             if trace_level == "all":
-                print(f"invokeAgent API response object: {_agent_resp}")
+                _trace_log.info("invokeAgent API response object: %s", _agent_resp)
             else:
-                print(
-                    f"invokeAgent API request ID: {_agent_resp['ResponseMetadata']['RequestId']}"
+                _trace_log.info(
+                    "invokeAgent API request ID: %s",
+                    _agent_resp["ResponseMetadata"]["RequestId"],
+                )
+                _trace_log.info("invokeAgent API session ID: %s", session_id)
+                _trace_log.info(
+                    "  agent id: %s, agent alias id: %s", agent_id, agent_alias_id
                 )
-                print(f"invokeAgent API session ID: {session_id}")
-                print(f"  agent id: {agent_id}, agent alias id: {agent_alias_id}")
 
         # Return error message if invoke was unsuccessful
         if _agent_resp["ResponseMetadata"]["HTTPStatusCode"] != 200:
             _error_message = f"API Response was not 200: {_agent_resp}"
             if enable_trace and trace_level == "all":
-                print(_error_message)
+                _trace_log.info(_error_message)
             return _error_message
 
         _total_in_tokens = 0
@@ -2067,8 +2570,11 @@ class AgentsForAmazonBedrock:
                     _data = _event["chunk"]["bytes"]
                     _tmp_agent_answer = _data.decode("utf8")
                     if enable_trace and trace_level == "all":
-                        print(
-                            f"tmp answer: '{_tmp_agent_answer}', streaming: {stream_final_response}, trace: {enable_trace}"
+                        _trace_log.info(
+                            "tmp answer: '%s', streaming: %s, trace: %s",
+                            _tmp_agent_answer,
+                            stream_final_response,
+                            enable_trace,
                         )
 
                     # continue to build up the full answer
@@ -2078,12 +2584,15 @@ class AgentsForAmazonBedrock:
                         _time_to_first_token = (
                             datetime.datetime.now() - _overall_start_time
                         )
+                        if metrics is not None:
+                            metrics["time_to_first_token_seconds"] = (
+                                datetime.datetime.now() - _time_before_call
+                            ).total_seconds()
                         if enable_trace and stream_final_response:
-                            print(
-                                colored(
-                                    f"Time to first token: {_time_to_first_token.total_seconds():,.1f}s\n",
-                                    "yellow",
-                                )
+                            _trace_log.info(
+                                "Time to first token: %.1fs\n",
+                                _time_to_first_token.total_seconds(),
+                                extra={"color": "yellow"},
                             )
                     _num_response_chunks += 1
 
@@ -2092,18 +2601,19 @@ class AgentsForAmazonBedrock:
                         and stream_final_response
                         and _num_response_chunks < 3
                     ):
-                        print(
-                            colored(
-                                f"Answer chunk [{_num_response_chunks}]: {_tmp_agent_answer}",
-                                "blue",
-                            )
+                        _trace_log.info(
+                            "Answer chunk [%s]: %s",
+                            _num_response_chunks,
+                            _tmp_agent_answer,
+                            extra={"color": "blue"},
                         )
 
                     # print all keys in _event["chunk"] dictionary if more than just 'bytes' provided
                     if enable_trace and trace_level == "all":
                         if len(_event["chunk"].keys()) > 1:
-                            print(
-                                f"chunk keys beyond just 'bytes': {list(_event['chunk'].keys())}"
+                            _trace_log.info(
+                                "chunk keys beyond just 'bytes': %s",
+                                list(_event["chunk"].keys()),
                             )
 
                     # remember the citations, if any are provided
@@ -2112,11 +2622,95 @@ class AgentsForAmazonBedrock:
                             _citations_event = copy.deepcopy(_event)
                             _citations = _event["chunk"]["attribution"]["citations"]
                             if enable_trace and trace_level == "all":
-                                print(colored(f"Citations: {_citations}", "blue"))
+                                _trace_log.info(
+                                    "Citations: %s", _citations, extra={"color": "blue"}
+                                )
+
+                # routing decisions are parsed whatever the trace level, and without
+                # enable_trace when only routing_log asked for the trace
+                if (
+                    "trace" in _event
+                    and "routingClassifierTrace" in _event["trace"]["trace"]
+                ):
+                    _route = _event["trace"]["trace"]["routingClassifierTrace"]
+
+                    if "modelInvocationInput" in _route:
+                        _orch_step += 1
+                        _time_before_routing = datetime.datetime.now()
+                        if enable_trace:
+                            _trace_log.info(
+                                "---- Step %s ----",
+                                _orch_step,
+                                extra={"color": "green"},
+                            )
+                            _trace_log.info(
+                                "Classifying request to immediately route to one collaborator if possible.",
+                                extra={"color": "blue"},
+                            )
+
+                    if "modelInvocationOutput" in _route:
+                        _llm_usage = _route["modelInvocationOutput"]["metadata"][
+                            "usage"
+                        ]
+                        _in_tokens = _llm_usage.get("inputTokens", 0)
+                        _total_in_tokens += _in_tokens
+
+                        _out_tokens = _llm_usage["outputTokens"]
+                        _total_out_tokens += _out_tokens
+
+                        _total_llm_calls += 1
+                        _route_duration = datetime.datetime.now() - _time_before_routing
+
+                        _raw_resp_str = _route["modelInvocationOutput"]["rawResponse"][
+                            "content"
+                        ]
+                        _raw_resp = json.loads(_raw_resp_str)
+                        _classification = (
+                            _raw_resp["content"][0]["text"]
+                            .replace("<a>", "")
+                            .replace("</a>", "")
+                        )
+
+                        if _classification == UNDECIDABLE_CLASSIFICATION:
+                            _routing_message = "Routing classifier did not find a matching collaborator. Reverting to 'SUPERVISOR' mode."
+                        elif _classification == "keep_previous_agent":
+                            _routing_message = (
+                                "Continuing conversation with previous collaborator."
+                            )
+                            # # since we replaced the typical orchestration step with a simple routing
+                            # # classification, bump the step count.
+                            # _orch_step += 1
+                        else:
+                            _sub_agent_name = _classification
+                            _routing_message = f"Routing classifier chose collaborator: '{_classification}'"
+                            # # since we replaced the typical orchestration step with a simple routing
+                            # # classification, bump the step count.
+                            # _orch_step += 1
+                        if enable_trace:
+                            _trace_log.info(
+                                "%s", _routing_message, extra={"color": "magenta"}
+                            )
+                            _trace_log.info(
+                                "Routing classifier took %.1fs, using %s tokens (in: %s, out: %s).\n",
+                                _route_duration.total_seconds(),
+                                _in_tokens + _out_tokens,
+                                _in_tokens,
+                                _out_tokens,
+                                extra={"color": "yellow"},
+                            )
+                        if routing_log is not None:
+                            routing_log.append(
+                                input_text,
+                                _classification,
+                                supervisor=agent_id,
+                                duration_seconds=_route_duration.total_seconds(),
+                                input_tokens=_in_tokens,
+                                output_tokens=_out_tokens,
+                            )
 
                 if "trace" in _event and enable_trace:
                     if trace_level == "all":
-                        print("---")
+                        _trace_log.info("---")
                     else:
                         if "callerChain" in _event["trace"]:
                             if len(_event["trace"]["callerChain"]) > 1:
@@ -2135,86 +2729,11 @@ class AgentsForAmazonBedrock:
                         # else:
                         #     _sub_agent_name = "<collab-name-not-yet-provided>"
 
-                    if "routingClassifierTrace" in _event["trace"]["trace"]:
-                        _route = _event["trace"]["trace"]["routingClassifierTrace"]
-
-                        if "modelInvocationInput" in _route:
-                            _orch_step += 1
-                            print(colored(f"---- Step {_orch_step} ----", "green"))
-                            _time_before_routing = datetime.datetime.now()
-                            print(
-                                colored(
-                                    "Classifying request to immediately route to one collaborator if possible.",
-                                    "blue",
-                                )
-                            )
-
-                        if "modelInvocationOutput" in _route:
-                            _llm_usage = _route["modelInvocationOutput"]["metadata"][
-                                "usage"
-                            ]
-                            _in_tokens = _llm_usage.get("inputTokens", 0)
-                            _total_in_tokens += _in_tokens
-
-                            _out_tokens = _llm_usage["outputTokens"]
-                            _total_out_tokens += _out_tokens
-
-                            _total_llm_calls += 1
-                            _route_duration = (
-                                datetime.datetime.now() - _time_before_routing
-                            )
-
-                            _raw_resp_str = _route["modelInvocationOutput"][
-                                "rawResponse"
-                            ]["content"]
-                            _raw_resp = json.loads(_raw_resp_str)
-                            _classification = (
-                                _raw_resp["content"][0]["text"]
-                                .replace("<a>", "")
-                                .replace("</a>", "")
-                            )
-
-                            if _classification == UNDECIDABLE_CLASSIFICATION:
-                                print(
-                                    colored(
-                                        f"Routing classifier did not find a matching collaborator. Reverting to 'SUPERVISOR' mode.",
-                                        "magenta",
-                                    )
-                                )
-                            elif _classification == "keep_previous_agent":
-                                print(
-                                    colored(
-                                        f"Continuing conversation with previous collaborator.",
-                                        "magenta",
-                                    )
-                                )
-                                # # since we replaced the typical orchestration step with a simple routing
-                                # # classification, bump the step count.
-                                # _orch_step += 1
-                            else:
-                                _sub_agent_name = _classification
-                                print(
-                                    colored(
-                                        f"Routing classifier chose collaborator: '{_classification}'",
-                                        "magenta",
-                                    )
-                                )
-                                # # since we replaced the typical orchestration step with a simple routing
-                                # # classification, bump the step count.
-                                # _orch_step += 1
-                            print(
-                                colored(
-                                    f"Routing classifier took {_route_duration.total_seconds():,.1f}s, using {_in_tokens+_out_tokens} tokens (in: {_in_tokens}, out: {_out_tokens}).\n",
-                                    "yellow",
-                                )
-                            )
-
                     if "failureTrace" in _event["trace"]["trace"]:
-                        print(
-                            colored(
-                                f"Agent error: {_event['trace']['trace']['failureTrace']['failureReason']}",
-                                "red",
-                            )
+                        _trace_log.warning(
+                            "Agent error: %s",
+                            _event["trace"]["trace"]["failureTrace"]["failureReason"],
+                            extra={"color": "red"},
                         )
 
                     if "orchestrationTrace" in _event["trace"]["trace"]:
@@ -2223,7 +2742,9 @@ class AgentsForAmazonBedrock:
                         if trace_level in ["core", "outline"]:
                             if "rationale" in _orch:
                                 _rationale = _orch["rationale"]
-                                print(colored(f"{_rationale['text']}", "blue"))
+                                _trace_log.info(
+                                    "%s", _rationale["text"], extra={"color": "blue"}
+                                )
 
                             if "invocationInput" in _orch:
                                 # NOTE: when agent determines invocations should happen in parallel
@@ -2232,29 +2753,30 @@ class AgentsForAmazonBedrock:
 
                                 if "actionGroupInvocationInput" in _input:
                                     if trace_level == "outline":
-                                        print(
-                                            colored(
-                                                f"Using tool: {_input['actionGroupInvocationInput']['function']}",
-                                                "magenta",
-                                            )
+                                        _trace_log.info(
+                                            "Using tool: %s",
+                                            _input["actionGroupInvocationInput"][
+                                                "function"
+                                            ],
+                                            extra={"color": "magenta"},
                                         )
                                     else:
                                         if (
                                             "function"
                                             not in _input["actionGroupInvocationInput"]
                                         ):
-                                            print(
-                                                colored(
-                                                    f"EXPECTING to capture 'Using tool', but 'function' not found\n{_input['actionGroupInvocationInput']}",
-                                                    "red",
-                                                )
+                                            _trace_log.warning(
+                                                "EXPECTING to capture 'Using tool', but 'function' not found\n%s",
+                                                _input["actionGroupInvocationInput"],
+                                                extra={"color": "red"},
                                             )
                                         else:
-                                            print(
-                                                colored(
-                                                    f"Using tool: {_input['actionGroupInvocationInput']['function']} with these inputs:",
-                                                    "magenta",
-                                                )
+                                            _trace_log.info(
+                                                "Using tool: %s with these inputs:",
+                                                _input["actionGroupInvocationInput"][
+                                                    "function"
+                                                ],
+                                                extra={"color": "magenta"},
                                             )
                                             if (
                                                 "parameters"
@@ -2273,25 +2795,25 @@ class AgentsForAmazonBedrock:
                                                     ]["parameters"][0]["name"]
                                                     == "input_text"
                                                 ):
-                                                    print(
-                                                        colored(
-                                                            f"{_input['actionGroupInvocationInput']['parameters'][0]['value']}",
-                                                            "magenta",
-                                                        )
+                                                    _trace_log.info(
+                                                        "%s",
+                                                        _input[
+                                                            "actionGroupInvocationInput"
+                                                        ]["parameters"][0]["value"],
+                                                        extra={"color": "magenta"},
                                                     )
                                                 else:
-                                                    print(
-                                                        colored(
-                                                            f"{_input['actionGroupInvocationInput']['parameters']}\n",
-                                                            "magenta",
-                                                        )
+                                                    _trace_log.info(
+                                                        "%s\n",
+                                                        _input[
+                                                            "actionGroupInvocationInput"
+                                                        ]["parameters"],
+                                                        extra={"color": "magenta"},
                                                     )
                                             else:
-                                                print(
-                                                    colored(
-                                                        f"    no input parameters being sent\n",
-                                                        "magenta",
-                                                    )
+                                                _trace_log.info(
+                                                    "    no input parameters being sent\n",
+                                                    extra={"color": "magenta"},
                                                 )
 
                                 elif "agentCollaboratorInvocationInput" in _input:
@@ -2308,32 +2830,32 @@ class AgentsForAmazonBedrock:
                                     _collab_ids = _collab_arn.split("/", 1)[1]
 
                                     if trace_level == "outline":
-                                        print(
-                                            colored(
-                                                f"Using sub-agent collaborator: '{_collab_name} [{_collab_ids}]'",
-                                                "magenta",
-                                            )
+                                        _trace_log.info(
+                                            "Using sub-agent collaborator: '%s [%s]'",
+                                            _collab_name,
+                                            _collab_ids,
+                                            extra={"color": "magenta"},
                                         )
                                     else:
-                                        print(
-                                            colored(
-                                                f"Using sub-agent collaborator: '{_collab_name} [{_collab_ids}]' passing input text:",
-                                                "magenta",
-                                            )
+                                        _trace_log.info(
+                                            "Using sub-agent collaborator: '%s [%s]' passing input text:",
+                                            _collab_name,
+                                            _collab_ids,
+                                            extra={"color": "magenta"},
                                         )
-                                        print(
-                                            colored(
-                                                f"{_collab_input_text[0:TRACE_TRUNCATION_LENGTH]}\n",
-                                                "magenta",
-                                            )
+                                        _trace_log.info(
+                                            "%s\n",
+                                            _collab_input_text[
+                                                0:TRACE_TRUNCATION_LENGTH
+                                            ],
+                                            extra={"color": "magenta"},
                                         )
 
                                 elif "codeInterpreterInvocationInput" in _input:
                                     if trace_level == "outline":
-                                        print(
-                                            colored(
-                                                f"Using code interpreter", "magenta"
-                                            )
+                                        _trace_log.info(
+                                            "Using code interpreter",
+                                            extra={"color": "magenta"},
                                         )
                                     else:
                                         console = Console()
@@ -2348,8 +2870,9 @@ class AgentsForAmazonBedrock:
 
                                 elif "knowledgeBaseLookupInput" in _input:
                                     if trace_level == "outline":
-                                        print(
-                                            colored(f"Using knowledge base", "magenta")
+                                        _trace_log.info(
+                                            "Using knowledge base",
+                                            extra={"color": "magenta"},
                                         )
                                     else:
                                         _kb_id = _input["knowledgeBaseLookupInput"][
@@ -2358,23 +2881,27 @@ class AgentsForAmazonBedrock:
                                         _kb_query = _input["knowledgeBaseLookupInput"][
                                             "text"
                                         ]
-                                        print(
-                                            colored(
-                                                f"Using knowledge base id: {_kb_id} to search for:",
-                                                "magenta",
-                                            )
+                                        _trace_log.info(
+                                            "Using knowledge base id: %s to search for:",
+                                            _kb_id,
+                                            extra={"color": "magenta"},
+                                        )
+                                        _trace_log.info(
+                                            "  %s\n",
+                                            _kb_query,
+                                            extra={"color": "magenta"},
                                         )
-                                        print(colored(f"  {_kb_query}\n", "magenta"))
 
                             if "observation" in _orch:
                                 if trace_level == "core":
                                     _output = _orch["observation"]
                                     if "actionGroupInvocationOutput" in _output:
-                                        print(
-                                            colored(
-                                                f"--tool outputs:\n{_output['actionGroupInvocationOutput']['text'][0:TRACE_TRUNCATION_LENGTH]}...\n",
-                                                "magenta",
-                                            )
+                                        _trace_log.info(
+                                            "--tool outputs:\n%s...\n",
+                                            _output["actionGroupInvocationOutput"][
+                                                "text"
+                                            ][0:TRACE_TRUNCATION_LENGTH],
+                                            extra={"color": "magenta"},
                                         )
 
                                     if "agentCollaboratorInvocationOutput" in _output:
@@ -2384,11 +2911,11 @@ class AgentsForAmazonBedrock:
                                         _collab_output_text = _output[
                                             "agentCollaboratorInvocationOutput"
                                         ]["output"]["text"][0:TRACE_TRUNCATION_LENGTH]
-                                        print(
-                                            colored(
-                                                f"\n----sub-agent {_collab_name} output text:\n{_collab_output_text}...\n",
-                                                "magenta",
-                                            )
+                                        _trace_log.info(
+                                            "\n----sub-agent %s output text:\n%s...\n",
+                                            _collab_name,
+                                            _collab_output_text,
+                                            extra={"color": "magenta"},
                                         )
 
                                     if "knowledgeBaseLookupOutput" in _output:
@@ -2396,43 +2923,51 @@ class AgentsForAmazonBedrock:
                                             "retrievedReferences"
                                         ]
                                         _ref_count = len(_refs)
-                                        print(
-                                            colored(
-                                                f"Knowledge base lookup output, {_ref_count} references:\n",
-                                                "magenta",
-                                            )
+                                        _trace_log.info(
+                                            "Knowledge base lookup output, %s references:\n",
+                                            _ref_count,
+                                            extra={"color": "magenta"},
                                         )
                                         _curr = 1
                                         for _ref in _refs:
-                                            print(
-                                                colored(
-                                                    f"  ({_curr}) {_ref['content']['text'][0:TRACE_TRUNCATION_LENGTH]}...\n",
-                                                    "magenta",
-                                                )
+                                            _trace_log.info(
+                                                "  (%s) %s...\n",
+                                                _curr,
+                                                _ref["content"]["text"][
+                                                    0:TRACE_TRUNCATION_LENGTH
+                                                ],
+                                                extra={"color": "magenta"},
                                             )
                                             _curr += 1
 
                                     if "finalResponse" in _output:
-                                        print(
-                                            colored(
-                                                f"Final response:\n{_output['finalResponse']['text'][0:TRACE_TRUNCATION_LENGTH]}...",
-                                                "cyan",
-                                            )
+                                        _trace_log.info(
+                                            "Final response:\n%s...",
+                                            _output["finalResponse"]["text"][
+                                                0:TRACE_TRUNCATION_LENGTH
+                                            ],
+                                            extra={"color": "cyan"},
                                         )
 
                         if "modelInvocationOutput" in _orch:
                             if _sub_agent_alias_id is not None:
                                 _sub_step += 1
-                                print(
-                                    colored(
-                                        f"---- Step {_orch_step}.{_sub_step} [using sub-agent name:{_sub_agent_name}, id:{_sub_agent_alias_id}] ----",
-                                        "green",
-                                    )
+                                _trace_log.info(
+                                    "---- Step %s.%s [using sub-agent name:%s, id:%s] ----",
+                                    _orch_step,
+                                    _sub_step,
+                                    _sub_agent_name,
+                                    _sub_agent_alias_id,
+                                    extra={"color": "green"},
                                 )
                             else:
                                 _orch_step += 1
                                 _sub_step = 0
-                                print(colored(f"---- Step {_orch_step} ----", "green"))
+                                _trace_log.info(
+                                    "---- Step %s ----",
+                                    _orch_step,
+                                    extra={"color": "green"},
+                                )
 
                             _total_llm_calls += 1
                             _orch_duration = (
@@ -2449,18 +2984,19 @@ class AgentsForAmazonBedrock:
                                 _out_tokens = _llm_usage["outputTokens"]
                                 _total_out_tokens += _out_tokens
 
-                                print(
-                                    colored(
-                                        f"Took {_orch_duration.total_seconds():,.1f}s, using {_in_tokens+_out_tokens} tokens (in: {_in_tokens}, out: {_out_tokens}) to complete prior action, observe, orchestrate.",
-                                        "yellow",
-                                    )
+                                _trace_log.info(
+                                    "Took %.1fs, using %s tokens (in: %s, out: %s) to complete prior action, observe, orchestrate.",
+                                    _orch_duration.total_seconds(),
+                                    _in_tokens + _out_tokens,
+                                    _in_tokens,
+                                    _out_tokens,
+                                    extra={"color": "yellow"},
                                 )
                             else:
-                                print(
-                                    colored(
-                                        f"Took {_orch_duration.total_seconds():,.1f}s [token count metadata was not returned] to complete prior action, observe, orchestrate.",
-                                        "yellow",
-                                    )
+                                _trace_log.info(
+                                    "Took %.1fs [token count metadata was not returned] to complete prior action, observe, orchestrate.",
+                                    _orch_duration.total_seconds(),
+                                    extra={"color": "yellow"},
                                 )
 
                             # restart the clock for next step/sub-step
@@ -2480,17 +3016,15 @@ class AgentsForAmazonBedrock:
 
                             _total_llm_calls += 1
 
-                            print(
-                                colored(
-                                    "Pre-processing trace, agent came up with an initial plan.",
-                                    "yellow",
-                                )
+                            _trace_log.info(
+                                "Pre-processing trace, agent came up with an initial plan.",
+                                extra={"color": "yellow"},
                             )
-                            print(
-                                colored(
-                                    f"Used LLM tokens, in: {_in_tokens}, out: {_out_tokens}",
-                                    "yellow",
-                                )
+                            _trace_log.info(
+                                "Used LLM tokens, in: %s, out: %s",
+                                _in_tokens,
+                                _out_tokens,
+                                extra={"color": "yellow"},
                             )
 
                     elif "postProcessingTrace" in _event["trace"]["trace"]:
@@ -2506,16 +3040,19 @@ class AgentsForAmazonBedrock:
                             _total_out_tokens += _out_tokens
 
                             _total_llm_calls += 1
-                            print(colored("Agent post-processing complete.", "yellow"))
-                            print(
-                                colored(
-                                    f"Used LLM tokens, in: {_in_tokens}, out: {_out_tokens}",
-                                    "yellow",
-                                )
+                            _trace_log.info(
+                                "Agent post-processing complete.",
+                                extra={"color": "yellow"},
+                            )
+                            _trace_log.info(
+                                "Used LLM tokens, in: %s, out: %s",
+                                _in_tokens,
+                                _out_tokens,
+                                extra={"color": "yellow"},
                             )
 
                     if trace_level == "all":
-                        print(json.dumps(_event["trace"], indent=2))
+                        _trace_log.info("%s", LazyJson(_event["trace"], indent=2))
 
                 if "files" in _event.keys() and enable_trace:
                     console = Console()
@@ -2524,7 +3061,7 @@ class AgentsForAmazonBedrock:
 
                     files_list = files_event["files"]
                     for this_file in files_list:
-                        print(f"{this_file['name']} ({this_file['type']})")
+                        _trace_log.info("%s (%s)", this_file["name"], this_file["type"])
                         file_bytes = this_file["bytes"]
 
                         # save bytes to file, given the name of file and the bytes
@@ -2540,36 +3077,66 @@ class AgentsForAmazonBedrock:
                 duration = datetime.datetime.now() - _time_before_call
 
                 if trace_level in ["core", "outline"]:
-                    print(
-                        colored(
-                            f"Agent made a total of {_total_llm_calls} LLM calls, "
-                            + f"using {_total_in_tokens+_total_out_tokens} tokens "
-                            + f"(in: {_total_in_tokens}, out: {_total_out_tokens})"
-                            + f", and took {duration.total_seconds():,.1f} total seconds",
-                            "yellow",
-                        )
+                    _trace_log.info(
+                        "Agent made a total of %s LLM calls, using %s tokens (in: %s, out: %s)"
+                        ", and took %.1f total seconds",
+                        _total_llm_calls,
+                        _total_in_tokens + _total_out_tokens,
+                        _total_in_tokens,
+                        _total_out_tokens,
+                        duration.total_seconds(),
+                        extra={"color": "yellow"},
                     )
 
                 if trace_level == "all":
-                    print(f"Returning agent answer as: {_agent_answer}")
+                    _trace_log.info("Returning agent answer as: %s", _agent_answer)
 
             if stream_final_response and enable_trace and trace_level == "all":
-                print(f"\nagent answer: ^^^{_agent_answer}^^^\n")
+                _trace_log.info("\nagent answer: ^^^%s^^^\n", _agent_answer)
 
             _agent_answer = self._make_fully_cited_answer(
                 _agent_answer, _citations_event, enable_trace, trace_level
             )
 
+            if metrics is not None:
+                metrics.update(
+                    duration_seconds=(
+                        datetime.datetime.now() - _time_before_call
+                    ).total_seconds(),
+                    input_tokens=_total_in_tokens,
+                    output_tokens=_total_out_tokens,
+                    llm_calls=_total_llm_calls,
+                )
+
+            if _cache_key is not None and _agent_answer:
+                response_cache.put(
+                    _cache_key,
+                    _agent_answer,
+                    trace_summary={
+                        "llm_calls": _total_llm_calls,
+                        "input_tokens": _total_in_tokens,
+                        "output_tokens": _total_out_tokens,
+                        "duration_seconds": (
+                            datetime.datetime.now() - _time_before_call
+                        ).total_seconds(),
+                    },
+                    ttl_seconds=cache_ttl_seconds,
+                    agent_id=agent_id,
+                    agent_alias_id=agent_alias_id,
+                )
+
             return _agent_answer
 
         except Exception as e:
-            print(f"Caught exception while processing input to invokeAgent:\n")
-            print(f"  for input text:\n{input_text}\n")
-            print(f"  on agent: {agent_id}, alias: {agent_alias_id}")
-            print(
-                f"  request ID: {_agent_resp['ResponseMetadata']['RequestId']}, retries: {_agent_resp['ResponseMetadata']['RetryAttempts']}\n"
+            _trace_log.info("Caught exception while processing input to invokeAgent:\n")
+            _trace_log.info("  for input text:\n%s\n", input_text)
+            _trace_log.info("  on agent: %s, alias: %s", agent_id, agent_alias_id)
+            _trace_log.info(
+                "  request ID: %s, retries: %s\n",
+                _agent_resp["ResponseMetadata"]["RequestId"],
+                _agent_resp["ResponseMetadata"]["RetryAttempts"],
             )
-            print(f"Error: {e}")
+            _trace_log.info("Error: %s", e)
             raise Exception("Unexpected exception: ", e)
 
     def invoke_roc(
@@ -2650,7 +3217,7 @@ class AgentsForAmazonBedrock:
                 elif "returnControl" in _event:
                     _agent_answer = _event["returnControl"]
                 elif "trace" in _event:
-                    print(json.dumps(_event["trace"], indent=2))
+                    _trace_log.info("%s", LazyJson(_event["trace"], indent=2))
                 else:
                     raise Exception("unexpected event.", _event)
             return _agent_answer
@@ -2762,14 +3329,164 @@ class AgentsForAmazonBedrock:
         except self._dynamodb_client.exceptions.ResourceInUseException:
             print(f"Table {table_name} already exists, skipping table creation step")
 
-    def load_dynamodb(self, table_name: str, items: List):
-        try:
+    def get_dynamodb_key_attributes(self, table_name: str) -> List[str]:
+        """Returns the partition key name, followed by the sort key name if the table has one."""
+        _key_schema = self._dynamodb_client.describe_table(TableName=table_name)[
+            "Table"
+        ]["KeySchema"]
+        return [
+            _key["AttributeName"]
+            for _key in sorted(_key_schema, key=lambda _key: _key["KeyType"] != "HASH")
+        ]
 
-            table = self._dynamodb_resource.Table(table_name)
-            for item in items:
-                table.put_item(Item=item)
-        except self._dynamodb_client.exceptions.ResourceInUseException:
-            print(f"Error on loading process for table: {table_name}.")
+    def load_dynamodb(
+        self,
+        table_name: str,
+        items: List,
+        max_workers: int = DYNAMODB_MAX_WORKERS,
+        verbose: bool = False,
+    ) -> Dict:
+        """Loads items into a DynamoDB table with batch writes of 25 items spread over a thread pool.
+        Unprocessed items are retried with jittered exponential backoff.
+
+        Args:
+            table_name (str): Name of the table
+            items (List): Items as plain Python values, as for put_item. Keys must be unique within the input.
+            max_workers (int, optional): Number of concurrent batch writers. Defaults to DYNAMODB_MAX_WORKERS.
+            verbose (bool, optional): Whether to print a summary. Defaults to False.
+
+        Returns:
+            Dict: items written, batches sent, retries and consumed_capacity (write capacity units)
+        """
+        _serializer = TypeSerializer()
+        _batches = []
+        _batch = []
+        for _item in items:
+            _batch.append(
+                {
+                    "PutRequest": {
+                        "Item": {k: _serializer.serialize(v) for k, v in _item.items()}
+                    }
+                }
+            )
+            if len(_batch) == DYNAMODB_BATCH_SIZE:
+                _batches.append(_batch)
+                _batch = []
+        if _batch:
+            _batches.append(_batch)
+
+        def _write(batch: List[Dict]) -> Tuple[int, float]:
+            _request = {table_name: batch}
+            _retries = 0
+            _capacity = 0.0
+            while _request:
+                _resp = self._dynamodb_client.batch_write_item(
+                    RequestItems=_request, ReturnConsumedCapacity="TOTAL"
+                )
+                _capacity += sum(
+                    _c.get("CapacityUnits", 0.0)
+                    for _c in _resp.get("ConsumedCapacity", [])
+                )
+                _request = _resp.get("UnprocessedItems") or {}
+                if _request:
+                    if _retries >= DYNAMODB_MAX_RETRIES:
+                        raise RuntimeError(
+                            f"{len(_request[table_name])} items still unprocessed in {table_name} "
+                            + f"after {_retries} retries"
+                        )
+                    time.sleep(min(0.05 * 2**_retries, 5.0) * random.uniform(0.5, 1.5))
+                    _retries += 1
+            return _retries, _capacity
+
+        _summary = {
+            "items": sum(len(_b) for _b in _batches),
+            "batches": len(_batches),
+            "retries": 0,
+            "consumed_capacity": 0.0,
+        }
+        if not _batches:
+            return _summary
+
+        with ThreadPoolExecutor(
+            max_workers=min(max_workers, len(_batches))
+        ) as _executor:
+            for _retries, _capacity in _executor.map(_write, _batches):
+                _summary["retries"] += _retries
+                _summary["consumed_capacity"] += _capacity
+
+        if verbose:
+            print(f"Loaded {table_name}: {_summary}")
+        return _summary
+
+    @staticmethod
+    def _projection_args(projection: List[str]) -> Dict:
+        """Returns ProjectionExpression arguments, with placeholders so that reserved words are allowed."""
+        if not projection:
+            return {}
+        _names = {f"#p{_i}": _attr for _i, _attr in enumerate(projection)}
+        return {
+            "ProjectionExpression": ", ".join(_names),
+            "ExpressionAttributeNames": _names,
+        }
+
+    @staticmethod
+    def _add_capacity(capacity: Dict, resp: Dict) -> None:
+        if capacity is None:
+            return
+        capacity["pages"] = capacity.get("pages", 0) + 1
+        capacity["items"] = capacity.get("items", 0) + resp.get("Count", 0)
+        capacity["consumed_capacity"] = capacity.get(
+            "consumed_capacity", 0.0
+        ) + resp.get("ConsumedCapacity", {}).get("CapacityUnits", 0.0)
+
+    def iter_query_dynamodb(
+        self,
+        table_name: str,
+        pk_field: str,
+        pk_value: str,
+        sk_field: str = None,
+        sk_value: str = None,
+        projection: List[str] = None,
+        page_size: int = None,
+        capacity: Dict = None,
+    ):
+        """Queries a DynamoDB table, fetching result pages lazily as the caller iterates.
+
+        Args:
+            table_name (str): Name of the table
+            pk_field (str): Name of the partition key
+            pk_value (str): Partition key value to query
+            sk_field (str, optional): Name of the sort key. Defaults to None.
+            sk_value (str, optional): Sort key prefix to match. Defaults to None.
+            projection (List[str], optional): Attributes to return. Defaults to all attributes.
+            page_size (int, optional): Maximum number of items per page. Defaults to the DynamoDB 1 MB page.
+            capacity (Dict, optional): Updated in place with pages, items and consumed_capacity (read units).
+
+        Yields:
+            Dict: Items, one at a time
+        """
+        table = self._dynamodb_resource.Table(table_name)
+        if sk_field:
+            key_expression = Key(pk_field).eq(pk_value) & Key(sk_field).begins_with(
+                sk_value
+            )
+        else:
+            key_expression = Key(pk_field).eq(pk_value)
+
+        _kwargs = {
+            "KeyConditionExpression": key_expression,
+            "ReturnConsumedCapacity": "TOTAL",
+            **self._projection_args(projection),
+        }
+        if page_size is not None:
+            _kwargs["Limit"] = page_size
+        while True:
+            _resp = table.query(**_kwargs)
+            self._add_capacity(capacity, _resp)
+            yield from _resp["Items"]
+            if "LastEvaluatedKey" not in _resp:
+                return
+            _kwargs["ExclusiveStartKey"] = _resp["LastEvaluatedKey"]
 
     def query_dynamodb(
         self,
@@ -2778,52 +3495,230 @@ class AgentsForAmazonBedrock:
         pk_value: str,
         sk_field: str = None,
         sk_value: str = None,
+        projection: List[str] = None,
     ):
         try:
-
-            table = self._dynamodb_resource.Table(table_name)
-            # Create expression
-            if sk_field:
-                key_expression = Key(pk_field).eq(pk_value) & Key(sk_field).begins_with(
-                    sk_value
+            # read every page, not only the first 1 MB of results
+            return list(
+                self.iter_query_dynamodb(
+                    table_name,
+                    pk_field,
+                    pk_value,
+                    sk_field,
+                    sk_value,
+                    projection=projection,
                 )
-            else:
-                key_expression = Key(pk_field).eq(pk_value)
-
-            query_data = table.query(KeyConditionExpression=key_expression)
-            return query_data["Items"]
+            )
         except self._dynamodb_client.exceptions.ResourceInUseException:
             print(f"Error querying table: {table_name}.")
 
-    def create_lambda_file(self, func: Callable, output_dir: str = ".") -> str:
+    def scan_dynamodb(
+        self,
+        table_name: str,
+        projection: List[str] = None,
+        segments: int = 1,
+        filter_expression: str = None,
+        expression_values: Dict = None,
+        page_size: int = None,
+        capacity: Dict = None,
+        expression_names: Dict[str, str] = None,
+    ):
+        """Scans a DynamoDB table page by page, optionally with parallel scan segments.
+
+        Args:
+            table_name (str): Name of the table
+            projection (List[str], optional): Attributes to return. Defaults to all attributes.
+            segments (int, optional): Number of segments scanned concurrently. Defaults to 1.
+            filter_expression (str, optional): FilterExpression, e.g. "updated_at > :since". Defaults to None.
+            expression_values (Dict, optional): Plain Python values of the filter placeholders. Defaults to None.
+            page_size (int, optional): Maximum number of items evaluated per page. Defaults to the DynamoDB 1 MB page.
+            capacity (Dict, optional): Updated in place with pages, items and consumed_capacity (read units).
+            expression_names (Dict[str, str], optional): Attribute name placeholders used in the filter. Defaults to None.
+
+        Yields:
+            Dict: Items as plain Python values, in the order their pages arrive
+        """
+        _serializer = TypeSerializer()
+        _deserializer = TypeDeserializer()
+        _base_kwargs = {
+            "TableName": table_name,
+            "ReturnConsumedCapacity": "TOTAL",
+            **self._projection_args(projection),
+        }
+        if filter_expression is not None:
+            _base_kwargs["FilterExpression"] = filter_expression
+        if expression_names:
+            _base_kwargs["ExpressionAttributeNames"] = {
+                **_base_kwargs.get("ExpressionAttributeNames", {}),
+                **expression_names,
+            }
+        if expression_values:
+            _base_kwargs["ExpressionAttributeValues"] = {
+                k: _serializer.serialize(v) for k, v in expression_values.items()
+            }
+        if page_size is not None:
+            _base_kwargs["Limit"] = page_size
+
+        def _pages(segment: int):
+            _kwargs = dict(_base_kwargs)
+            if segments > 1:
+                _kwargs.update(Segment=segment, TotalSegments=segments)
+            while True:
+                _resp = self._dynamodb_client.scan(**_kwargs)
+                yield _resp
+                if "LastEvaluatedKey" not in _resp:
+                    return
+                _kwargs["ExclusiveStartKey"] = _resp["LastEvaluatedKey"]
+
+        def _deserialize(resp: Dict):
+            self._add_capacity(capacity, resp)
+            for _item in resp["Items"]:
+                yield {k: _deserializer.deserialize(v) for k, v in _item.items()}
+
+        if segments <= 1:
+            for _resp in _pages(0):
+                yield from _deserialize(_resp)
+            return
+
+        # each segment pushes its pages into a bounded queue, so memory stays flat while the caller iterates
+        _queue = queue.Queue(maxsize=segments * 2)
+        _done = object()
+        _stop = threading.Event()
+
+        def _put(value) -> None:
+            while not _stop.is_set():
+                try:
+                    _queue.put(value, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def _scan_segment(segment: int) -> None:
+            try:
+                for _resp in _pages(segment):
+                    if _stop.is_set():
+                        return
+                    _put(_resp)
+            except Exception as e:
+                _put(e)
+            finally:
+                _put(_done)
+
+        with ThreadPoolExecutor(max_workers=segments) as _executor:
+            for _segment in range(segments):
+                _executor.submit(_scan_segment, _segment)
+            try:
+                _remaining = segments
+                while _remaining:
+                    _resp = _queue.get()
+                    if _resp is _done:
+                        _remaining -= 1
+                    elif isinstance(_resp, Exception):
+                        raise _resp
+                    else:
+                        yield from _deserialize(_resp)
+            finally:
+                # lets the segment threads exit if the caller stops iterating early
+                _stop.set()
+
+    def create_memo_table(self, table_name: str) -> None:
+        """Creates the DynamoDB table shared by memoized tool Lambdas, with TTL expiry enabled.
+
+        Pass dynamo_args=[table_name, MEMO_TABLE_PK, MEMO_TABLE_SK] when adding the action group, so that
+        the Lambda role can access the table and the handler finds it in its environment.
+
+        Args:
+            table_name (str): Name of the table
+        """
+        self.create_dynamodb(table_name, MEMO_TABLE_PK, MEMO_TABLE_SK)
+        try:
+            self._dynamodb_client.update_time_to_live(
+                TableName=table_name,
+                TimeToLiveSpecification={
+                    "Enabled": True,
+                    "AttributeName": MEMO_TABLE_TTL_ATTRIBUTE,
+                },
+            )
+        except self._dynamodb_client.exceptions.ClientError as e:
+            # raised when TTL is already enabled on the table
+            print(f"TTL not updated for table {table_name}: {e}")
+
+    def create_lambda_file(
+        self,
+        func: Callable,
+        output_dir: str = ".",
+        memoize: bool = False,
+        memo_max_entries: int = MEMO_MAX_ENTRIES,
+        memo_ttl_seconds: int = MEMO_TTL_SECONDS,
+        memo_dynamodb: bool = False,
+    ) -> str:
         """
         Creates a Lambda function file that wraps the given function with the necessary handler code.
 
         Args:
             func: The function to wrap
             output_dir: Directory where the Lambda file should be created
+            memoize: Whether to cache results, see create_multi_function_lambda_file()
+            memo_max_entries: Size of the in-container result cache
+            memo_ttl_seconds: Lifetime of cached results
+            memo_dynamodb: Whether to also share results through the DynamoDB table of the function
 
         Returns:
             str: Path to the created Lambda file
         """
-        # Get the function's source code
-        func_source = inspect.getsource(func)
+        return self.create_multi_function_lambda_file(
+            [func],
+            output_dir,
+            f"lambda_{func.__name__}.py",
+            memoize=memoize,
+            memo_max_entries=memo_max_entries,
+            memo_ttl_seconds=memo_ttl_seconds,
+            memo_dynamodb=memo_dynamodb,
+        )
 
-        # Get the function's name
-        func_name = func.__name__
+    def create_multi_function_lambda_file(
+        self,
+        funcs: List[Callable],
+        output_dir: str = ".",
+        file_name: str = None,
+        memoize: bool = False,
+        memo_max_entries: int = MEMO_MAX_ENTRIES,
+        memo_ttl_seconds: int = MEMO_TTL_SECONDS,
+        memo_dynamodb: bool = False,
+    ) -> str:
+        """
+        Creates a single Lambda function file that serves several functions of one action group.
+        The dispatch table and the parameter names of each function are computed once, when the
+        container starts, so that each invocation is a dictionary lookup.
+
+        With memoize, results are cached per function name and canonicalized parameters in an
+        in-container LRU, and optionally in a DynamoDB table with TTL expiry (see create_memo_table()).
+        Hit and miss counters are returned in the tool_memo session attribute for tracing.
+
+        Args:
+            funcs: The functions to wrap. Their names must be unique.
+            output_dir: Directory where the Lambda file should be created
+            file_name: Name of the Lambda file. Defaults to lambda_<first function>_group.py
+            memoize: Whether to cache results. Only use it for functions without side effects.
+            memo_max_entries: Size of the in-container result cache
+            memo_ttl_seconds: Lifetime of cached results
+            memo_dynamodb: Whether to also share results through the DynamoDB table named by the
+            dynamodb_table environment variable of the function
+
+        Returns:
+            str: Path to the created Lambda file
+        """
+        _func_names = [_func.__name__ for _func in funcs]
+        if not funcs:
+            raise ValueError("At least one function is required")
+        if len(set(_func_names)) != len(_func_names):
+            raise ValueError(f"Function names must be unique: {_func_names}")
 
         lambda_code = [
             "import json",
             "import inspect",
             "from typing import Any, Dict",
             "",
-            "def get_named_parameter(event: Dict[str, Any], name: str) -> Any:",
-            '    """Extract a named parameter from the event object."""',
-            "    if 'parameters' in event:",
-            "        return next(item for item in event['parameters'] if item['name'] == name)['value']",
-            "    else:",
-            "        return None",
-            "",
             "def populate_function_response(event: Dict[str, Any], response_body: Any) -> Dict[str, Any]:",
             '    """Create the response structure expected by the agent."""',
             "    return {",
@@ -2838,50 +3733,164 @@ class AgentsForAmazonBedrock:
             "        }",
             "    }",
             "",
-            func_source,
+        ]
+        if memoize:
+            lambda_code += self._memoization_code(
+                memo_max_entries, memo_ttl_seconds, memo_dynamodb
+            )
+        for _func in funcs:
+            lambda_code += [inspect.getsource(_func), ""]
+
+        lambda_code += [
+            "# Built once per container: function name -> (function, parameter names, required parameter names)",
+            "_DISPATCH = {}",
+            f"for _function in [{', '.join(_func_names)}]:",
+            "    _parameters = inspect.signature(_function).parameters",
+            "    _DISPATCH[_function.__name__] = (",
+            "        _function,",
+            "        tuple(_parameters),",
+            "        frozenset(",
+            "            _name for _name, _param in _parameters.items()",
+            "            if _param.default is inspect.Parameter.empty",
+            "        ),",
+            "    )",
             "",
             "def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:",
             '    """',
-            "    AWS Lambda handler that wraps the main function.",
+            "    AWS Lambda handler that dispatches to the requested function.",
             "    Extracts parameters from the event and formats the response.",
             '    """',
             '    print(f"Received event: {event}")',
             "",
-            f"    function = event['function']",
-            f"    if function == '{func_name}':",
-            "        # Get parameters from the event",
-            "        params = {}",
-            f"        for param_name in inspect.signature({func_name}).parameters:",
-            "            param_value = get_named_parameter(event, param_name)",
-            "            if param_value is None:",
-            "                # Check session state if parameter not found",
-            "                session_state = event.get('sessionAttributes', {})",
-            "                if session_state and param_name in session_state:",
-            "                    param_value = session_state[param_name]",
-            "                else:",
-            '                    result = f"Missing required parameter: {param_name}"',
-            "                    return populate_function_response(event, result)",
-            "            params[param_name] = param_value",
-            "",
-            "        try:",
-            "            # Call the function with extracted parameters",
-            f"            result = {func_name}(**params)",
-            "            return populate_function_response(event, result)",
-            "        except Exception as e:",
-            f'            error_message = f"Error executing {func_name}: {{str(e)}}"',
-            "            print(error_message)",
-            "            return populate_function_response(event, error_message)",
-            "    else:",
+            "    function = event['function']",
+            "    entry = _DISPATCH.get(function)",
+            "    if entry is None:",
             "        result = f\"Error: Function '{function}' not recognized\"",
             "        return populate_function_response(event, result)",
+            "    func, param_names, required = entry",
+            "",
+            "    # Parameters sent by the agent, falling back to session state",
+            "    event_params = {item['name']: item['value'] for item in event.get('parameters') or []}",
+            "    session_state = event.get('sessionAttributes') or {}",
+            "    params = {}",
+            "    for param_name in param_names:",
+            "        if param_name in event_params:",
+            "            params[param_name] = event_params[param_name]",
+            "        elif param_name in session_state:",
+            "            params[param_name] = session_state[param_name]",
+            "        elif param_name in required:",
+            '            result = f"Missing required parameter: {param_name}"',
+            "            return populate_function_response(event, result)",
+            "",
+            "    try:",
+            "        # Call the function with extracted parameters",
+        ]
+        if memoize:
+            lambda_code += [
+                "        result = memoized_call(function, params, lambda: func(**params))",
+                "        return add_memo_stats(event, populate_function_response(event, result))",
+            ]
+        else:
+            lambda_code += [
+                "        result = func(**params)",
+                "        return populate_function_response(event, result)",
+            ]
+        lambda_code += [
+            "    except Exception as e:",
+            '        error_message = f"Error executing {function}: {str(e)}"',
+            "        print(error_message)",
+            "        return populate_function_response(event, error_message)",
         ]
 
         # Create output directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
 
         # Create the Lambda file
-        file_path = os.path.join(output_dir, f"lambda_{func_name}.py")
+        if file_name is None:
+            file_name = f"lambda_{_func_names[0]}_group.py"
+        file_path = os.path.join(output_dir, file_name)
         with open(file_path, "w") as f:
             f.write("\n".join(lambda_code))
 
         return file_path
+
+    @staticmethod
+    def _memoization_code(
+        max_entries: int, ttl_seconds: int, use_dynamodb: bool
+    ) -> List[str]:
+        """Returns the generated code of the result cache used by memoized tool Lambdas."""
+        return [
+            "import hashlib",
+            "import os",
+            "import time",
+            "from collections import OrderedDict",
+            "",
+            f"_MEMO_MAX_ENTRIES = {int(max_entries)}",
+            f"_MEMO_TTL_SECONDS = {int(ttl_seconds)}",
+            f"_MEMO_TABLE_NAME = os.environ.get('dynamodb_table') if {bool(use_dynamodb)} else None",
+            "_MEMO_CACHE = OrderedDict()  # cache key -> (expires at, result)",
+            "_MEMO_STATS = {'hits': 0, 'misses': 0, 'table_hits': 0}",
+            "_memo_table = None",
+            "",
+            "def _get_memo_table():",
+            "    global _memo_table",
+            "    if _memo_table is None and _MEMO_TABLE_NAME:",
+            "        import boto3",
+            "        _memo_table = boto3.resource('dynamodb').Table(_MEMO_TABLE_NAME)",
+            "    return _memo_table",
+            "",
+            "def _memo_remember(key: str, result: str, expires_at: float) -> None:",
+            "    _MEMO_CACHE[key] = (expires_at, result)",
+            "    _MEMO_CACHE.move_to_end(key)",
+            "    while len(_MEMO_CACHE) > _MEMO_MAX_ENTRIES:",
+            "        _MEMO_CACHE.popitem(last=False)",
+            "",
+            "def memoized_call(function_name: str, params: Dict[str, Any], compute) -> str:",
+            '    """Returns the cached result for these parameters, or computes and caches it."""',
+            "    canonical = json.dumps([function_name, params], sort_keys=True, default=str)",
+            "    key = hashlib.sha256(canonical.encode('utf-8')).hexdigest()",
+            "    now = time.time()",
+            "",
+            "    entry = _MEMO_CACHE.get(key)",
+            "    if entry is not None and entry[0] > now:",
+            "        _MEMO_CACHE.move_to_end(key)",
+            "        _MEMO_STATS['hits'] += 1",
+            "        return entry[1]",
+            "",
+            "    table = _get_memo_table()",
+            "    if table is not None:",
+            "        try:",
+            f"            item = table.get_item(Key={{'{MEMO_TABLE_PK}': key, '{MEMO_TABLE_SK}': function_name}}).get('Item')",
+            f"            if item is not None and float(item['{MEMO_TABLE_TTL_ATTRIBUTE}']) > now:",
+            "                _MEMO_STATS['hits'] += 1",
+            "                _MEMO_STATS['table_hits'] += 1",
+            f"                _memo_remember(key, item['result'], float(item['{MEMO_TABLE_TTL_ATTRIBUTE}']))",
+            "                return item['result']",
+            "        except Exception as e:",
+            '            print(f"Memo table lookup failed: {e}")',
+            "",
+            "    _MEMO_STATS['misses'] += 1",
+            "    result = str(compute())",
+            "    expires_at = now + _MEMO_TTL_SECONDS",
+            "    _memo_remember(key, result, expires_at)",
+            "    if table is not None:",
+            "        try:",
+            "            table.put_item(Item={",
+            f"                '{MEMO_TABLE_PK}': key,",
+            f"                '{MEMO_TABLE_SK}': function_name,",
+            "                'result': result,",
+            f"                '{MEMO_TABLE_TTL_ATTRIBUTE}': int(expires_at),",
+            "            })",
+            "        except Exception as e:",
+            '            print(f"Memo table write failed: {e}")',
+            "    return result",
+            "",
+            "def add_memo_stats(event: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:",
+            '    """Returns the cache counters of this container in the tool_memo session attribute."""',
+            "    session_attributes = dict(event.get('sessionAttributes') or {})",
+            "    session_attributes['tool_memo'] = json.dumps(_MEMO_STATS)",
+            "    response['sessionAttributes'] = session_attributes",
+            '    print(f"Memo stats: {_MEMO_STATS}")',
+            "    return response",
+            "",
+        ]
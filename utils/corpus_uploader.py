@@ -0,0 +1,249 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+This module contains a bulk uploader for Knowledge Base source documents.
+The CorpusUploader class walks a directory (or takes any iterable of files), filters it with
+glob include / exclude rules, and uploads the files on a thread pool, each one through the S3
+managed transfer so that large documents are sent as concurrent multipart uploads. The SHA-256
+of every file is stored in the object metadata, and files whose remote hash matches are skipped,
+so that repeated pushes only send what changed.
+"""
+
+import fnmatch
+import hashlib
+import mimetypes
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Set, Tuple, Union
+
+DEFAULT_UPLOAD_MAX_WORKERS = 16
+CONTENT_HASH_METADATA_KEY = "content-sha256"
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    """Returns the hex SHA-256 of a file, read in chunks."""
+    _hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for _chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            _hash.update(_chunk)
+    return _hash.hexdigest()
+
+
+def matches_rules(
+    relative_path: str, include: List[str] = None, exclude: List[str] = None
+) -> bool:
+    """Returns True if a path matches one of the include globs and none of the exclude globs.
+
+    Globs are matched against the forward-slash relative path with fnmatch, so "*" also spans
+    directories ("*.pdf" matches "docs/a/b.pdf") and "docs/*" matches everything under docs/.
+    """
+    if include and not any(
+        fnmatch.fnmatchcase(relative_path, _pattern) for _pattern in include
+    ):
+        return False
+    return not any(
+        fnmatch.fnmatchcase(relative_path, _pattern) for _pattern in exclude or []
+    )
+
+
+def collect_files(
+    path_or_iterable: Union[str, Iterable],
+    include: List[str] = None,
+    exclude: List[str] = None,
+) -> List[Tuple[str, str]]:
+    """Lists the files of a corpus together with their relative keys.
+
+    Args:
+        path_or_iterable (Union[str, Iterable]): A directory, a single file, or an iterable of file paths
+        or of (file path, relative key) tuples. Plain paths are keyed relative to their common directory.
+        include (List[str], optional): Globs a relative key must match. Defaults to every file.
+        exclude (List[str], optional): Globs a relative key must not match. Defaults to None.
+
+    Returns:
+        List[Tuple[str, str]]: (file path, relative key) pairs, sorted by key
+    """
+    _pairs = []
+    if isinstance(path_or_iterable, (str, os.PathLike)) and os.path.isdir(
+        path_or_iterable
+    ):
+        _root = os.fspath(path_or_iterable)
+        for _dir, _subdirs, _files in os.walk(_root):
+            _subdirs.sort()
+            for _file in _files:
+                _path = os.path.join(_dir, _file)
+                _pairs.append((_path, os.path.relpath(_path, _root)))
+    else:
+        if isinstance(path_or_iterable, (str, os.PathLike)):
+            path_or_iterable = [path_or_iterable]
+        _plain = []
+        for _entry in path_or_iterable:
+            if isinstance(_entry, tuple):
+                _pairs.append(_entry)
+            else:
+                _plain.append(os.fspath(_entry))
+        if _plain:
+            _root = os.path.commonpath([os.path.abspath(_path) for _path in _plain])
+            if len(_plain) == 1:
+                _root = os.path.dirname(_root)
+            for _path in _plain:
+                _pairs.append((_path, os.path.relpath(os.path.abspath(_path), _root)))
+
+    _selected = {}
+    for _path, _key in _pairs:
+        _key = _key.replace(os.sep, "/")
+        if matches_rules(_key, include, exclude):
+            _selected[_key] = _path
+    return sorted(
+        ((_path, _key) for _key, _path in _selected.items()), key=lambda _p: _p[1]
+    )
+
+
+class CorpusUploadReport:
+    """Outcome of one upload_corpus call."""
+
+    def __init__(self):
+        self.changed_keys: Set[str] = set()
+        self.skipped_keys: Set[str] = set()
+        self.failed: Dict[str, str] = {}
+        self.bytes_uploaded = 0
+        self.bytes_skipped = 0
+        self.elapsed_seconds = 0.0
+
+    @property
+    def throughput_mb_per_second(self) -> float:
+        if self.elapsed_seconds <= 0:
+            return 0.0
+        return self.bytes_uploaded / self.elapsed_seconds / (1024 * 1024)
+
+    @property
+    def files_per_second(self) -> float:
+        if self.elapsed_seconds <= 0:
+            return 0.0
+        return len(self.changed_keys) / self.elapsed_seconds
+
+    def summary(self) -> str:
+        return (
+            f"uploaded {len(self.changed_keys)} files "
+            f"({self.bytes_uploaded / (1024 * 1024):.1f} MB), "
+            f"skipped {len(self.skipped_keys)} unchanged, "
+            f"{len(self.failed)} failed in {self.elapsed_seconds:.1f}s "
+            f"({self.throughput_mb_per_second:.2f} MB/s, {self.files_per_second:.1f} files/s)"
+        )
+
+
+class CorpusUploader:
+    """Uploads a document corpus to S3 concurrently, skipping files that did not change."""
+
+    def __init__(
+        self,
+        s3_client,
+        bucket_name: str,
+        prefix: str = "",
+        max_workers: int = DEFAULT_UPLOAD_MAX_WORKERS,
+        transfer_config=None,
+        verbose: bool = False,
+    ):
+        """Constructs an instance.
+
+        Args:
+            s3_client: boto3 S3 client, with a connection pool at least as large as the number of concurrent requests
+            bucket_name (str): Destination bucket
+            prefix (str, optional): Key prefix of the corpus in the bucket. Defaults to "".
+            max_workers (int, optional): Number of files uploaded concurrently. Defaults to DEFAULT_UPLOAD_MAX_WORKERS.
+            transfer_config (boto3.s3.transfer.TransferConfig, optional): Multipart threshold, chunk size and
+            per-file concurrency. Defaults to the boto3 defaults.
+            verbose (bool, optional): Print one line per uploaded file. Defaults to False.
+        """
+        self._s3_client = s3_client
+        self._bucket_name = bucket_name
+        self._prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self._max_workers = max_workers
+        self._transfer_config = transfer_config
+        self._verbose = verbose
+
+    def _remote_objects(self) -> Dict[str, int]:
+        """Returns the size of every object under the prefix, keyed by object key."""
+        _sizes = {}
+        _paginator = self._s3_client.get_paginator("list_objects_v2")
+        for _page in _paginator.paginate(Bucket=self._bucket_name, Prefix=self._prefix):
+            for _obj in _page.get("Contents", []):
+                _sizes[_obj["Key"]] = _obj["Size"]
+        return _sizes
+
+    def _remote_hash(self, key: str) -> str:
+        try:
+            _resp = self._s3_client.head_object(Bucket=self._bucket_name, Key=key)
+        except self._s3_client.exceptions.ClientError:
+            return None
+        return _resp.get("Metadata", {}).get(CONTENT_HASH_METADATA_KEY)
+
+    def _upload_one(self, path: str, key: str, remote_size: int) -> Tuple[str, int]:
+        _size = os.path.getsize(path)
+        _hash = file_sha256(path)
+        # listing gives sizes for free, so only objects of the same size need a HEAD
+        if remote_size == _size and self._remote_hash(key) == _hash:
+            return "SKIPPED", _size
+
+        _extra_args = {"Metadata": {CONTENT_HASH_METADATA_KEY: _hash}}
+        _content_type = mimetypes.guess_type(path)[0]
+        if _content_type is not None:
+            _extra_args["ContentType"] = _content_type
+        _kwargs = {"ExtraArgs": _extra_args}
+        if self._transfer_config is not None:
+            _kwargs["Config"] = self._transfer_config
+        self._s3_client.upload_file(path, self._bucket_name, key, **_kwargs)
+        if self._verbose:
+            print(f"Uploaded s3://{self._bucket_name}/{key}")
+        return "UPLOADED", _size
+
+    def upload(
+        self,
+        path_or_iterable: Union[str, Iterable],
+        include: List[str] = None,
+        exclude: List[str] = None,
+    ) -> CorpusUploadReport:
+        """Uploads every selected file whose content differs from the object already in the bucket.
+
+        Args:
+            path_or_iterable (Union[str, Iterable]): Corpus to upload, see collect_files()
+            include (List[str], optional): Globs the relative path of a file must match. Defaults to every file.
+            exclude (List[str], optional): Globs the relative path of a file must not match. Defaults to None.
+
+        Returns:
+            CorpusUploadReport: Changed and skipped keys, failures and throughput
+        """
+        _report = CorpusUploadReport()
+        _start = time.monotonic()
+        _files = collect_files(path_or_iterable, include, exclude)
+        _remote = self._remote_objects()
+
+        with ThreadPoolExecutor(max_workers=self._max_workers) as _executor:
+            _futures = {
+                _executor.submit(
+                    self._upload_one,
+                    _path,
+                    self._prefix + _key,
+                    _remote.get(self._prefix + _key),
+                ): self._prefix
+                + _key
+                for _path, _key in _files
+            }
+            for _future, _key in _futures.items():
+                try:
+                    _outcome, _size = _future.result()
+                except Exception as e:
+                    _report.failed[_key] = str(e)
+                    continue
+                if _outcome == "SKIPPED":
+                    _report.skipped_keys.add(_key)
+                    _report.bytes_skipped += _size
+                else:
+                    _report.changed_keys.add(_key)
+                    _report.bytes_uploaded += _size
+
+        _report.elapsed_seconds = time.monotonic() - _start
+        return _report
@@ -0,0 +1,289 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+This module contains the process pool that runs Bedrock agent invocations for the Streamlit app.
+InvocationWorkerPool starts worker processes, each holding its own bedrock-agent-runtime client
+for as long as it lives, and hands them turns (one invoke_agent call each) through a task queue.
+Workers put every completion event of a turn on a shared result queue; a dispatcher thread in the
+serving process appends them to a per-turn channel. Scripts subscribe to a turn by id and can
+subscribe again from the first event after a rerun, since channels are kept for a while after
+their turn ends. A worker that dies fails its running turn and is replaced; if the dispatcher
+itself stops, every unfinished turn is failed.
+"""
+
+import atexit
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+import uuid
+from typing import Dict, Iterator
+
+import boto3
+
+DEFAULT_INVOCATION_WORKERS = 4
+TURN_RETENTION_SECONDS = 600
+# longer than the 60 s read timeout of a worker's stream, plus time spent queued behind other turns
+DEFAULT_EVENT_TIMEOUT_SECONDS = 300
+_POLL_SECONDS = 0.5
+# a worker that dies sooner than this after starting is not replaced before the delay is up
+_RESTART_BACKOFF_SECONDS = 5
+
+_FINISHED = ("done", "error")
+
+
+class InvocationError(RuntimeError):
+    """Raised to subscribers when a turn failed in its worker."""
+
+
+def _invoke_turn(client, request: Dict):
+    _kwargs = {
+        "agentId": request["agent_id"],
+        "agentAliasId": request["agent_alias_id"],
+        "sessionId": request["session_id"],
+        "inputText": request["input_text"],
+        "enableTrace": request.get("enable_trace", True),
+    }
+    if request.get("session_state"):
+        _kwargs["sessionState"] = request["session_state"]
+    return client.invoke_agent(**_kwargs)["completion"]
+
+
+def _worker_main(task_queue, result_queue, current_turn) -> None:
+    # Ctrl-C goes to the serving process, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _client = boto3.client("bedrock-agent-runtime")
+    _pid = os.getpid()
+    while True:
+        _request = task_queue.get()
+        if _request is None:
+            return
+        _turn_id = _request["turn_id"]
+        # read by the pool if this process dies, since queued messages die with it
+        current_turn.value = _turn_id.encode()
+        result_queue.put((_turn_id, "started", _pid))
+        try:
+            for _event in _invoke_turn(_client, _request):
+                result_queue.put((_turn_id, "event", _event))
+            result_queue.put((_turn_id, "done", None))
+        except Exception as e:
+            result_queue.put((_turn_id, "error", f"{type(e).__name__}: {e}"))
+        current_turn.value = b""
+
+
+class _TurnChannel:
+    def __init__(self):
+        self.events = []
+        self.status = "queued"
+        self.error = None
+        self.worker_pid = None
+        self.finished_at = None
+        self.condition = threading.Condition()
+
+    def finish(self, status: str, error: str = None) -> None:
+        with self.condition:
+            self.status = status
+            self.error = error
+            self.finished_at = time.monotonic()
+            self.condition.notify_all()
+
+
+class InvocationWorkerPool:
+    """Worker processes running agent turns, with replayable per-turn event channels."""
+
+    def __init__(
+        self,
+        num_workers: int = None,
+        retention_seconds: float = TURN_RETENTION_SECONDS,
+    ):
+        """Constructs an instance and starts the workers.
+
+        Args:
+            num_workers (int, optional): Worker processes, i.e. turns running at once. Defaults to
+            $AGENT_INVOCATION_WORKERS or DEFAULT_INVOCATION_WORKERS.
+            retention_seconds (float, optional): How long the events of a finished turn stay available
+            to subscribers. Defaults to TURN_RETENTION_SECONDS.
+        """
+        if num_workers is None:
+            num_workers = int(
+                os.environ.get("AGENT_INVOCATION_WORKERS", DEFAULT_INVOCATION_WORKERS)
+            )
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1")
+        # spawn, so that workers do not inherit the threads of the serving process
+        self._context = multiprocessing.get_context("spawn")
+        self._task_queue = self._context.Queue()
+        self._result_queue = self._context.Queue()
+        self._retention_seconds = retention_seconds
+        self._turns: Dict[str, _TurnChannel] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._workers = [self._start_worker() for _ in range(num_workers)]
+        self._dispatcher = threading.Thread(
+            target=self._dispatch, name="invocation-dispatcher", daemon=True
+        )
+        self._dispatcher.start()
+
+    def _start_worker(self):
+        _current_turn = self._context.Array("c", 32, lock=False)
+        _process = self._context.Process(
+            target=_worker_main,
+            args=(self._task_queue, self._result_queue, _current_turn),
+            name="invocation-worker",
+            daemon=True,
+        )
+        _process.start()
+        _process.started_at = time.monotonic()
+        _process.current_turn = _current_turn
+        return _process
+
+    def submit(self, request: Dict) -> str:
+        """Queues a turn.
+
+        Args:
+            request (Dict): agent_id, agent_alias_id, session_id, input_text and optionally session_state
+            and enable_trace (defaults to True)
+
+        Returns:
+            str: Id of the turn, to subscribe to
+        """
+        if self._closed:
+            raise RuntimeError("The invocation worker pool is closed")
+        _turn_id = uuid.uuid4().hex
+        with self._lock:
+            self._turns[_turn_id] = _TurnChannel()
+        self._task_queue.put(dict(request, turn_id=_turn_id))
+        return _turn_id
+
+    def status(self, turn_id: str) -> str:
+        """Returns queued, running, done or error, or None for unknown and expired turns."""
+        _channel = self._turns.get(turn_id)
+        return _channel.status if _channel is not None else None
+
+    def subscribe(
+        self, turn_id: str, start: int = 0, timeout: float = None
+    ) -> Iterator[Dict]:
+        """Yields the completion events of a turn, as returned by invoke_agent, until it ends.
+
+        Args:
+            turn_id (str): Id returned by submit()
+            start (int, optional): Index of the first event to yield. Defaults to 0, which replays the turn.
+            timeout (float, optional): Seconds to wait for each event. Defaults to None, i.e. no limit.
+
+        Raises:
+            KeyError: The turn is unknown or has expired
+            InvocationError: The turn failed in its worker
+            TimeoutError: No event arrived within timeout
+        """
+        _channel = self._turns.get(turn_id)
+        if _channel is None:
+            raise KeyError(f"Unknown or expired turn {turn_id}")
+        _next = start
+        while True:
+            with _channel.condition:
+                while (
+                    _next >= len(_channel.events) and _channel.status not in _FINISHED
+                ):
+                    if not _channel.condition.wait(timeout):
+                        raise TimeoutError(
+                            f"No event from turn {turn_id} in {timeout}s"
+                        )
+                _batch = _channel.events[_next:]
+                _status, _error = _channel.status, _channel.error
+            yield from _batch
+            _next += len(_batch)
+            if not _batch and _status == "done":
+                return
+            if not _batch and _status == "error":
+                raise InvocationError(_error)
+
+    def _dispatch(self) -> None:
+        try:
+            self._dispatch_results()
+        finally:
+            # nothing delivers events any more, so subscribers must not wait for them
+            for _channel in list(self._turns.values()):
+                if _channel.status not in _FINISHED:
+                    _channel.finish("error", "The invocation worker pool stopped")
+
+    def _dispatch_results(self) -> None:
+        _last_check = time.monotonic()
+        while not self._closed:
+            try:
+                _turn_id, _kind, _payload = self._result_queue.get(
+                    timeout=_POLL_SECONDS
+                )
+                _channel = self._turns.get(_turn_id)
+                if _channel is not None:
+                    if _kind in _FINISHED:
+                        _channel.finish(_kind, _payload)
+                    else:
+                        with _channel.condition:
+                            if _kind == "started":
+                                _channel.status = "running"
+                                _channel.worker_pid = _payload
+                            else:
+                                _channel.events.append(_payload)
+                            _channel.condition.notify_all()
+            except queue.Empty:
+                pass
+            except (EOFError, OSError):
+                return
+            if time.monotonic() - _last_check >= _POLL_SECONDS:
+                _last_check = time.monotonic()
+                self._replace_dead_workers()
+                self._expire_turns()
+
+    def _replace_dead_workers(self) -> None:
+        for _i, _process in enumerate(self._workers):
+            if _process.is_alive() or self._closed:
+                continue
+            _turn_id = _process.current_turn.value.decode()
+            _channel = self._turns.get(_turn_id)
+            if _channel is not None and _channel.status not in _FINISHED:
+                _channel.finish(
+                    "error", f"Worker process exited with code {_process.exitcode}"
+                )
+            _process.current_turn.value = b""
+            if time.monotonic() - _process.started_at >= _RESTART_BACKOFF_SECONDS:
+                self._workers[_i] = self._start_worker()
+
+    def _expire_turns(self) -> None:
+        _now = time.monotonic()
+        with self._lock:
+            for _turn_id, _channel in list(self._turns.items()):
+                if (
+                    _channel.finished_at is not None
+                    and _now - _channel.finished_at > self._retention_seconds
+                ):
+                    del self._turns[_turn_id]
+
+    def close(self, timeout: float = 5) -> None:
+        """Stops the workers once they finish their current turn, terminating them after timeout."""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._workers:
+            self._task_queue.put(None)
+        _deadline = time.monotonic() + timeout
+        for _process in self._workers:
+            _process.join(max(_deadline - time.monotonic(), 0))
+            if _process.is_alive():
+                _process.terminate()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_invocation_pool() -> InvocationWorkerPool:
+    """Returns the process-wide worker pool, starting it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = InvocationWorkerPool()
+            atexit.register(_pool.close)
+        return _pool
@@ -0,0 +1,123 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+This module contains a cached catalog of the Knowledge Bases and data sources of an account.
+The KnowledgeBaseCatalog class pages through list_knowledge_bases once and indexes the
+summaries by name, so that name lookups are dictionary reads however many Knowledge Bases
+exist. The data sources of a Knowledge Base are listed on first use, and their S3 buckets are
+resolved with concurrent get_data_source calls in the same pass. Everything is kept in a
+TTLCache and is invalidated by the helper whenever it creates or deletes a Knowledge Base.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from utils.ttl_cache import TTLCache
+
+CATALOG_TTL_SECONDS = 300
+CATALOG_MAX_ENTRIES = 1024
+CATALOG_MAX_WORKERS = 8
+
+_KNOWLEDGE_BASES_KEY = "knowledge_bases"
+
+
+def _paginate(list_fn: Callable, items_key: str, **kwargs) -> List[Dict]:
+    _items = []
+    _kwargs = dict(kwargs, maxResults=100)
+    while True:
+        _resp = list_fn(**_kwargs)
+        _items.extend(_resp[items_key])
+        if not _resp.get("nextToken"):
+            return _items
+        _kwargs["nextToken"] = _resp["nextToken"]
+
+
+class KnowledgeBaseCatalog:
+    """TTL-cached index of Knowledge Bases by name and of data sources by Knowledge Base."""
+
+    def __init__(
+        self,
+        bedrock_agent_client,
+        ttl_seconds: float = CATALOG_TTL_SECONDS,
+        max_workers: int = CATALOG_MAX_WORKERS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Constructs an instance.
+
+        Args:
+            bedrock_agent_client: boto3 bedrock-agent client
+            ttl_seconds (float, optional): Lifetime of the cached listings. Defaults to CATALOG_TTL_SECONDS.
+            max_workers (int, optional): Concurrent get_data_source calls. Defaults to CATALOG_MAX_WORKERS.
+            clock (Callable[[], float], optional): Returns the current time in seconds. Defaults to time.monotonic.
+        """
+        self._bedrock_agent_client = bedrock_agent_client
+        self._max_workers = max_workers
+        self._cache = TTLCache(
+            max_entries=CATALOG_MAX_ENTRIES, ttl_seconds=ttl_seconds, clock=clock
+        )
+
+    def knowledge_bases(self) -> Dict[str, Dict]:
+        """Returns the summary of every Knowledge Base, keyed by name."""
+
+        def _load():
+            _summaries = _paginate(
+                self._bedrock_agent_client.list_knowledge_bases,
+                "knowledgeBaseSummaries",
+            )
+            return {_kb["name"]: _kb for _kb in _summaries}
+
+        return self._cache.get_or_load(_KNOWLEDGE_BASES_KEY, _load)
+
+    def get_kb_id(self, kb_name: str) -> str:
+        """Returns the id of the Knowledge Base with the given name, or None."""
+        _kb = self.knowledge_bases().get(kb_name)
+        return _kb["knowledgeBaseId"] if _kb is not None else None
+
+    def _describe_data_source(self, kb_id: str, summary: Dict) -> Dict:
+        _ds = self._bedrock_agent_client.get_data_source(
+            knowledgeBaseId=kb_id, dataSourceId=summary["dataSourceId"]
+        )["dataSource"]
+        _config = _ds["dataSourceConfiguration"]
+        _bucket_name = None
+        if _config["type"] == "S3":
+            _bucket_name = _config["s3Configuration"]["bucketArn"].split(":")[-1]
+        return dict(summary, type=_config["type"], bucketName=_bucket_name)
+
+    def data_sources(self, kb_id: str) -> List[Dict]:
+        """Returns the data sources of a Knowledge Base.
+
+        Returns:
+            List[Dict]: Data source summaries, in listing order, with "type" and "bucketName"
+            (None for data sources not backed by S3) added
+        """
+
+        def _load():
+            _summaries = _paginate(
+                self._bedrock_agent_client.list_data_sources,
+                "dataSourceSummaries",
+                knowledgeBaseId=kb_id,
+            )
+            if len(_summaries) <= 1:
+                return [self._describe_data_source(kb_id, _s) for _s in _summaries]
+            with ThreadPoolExecutor(
+                max_workers=min(self._max_workers, len(_summaries))
+            ) as _executor:
+                return list(
+                    _executor.map(
+                        lambda _s: self._describe_data_source(kb_id, _s), _summaries
+                    )
+                )
+
+        return self._cache.get_or_load(("data_sources", kb_id), _load)
+
+    def invalidate(self, kb_id: str = None) -> None:
+        """Drops the Knowledge Base listing, and the data sources of kb_id, or of every Knowledge Base if None."""
+        if kb_id is None:
+            self._cache.invalidate()
+        else:
+            self._cache.invalidate(
+                lambda _key: _key == _KNOWLEDGE_BASES_KEY
+                or _key == ("data_sources", kb_id)
+            )
@@ -0,0 +1,310 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+This module contains a change-aware synchronizer for Knowledge Base data sources.
+The KnowledgeBaseSyncManager class keeps a manifest of the S3 object ETags behind every data
+source, and only starts an ingestion job when the listing differs from the manifest of the
+last successful sync. Jobs for several Knowledge Bases and data sources run concurrently,
+within the Bedrock limits of one running job per Knowledge Base and a bounded number of jobs
+per account, and their statistics are streamed as progress events while they run.
+"""
+
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Union
+
+from utils.resource_waiter import (
+    ResourceWaiter,
+    ingestion_job_target,
+    knowledge_base_target,
+)
+
+DEFAULT_MANIFEST_FILE = os.path.join(".cache", "kb_sync_manifest.json")
+# Bedrock runs at most one ingestion job per Knowledge Base, and a few per account
+DEFAULT_MAX_CONCURRENT_JOBS = 5
+DEFAULT_MAX_LIST_WORKERS = 8
+DEFAULT_START_RETRIES = 8
+DEFAULT_START_RETRY_DELAY = 2.0
+
+
+def manifest_digest(manifest: Dict[str, str]) -> str:
+    """Returns a digest of a key -> ETag manifest that does not depend on ordering."""
+    _hash = hashlib.sha256()
+    for _key in sorted(manifest):
+        _hash.update(f"{_key}\0{manifest[_key]}\n".encode("utf-8"))
+    return _hash.hexdigest()
+
+
+def diff_manifests(old: Dict[str, str], new: Dict[str, str]) -> Dict[str, int]:
+    """Counts the keys added, modified and deleted between two manifests."""
+    return {
+        "added": sum(1 for _key in new if _key not in old),
+        "modified": sum(1 for _key in new if _key in old and old[_key] != new[_key]),
+        "deleted": sum(1 for _key in old if _key not in new),
+    }
+
+
+def job_statistics(ingestion_job: Dict) -> Dict[str, int]:
+    """Flattens the statistics of an ingestion job to scanned / indexed / deleted / failed counts."""
+    _stats = ingestion_job.get("statistics") or {}
+    return {
+        "scanned": _stats.get("numberOfDocumentsScanned", 0),
+        "indexed": _stats.get("numberOfNewDocumentsIndexed", 0)
+        + _stats.get("numberOfModifiedDocumentsIndexed", 0),
+        "deleted": _stats.get("numberOfDocumentsDeleted", 0),
+        "failed": _stats.get("numberOfDocumentsFailed", 0),
+    }
+
+
+class KnowledgeBaseSyncManager:
+    """Runs ingestion jobs only for data sources whose S3 content changed since their last sync."""
+
+    def __init__(
+        self,
+        bedrock_agent_client,
+        s3_client,
+        waiter: ResourceWaiter = None,
+        manifest_file: str = DEFAULT_MANIFEST_FILE,
+        max_concurrent_jobs: int = DEFAULT_MAX_CONCURRENT_JOBS,
+        max_list_workers: int = DEFAULT_MAX_LIST_WORKERS,
+        on_complete: Callable[[str], None] = None,
+    ):
+        """Constructs an instance.
+
+        Args:
+            bedrock_agent_client: boto3 bedrock-agent client
+            s3_client: boto3 S3 client used to list the data source buckets
+            waiter (ResourceWaiter, optional): Engine polling the ingestion jobs. Defaults to ResourceWaiter().
+            manifest_file (str, optional): JSON file holding the manifest of the last successful sync of every
+            data source, or None to keep manifests in memory only. Defaults to DEFAULT_MANIFEST_FILE.
+            max_concurrent_jobs (int, optional): Ingestion jobs running at once across all Knowledge Bases.
+            Defaults to DEFAULT_MAX_CONCURRENT_JOBS.
+            max_list_workers (int, optional): Data sources listed at once. Defaults to DEFAULT_MAX_LIST_WORKERS.
+            on_complete (Callable[[str], None], optional): Called with the Knowledge Base id after every
+            completed ingestion job. Defaults to None.
+        """
+        self._bedrock_agent_client = bedrock_agent_client
+        self._s3_client = s3_client
+        self._waiter = waiter if waiter is not None else ResourceWaiter()
+        self._manifest_file = manifest_file
+        self._on_complete = on_complete
+
+        self._job_slots = threading.BoundedSemaphore(max_concurrent_jobs)
+        self._list_slots = threading.BoundedSemaphore(max_list_workers)
+        self._kb_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._manifests = self._load_manifests()
+
+    def _load_manifests(self) -> Dict[str, Dict]:
+        if self._manifest_file is None or not os.path.exists(self._manifest_file):
+            return {}
+        with open(self._manifest_file) as f:
+            return json.load(f)
+
+    def _save_manifest(self, source_key: str, manifest: Dict[str, str]) -> None:
+        with self._lock:
+            self._manifests[source_key] = {
+                "digest": manifest_digest(manifest),
+                "objects": manifest,
+            }
+            if self._manifest_file is None:
+                return
+            os.makedirs(os.path.dirname(self._manifest_file) or ".", exist_ok=True)
+            _tmp_file = f"{self._manifest_file}.{os.getpid()}.tmp"
+            with open(_tmp_file, "w") as f:
+                json.dump(self._manifests, f)
+            os.replace(_tmp_file, self._manifest_file)
+
+    def _kb_lock(self, kb_id: str) -> threading.Lock:
+        with self._lock:
+            return self._kb_locks.setdefault(kb_id, threading.Lock())
+
+    def list_data_sources(self, kb_id: str) -> List[str]:
+        """Returns the ids of every data source of a Knowledge Base."""
+        _ids = []
+        _kwargs = {"knowledgeBaseId": kb_id, "maxResults": 100}
+        while True:
+            _resp = self._bedrock_agent_client.list_data_sources(**_kwargs)
+            _ids.extend(_ds["dataSourceId"] for _ds in _resp["dataSourceSummaries"])
+            if "nextToken" not in _resp:
+                return _ids
+            _kwargs["nextToken"] = _resp["nextToken"]
+
+    def data_source_manifest(self, kb_id: str, ds_id: str) -> Dict[str, str]:
+        """Lists the S3 objects behind a data source.
+
+        Returns:
+            Dict[str, str]: ETag of every object, keyed by object key, or None if the data source is not backed by S3
+        """
+        _config = self._bedrock_agent_client.get_data_source(
+            knowledgeBaseId=kb_id, dataSourceId=ds_id
+        )["dataSource"]["dataSourceConfiguration"]
+        if _config["type"] != "S3":
+            return None
+        _s3_config = _config["s3Configuration"]
+        _bucket_name = _s3_config["bucketArn"].split(":")[-1]
+        _manifest = {}
+        _paginator = self._s3_client.get_paginator("list_objects_v2")
+        for _prefix in _s3_config.get("inclusionPrefixes") or [""]:
+            for _page in _paginator.paginate(Bucket=_bucket_name, Prefix=_prefix):
+                for _obj in _page.get("Contents", []):
+                    _manifest[_obj["Key"]] = _obj["ETag"]
+        return _manifest
+
+    def _start_job(self, kb_id: str, ds_id: str) -> Dict:
+        _exceptions = self._bedrock_agent_client.exceptions
+        _delay = DEFAULT_START_RETRY_DELAY
+        for _attempt in range(DEFAULT_START_RETRIES):
+            try:
+                return self._bedrock_agent_client.start_ingestion_job(
+                    knowledgeBaseId=kb_id, dataSourceId=ds_id
+                )["ingestionJob"]
+            except (_exceptions.ConflictException, _exceptions.ThrottlingException):
+                # a job started outside this manager still holds the Knowledge Base
+                if _attempt == DEFAULT_START_RETRIES - 1:
+                    raise
+                self._waiter.clock.sleep(_delay)
+                _delay = min(_delay * 2, 30.0)
+
+    def _sync_source(
+        self, kb_id: str, ds_id: str, force: bool, emit: Callable[..., None]
+    ) -> None:
+        _source_key = f"{kb_id}/{ds_id}"
+        with self._list_slots:
+            _manifest = self.data_source_manifest(kb_id, ds_id)
+        _previous = self._manifests.get(_source_key)
+        _changes = None
+        if _manifest is not None:
+            _changes = diff_manifests(
+                _previous["objects"] if _previous else {}, _manifest
+            )
+            if (
+                not force
+                and _previous is not None
+                and _previous["digest"] == manifest_digest(_manifest)
+            ):
+                emit("SKIPPED", kb_id, ds_id, changes=_changes)
+                return
+
+        with self._kb_lock(kb_id), self._job_slots:
+            self._waiter.wait(knowledge_base_target(self._bedrock_agent_client, kb_id))
+            _job = self._start_job(kb_id, ds_id)
+            _job_id = _job["ingestionJobId"]
+            emit("STARTED", kb_id, ds_id, job_id=_job_id, changes=_changes)
+
+            _target = ingestion_job_target(
+                self._bedrock_agent_client, kb_id, ds_id, _job_id
+            )
+            _check = _target.check
+            _last_stats = {}
+
+            def _check_and_report():
+                _status, _resp = _check()
+                _stats = job_statistics(_resp["ingestionJob"])
+                if _stats != _last_stats:
+                    _last_stats.update(_stats)
+                    emit(
+                        "PROGRESS",
+                        kb_id,
+                        ds_id,
+                        job_id=_job_id,
+                        statistics=_stats,
+                        status=_status,
+                    )
+                return _status, _resp
+
+            _target.check = _check_and_report
+            _status = self._waiter.wait(_target)
+
+        _job = _target.last_response["ingestionJob"]
+        _stats = job_statistics(_job)
+        if _status != "COMPLETE":
+            emit(
+                "FAILED",
+                kb_id,
+                ds_id,
+                job_id=_job_id,
+                statistics=_stats,
+                status=_status,
+                message="; ".join(_job.get("failureReasons", [])),
+            )
+            return
+        # documents that failed to index are retried on the next sync
+        if _manifest is not None and _stats["failed"] == 0:
+            self._save_manifest(_source_key, _manifest)
+        if self._on_complete is not None:
+            self._on_complete(kb_id)
+        emit(
+            "COMPLETE",
+            kb_id,
+            ds_id,
+            job_id=_job_id,
+            statistics=_stats,
+            changes=_changes,
+        )
+
+    def iter_sync(
+        self,
+        sources: Iterable[Union[str, Tuple[str, str]]],
+        force: bool = False,
+    ) -> Iterator[Dict]:
+        """Synchronizes the given data sources and yields progress events as they happen.
+
+        Args:
+            sources (Iterable[Union[str, Tuple[str, str]]]): Knowledge Base ids, meaning all of their data sources,
+            or (Knowledge Base id, data source id) tuples
+            force (bool, optional): Start an ingestion job even if the content did not change. Defaults to False.
+
+        Yields:
+            Dict: Events with "event" (SKIPPED, STARTED, PROGRESS, COMPLETE or FAILED), "kb_id", "data_source_id",
+            and where known "ingestion_job_id", "status", "statistics" (scanned, indexed, deleted, failed),
+            "changes" (added, modified, deleted objects) and "message"
+        """
+        _pairs = []
+        for _source in sources:
+            if isinstance(_source, tuple):
+                _pairs.append(_source)
+            else:
+                _pairs.extend(
+                    (_source, _ds_id) for _ds_id in self.list_data_sources(_source)
+                )
+        _pairs = list(dict.fromkeys(_pairs))
+        if not _pairs:
+            return
+
+        _events = queue.Queue()
+
+        def _emit(event, kb_id, ds_id, job_id=None, **fields):
+            _event = {"event": event, "kb_id": kb_id, "data_source_id": ds_id}
+            if job_id is not None:
+                _event["ingestion_job_id"] = job_id
+            _event.update({_k: _v for _k, _v in fields.items() if _v is not None})
+            _event["time"] = time.time()
+            _events.put(_event)
+
+        def _run(kb_id, ds_id):
+            try:
+                self._sync_source(kb_id, ds_id, force, _emit)
+            except Exception as e:
+                _emit("FAILED", kb_id, ds_id, message=str(e))
+            finally:
+                _events.put(None)
+
+        # sources wait for their job slot inside the workers, so there is one worker per source
+        # and the listing of every source overlaps with the jobs already running
+        with ThreadPoolExecutor(max_workers=len(_pairs)) as _executor:
+            for _kb_id, _ds_id in _pairs:
+                _executor.submit(_run, _kb_id, _ds_id)
+            _remaining = len(_pairs)
+            while _remaining:
+                _event = _events.get()
+                if _event is None:
+                    _remaining -= 1
+                else:
+                    yield _event
@@ -8,9 +8,12 @@ It includes methods for creating, updating, and invoking Knowledge Bases, as wel
 IAM roles and OpenSearch Serverless.
 """
 
+import copy
 import json
 import boto3
 import time
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from opensearchpy import (
     OpenSearch,
@@ -21,15 +24,39 @@ from opensearchpy import (
 import pprint
 from retrying import retry
 import random
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 
-valid_embedding_models = [
-    "cohere.embed-multilingual-v3",
-    "cohere.embed-english-v3",
-    "amazon.titan-embed-text-v1",
-    "amazon.titan-embed-text-v2:0",
-]
+from utils.resource_waiter import (
+    ResourceWaiter,
+    collection_target,
+    knowledge_base_target,
+)
+from utils.corpus_uploader import CorpusUploader, DEFAULT_UPLOAD_MAX_WORKERS
+from utils.kb_catalog import KnowledgeBaseCatalog
+from utils.kb_sync import KnowledgeBaseSyncManager
+from utils.response_cache import normalize_input_text
+from utils.ttl_cache import TTLCache
+from utils.vector_index_profiles import (
+    DEFAULT_INDEX_PROFILE,
+    EMBEDDING_MODEL_DIMENSIONS,
+    embedding_dimension,
+    vector_index_body,
+)
+
+valid_embedding_models = list(EMBEDDING_MODEL_DIMENSIONS)
 pp = pprint.PrettyPrinter(indent=2)
 
+RETRIEVE_CACHE_MAX_ENTRIES = 1024
+RETRIEVE_CACHE_TTL_SECONDS = 600
+SYNC_VERSION_TTL_SECONDS = 60
+RETRIEVE_MAX_WORKERS = 8
+S3_DELETE_BATCH_SIZE = 1000
+S3_DELETE_MAX_WORKERS = 8
+UPLOAD_MULTIPART_THRESHOLD = 16 * 1024 * 1024
+UPLOAD_MULTIPART_CHUNK_SIZE = 16 * 1024 * 1024
+UPLOAD_MULTIPART_CONCURRENCY = 4
+
 
 def interactive_sleep(seconds: int):
     """
@@ -44,19 +71,39 @@ def interactive_sleep(seconds: int):
         time.sleep(1)
 
 
+def _format_sync_event(event: dict) -> str:
+    line = f"[{event['kb_id']}/{event['data_source_id']}] {event['event']}"
+    if "statistics" in event:
+        line += " " + ", ".join(f"{k}={v}" for k, v in event["statistics"].items())
+    if "changes" in event and event["event"] in ("SKIPPED", "STARTED"):
+        line += (
+            " (objects "
+            + ", ".join(f"{k}={v}" for k, v in event["changes"].items())
+            + ")"
+        )
+    if event.get("message"):
+        line += f": {event['message']}"
+    return line
+
+
 class KnowledgeBasesForAmazonBedrock:
     """
     Support class that allows for:
         - creation (or retrieval) of a Knowledge Base for Amazon Bedrock with all its pre-requisites
           (including OSS, IAM roles and Permissions and S3 bucket)
         - Ingestion of data into the Knowledge Base
+        - Retrieval of grounded context directly from the Knowledge Base, with a query-result cache
         - Deletion of all resources created
     """
 
-    def __init__(self, suffix=None):
+    def __init__(self, suffix=None, waiter: ResourceWaiter = None):
         """
         Class initializer
+        Args:
+            suffix: unused, kept for backwards compatibility
+            waiter: engine used to poll collections, Knowledge Bases and ingestion jobs until they are ready
         """
+        self.waiter = waiter if waiter is not None else ResourceWaiter()
         boto3_session = boto3.session.Session()
         self.region_name = boto3_session.region_name
         self.iam_client = boto3_session.client("iam", region_name=self.region_name)
@@ -79,10 +126,25 @@ class KnowledgeBasesForAmazonBedrock:
         self.bedrock_agent_client = boto3.client(
             "bedrock-agent", region_name=self.region_name
         )
+        self.bedrock_agent_runtime_client = boto3.client(
+            "bedrock-agent-runtime", region_name=self.region_name
+        )
         credentials = boto3.Session().get_credentials()
         self.awsauth = AWSV4SignerAuth(credentials, self.region_name, "aoss")
         self.oss_client = None
         self.data_bucket_name = None
+        self.retrieve_cache = TTLCache(
+            max_entries=RETRIEVE_CACHE_MAX_ENTRIES,
+            ttl_seconds=RETRIEVE_CACHE_TTL_SECONDS,
+        )
+        self._sync_version_cache = TTLCache(ttl_seconds=SYNC_VERSION_TTL_SECONDS)
+        self.catalog = KnowledgeBaseCatalog(self.bedrock_agent_client)
+        self.sync_manager = KnowledgeBaseSyncManager(
+            self.bedrock_agent_client,
+            self.s3_client,
+            waiter=self.waiter,
+            on_complete=self.invalidate_retrieve_cache,
+        )
 
     def create_or_retrieve_knowledge_base(
         self,
@@ -90,6 +152,7 @@ class KnowledgeBasesForAmazonBedrock:
         kb_description: str = None,
         data_bucket_name: str = None,
         embedding_model: str = "amazon.titan-embed-text-v2:0",
+        index_profile=DEFAULT_INDEX_PROFILE,
     ):
         """
         Function used to create a new Knowledge Base or retrieve an existent one
@@ -99,31 +162,20 @@ class KnowledgeBasesForAmazonBedrock:
             kb_description: Knowledge Base Description
             data_bucket_name: Name of s3 Bucket containing Knowledge Base Data
             embedding_model: Name of Embedding model to be used on Knowledge Base creation
+            index_profile: name of an INDEX_PROFILES entry (legacy, fast, balanced, high_recall, compact),
+                a dict of VectorIndexProfile settings, or a VectorIndexProfile. Only used on creation
 
         Returns:
             kb_id: str - Knowledge base id
             ds_id: str - Data Source id
         """
-        kb_id = None
         ds_id = None
-        kbs_available = self.bedrock_agent_client.list_knowledge_bases(
-            maxResults=100,
-        )
-        for kb in kbs_available["knowledgeBaseSummaries"]:
-            if kb_name == kb["name"]:
-                kb_id = kb["knowledgeBaseId"]
+        kb_id = self.catalog.get_kb_id(kb_name)
         if kb_id is not None:
-            ds_available = self.bedrock_agent_client.list_data_sources(
-                knowledgeBaseId=kb_id,
-                maxResults=100,
-            )
-            for ds in ds_available["dataSourceSummaries"]:
-                if kb_id == ds["knowledgeBaseId"]:
-                    ds_id = ds["dataSourceId"]
-                    if not data_bucket_name:
-                        self.data_bucket_name = self._get_knowledge_base_s3_bucket(
-                            kb_id, ds_id
-                        )
+            for ds in self.catalog.data_sources(kb_id):
+                ds_id = ds["dataSourceId"]
+                if not data_bucket_name:
+                    self.data_bucket_name = ds["bucketName"]
             print(f"Knowledge Base {kb_name} already exists.")
             print(f"Retrieved Knowledge Base Id: {kb_id}")
             print(f"Retrieved Data Source Id: {ds_id}")
@@ -212,7 +264,7 @@ class KnowledgeBasesForAmazonBedrock:
                 "========================================================================================"
             )
             print(f"Step 5 - Creating OSS Vector Index")
-            self.create_vector_index(index_name)
+            self.create_vector_index(index_name, embedding_model, index_profile)
             print(
                 "========================================================================================"
             )
@@ -257,6 +309,60 @@ class KnowledgeBasesForAmazonBedrock:
     def get_data_bucket_name(self):
         return self.data_bucket_name
 
+    def upload_corpus(
+        self,
+        path_or_iterable,
+        bucket_name: str = None,
+        prefix: str = "",
+        include: List[str] = None,
+        exclude: List[str] = None,
+        max_workers: int = DEFAULT_UPLOAD_MAX_WORKERS,
+        verbose: bool = False,
+    ):
+        """
+        Upload Knowledge Base source documents to S3, skipping files that did not change since the last push.
+        Files are uploaded concurrently, and files above UPLOAD_MULTIPART_THRESHOLD as concurrent multipart uploads.
+        The SHA-256 of each file is stored in the object metadata and compared on the next push
+        Args:
+            path_or_iterable: directory, file, or iterable of file paths or (file path, key) tuples
+            bucket_name: destination bucket, defaults to the bucket passed to create_s3_bucket
+            prefix: key prefix of the corpus in the bucket
+            include: glob rules the relative path of a file must match, e.g. ["*.pdf", "*.md"]
+            exclude: glob rules the relative path of a file must not match, e.g. [".git/*"]
+            max_workers: number of files uploaded concurrently
+            verbose: print one line per uploaded file
+        Returns:
+            CorpusUploadReport whose changed_keys can be passed on to an incremental sync
+        """
+        bucket_name = bucket_name or self.data_bucket_name
+        if bucket_name is None:
+            raise ValueError("No bucket given and create_s3_bucket has not been called")
+        # every file can hold UPLOAD_MULTIPART_CONCURRENCY connections during a multipart upload
+        upload_client = boto3.client(
+            "s3",
+            region_name=self.region_name,
+            config=Config(
+                max_pool_connections=max_workers * UPLOAD_MULTIPART_CONCURRENCY
+            ),
+        )
+        uploader = CorpusUploader(
+            upload_client,
+            bucket_name,
+            prefix=prefix,
+            max_workers=max_workers,
+            transfer_config=TransferConfig(
+                multipart_threshold=UPLOAD_MULTIPART_THRESHOLD,
+                multipart_chunksize=UPLOAD_MULTIPART_CHUNK_SIZE,
+                max_concurrency=UPLOAD_MULTIPART_CONCURRENCY,
+            ),
+            verbose=verbose,
+        )
+        report = uploader.upload(path_or_iterable, include=include, exclude=exclude)
+        print(f"s3://{bucket_name}/{prefix}: {report.summary()}")
+        for key, error in report.failed.items():
+            print(f"Failed to upload {key}: {error}")
+        return report
+
     def _get_knowledge_base_s3_bucket(self, knowledge_base_id, data_source_id):
         """Get the s3 bucket associated with a knowledge base, if there is one"""
         try:
@@ -594,12 +700,10 @@ class KnowledgeBasesForAmazonBedrock:
         print(host)
         # wait for collection creation
         # This can take couple of minutes to finish
-        response = self.aoss_client.batch_get_collection(names=[vector_store_name])
-        # Periodically check collection status
-        while (response["collectionDetails"][0]["status"]) == "CREATING":
-            print("Creating collection...")
-            interactive_sleep(30)
-            response = self.aoss_client.batch_get_collection(names=[vector_store_name])
+        print("Creating collection...")
+        target = collection_target(self.aoss_client, vector_store_name)
+        self.waiter.wait(target)
+        response = target.last_response
         print("\nCollection successfully created:")
         pp.pprint(response["collectionDetails"])
         # create opensearch serverless access policy and attach it to Bedrock execution role
@@ -618,35 +722,25 @@ class KnowledgeBasesForAmazonBedrock:
             print("Policy already exists")
             pp.pprint(e)
 
-    def create_vector_index(self, index_name: str):
+    def create_vector_index(
+        self,
+        index_name: str,
+        embedding_model: str = "amazon.titan-embed-text-v2:0",
+        index_profile=DEFAULT_INDEX_PROFILE,
+    ):
         """
         Create OpenSearch Serverless vector index. If existent, ignore
         Args:
             index_name: name of the vector index
+            embedding_model: id of the embedding model, which determines the vector dimension
+            index_profile: name, settings dict or VectorIndexProfile of the HNSW configuration
         """
-        body_json = {
-            "settings": {
-                "index.knn": "true",
-                "number_of_shards": 1,
-                "knn.algo_param.ef_search": 512,
-                "number_of_replicas": 0,
-            },
-            "mappings": {
-                "properties": {
-                    "vector": {
-                        "type": "knn_vector",
-                        "dimension": 1024,
-                        "method": {
-                            "name": "hnsw",
-                            "engine": "faiss",
-                            "space_type": "l2",
-                        },
-                    },
-                    "text": {"type": "text"},
-                    "text-metadata": {"type": "text"},
-                }
-            },
-        }
+        body_json = vector_index_body(
+            index_profile, embedding_dimension(embedding_model)
+        )
+        print(
+            f"Vector index method: {body_json['mappings']['properties']['vector']['method']}"
+        )
 
         # Create index
         try:
@@ -749,12 +843,11 @@ class KnowledgeBasesForAmazonBedrock:
             )
             kb = create_kb_response["knowledgeBase"]
             pp.pprint(kb)
+            self.catalog.invalidate()
         except self.bedrock_agent_client.exceptions.ConflictException:
-            kbs = self.bedrock_agent_client.list_knowledge_bases(maxResults=100)
-            kb_id = None
-            for kb in kbs["knowledgeBaseSummaries"]:
-                if kb["name"] == kb_name:
-                    kb_id = kb["knowledgeBaseId"]
+            # the cached listing predates the conflicting Knowledge Base
+            self.catalog.invalidate()
+            kb_id = self.catalog.get_kb_id(kb_name)
             response = self.bedrock_agent_client.get_knowledge_base(
                 knowledgeBaseId=kb_id
             )
@@ -778,10 +871,10 @@ class KnowledgeBasesForAmazonBedrock:
             )
             ds = create_ds_response["dataSource"]
             pp.pprint(ds)
+            self.catalog.invalidate(kb["knowledgeBaseId"])
         except self.bedrock_agent_client.exceptions.ConflictException:
-            ds_id = self.bedrock_agent_client.list_data_sources(
-                knowledgeBaseId=kb["knowledgeBaseId"], maxResults=100
-            )["dataSourceSummaries"][0]["dataSourceId"]
+            self.catalog.invalidate(kb["knowledgeBaseId"])
+            ds_id = self.catalog.data_sources(kb["knowledgeBaseId"])[0]["dataSourceId"]
             get_ds_response = self.bedrock_agent_client.get_data_source(
                 dataSourceId=ds_id, knowledgeBaseId=kb["knowledgeBaseId"]
             )
@@ -789,40 +882,163 @@ class KnowledgeBasesForAmazonBedrock:
             pp.pprint(ds)
         return kb, ds
 
-    def synchronize_data(self, kb_id, ds_id):
+    def synchronize_data(self, kb_id, ds_id, force: bool = False):
         """
         Start an ingestion job to synchronize data from an S3 bucket to the Knowledge Base
-        and waits for the job to be completed
+        and waits for the job to be completed. The job is skipped if the objects in the bucket
+        did not change since the last successful sync
         Args:
             kb_id: knowledge base id
             ds_id: data source id
+            force: start the ingestion job even if nothing changed
+        Returns:
+            the last event of the sync: SKIPPED, COMPLETE or FAILED
         """
-        # ensure that the kb is available
-        i_status = ["CREATING", "DELETING", "UPDATING"]
-        while (
-            self.bedrock_agent_client.get_knowledge_base(knowledgeBaseId=kb_id)[
-                "knowledgeBase"
-            ]["status"]
-            in i_status
-        ):
-            time.sleep(10)
-        # Start an ingestion job
-        start_job_response = self.bedrock_agent_client.start_ingestion_job(
-            knowledgeBaseId=kb_id, dataSourceId=ds_id
-        )
-        job = start_job_response["ingestionJob"]
-        pp.pprint(job)
-        # Get job
-        while job["status"] != "COMPLETE" and job["status"] != "FAILED":
-            get_job_response = self.bedrock_agent_client.get_ingestion_job(
+        event = None
+        for event in self.synchronize_knowledge_bases([(kb_id, ds_id)], force=force):
+            pass
+        return event
+
+    def synchronize_knowledge_bases(
+        self, sources, force: bool = False, verbose: bool = True
+    ):
+        """
+        Synchronize several Knowledge Bases and data sources concurrently, only ingesting the
+        data sources whose S3 objects changed since their last successful sync
+        Args:
+            sources: knowledge base ids (all of their data sources) or (knowledge base id, data source id) tuples
+            force: start the ingestion jobs even if nothing changed
+            verbose: print every event
+        Returns:
+            generator of progress events, see KnowledgeBaseSyncManager.iter_sync
+        """
+        for event in self.sync_manager.iter_sync(sources, force=force):
+            if verbose:
+                print(_format_sync_event(event))
+            yield event
+
+    def _get_sync_version(self, kb_id: str) -> str:
+        """
+        Identify the latest completed ingestion job of every data source of a Knowledge Base.
+        Cached retrieval results are keyed on this version, so they are never served across a sync.
+        Args:
+            kb_id: knowledge base id
+
+        Returns:
+            version: str - ingestion job ids of the latest completed sync per data source
+        """
+
+        def _load_sync_version():
+            versions = []
+            for ds in self.catalog.data_sources(kb_id):
+                jobs = self.bedrock_agent_client.list_ingestion_jobs(
+                    knowledgeBaseId=kb_id,
+                    dataSourceId=ds["dataSourceId"],
+                    filters=[
+                        {
+                            "attribute": "STATUS",
+                            "operator": "EQ",
+                            "values": ["COMPLETE"],
+                        }
+                    ],
+                    sortBy={"attribute": "STARTED_AT", "order": "DESCENDING"},
+                    maxResults=1,
+                )["ingestionJobSummaries"]
+                if jobs:
+                    versions.append(f"{ds['dataSourceId']}:{jobs[0]['ingestionJobId']}")
+            return "|".join(sorted(versions))
+
+        return self._sync_version_cache.get_or_load(kb_id, _load_sync_version)
+
+    def invalidate_retrieve_cache(self, kb_id: str = None):
+        """
+        Drop cached retrieval results, e.g. after the Knowledge Base content changed
+        Args:
+            kb_id: knowledge base id to invalidate. If None, the whole cache is cleared
+        """
+        if kb_id is None:
+            self.retrieve_cache.invalidate()
+            self._sync_version_cache.invalidate()
+        else:
+            self.retrieve_cache.invalidate(lambda key: key[0] == kb_id)
+            self._sync_version_cache.invalidate(lambda key: key == kb_id)
+
+    def retrieve(
+        self,
+        kb_id: str,
+        query: str,
+        k: int = 5,
+        filters: Dict = None,
+        use_cache: bool = True,
+    ) -> List[Dict]:
+        """
+        Query a Knowledge Base directly with the Retrieve API, without any agent orchestration.
+        Results are cached per Knowledge Base sync version and normalized query; each call
+        returns its own copy, so callers may modify the results
+        Args:
+            kb_id: knowledge base id
+            query: text to search for
+            k: number of results to return
+            filters: optional metadata filter, in the Retrieve API vectorSearchConfiguration format
+            use_cache: whether to serve and store results through the query-result cache
+
+        Returns:
+            results: list - retrievalResults items, each with content, location, metadata and score
+        """
+        vector_search_configuration = {"numberOfResults": k}
+        if filters:
+            vector_search_configuration["filter"] = filters
+
+        def _retrieve():
+            response = self.bedrock_agent_runtime_client.retrieve(
                 knowledgeBaseId=kb_id,
-                dataSourceId=ds_id,
-                ingestionJobId=job["ingestionJobId"],
+                retrievalQuery={"text": query},
+                retrievalConfiguration={
+                    "vectorSearchConfiguration": vector_search_configuration
+                },
+            )
+            return response["retrievalResults"]
+
+        if not use_cache:
+            return _retrieve()
+
+        cache_key = (
+            kb_id,
+            self._get_sync_version(kb_id),
+            normalize_input_text(query),
+            k,
+            json.dumps(filters, sort_keys=True, default=str) if filters else None,
+        )
+        return copy.deepcopy(self.retrieve_cache.get_or_load(cache_key, _retrieve))
+
+    def retrieve_many(
+        self,
+        kb_id: str,
+        queries: List[str],
+        k: int = 5,
+        filters: Dict = None,
+        max_workers: int = RETRIEVE_MAX_WORKERS,
+    ) -> List[List[Dict]]:
+        """
+        Run several Knowledge Base queries in parallel
+        Args:
+            kb_id: knowledge base id
+            queries: texts to search for
+            k: number of results to return per query
+            filters: optional metadata filter applied to every query
+            max_workers: maximum number of concurrent Retrieve calls
+
+        Returns:
+            results: list - one list of retrievalResults per query, in the order of the queries
+        """
+        if not queries:
+            return []
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(queries))) as executor:
+            return list(
+                executor.map(
+                    lambda query: self.retrieve(kb_id, query, k, filters), queries
+                )
             )
-            job = get_job_response["ingestionJob"]
-            interactive_sleep(5)
-        pp.pprint(job)
-        # interactive_sleep(40)
 
     def get_kb(self, kb_id):
         """
@@ -843,21 +1059,20 @@ class KnowledgeBasesForAmazonBedrock:
         delete_aoss: bool = True,
     ):
         """
-        Delete the Knowledge Base resources
+        Delete the Knowledge Base resources. Independent resources (S3 bucket, OSS policies, IAM roles)
+        are deleted concurrently, and resources that depend on each other are chained with readiness
+        checks: data source -> knowledge base -> index -> collection -> encryption policy
         Args:
             kb_name: name of the knowledge base to delete
             delete_s3_bucket (bool): boolean to indicate if s3 bucket should also be deleted
             delete_iam_roles_and_policies (bool): boolean to indicate if IAM roles and Policies should also be deleted
             delete_aoss: boolean to indicate if amazon opensearch serverless resources should also be deleted
+        Returns:
+            outcome of each deletion, keyed by resource
         """
-        kbs_available = self.bedrock_agent_client.list_knowledge_bases(
-            maxResults=100,
-        )
-        kb_id = None
-        ds_id = None
-        for kb in kbs_available["knowledgeBaseSummaries"]:
-            if kb_name == kb["name"]:
-                kb_id = kb["knowledgeBaseId"]
+        kb_id = self.catalog.get_kb_id(kb_name)
+        if kb_id is None:
+            raise ValueError(f"Knowledge Base {kb_name} not found")
         kb_details = self.bedrock_agent_client.get_knowledge_base(knowledgeBaseId=kb_id)
         kb_role = kb_details["knowledgeBase"]["roleArn"].split("/")[1]
         collection_id = kb_details["knowledgeBase"]["storageConfiguration"][
@@ -867,101 +1082,152 @@ class KnowledgeBasesForAmazonBedrock:
             "opensearchServerlessConfiguration"
         ]["vectorIndexName"]
 
-        encryption_policies = self.aoss_client.list_security_policies(
-            maxResults=100, type="encryption"
-        )
-        encryption_policy_name = None
-        for ep in encryption_policies["securityPolicySummaries"]:
-            if ep["name"].startswith(kb_name):
-                encryption_policy_name = ep["name"]
+        def _find_policy(list_fn, policy_type: str, summaries_key: str):
+            policies = list_fn(maxResults=100, type=policy_type)
+            name = None
+            for policy in policies[summaries_key]:
+                if policy["name"].startswith(kb_name):
+                    name = policy["name"]
+            return name
 
-        network_policies = self.aoss_client.list_security_policies(
-            maxResults=100, type="network"
-        )
-        network_policy_name = None
-        for np in network_policies["securityPolicySummaries"]:
-            if np["name"].startswith(kb_name):
-                network_policy_name = np["name"]
+        def _find_data_source():
+            ds = self.catalog.data_sources(kb_id)[-1]
+            return ds["dataSourceId"], ds["bucketName"]
 
-        data_policies = self.aoss_client.list_access_policies(
-            maxResults=100, type="data"
-        )
-        access_policy_name = None
-        for dp in data_policies["accessPolicySummaries"]:
-            if dp["name"].startswith(kb_name):
-                access_policy_name = dp["name"]
-
-        ds_available = self.bedrock_agent_client.list_data_sources(
-            knowledgeBaseId=kb_id,
-            maxResults=100,
-        )
-        for ds in ds_available["dataSourceSummaries"]:
-            if kb_id == ds["knowledgeBaseId"]:
-                ds_id = ds["dataSourceId"]
-        ds_details = self.bedrock_agent_client.get_data_source(
-            dataSourceId=ds_id,
-            knowledgeBaseId=kb_id,
-        )
-        bucket_name = ds_details["dataSource"]["dataSourceConfiguration"][
-            "s3Configuration"
-        ]["bucketArn"].replace("arn:aws:s3:::", "")
-        try:
-            self.bedrock_agent_client.delete_data_source(
-                dataSourceId=ds_id, knowledgeBaseId=kb_id
+        # look everything up at once
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            encryption_future = executor.submit(
+                _find_policy,
+                self.aoss_client.list_security_policies,
+                "encryption",
+                "securityPolicySummaries",
             )
-            print("Data Source deleted successfully!")
-        except Exception as e:
-            print(e)
-        try:
-            self.bedrock_agent_client.delete_knowledge_base(knowledgeBaseId=kb_id)
-            print("Knowledge Base deleted successfully!")
-        except Exception as e:
-            print(e)
-        if delete_aoss:
-            try:
-                self.oss_client.indices.delete(index=index_name)
-                print("OpenSource Serveless Index deleted successfully!")
-            except Exception as e:
-                print(e)
-            try:
-                self.aoss_client.delete_collection(id=collection_id)
-                print("OpenSource Collection Index deleted successfully!")
-            except Exception as e:
-                print(e)
+            network_future = executor.submit(
+                _find_policy,
+                self.aoss_client.list_security_policies,
+                "network",
+                "securityPolicySummaries",
+            )
+            access_future = executor.submit(
+                _find_policy,
+                self.aoss_client.list_access_policies,
+                "data",
+                "accessPolicySummaries",
+            )
+            ds_future = executor.submit(_find_data_source)
+        encryption_policy_name = encryption_future.result()
+        network_policy_name = network_future.result()
+        access_policy_name = access_future.result()
+        ds_id, bucket_name = ds_future.result()
+
+        report = {}
+
+        def _step(resource: str, fn, message: str):
             try:
-                self.aoss_client.delete_access_policy(
-                    type="data", name=access_policy_name
-                )
-                print("OpenSource Serveless access policy deleted successfully!")
+                fn()
+                report[resource] = "DELETED"
+                print(message)
             except Exception as e:
+                report[resource] = f"FAILED: {e}"
                 print(e)
-            try:
-                self.aoss_client.delete_security_policy(
-                    type="network", name=network_policy_name
+
+        def _delete_collection():
+            self.aoss_client.delete_collection(id=collection_id)
+            self.waiter.wait(
+                collection_target(self.aoss_client, collection_id=collection_id)
+            )
+
+        def _delete_kb_chain():
+            _step(
+                "data_source",
+                lambda: self.bedrock_agent_client.delete_data_source(
+                    dataSourceId=ds_id, knowledgeBaseId=kb_id
+                ),
+                "Data Source deleted successfully!",
+            )
+            _step(
+                "knowledge_base",
+                lambda: self.bedrock_agent_client.delete_knowledge_base(
+                    knowledgeBaseId=kb_id
+                ),
+                "Knowledge Base deleted successfully!",
+            )
+            # the KB role and the access policy are needed until the KB has removed its vectors
+            self.waiter.wait(knowledge_base_target(self.bedrock_agent_client, kb_id))
+
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            s3_future = None
+            if delete_s3_bucket:
+                # the bucket is independent of the rest of the stack, and usually the slowest to empty
+                s3_future = executor.submit(
+                    _step,
+                    "s3_bucket",
+                    lambda: self.delete_s3(bucket_name),
+                    "Knowledge Base S3 bucket deleted successfully!",
                 )
-                print("OpenSource Serveless network policy deleted successfully!")
-            except Exception as e:
-                print(e)
-            try:
-                self.aoss_client.delete_security_policy(
-                    type="encryption", name=encryption_policy_name
+
+            _delete_kb_chain()
+            futures = []
+            if delete_aoss:
+
+                def _delete_oss_chain():
+                    _step(
+                        "oss_index",
+                        lambda: self.oss_client.indices.delete(index=index_name),
+                        "OpenSource Serveless Index deleted successfully!",
+                    )
+                    # the index is deleted through the data plane, so the access and network
+                    # policies have to outlive it; after that they are independent of the collection
+                    policy_futures = [
+                        executor.submit(
+                            _step,
+                            "oss_access_policy",
+                            lambda: self.aoss_client.delete_access_policy(
+                                type="data", name=access_policy_name
+                            ),
+                            "OpenSource Serveless access policy deleted successfully!",
+                        ),
+                        executor.submit(
+                            _step,
+                            "oss_network_policy",
+                            lambda: self.aoss_client.delete_security_policy(
+                                type="network", name=network_policy_name
+                            ),
+                            "OpenSource Serveless network policy deleted successfully!",
+                        ),
+                    ]
+                    _step(
+                        "oss_collection",
+                        _delete_collection,
+                        "OpenSource Collection Index deleted successfully!",
+                    )
+                    # an encryption policy cannot be deleted while a collection uses it
+                    _step(
+                        "oss_encryption_policy",
+                        lambda: self.aoss_client.delete_security_policy(
+                            type="encryption", name=encryption_policy_name
+                        ),
+                        "OpenSource Serveless encryption policy deleted successfully!",
+                    )
+                    for policy_future in policy_futures:
+                        policy_future.result()
+
+                futures.append(executor.submit(_delete_oss_chain))
+            if delete_iam_roles_and_policies:
+                futures.append(
+                    executor.submit(
+                        _step,
+                        "iam_roles_and_policies",
+                        lambda: self.delete_iam_roles_and_policies(kb_role),
+                        "Knowledge Base Roles and Policies deleted successfully!",
+                    )
                 )
-                print("OpenSource Serveless encryption policy deleted successfully!")
-            except Exception as e:
-                print(e)
-        if delete_s3_bucket:
-            try:
-                self.delete_s3(bucket_name)
-                print("Knowledge Base S3 bucket deleted successfully!")
-            except Exception as e:
-                print(e)
-        if delete_iam_roles_and_policies:
-            try:
-                self.delete_iam_roles_and_policies(kb_role)
-                print("Knowledge Base Roles and Policies deleted successfully!")
-            except Exception as e:
-                print(e)
+            for future in futures + ([s3_future] if s3_future else []):
+                future.result()
+
+        self.catalog.invalidate(kb_id)
         print("Resources deleted successfully!")
+        return report
 
     def delete_iam_roles_and_policies(self, kb_execution_role_name: str):
         """
@@ -983,16 +1249,79 @@ class KnowledgeBasesForAmazonBedrock:
         self.iam_client.delete_role(RoleName=kb_execution_role_name)
         return 0
 
-    def delete_s3(self, bucket_name: str):
+    def _iter_s3_object_batches(self, bucket_name: str):
         """
-        Delete the objects contained in the Knowledge Base S3 bucket.
-        Once the bucket is empty, delete the bucket
+        Yield the keys of every object in a bucket, in batches that fit one delete_objects call.
+        Versioned buckets yield every version and delete marker, since a plain key delete would
+        only add a new delete marker and leave the bucket non-empty
         Args:
             bucket_name: bucket name
+        """
+        versioning = self.s3_client.get_bucket_versioning(Bucket=bucket_name)
+        if versioning.get("Status") in ("Enabled", "Suspended"):
+            paginator = self.s3_client.get_paginator("list_object_versions")
+            pages = paginator.paginate(
+                Bucket=bucket_name, PaginationConfig={"PageSize": S3_DELETE_BATCH_SIZE}
+            )
+            for page in pages:
+                batch = [
+                    {"Key": obj["Key"], "VersionId": obj["VersionId"]}
+                    for obj in page.get("Versions", []) + page.get("DeleteMarkers", [])
+                ]
+                # a page holds up to PageSize versions plus delete markers
+                for start in range(0, len(batch), S3_DELETE_BATCH_SIZE):
+                    yield batch[start : start + S3_DELETE_BATCH_SIZE]
+        else:
+            paginator = self.s3_client.get_paginator("list_objects_v2")
+            pages = paginator.paginate(
+                Bucket=bucket_name, PaginationConfig={"PageSize": S3_DELETE_BATCH_SIZE}
+            )
+            for page in pages:
+                batch = [{"Key": obj["Key"]} for obj in page.get("Contents", [])]
+                if batch:
+                    yield batch
 
+    def _delete_s3_batch(self, bucket_name: str, batch: List[Dict]):
+        response = self.s3_client.delete_objects(
+            Bucket=bucket_name, Delete={"Objects": batch, "Quiet": True}
+        )
+        # in quiet mode only the failed keys are returned
+        return response.get("Errors", [])
+
+    def delete_s3(self, bucket_name: str, max_workers: int = S3_DELETE_MAX_WORKERS):
         """
-        objects = self.s3_client.list_objects(Bucket=bucket_name)
-        if "Contents" in objects:
-            for obj in objects["Contents"]:
-                self.s3_client.delete_object(Bucket=bucket_name, Key=obj["Key"])
+        Delete the objects contained in the Knowledge Base S3 bucket.
+        Objects are listed page by page and deleted in batches of S3_DELETE_BATCH_SIZE keys
+        on a thread pool, while the next pages are being listed. Once the bucket is empty, delete the bucket
+        Args:
+            bucket_name: bucket name
+            max_workers: maximum number of concurrent delete_objects calls
+        Returns:
+            number of deleted objects and object versions
+        """
+        deleted = 0
+        errors = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for batch in self._iter_s3_object_batches(bucket_name):
+                futures[executor.submit(self._delete_s3_batch, bucket_name, batch)] = (
+                    len(batch)
+                )
+                # keep listing ahead of the deletes, but not unboundedly
+                if len(futures) >= 2 * max_workers:
+                    future = next(iter(futures))
+                    batch_errors = future.result()
+                    errors.extend(batch_errors)
+                    deleted += futures.pop(future) - len(batch_errors)
+            for future, batch_size in futures.items():
+                batch_errors = future.result()
+                errors.extend(batch_errors)
+                deleted += batch_size - len(batch_errors)
+        if errors:
+            raise RuntimeError(
+                f"Could not delete {len(errors)} objects from {bucket_name}, e.g. "
+                f"{errors[0].get('Key')}: {errors[0].get('Message')}"
+            )
         self.s3_client.delete_bucket(Bucket=bucket_name)
+        print(f"Deleted {deleted} objects from {bucket_name}")
+        return deleted
@@ -0,0 +1,94 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+This module contains deterministic, content-addressed packaging for tool Lambda functions.
+The build_lambda_package function zips a source file and its dependencies with fixed
+timestamps and permissions, so that identical inputs always produce a byte-identical zip
+whose SHA-256 matches the CodeSha256 reported by AWS Lambda. Built packages are cached
+on disk by the digest of their inputs.
+"""
+
+import base64
+import hashlib
+import os
+import tempfile
+import zipfile
+from io import BytesIO
+from typing import List, Tuple
+
+DEFAULT_PACKAGE_CACHE_DIR = os.path.join(".cache", "lambda_packages")
+
+# zip timestamps cannot predate 1980, so use the earliest value for every entry
+_FIXED_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+_FILE_MODE = 0o644 << 16
+
+
+def code_sha256(zip_content: bytes) -> str:
+    """Returns the digest of a deployment package in the format of the Lambda CodeSha256 field."""
+    return base64.b64encode(hashlib.sha256(zip_content).digest()).decode("ascii")
+
+
+def _package_inputs(source_code_file: str, dependency_files: List[str]) -> List[str]:
+    return sorted(dict.fromkeys([source_code_file] + list(dependency_files or [])))
+
+
+def _inputs_digest(files: List[str]) -> str:
+    _hash = hashlib.sha256()
+    for _file in files:
+        _hash.update(_file.encode("utf-8") + b"\0")
+        with open(_file, "rb") as f:
+            _hash.update(hashlib.sha256(f.read()).digest())
+    return _hash.hexdigest()
+
+
+def _build_zip(files: List[str]) -> bytes:
+    _buffer = BytesIO()
+    with zipfile.ZipFile(_buffer, "w", zipfile.ZIP_DEFLATED) as _zip:
+        for _file in files:
+            # from_file() normalizes the archive name the same way ZipFile.write() does
+            _info = zipfile.ZipInfo.from_file(_file)
+            _info.date_time = _FIXED_DATE_TIME
+            _info.external_attr = _FILE_MODE
+            _info.compress_type = zipfile.ZIP_DEFLATED
+            with open(_file, "rb") as f:
+                _zip.writestr(_info, f.read())
+    return _buffer.getvalue()
+
+
+def build_lambda_package(
+    source_code_file: str,
+    dependency_files: List[str] = None,
+    cache_dir: str = DEFAULT_PACKAGE_CACHE_DIR,
+) -> Tuple[bytes, str]:
+    """Builds, or loads from the local cache, the deployment zip for a tool Lambda.
+
+    Args:
+        source_code_file (str): Path of the file containing the Lambda handler
+        dependency_files (List[str], optional): Additional local files to include in the package. Defaults to None.
+        cache_dir (str, optional): Directory of the local package cache, or None to disable it.
+        Defaults to DEFAULT_PACKAGE_CACHE_DIR.
+
+    Returns:
+        Tuple[bytes, str]: The zip content and its CodeSha256
+    """
+    _files = _package_inputs(source_code_file, dependency_files)
+    _cache_file = None
+    if cache_dir is not None:
+        _cache_file = os.path.join(cache_dir, f"{_inputs_digest(_files)}.zip")
+        if os.path.exists(_cache_file):
+            with open(_cache_file, "rb") as f:
+                _zip_content = f.read()
+            return _zip_content, code_sha256(_zip_content)
+
+    _zip_content = _build_zip(_files)
+    if _cache_file is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # a private temporary file per writer, so that threads and processes packaging the same
+        # inputs never share one; the last os.replace() wins with identical content
+        with tempfile.NamedTemporaryFile(
+            dir=cache_dir, suffix=".tmp", delete=False
+        ) as f:
+            f.write(_zip_content)
+        os.replace(f.name, _cache_file)
+    return _zip_content, code_sha256(_zip_content)
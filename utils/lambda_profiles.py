@@ -0,0 +1,371 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+This module contains deployment profiles for the tool Lambda functions behind agent action groups.
+A LambdaProfile declares memory, architecture, ephemeral storage, timeout, SnapStart, reserved and
+provisioned concurrency, and an optional alias pointing at a published version. apply_lambda_profile()
+converges a deployed function to its profile, only issuing the calls needed to close the gap, so that
+re-applying an unchanged profile is read-only. LocalLambdaControlPlane implements the subset of the
+Lambda API used here in memory, so that profiles can be exercised without an AWS account.
+"""
+
+from dataclasses import dataclass, fields
+from typing import Dict, Union
+
+from utils.lambda_packaging import code_sha256
+from utils.resource_waiter import ResourceWaiter, lambda_function_target
+
+ARCHITECTURES = ("x86_64", "arm64")
+
+
+@dataclass
+class LambdaProfile:
+    """Deployment settings of a tool Lambda. Fields left as None keep the Lambda defaults."""
+
+    memory_size: int = None
+    architecture: str = None
+    ephemeral_storage: int = None
+    timeout: int = None
+    snap_start: bool = False
+    reserved_concurrency: int = None
+    provisioned_concurrency: int = None
+    alias: str = None
+
+    def __post_init__(self):
+        if self.architecture is not None and self.architecture not in ARCHITECTURES:
+            raise ValueError(
+                f"architecture must be one of {ARCHITECTURES}, not {self.architecture}"
+            )
+        if self.provisioned_concurrency and self.alias is None:
+            raise ValueError(
+                "provisioned_concurrency requires an alias, since it applies to a published version"
+            )
+
+    @classmethod
+    def from_value(cls, value: Union[Dict, "LambdaProfile"]) -> "LambdaProfile":
+        """Builds a profile from a YAML / dict declaration, passing profiles and None through."""
+        if value is None or isinstance(value, cls):
+            return value
+        _known = {_field.name for _field in fields(cls)}
+        _unknown = set(value) - _known
+        if _unknown:
+            raise ValueError(f"Unknown Lambda profile settings: {sorted(_unknown)}")
+        return cls(**value)
+
+    def configuration(self) -> Dict:
+        """Returns the function configuration parameters declared by this profile."""
+        _config = {}
+        if self.memory_size is not None:
+            _config["MemorySize"] = self.memory_size
+        if self.ephemeral_storage is not None:
+            _config["EphemeralStorage"] = {"Size": self.ephemeral_storage}
+        if self.timeout is not None:
+            _config["Timeout"] = self.timeout
+        # always declared, so that turning snap_start off also turns SnapStart off on the function
+        _config["SnapStart"] = {
+            "ApplyOn": "PublishedVersions" if self.snap_start else "None"
+        }
+        return _config
+
+    def creation_kwargs(self) -> Dict:
+        """Returns the create_function parameters declared by this profile."""
+        _kwargs = self.configuration()
+        if self.architecture is not None:
+            _kwargs["Architectures"] = [self.architecture]
+        return _kwargs
+
+
+def _configuration_drift(current: Dict, desired: Dict) -> Dict:
+    _drift = {}
+    for _key, _value in desired.items():
+        if _key == "SnapStart":
+            if current.get("SnapStart", {}).get("ApplyOn", "None") != _value["ApplyOn"]:
+                _drift[_key] = _value
+        elif current.get(_key) != _value:
+            _drift[_key] = _value
+    return _drift
+
+
+def apply_lambda_profile(
+    lambda_client,
+    function_name: str,
+    profile: LambdaProfile,
+    zip_content: bytes = None,
+    waiter: ResourceWaiter = None,
+) -> str:
+    """Converges a deployed Lambda function to a deployment profile.
+
+    Args:
+        lambda_client: boto3 Lambda client, or a LocalLambdaControlPlane
+        function_name (str): Name of the function
+        profile (LambdaProfile): Desired deployment settings
+        zip_content (bytes, optional): Deployment package, required only to change the architecture. Defaults to None.
+        waiter (ResourceWaiter, optional): Used to wait for updates and versions to become active. Defaults to a new ResourceWaiter.
+
+    Returns:
+        str: ARN to use as the action group executor, qualified with the alias if the profile declares one
+    """
+    _waiter = waiter if waiter is not None else ResourceWaiter()
+    _current = lambda_client.get_function_configuration(FunctionName=function_name)
+
+    if profile.architecture is not None and _current.get(
+        "Architectures", ["x86_64"]
+    ) != [profile.architecture]:
+        if zip_content is None:
+            raise ValueError(
+                f"Changing the architecture of {function_name} requires its deployment package"
+            )
+        print(f"Switching Lambda {function_name} to {profile.architecture}")
+        lambda_client.update_function_code(
+            FunctionName=function_name,
+            ZipFile=zip_content,
+            Architectures=[profile.architecture],
+        )
+        _waiter.wait(lambda_function_target(lambda_client, function_name))
+
+    _drift = _configuration_drift(_current, profile.configuration())
+    if _drift:
+        print(f"Updating Lambda {function_name} configuration: {sorted(_drift)}")
+        lambda_client.update_function_configuration(
+            FunctionName=function_name, **_drift
+        )
+        _waiter.wait(lambda_function_target(lambda_client, function_name))
+
+    if profile.reserved_concurrency is not None:
+        _reserved = lambda_client.get_function_concurrency(
+            FunctionName=function_name
+        ).get("ReservedConcurrentExecutions")
+        if _reserved != profile.reserved_concurrency:
+            lambda_client.put_function_concurrency(
+                FunctionName=function_name,
+                ReservedConcurrentExecutions=profile.reserved_concurrency,
+            )
+
+    if profile.alias is None:
+        return _current["FunctionArn"]
+
+    # Lambda returns the latest version instead of publishing a new one when nothing changed
+    _version = lambda_client.publish_version(FunctionName=function_name)["Version"]
+    _waiter.wait(lambda_function_target(lambda_client, function_name, _version))
+
+    try:
+        _alias = lambda_client.get_alias(FunctionName=function_name, Name=profile.alias)
+        if _alias["FunctionVersion"] != _version:
+            _alias = lambda_client.update_alias(
+                FunctionName=function_name, Name=profile.alias, FunctionVersion=_version
+            )
+    except lambda_client.exceptions.ResourceNotFoundException:
+        _alias = lambda_client.create_alias(
+            FunctionName=function_name, Name=profile.alias, FunctionVersion=_version
+        )
+
+    if profile.provisioned_concurrency is not None:
+        try:
+            _provisioned = lambda_client.get_provisioned_concurrency_config(
+                FunctionName=function_name, Qualifier=profile.alias
+            )["RequestedProvisionedConcurrentExecutions"]
+        except lambda_client.exceptions.ProvisionedConcurrencyConfigNotFoundException:
+            _provisioned = 0
+        if _provisioned != profile.provisioned_concurrency:
+            if profile.provisioned_concurrency == 0:
+                lambda_client.delete_provisioned_concurrency_config(
+                    FunctionName=function_name, Qualifier=profile.alias
+                )
+            else:
+                lambda_client.put_provisioned_concurrency_config(
+                    FunctionName=function_name,
+                    Qualifier=profile.alias,
+                    ProvisionedConcurrentExecutions=profile.provisioned_concurrency,
+                )
+
+    return _alias["AliasArn"]
+
+
+class LocalLambdaControlPlane:
+    """In-memory stand-in for the Lambda control plane calls used by the helper and apply_lambda_profile().
+
+    Every mutating call is recorded in .calls, so callers can check that re-applying a profile is a no-op.
+    """
+
+    class exceptions:
+        class ResourceNotFoundException(Exception):
+            pass
+
+        class ResourceConflictException(Exception):
+            pass
+
+        class ProvisionedConcurrencyConfigNotFoundException(Exception):
+            pass
+
+    def __init__(self, region: str = "us-east-1", account_id: str = "000000000000"):
+        self._arn_prefix = f"arn:aws:lambda:{region}:{account_id}:function"
+        self.functions = {}
+        self.calls = []
+
+    def _function(self, name: str) -> Dict:
+        if name not in self.functions:
+            raise self.exceptions.ResourceNotFoundException(
+                f"Function not found: {name}"
+            )
+        return self.functions[name]
+
+    def _record(self, operation: str, **kwargs) -> None:
+        self.calls.append((operation, kwargs))
+
+    def create_function(self, FunctionName, Code, **kwargs):
+        if FunctionName in self.functions:
+            raise self.exceptions.ResourceConflictException(
+                f"Function already exist: {FunctionName}"
+            )
+        self._record("create_function", FunctionName=FunctionName)
+        _config = {
+            "FunctionName": FunctionName,
+            "FunctionArn": f"{self._arn_prefix}:{FunctionName}",
+            "MemorySize": 128,
+            "Timeout": 3,
+            "EphemeralStorage": {"Size": 512},
+            "Architectures": ["x86_64"],
+            "SnapStart": {"ApplyOn": "None"},
+            "State": "Active",
+            "LastUpdateStatus": "Successful",
+            "CodeSha256": code_sha256(Code.get("ZipFile", b"")),
+        }
+        _config.update(
+            {_key: _value for _key, _value in kwargs.items() if _key != "Publish"}
+        )
+        self.functions[FunctionName] = {
+            "config": _config,
+            "versions": {},
+            "aliases": {},
+            "concurrency": None,
+            "provisioned": {},
+            "policy": set(),
+        }
+        return dict(_config)
+
+    def get_function(self, FunctionName):
+        return {"Configuration": dict(self._function(FunctionName)["config"])}
+
+    def get_function_configuration(self, FunctionName, Qualifier=None):
+        _function = self._function(FunctionName)
+        if Qualifier is None or Qualifier == "$LATEST":
+            return dict(_function["config"])
+        if Qualifier in _function["aliases"]:
+            Qualifier = _function["aliases"][Qualifier]["FunctionVersion"]
+        return dict(_function["versions"][Qualifier])
+
+    def update_function_code(self, FunctionName, ZipFile, Architectures=None, **kwargs):
+        _config = self._function(FunctionName)["config"]
+        self._record("update_function_code", FunctionName=FunctionName)
+        _config["CodeSha256"] = code_sha256(ZipFile)
+        if Architectures is not None:
+            _config["Architectures"] = list(Architectures)
+        return dict(_config)
+
+    def update_function_configuration(self, FunctionName, **kwargs):
+        _config = self._function(FunctionName)["config"]
+        self._record(
+            "update_function_configuration", FunctionName=FunctionName, **kwargs
+        )
+        _config.update(kwargs)
+        return dict(_config)
+
+    def get_function_concurrency(self, FunctionName):
+        _reserved = self._function(FunctionName)["concurrency"]
+        return {} if _reserved is None else {"ReservedConcurrentExecutions": _reserved}
+
+    def put_function_concurrency(self, FunctionName, ReservedConcurrentExecutions):
+        self._record("put_function_concurrency", FunctionName=FunctionName)
+        self._function(FunctionName)["concurrency"] = ReservedConcurrentExecutions
+        return {"ReservedConcurrentExecutions": ReservedConcurrentExecutions}
+
+    def publish_version(self, FunctionName, **kwargs):
+        _function = self._function(FunctionName)
+        _config = _function["config"]
+        _snapshot = {
+            _key: _value
+            for _key, _value in _config.items()
+            if _key not in ("FunctionArn", "Version")
+        }
+        if _function["versions"]:
+            _latest = _function["versions"][str(len(_function["versions"]))]
+            if {
+                _key: _value
+                for _key, _value in _latest.items()
+                if _key not in ("FunctionArn", "Version")
+            } == _snapshot:
+                return dict(_latest)
+
+        self._record("publish_version", FunctionName=FunctionName)
+        _version = str(len(_function["versions"]) + 1)
+        _published = dict(_snapshot)
+        _published["Version"] = _version
+        _published["FunctionArn"] = f"{_config['FunctionArn']}:{_version}"
+        _function["versions"][_version] = _published
+        return dict(_published)
+
+    def get_alias(self, FunctionName, Name):
+        _aliases = self._function(FunctionName)["aliases"]
+        if Name not in _aliases:
+            raise self.exceptions.ResourceNotFoundException(f"Alias not found: {Name}")
+        return dict(_aliases[Name])
+
+    def create_alias(self, FunctionName, Name, FunctionVersion, **kwargs):
+        _function = self._function(FunctionName)
+        self._record("create_alias", FunctionName=FunctionName, Name=Name)
+        _function["aliases"][Name] = {
+            "Name": Name,
+            "FunctionVersion": FunctionVersion,
+            "AliasArn": f"{_function['config']['FunctionArn']}:{Name}",
+        }
+        return dict(_function["aliases"][Name])
+
+    def update_alias(self, FunctionName, Name, FunctionVersion, **kwargs):
+        _alias = self._function(FunctionName)["aliases"][Name]
+        self._record("update_alias", FunctionName=FunctionName, Name=Name)
+        _alias["FunctionVersion"] = FunctionVersion
+        return dict(_alias)
+
+    def get_provisioned_concurrency_config(self, FunctionName, Qualifier):
+        _provisioned = self._function(FunctionName)["provisioned"]
+        if Qualifier not in _provisioned:
+            raise self.exceptions.ProvisionedConcurrencyConfigNotFoundException(
+                f"No provisioned concurrency for {FunctionName}:{Qualifier}"
+            )
+        return {
+            "RequestedProvisionedConcurrentExecutions": _provisioned[Qualifier],
+            "Status": "READY",
+        }
+
+    def put_provisioned_concurrency_config(
+        self, FunctionName, Qualifier, ProvisionedConcurrentExecutions
+    ):
+        self._record("put_provisioned_concurrency_config", FunctionName=FunctionName)
+        self._function(FunctionName)["provisioned"][
+            Qualifier
+        ] = ProvisionedConcurrentExecutions
+        return {
+            "RequestedProvisionedConcurrentExecutions": ProvisionedConcurrentExecutions
+        }
+
+    def delete_provisioned_concurrency_config(self, FunctionName, Qualifier):
+        self._record("delete_provisioned_concurrency_config", FunctionName=FunctionName)
+        self._function(FunctionName)["provisioned"].pop(Qualifier, None)
+
+    def add_permission(self, FunctionName, StatementId, Qualifier=None, **kwargs):
+        _policy = self._function(FunctionName)["policy"]
+        if (StatementId, Qualifier) in _policy:
+            raise self.exceptions.ResourceConflictException(
+                f"The statement id ({StatementId}) provided already exists"
+            )
+        self._record(
+            "add_permission", FunctionName=FunctionName, StatementId=StatementId
+        )
+        _policy.add((StatementId, Qualifier))
+        return {}
+
+    def delete_function(self, FunctionName, **kwargs):
+        self._function(FunctionName)
+        self._record("delete_function", FunctionName=FunctionName)
+        del self.functions[FunctionName]
@@ -0,0 +1,281 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+This module contains a local router that predicts the routing classifier of a SUPERVISOR_ROUTER
+agent, so that confidently routable requests can go straight to the chosen collaborator and skip
+the routing LLM call. RoutingLog appends every routingClassifierTrace decision (input text,
+classification, routing latency and tokens) to a JSONL file. LearnedRouter is trained from those
+decisions: TF-IDF over word unigrams and bigrams, then a softmax regression, all in NumPy, and
+saved as a small .npz file. Its predictions come with a confidence (the top class probability)
+that callers compare to a threshold before bypassing the supervisor.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+DEFAULT_ROUTING_LOG_PATH = os.path.join(".cache", "routing_decisions.jsonl")
+DEFAULT_ROUTER_THRESHOLD = 0.8
+# decisions that depend on the conversation rather than on the request text
+NON_ROUTABLE_CLASSIFICATIONS = ("keep_previous_agent",)
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class RoutingLog:
+    """Append-only JSONL log of routing classifier decisions, safe to share between threads."""
+
+    def __init__(self, path: str = DEFAULT_ROUTING_LOG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "RoutingLog":
+        """Returns a log at $AGENT_ROUTING_LOG, or None when decisions are not to be logged."""
+        _path = os.environ.get("AGENT_ROUTING_LOG")
+        return cls(_path) if _path else None
+
+    def append(
+        self,
+        input_text: str,
+        classification: str,
+        supervisor: str = None,
+        duration_seconds: float = None,
+        input_tokens: int = 0,
+        output_tokens: int = 0,
+    ) -> None:
+        """Records one routing decision.
+
+        Args:
+            input_text (str): The text the routing classifier saw
+            classification (str): Collaborator name, "undecidable" or "keep_previous_agent"
+            supervisor (str, optional): Id of the supervisor agent. Defaults to None.
+            duration_seconds (float, optional): Time taken by the routing classifier. Defaults to None.
+            input_tokens (int, optional): Input tokens of the routing LLM call. Defaults to 0.
+            output_tokens (int, optional): Output tokens of the routing LLM call. Defaults to 0.
+        """
+        _record = {
+            "time": time.time(),
+            "supervisor": supervisor,
+            "input_text": input_text,
+            "classification": classification,
+            "duration_seconds": duration_seconds,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+        }
+        _line = json.dumps(_record, ensure_ascii=False) + "\n"
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as _file:
+                _file.write(_line)
+
+    def read(self, supervisor: str = None) -> Iterator[Dict]:
+        """Yields the logged decisions in order, optionally of one supervisor only; bad lines are skipped."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as _file:
+            for _line in _file:
+                try:
+                    _record = json.loads(_line)
+                except ValueError:
+                    continue
+                if supervisor is None or _record.get("supervisor") == supervisor:
+                    yield _record
+
+
+def routable_examples(records: List[Dict]) -> List[Dict]:
+    """Returns the decisions a router can learn from: those that depend on the request text alone."""
+    return [
+        _record
+        for _record in records
+        if _record.get("input_text")
+        and _record.get("classification")
+        and _record["classification"] not in NON_ROUTABLE_CLASSIFICATIONS
+    ]
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word unigrams and bigrams; \\w matches any script, so Korean text works too."""
+    _words = _TOKEN_PATTERN.findall((text or "").casefold())
+    return _words + [f"{_a} {_b}" for _a, _b in zip(_words, _words[1:])]
+
+
+class LearnedRouter:
+    """TF-IDF plus softmax regression over logged routing decisions."""
+
+    def __init__(
+        self,
+        vocabulary: List[str],
+        idf: np.ndarray,
+        weights: np.ndarray,
+        bias: np.ndarray,
+        labels: List[str],
+    ):
+        """Constructs an instance from trained parameters; use train() or load() instead.
+
+        Args:
+            vocabulary (List[str]): Terms, in feature order
+            idf (np.ndarray): Inverse document frequency of each term
+            weights (np.ndarray): (terms, labels) coefficients
+            bias (np.ndarray): Per-label intercepts
+            labels (List[str]): Classifications, in column order
+        """
+        self.vocabulary = list(vocabulary)
+        self._index = {_term: _i for _i, _term in enumerate(self.vocabulary)}
+        self.idf = idf.astype(np.float32)
+        self.weights = weights.astype(np.float32)
+        self.bias = bias.astype(np.float32)
+        self.labels = list(labels)
+
+    @classmethod
+    def train(
+        cls,
+        texts: List[str],
+        labels: List[str],
+        min_df: int = 1,
+        max_features: int = 50000,
+        l2: float = 1e-4,
+        epochs: int = 100,
+        learning_rate: float = 2.0,
+        batch_size: int = 256,
+        seed: int = 0,
+    ) -> "LearnedRouter":
+        """Fits a router to request texts and the classification the routing LLM gave each.
+
+        Args:
+            texts (List[str]): Request texts
+            labels (List[str]): Their classifications
+            min_df (int, optional): Terms seen in fewer requests are ignored. Defaults to 1.
+            max_features (int, optional): Most frequent terms kept. Defaults to 50000.
+            l2 (float, optional): Weight decay. Defaults to 1e-4.
+            epochs (int, optional): Passes of minibatch gradient descent. Defaults to 100.
+            learning_rate (float, optional): Step size. Defaults to 2.0.
+            batch_size (int, optional): Requests per gradient step. Defaults to 256.
+            seed (int, optional): Seed of the minibatch order. Defaults to 0.
+
+        Returns:
+            LearnedRouter: The trained router
+        """
+        if not texts or len(texts) != len(labels):
+            raise ValueError(
+                "train needs as many labels as texts, and at least one of each"
+            )
+
+        _documents = [set(tokenize(_text)) for _text in texts]
+        _df = {}
+        for _terms in _documents:
+            for _term in _terms:
+                _df[_term] = _df.get(_term, 0) + 1
+        _kept = sorted(
+            (_term for _term, _count in _df.items() if _count >= min_df),
+            key=lambda _term: (-_df[_term], _term),
+        )[:max_features]
+        _vocabulary = sorted(_kept)
+        # smoothed idf, as if one extra document contained every term
+        _idf = np.array(
+            [
+                math.log((1 + len(texts)) / (1 + _df[_term])) + 1
+                for _term in _vocabulary
+            ],
+            dtype=np.float32,
+        )
+        _labels = sorted(set(labels))
+        _router = cls(
+            _vocabulary,
+            _idf,
+            np.zeros((len(_vocabulary), len(_labels)), dtype=np.float32),
+            np.zeros(len(_labels), dtype=np.float32),
+            _labels,
+        )
+
+        _rows = [_router._features(_text) for _text in texts]
+        _targets = np.array([_labels.index(_label) for _label in labels])
+        # start from the class priors, so that rare classes need evidence to win
+        _prior = np.bincount(_targets, minlength=len(_labels)) / len(_targets)
+        _router.bias = np.log(_prior + 1e-6).astype(np.float32)
+
+        _rng = np.random.default_rng(seed)
+        for _ in range(epochs):
+            _order = _rng.permutation(len(_rows))
+            for _start in range(0, len(_order), batch_size):
+                _batch = _order[_start : _start + batch_size]
+                _x = _router._dense([_rows[_i] for _i in _batch])
+                _p = _router._softmax(_x @ _router.weights + _router.bias)
+                _p[np.arange(len(_batch)), _targets[_batch]] -= 1
+                _router.weights -= learning_rate * (
+                    _x.T @ _p / len(_batch) + l2 * _router.weights
+                )
+                _router.bias -= learning_rate * _p.mean(axis=0)
+        return _router
+
+    def _features(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Sparse L2-normalized TF-IDF vector of a text, as (term indices, values)."""
+        _counts = {}
+        for _term in tokenize(text):
+            _i = self._index.get(_term)
+            if _i is not None:
+                _counts[_i] = _counts.get(_i, 0) + 1
+        _indices = np.fromiter(_counts.keys(), dtype=np.int64, count=len(_counts))
+        _values = np.fromiter(_counts.values(), dtype=np.float32, count=len(_counts))
+        _values *= self.idf[_indices]
+        _norm = np.linalg.norm(_values)
+        if _norm > 0:
+            _values /= _norm
+        return _indices, _values
+
+    def _dense(self, rows: List[Tuple[np.ndarray, np.ndarray]]) -> np.ndarray:
+        _x = np.zeros((len(rows), len(self.vocabulary)), dtype=np.float32)
+        for _r, (_indices, _values) in enumerate(rows):
+            _x[_r, _indices] = _values
+        return _x
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        _exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return _exp / _exp.sum(axis=1, keepdims=True)
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        """Returns the probability of each classification for a request text."""
+        _indices, _values = self._features(text)
+        _logits = _values @ self.weights[_indices] + self.bias
+        _p = self._softmax(_logits[np.newaxis, :])[0]
+        return {_label: float(_p[_i]) for _i, _label in enumerate(self.labels)}
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """Returns the most likely classification of a request text and its probability."""
+        _indices, _values = self._features(text)
+        _logits = _values @ self.weights[_indices] + self.bias
+        _p = self._softmax(_logits[np.newaxis, :])[0]
+        _best = int(np.argmax(_p))
+        return self.labels[_best], float(_p[_best])
+
+    def save(self, path: str) -> None:
+        """Writes the router to a .npz file."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(
+            path,
+            vocabulary=np.array(self.vocabulary, dtype=str),
+            idf=self.idf,
+            weights=self.weights,
+            bias=self.bias,
+            labels=np.array(self.labels, dtype=str),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "LearnedRouter":
+        """Reads a router written by save()."""
+        with np.load(path, allow_pickle=False) as _data:
+            return cls(
+                _data["vocabulary"].tolist(),
+                _data["idf"],
+                _data["weights"],
+                _data["bias"],
+                _data["labels"].tolist(),
+            )
@@ -0,0 +1,1472 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+This module contains an offline stand-in for the bedrock-agent and bedrock-agent-runtime services.
+LocalBedrockAgents keeps agents, aliases, action groups, knowledge base associations and
+collaborators in memory and serves the control-plane calls made by AgentsForAmazonBedrock, with
+status transitions (CREATING, PREPARING, DELETING, ...) that complete after a configurable delay.
+Its invoke_agent returns a completion stream shaped like the real one: routing classifier traces
+for SUPERVISOR_ROUTER agents, orchestration traces with rationales, action group, knowledge base
+and code interpreter calls and their observations, token usage, answer chunks with citations and
+files, all generated from a seeded random source and paced by LocalLatencies.
+
+install_local_bedrock_agents() routes the boto3 clients of bedrock-agent, bedrock-agent-runtime
+and sts (GetCallerIdentity only) created in this process to one LocalBedrockAgents at the HTTP
+layer: a before-send handler answers each request with a serialized response (an event stream for
+invoke_agent), so parameter validation, retries, needs-retry handlers and response parsing all run
+as against the real service. Requests are not signed, so no credentials or network are needed,
+and errors come back as the modeled client exceptions (ResourceNotFoundException,
+ConflictException, ThrottlingException, ...). Setting BEDROCK_AGENTS_LOCAL to 1, or to the path of a
+YAML file of agents (see load_agents()), installs it when the utils package is imported, before
+any client exists, which also covers the invocation worker processes.
+"""
+
+import base64
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+import xml.sax.saxutils
+import zlib
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List
+
+import yaml
+
+from utils.bedrock_agent_helper import UNDECIDABLE_CLASSIFICATION
+
+LOCAL_SERVICES = ("bedrock-agent", "bedrock-agent-runtime", "sts")
+DEFAULT_ALIAS_NAME = "live"
+TEST_ALIAS_ID = "TSTALIASID"
+
+_ID_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+class LocalServiceError(Exception):
+    """An error response of the local service, turned into the modeled client exception when installed."""
+
+    code = "ValidationException"
+    status_code = 400
+
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
+
+
+@dataclass
+class LocalLatencies:
+    """Simulated service timings in seconds; each sleep is drawn uniformly within +/- jitter of its value.
+
+    Args:
+        control_plane (float): Each bedrock-agent call
+        transition (float): CREATING, UPDATING, PREPARING and DELETING before the status settles
+        first_event (float): Between invoke_agent and the first completion event
+        llm_call (float): Each routing classifier or orchestration model invocation
+        tool_call (float): Each action group, knowledge base or code interpreter call
+        chunk (float): Between two answer chunks
+        jitter (float): Relative spread of every sleep, 0 for fixed timings
+        speed (float): Factor applied to every timing, 0 for an instant service
+    """
+
+    control_plane: float = 0.05
+    transition: float = 0.5
+    first_event: float = 0.3
+    llm_call: float = 1.5
+    tool_call: float = 0.4
+    chunk: float = 0.03
+    jitter: float = 0.25
+    speed: float = 1.0
+
+    @classmethod
+    def instant(cls) -> "LocalLatencies":
+        """No sleeps and no pending statuses, for tests and functional checks."""
+        return cls(speed=0.0)
+
+    def seconds(self, name: str, rng: random.Random) -> float:
+        _base = getattr(self, name) * self.speed
+        if _base <= 0:
+            return 0.0
+        return max(_base * (1 + rng.uniform(-self.jitter, self.jitter)), 0.0)
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _make_id(*parts: str, length: int = 10) -> str:
+    """Service-style id derived from names, so every process of a run builds the same ids."""
+    _digest = hashlib.sha256("/".join(parts).encode("utf-8")).digest()
+    return "".join(
+        _ID_ALPHABET[_byte % len(_ID_ALPHABET)] for _byte in _digest[:length]
+    )
+
+
+def _words(text: str) -> set:
+    return set(_WORD.findall((text or "").lower()))
+
+
+def _tokens(text: str) -> int:
+    return max(len(text or "") // 4, 1)
+
+
+class LocalCompletionStream:
+    """Completion event stream of invoke_agent; iterate once, close() to stop early.
+
+    close() may be called from another thread than the reader's, which then stops after its
+    current event.
+    """
+
+    def __init__(self, events: Iterator[Dict]):
+        self._events = events
+        self._closed = False
+
+    def __iter__(self):
+        for _event in self._events:
+            if self._closed:
+                return
+            yield _event
+
+    def close(self) -> None:
+        self._closed = True
+
+
+class LocalBedrockAgents:
+    """In-memory stand-in for the bedrock-agent and bedrock-agent-runtime calls used by the helper and app.
+
+    Methods take and return the API's own parameter and response names. Every call is recorded in
+    .calls as (operation, kwargs).
+    """
+
+    class exceptions:
+        class ValidationException(LocalServiceError):
+            pass
+
+        class ResourceNotFoundException(LocalServiceError):
+            code = "ResourceNotFoundException"
+            status_code = 404
+
+        class ConflictException(LocalServiceError):
+            code = "ConflictException"
+            status_code = 409
+
+        class ThrottlingException(LocalServiceError):
+            code = "ThrottlingException"
+            status_code = 429
+
+    def __init__(
+        self,
+        region: str = "us-east-1",
+        account_id: str = "000000000000",
+        latencies: LocalLatencies = None,
+        throttle_rate: float = 0.0,
+        unknown_agents: bool = False,
+        seed: int = None,
+    ):
+        """Constructs an instance.
+
+        Args:
+            region (str, optional): Region of the generated ARNs. Defaults to "us-east-1".
+            account_id (str, optional): Account of the generated ARNs and of GetCallerIdentity.
+            latencies (LocalLatencies, optional): Simulated timings. Defaults to LocalLatencies().
+            throttle_rate (float, optional): Fraction of calls failing with ThrottlingException. Defaults to 0.
+            unknown_agents (bool, optional): Answer invoke_agent for agent ids that were never created, as a
+            plain agent named after the id, instead of raising ResourceNotFoundException. Defaults to False.
+            seed (int, optional): Seed of the random source; the streams of one (session, text) are always
+            the same for a given seed. Defaults to None, i.e. a fixed seed of 0.
+        """
+        self.region = region
+        self.account_id = account_id
+        self.latencies = latencies or LocalLatencies()
+        self.throttle_rate = throttle_rate
+        self.unknown_agents = unknown_agents
+        self.seed = seed or 0
+        self.agents = {}
+        self.calls = []
+        self._rng = random.Random(self.seed)
+        self._lock = threading.RLock()
+        # sessionId -> collaborator alias arn that answered the previous turn
+        self._previous_collaborator = {}
+
+    # -- plumbing
+
+    def _call(self, operation: str, kwargs: Dict) -> None:
+        with self._lock:
+            self.calls.append((operation, kwargs))
+            _throttled = self.throttle_rate and self._rng.random() < self.throttle_rate
+            _delay = self.latencies.seconds("control_plane", self._rng)
+        if _throttled:
+            raise self.exceptions.ThrottlingException(f"Rate exceeded for {operation}")
+        if _delay and operation != "invoke_agent":
+            time.sleep(_delay)
+
+    def _settle(self, record: Dict, status_key: str) -> None:
+        """Completes a pending status transition of an agent or alias once its time has come."""
+        _pending = record.get("_pending")
+        if _pending and time.monotonic() >= _pending[1]:
+            record.pop("_pending")
+            record[status_key] = _pending[0]
+            record["updatedAt"] = _now()
+            if _pending[0] == "DELETED":
+                self.agents.pop(record.get("agentId"), None)
+                record["_deleted"] = True
+
+    def _transition(
+        self, record: Dict, status_key: str, interim: str, final: str
+    ) -> None:
+        _delay = self.latencies.seconds("transition", self._rng)
+        record[status_key] = interim
+        record["updatedAt"] = _now()
+        record["_pending"] = (final, time.monotonic() + _delay)
+        self._settle(record, status_key)
+
+    def _agent(self, agent_id: str) -> Dict:
+        _agent = self.agents.get(agent_id)
+        if _agent is not None:
+            self._settle(_agent, "agentStatus")
+        if _agent is None or _agent.get("_deleted"):
+            raise self.exceptions.ResourceNotFoundException(
+                f"Agent {agent_id} not found"
+            )
+        return _agent
+
+    def _alias(self, agent_id: str, alias_id: str) -> Dict:
+        _alias = self._agent(agent_id)["aliases"].get(alias_id)
+        if _alias is None:
+            raise self.exceptions.ResourceNotFoundException(
+                f"Alias {alias_id} of agent {agent_id} not found"
+            )
+        self._settle(_alias, "agentAliasStatus")
+        return _alias
+
+    def _require_not_busy(self, agent: Dict) -> None:
+        if agent["agentStatus"] in ("CREATING", "UPDATING", "PREPARING", "DELETING"):
+            raise self.exceptions.ConflictException(
+                f"Agent {agent['agentId']} is {agent['agentStatus']}, retry once it settles"
+            )
+
+    def _draft_changed(self, agent: Dict) -> None:
+        if agent["agentStatus"] == "PREPARED":
+            agent["agentStatus"] = "NOT_PREPARED"
+        agent["updatedAt"] = _now()
+
+    @staticmethod
+    def _public(
+        record: Dict,
+        drop=("aliases", "actionGroups", "knowledgeBases", "collaborators"),
+    ) -> Dict:
+        return {
+            _key: _value
+            for _key, _value in record.items()
+            if not _key.startswith("_") and _key not in drop
+        }
+
+    def alias_arn(self, agent_id: str, alias_id: str) -> str:
+        return f"arn:aws:bedrock:{self.region}:{self.account_id}:agent-alias/{agent_id}/{alias_id}"
+
+    def _find_by_alias_arn(self, alias_arn: str) -> Dict:
+        _agent_id, _alias_id = alias_arn.split("/")[-2:]
+        return self._alias(_agent_id, _alias_id)
+
+    # -- agents
+
+    def create_agent(self, agentName, **kwargs):
+        with self._lock:
+            self._call("create_agent", dict(kwargs, agentName=agentName))
+            if any(
+                _a["agentName"] == agentName and not _a.get("_deleted")
+                for _a in self.agents.values()
+            ):
+                raise self.exceptions.ConflictException(
+                    f"Agent with name {agentName} already exists"
+                )
+            _agent_id = _make_id("agent", agentName)
+            _agent = {
+                "agentId": _agent_id,
+                "agentName": agentName,
+                "agentArn": f"arn:aws:bedrock:{self.region}:{self.account_id}:agent/{_agent_id}",
+                "agentVersion": "DRAFT",
+                "latestAgentVersion": "DRAFT",
+                "agentCollaboration": "DISABLED",
+                "idleSessionTTLInSeconds": 600,
+                "createdAt": _now(),
+                "aliases": {},
+                "actionGroups": {},
+                "knowledgeBases": {},
+                "collaborators": {},
+                "_versions": 0,
+            }
+            _agent.update(kwargs)
+            self.agents[_agent_id] = _agent
+            self._transition(_agent, "agentStatus", "CREATING", "NOT_PREPARED")
+            return {"agent": self._public(_agent)}
+
+    def get_agent(self, agentId):
+        with self._lock:
+            self._call("get_agent", {"agentId": agentId})
+            return {"agent": self._public(self._agent(agentId))}
+
+    def list_agents(self, maxResults=100, nextToken=None):
+        with self._lock:
+            self._call(
+                "list_agents", {"maxResults": maxResults, "nextToken": nextToken}
+            )
+            for _agent in list(self.agents.values()):
+                self._settle(_agent, "agentStatus")
+            _summaries = [
+                {
+                    _key: _agent[_key]
+                    for _key in (
+                        "agentId",
+                        "agentName",
+                        "agentStatus",
+                        "description",
+                        "latestAgentVersion",
+                        "updatedAt",
+                    )
+                    if _key in _agent
+                }
+                for _agent in self.agents.values()
+                if not _agent.get("_deleted")
+            ]
+            return self._page(_summaries, "agentSummaries", maxResults, nextToken)
+
+    @staticmethod
+    def _page(items: List[Dict], key: str, max_results: int, next_token: str) -> Dict:
+        _start = int(next_token or 0)
+        _end = _start + (max_results or 100)
+        _resp = {key: items[_start:_end]}
+        if _end < len(items):
+            _resp["nextToken"] = str(_end)
+        return _resp
+
+    def update_agent(self, agentId, agentName, **kwargs):
+        with self._lock:
+            self._call(
+                "update_agent", dict(kwargs, agentId=agentId, agentName=agentName)
+            )
+            _agent = self._agent(agentId)
+            self._require_not_busy(_agent)
+            _agent.update(kwargs, agentName=agentName)
+            self._transition(_agent, "agentStatus", "UPDATING", "NOT_PREPARED")
+            return {"agent": self._public(_agent)}
+
+    def prepare_agent(self, agentId):
+        with self._lock:
+            self._call("prepare_agent", {"agentId": agentId})
+            _agent = self._agent(agentId)
+            self._require_not_busy(_agent)
+            _agent["preparedAt"] = _now()
+            self._transition(_agent, "agentStatus", "PREPARING", "PREPARED")
+            return {
+                "agentId": agentId,
+                "agentStatus": _agent["agentStatus"],
+                "agentVersion": "DRAFT",
+                "preparedAt": _agent["preparedAt"],
+            }
+
+    def delete_agent(self, agentId, skipResourceInUseCheck=False):
+        with self._lock:
+            self._call("delete_agent", {"agentId": agentId})
+            _agent = self._agent(agentId)
+            if _agent["aliases"] and not skipResourceInUseCheck:
+                raise self.exceptions.ConflictException(
+                    f"Agent {agentId} still has aliases, delete them first"
+                )
+            self._transition(_agent, "agentStatus", "DELETING", "DELETED")
+            return {"agentId": agentId, "agentStatus": "DELETING"}
+
+    # -- aliases
+
+    def create_agent_alias(self, agentId, agentAliasName, **kwargs):
+        with self._lock:
+            self._call(
+                "create_agent_alias",
+                dict(kwargs, agentId=agentId, agentAliasName=agentAliasName),
+            )
+            _agent = self._agent(agentId)
+            if any(
+                _a["agentAliasName"] == agentAliasName
+                for _a in _agent["aliases"].values()
+            ):
+                raise self.exceptions.ConflictException(
+                    f"Alias {agentAliasName} of agent {agentId} already exists"
+                )
+            if "routingConfiguration" not in kwargs:
+                # a new alias snapshots the prepared draft into a new numbered version
+                _agent["_versions"] += 1
+                _agent["latestAgentVersion"] = str(_agent["_versions"])
+                kwargs["routingConfiguration"] = [
+                    {"agentVersion": _agent["latestAgentVersion"]}
+                ]
+            _alias_id = _make_id("alias", agentId, agentAliasName)
+            _alias = {
+                "agentId": agentId,
+                "agentAliasId": _alias_id,
+                "agentAliasName": agentAliasName,
+                "agentAliasArn": self.alias_arn(agentId, _alias_id),
+                "createdAt": _now(),
+            }
+            _alias.update(kwargs)
+            _agent["aliases"][_alias_id] = _alias
+            self._transition(_alias, "agentAliasStatus", "CREATING", "PREPARED")
+            return {"agentAlias": self._public(_alias)}
+
+    def get_agent_alias(self, agentId, agentAliasId):
+        with self._lock:
+            self._call(
+                "get_agent_alias", {"agentId": agentId, "agentAliasId": agentAliasId}
+            )
+            return {"agentAlias": self._public(self._alias(agentId, agentAliasId))}
+
+    def list_agent_aliases(self, agentId, maxResults=100, nextToken=None):
+        with self._lock:
+            self._call("list_agent_aliases", {"agentId": agentId})
+            _aliases = []
+            for _alias in self._agent(agentId)["aliases"].values():
+                self._settle(_alias, "agentAliasStatus")
+                _aliases.append(self._public(_alias, drop=("agentAliasArn", "agentId")))
+            return self._page(_aliases, "agentAliasSummaries", maxResults, nextToken)
+
+    def delete_agent_alias(self, agentId, agentAliasId):
+        with self._lock:
+            self._call(
+                "delete_agent_alias", {"agentId": agentId, "agentAliasId": agentAliasId}
+            )
+            self._alias(agentId, agentAliasId)
+            del self.agents[agentId]["aliases"][agentAliasId]
+            return {
+                "agentId": agentId,
+                "agentAliasId": agentAliasId,
+                "agentAliasStatus": "DELETING",
+            }
+
+    # -- action groups
+
+    def _action_group(self, agentId, actionGroupId) -> Dict:
+        _group = self._agent(agentId)["actionGroups"].get(actionGroupId)
+        if _group is None:
+            raise self.exceptions.ResourceNotFoundException(
+                f"Action group {actionGroupId} of agent {agentId} not found"
+            )
+        return _group
+
+    def create_agent_action_group(
+        self, agentId, agentVersion, actionGroupName, **kwargs
+    ):
+        with self._lock:
+            self._call(
+                "create_agent_action_group",
+                dict(kwargs, agentId=agentId, actionGroupName=actionGroupName),
+            )
+            _agent = self._agent(agentId)
+            if any(
+                _g["actionGroupName"] == actionGroupName
+                for _g in _agent["actionGroups"].values()
+            ):
+                raise self.exceptions.ConflictException(
+                    f"Action group {actionGroupName} of agent {agentId} already exists"
+                )
+            _group_id = _make_id("action-group", agentId, actionGroupName)
+            _group = {
+                "agentId": agentId,
+                "agentVersion": agentVersion,
+                "actionGroupId": _group_id,
+                "actionGroupName": actionGroupName,
+                "actionGroupState": "ENABLED",
+                "createdAt": _now(),
+                "updatedAt": _now(),
+            }
+            _group.update(kwargs)
+            _agent["actionGroups"][_group_id] = _group
+            self._draft_changed(_agent)
+            return {"agentActionGroup": dict(_group)}
+
+    def get_agent_action_group(self, agentId, agentVersion, actionGroupId):
+        with self._lock:
+            self._call(
+                "get_agent_action_group",
+                {"agentId": agentId, "actionGroupId": actionGroupId},
+            )
+            return {
+                "agentActionGroup": dict(self._action_group(agentId, actionGroupId))
+            }
+
+    def list_agent_action_groups(
+        self, agentId, agentVersion, maxResults=100, nextToken=None
+    ):
+        with self._lock:
+            self._call("list_agent_action_groups", {"agentId": agentId})
+            _summaries = [
+                {
+                    _key: _group[_key]
+                    for _key in (
+                        "actionGroupId",
+                        "actionGroupName",
+                        "actionGroupState",
+                        "description",
+                        "updatedAt",
+                    )
+                    if _key in _group
+                }
+                for _group in self._agent(agentId)["actionGroups"].values()
+            ]
+            return self._page(_summaries, "actionGroupSummaries", maxResults, nextToken)
+
+    def update_agent_action_group(
+        self, agentId, agentVersion, actionGroupId, actionGroupName, **kwargs
+    ):
+        with self._lock:
+            self._call(
+                "update_agent_action_group",
+                dict(kwargs, agentId=agentId, actionGroupId=actionGroupId),
+            )
+            _group = self._action_group(agentId, actionGroupId)
+            _group.update(kwargs, actionGroupName=actionGroupName, updatedAt=_now())
+            self._draft_changed(self._agent(agentId))
+            return {"agentActionGroup": dict(_group)}
+
+    def delete_agent_action_group(self, agentId, agentVersion, actionGroupId, **kwargs):
+        with self._lock:
+            self._call(
+                "delete_agent_action_group",
+                {"agentId": agentId, "actionGroupId": actionGroupId},
+            )
+            self._action_group(agentId, actionGroupId)
+            del self.agents[agentId]["actionGroups"][actionGroupId]
+            self._draft_changed(self._agent(agentId))
+            return {}
+
+    # -- knowledge bases
+
+    def associate_agent_knowledge_base(
+        self, agentId, agentVersion, knowledgeBaseId, description="", **kwargs
+    ):
+        with self._lock:
+            self._call(
+                "associate_agent_knowledge_base",
+                dict(kwargs, agentId=agentId, knowledgeBaseId=knowledgeBaseId),
+            )
+            _agent = self._agent(agentId)
+            if knowledgeBaseId in _agent["knowledgeBases"]:
+                raise self.exceptions.ConflictException(
+                    f"Knowledge base {knowledgeBaseId} is already associated with agent {agentId}"
+                )
+            _association = {
+                "agentId": agentId,
+                "agentVersion": agentVersion,
+                "knowledgeBaseId": knowledgeBaseId,
+                "description": description,
+                "knowledgeBaseState": kwargs.get("knowledgeBaseState", "ENABLED"),
+                "createdAt": _now(),
+                "updatedAt": _now(),
+            }
+            _agent["knowledgeBases"][knowledgeBaseId] = _association
+            self._draft_changed(_agent)
+            return {"agentKnowledgeBase": dict(_association)}
+
+    def list_agent_knowledge_bases(
+        self, agentId, agentVersion, maxResults=100, nextToken=None
+    ):
+        with self._lock:
+            self._call("list_agent_knowledge_bases", {"agentId": agentId})
+            _summaries = [
+                dict(_kb) for _kb in self._agent(agentId)["knowledgeBases"].values()
+            ]
+            return self._page(
+                _summaries, "agentKnowledgeBaseSummaries", maxResults, nextToken
+            )
+
+    # -- collaborators
+
+    def _collaborator(self, agentId, collaboratorId) -> Dict:
+        _collaborator = self._agent(agentId)["collaborators"].get(collaboratorId)
+        if _collaborator is None:
+            raise self.exceptions.ResourceNotFoundException(
+                f"Collaborator {collaboratorId} of agent {agentId} not found"
+            )
+        return _collaborator
+
+    def associate_agent_collaborator(
+        self, agentId, agentVersion, agentDescriptor, collaboratorName, **kwargs
+    ):
+        with self._lock:
+            self._call(
+                "associate_agent_collaborator",
+                dict(kwargs, agentId=agentId, collaboratorName=collaboratorName),
+            )
+            _agent = self._agent(agentId)
+            if _agent.get("agentCollaboration", "DISABLED") == "DISABLED":
+                raise self.exceptions.ValidationException(
+                    f"Agent {agentId} does not have agent collaboration enabled"
+                )
+            if any(
+                _c["collaboratorName"] == collaboratorName
+                for _c in _agent["collaborators"].values()
+            ):
+                raise self.exceptions.ConflictException(
+                    f"Collaborator {collaboratorName} of agent {agentId} already exists"
+                )
+            self._find_by_alias_arn(agentDescriptor["aliasArn"])
+            _collaborator_id = _make_id("collaborator", agentId, collaboratorName)
+            _collaborator = {
+                "agentId": agentId,
+                "agentVersion": agentVersion,
+                "collaboratorId": _collaborator_id,
+                "collaboratorName": collaboratorName,
+                "agentDescriptor": dict(agentDescriptor),
+                "collaborationInstruction": "",
+                "relayConversationHistory": "DISABLED",
+                "createdAt": _now(),
+                "lastUpdatedAt": _now(),
+            }
+            _collaborator.update(kwargs)
+            _agent["collaborators"][_collaborator_id] = _collaborator
+            self._draft_changed(_agent)
+            return {"agentCollaborator": dict(_collaborator)}
+
+    def update_agent_collaborator(
+        self,
+        agentId,
+        agentVersion,
+        collaboratorId,
+        agentDescriptor,
+        collaboratorName,
+        **kwargs,
+    ):
+        with self._lock:
+            self._call(
+                "update_agent_collaborator",
+                dict(kwargs, agentId=agentId, collaboratorId=collaboratorId),
+            )
+            _collaborator = self._collaborator(agentId, collaboratorId)
+            _collaborator.update(
+                kwargs,
+                agentDescriptor=dict(agentDescriptor),
+                collaboratorName=collaboratorName,
+                lastUpdatedAt=_now(),
+            )
+            self._draft_changed(self._agent(agentId))
+            return {"agentCollaborator": dict(_collaborator)}
+
+    def get_agent_collaborator(self, agentId, agentVersion, collaboratorId):
+        with self._lock:
+            self._call(
+                "get_agent_collaborator",
+                {"agentId": agentId, "collaboratorId": collaboratorId},
+            )
+            return {
+                "agentCollaborator": dict(self._collaborator(agentId, collaboratorId))
+            }
+
+    def list_agent_collaborators(
+        self, agentId, agentVersion, maxResults=100, nextToken=None
+    ):
+        with self._lock:
+            self._call("list_agent_collaborators", {"agentId": agentId})
+            _summaries = [
+                dict(_c) for _c in self._agent(agentId)["collaborators"].values()
+            ]
+            return self._page(
+                _summaries, "agentCollaboratorSummaries", maxResults, nextToken
+            )
+
+    def disassociate_agent_collaborator(self, agentId, agentVersion, collaboratorId):
+        with self._lock:
+            self._call(
+                "disassociate_agent_collaborator",
+                {"agentId": agentId, "collaboratorId": collaboratorId},
+            )
+            self._collaborator(agentId, collaboratorId)
+            del self.agents[agentId]["collaborators"][collaboratorId]
+            self._draft_changed(self._agent(agentId))
+            return {}
+
+    # -- sts
+
+    def get_caller_identity(self):
+        return {
+            "UserId": "AIDALOCALBEDROCKAGENTS",
+            "Account": self.account_id,
+            "Arn": f"arn:aws:iam::{self.account_id}:user/local",
+        }
+
+    # -- runtime
+
+    def invoke_agent(
+        self,
+        agentId,
+        agentAliasId,
+        sessionId,
+        inputText="",
+        enableTrace=False,
+        streamingConfigurations=None,
+        **kwargs,
+    ):
+        """Starts a turn; the returned completion stream is generated lazily while it is read."""
+        self._call("invoke_agent", {"agentId": agentId, "agentAliasId": agentAliasId})
+        with self._lock:
+            if agentId not in self.agents and self.unknown_agents:
+                # registered, so that get_agent and list_agents agree with the invocation
+                self.agents[agentId] = {
+                    "agentId": agentId,
+                    "agentName": agentId,
+                    "agentStatus": "PREPARED",
+                    "agentVersion": "DRAFT",
+                    "latestAgentVersion": "DRAFT",
+                    "agentCollaboration": "DISABLED",
+                    "createdAt": _now(),
+                    "updatedAt": _now(),
+                    "actionGroups": {},
+                    "knowledgeBases": {},
+                    "collaborators": {},
+                    "aliases": {},
+                    "_versions": 0,
+                    "_unknown": True,
+                }
+            _agent = self._agent(agentId)
+            if _agent.get("_unknown") and agentAliasId != TEST_ALIAS_ID:
+                # every alias id an unknown agent is invoked with exists from then on
+                _agent["aliases"].setdefault(
+                    agentAliasId,
+                    {
+                        "agentId": agentId,
+                        "agentAliasId": agentAliasId,
+                        "agentAliasName": agentAliasId,
+                        "agentAliasArn": self.alias_arn(agentId, agentAliasId),
+                        "agentAliasStatus": "PREPARED",
+                        "routingConfiguration": [{"agentVersion": "DRAFT"}],
+                        "createdAt": _now(),
+                        "updatedAt": _now(),
+                    },
+                )
+            # aliases serve their own version, the test alias serves the prepared draft
+            if agentAliasId == TEST_ALIAS_ID:
+                _status = _agent["agentStatus"]
+            else:
+                _status = self._alias(agentId, agentAliasId)["agentAliasStatus"]
+            if _status != "PREPARED":
+                raise self.exceptions.ValidationException(
+                    f"Agent {agentId} alias {agentAliasId} is {_status}, prepare it before invoking"
+                )
+        _streaming = bool((streamingConfigurations or {}).get("streamFinalResponse"))
+        _turn = _Turn(
+            self, _agent, agentAliasId, sessionId, inputText, enableTrace, _streaming
+        )
+        return {
+            "completion": LocalCompletionStream(_turn.events()),
+            "contentType": "application/json",
+            "sessionId": sessionId,
+            "ResponseMetadata": {
+                "RequestId": str(uuid.uuid4()),
+                "HTTPStatusCode": 200,
+                "HTTPHeaders": {},
+                "RetryAttempts": 0,
+            },
+        }
+
+
+class _Turn:
+    """Generates the completion events of one invoke_agent call."""
+
+    def __init__(
+        self, service, agent, alias_id, session_id, text, enable_trace, streaming
+    ):
+        self.service = service
+        self.agent = agent
+        self.alias_id = alias_id
+        self.session_id = session_id
+        self.text = text
+        self.enable_trace = enable_trace
+        self.streaming = streaming
+        # the same question in the same session always takes the same path
+        self.rng = random.Random(f"{service.seed}/{session_id}/{text}")
+        self.chain = [{"agentAliasArn": service.alias_arn(agent["agentId"], alias_id)}]
+
+    def _sleep(self, name: str) -> None:
+        _seconds = self.service.latencies.seconds(name, self.rng)
+        if _seconds:
+            time.sleep(_seconds)
+
+    def _trace(self, agent: Dict, chain: List[Dict], kind: str, body: Dict) -> Dict:
+        _trace = {
+            "agentId": agent["agentId"],
+            "agentAliasId": chain[-1]["agentAliasArn"].split("/")[-1],
+            "agentVersion": agent.get("latestAgentVersion", "DRAFT"),
+            "sessionId": self.session_id,
+            "eventTime": _now(),
+            "callerChain": list(chain),
+            "trace": {kind: body},
+        }
+        if len(chain) > 1:
+            _trace["collaboratorName"] = agent["agentName"]
+        return {"trace": _trace}
+
+    def _usage(self, prompt: str, instruction: str = "") -> Dict:
+        return {
+            "inputTokens": _tokens(prompt)
+            + _tokens(instruction)
+            + self.rng.randint(400, 1200),
+            "outputTokens": self.rng.randint(30, 250),
+        }
+
+    def events(self) -> Iterator[Dict]:
+        self._sleep("first_event")
+        _agent, _chain = self.agent, self.chain
+        if (
+            self.agent.get("agentCollaboration") == "SUPERVISOR_ROUTER"
+            and self.agent["collaborators"]
+        ):
+            _routed = yield from self._route()
+            if _routed is not None:
+                _agent, _chain = _routed
+        _answer, _references, _files = yield from self._orchestrate(_agent, _chain)
+        yield from self._answer(_answer, _references)
+        if _files:
+            yield {"files": {"files": _files}}
+
+    def _route(self):
+        """Routing classifier of a SUPERVISOR_ROUTER agent; returns the (agent, chain) answering the turn."""
+        _supervisor = self.agent
+        _trace_id = str(uuid.uuid4())
+        if self.enable_trace:
+            yield self._trace(
+                _supervisor,
+                self.chain,
+                "routingClassifierTrace",
+                {
+                    "modelInvocationInput": {
+                        "traceId": _trace_id,
+                        "type": "ROUTING_CLASSIFIER",
+                        "text": self.text,
+                    }
+                },
+            )
+        self._sleep("llm_call")
+
+        _question = _words(self.text)
+        _best, _best_score = None, 0
+        for _collaborator in _supervisor["collaborators"].values():
+            _score = len(
+                _question
+                & _words(
+                    _collaborator["collaboratorName"]
+                    .replace("_", " ")
+                    .replace("-", " ")
+                    + " "
+                    + _collaborator.get("collaborationInstruction", "")
+                )
+            )
+            if _score > _best_score:
+                _best, _best_score = _collaborator, _score
+        _previous = self.service._previous_collaborator.get(self.session_id)
+        if _best is not None:
+            _classification = _best["collaboratorName"]
+        elif _previous is not None:
+            _classification = "keep_previous_agent"
+        else:
+            _classification = UNDECIDABLE_CLASSIFICATION
+
+        if self.enable_trace:
+            yield self._trace(
+                _supervisor,
+                self.chain,
+                "routingClassifierTrace",
+                {
+                    "modelInvocationOutput": {
+                        "traceId": _trace_id,
+                        "rawResponse": {
+                            "content": json.dumps(
+                                {"content": [{"text": f"<a>{_classification}</a>"}]}
+                            )
+                        },
+                        "metadata": {"usage": self._usage(self.text)},
+                    }
+                },
+            )
+
+        if _classification == UNDECIDABLE_CLASSIFICATION:
+            return None
+        _alias_arn = (
+            _best["agentDescriptor"]["aliasArn"] if _best is not None else _previous
+        )
+        self.service._previous_collaborator[self.session_id] = _alias_arn
+        _agent_id = _alias_arn.split("/")[-2]
+        with self.service._lock:
+            _agent = self.service.agents.get(_agent_id)
+        if _agent is None:
+            return None
+        return _agent, self.chain + [{"agentAliasArn": _alias_arn}]
+
+    def _orchestrate(self, agent: Dict, chain: List[Dict]):
+        """One orchestration loop: plan, call a tool or collaborator, observe, answer."""
+        _profile = agent.get("_profile", {})
+        _instruction = agent.get("instruction", "")
+        _tools = []
+        for _group in agent["actionGroups"].values():
+            if _group.get("parentActionGroupSignature") == "AMAZON.CodeInterpreter":
+                _tools.append(("code", _group))
+            elif not _group.get("parentActionGroupSignature"):
+                _tools.append(("action", _group))
+        _tools.extend(("kb", _kb) for _kb in agent["knowledgeBases"].values())
+        if len(chain) < 3:
+            _tools.extend(
+                ("collaborator", _c) for _c in agent["collaborators"].values()
+            )
+        _kind, _tool = self.rng.choice(_tools) if _tools else (None, None)
+
+        _trace_id = str(uuid.uuid4())
+        _references, _files = [], []
+
+        def _trace(part: str, body: Dict) -> Dict:
+            return self._trace(
+                agent,
+                chain,
+                "orchestrationTrace",
+                {part: dict(body, traceId=_trace_id)},
+            )
+
+        def _model_step(rationale: str):
+            if self.enable_trace:
+                yield _trace(
+                    "modelInvocationInput", {"type": "ORCHESTRATION", "text": self.text}
+                )
+            self._sleep("llm_call")
+            if self.enable_trace:
+                yield _trace(
+                    "modelInvocationOutput",
+                    {"metadata": {"usage": self._usage(self.text, _instruction)}},
+                )
+                if rationale:
+                    yield _trace("rationale", {"text": rationale})
+
+        yield from _model_step(
+            f"To answer '{self.text[:80]}' I will "
+            + {
+                "action": "call a tool.",
+                "kb": "search the knowledge base.",
+                "code": "write and run some code.",
+                "collaborator": "ask a collaborator.",
+                None: "answer directly.",
+            }[_kind]
+        )
+
+        if _kind == "action":
+            _functions = _tool.get("functionSchema", {}).get("functions") or [
+                {"name": "run"}
+            ]
+            _function = self.rng.choice(_functions)
+            _input = {
+                "invocationType": "ACTION_GROUP",
+                "actionGroupInvocationInput": {
+                    "actionGroupName": _tool["actionGroupName"],
+                    "function": _function["name"],
+                    "executionType": "LAMBDA",
+                    "parameters": [
+                        {
+                            "name": _name,
+                            "type": _spec.get("type", "string"),
+                            "value": self.text[:60],
+                        }
+                        for _name, _spec in _function.get("parameters", {}).items()
+                    ],
+                },
+            }
+        elif _kind == "kb":
+            _input = {
+                "invocationType": "KNOWLEDGE_BASE",
+                "knowledgeBaseLookupInput": {
+                    "knowledgeBaseId": _tool["knowledgeBaseId"],
+                    "text": self.text,
+                },
+            }
+        elif _kind == "code":
+            _input = {
+                "invocationType": "ACTION_GROUP_CODE_INTERPRETER",
+                "codeInterpreterInvocationInput": {
+                    "code": "import pandas as pd\n\ndf = pd.DataFrame({'x': range(10)})\nprint(df.describe())"
+                },
+            }
+        elif _kind == "collaborator":
+            _input = {
+                "invocationType": "AGENT_COLLABORATOR",
+                "agentCollaboratorInvocationInput": {
+                    "agentCollaboratorName": _tool["collaboratorName"],
+                    "agentCollaboratorAliasArn": _tool["agentDescriptor"]["aliasArn"],
+                    "input": {"type": "TEXT", "text": self.text},
+                },
+            }
+        if _kind is not None and self.enable_trace:
+            yield _trace("invocationInput", _input)
+
+        if _kind == "action":
+            self._sleep("tool_call")
+            _observation = {
+                "type": "ACTION_GROUP",
+                "actionGroupInvocationOutput": {
+                    "text": json.dumps(
+                        {
+                            "result": f"{_function['name']} completed",
+                            "rows": self.rng.randint(1, 40),
+                        }
+                    )
+                },
+            }
+        elif _kind == "kb":
+            self._sleep("tool_call")
+            _references = [
+                {
+                    "content": {
+                        "text": f"Passage {_i + 1} of the documents on {self.text[:60]}"
+                    },
+                    "location": {
+                        "type": "S3",
+                        "s3Location": {
+                            "uri": f"s3://{_tool['knowledgeBaseId'].lower()}-docs/doc-{self.rng.randint(1, 99)}.pdf"
+                        },
+                    },
+                    "metadata": {"x-amz-bedrock-kb-chunk-id": str(uuid.uuid4())},
+                }
+                for _i in range(self.rng.randint(1, 4))
+            ]
+            _observation = {
+                "type": "KNOWLEDGE_BASE",
+                "knowledgeBaseLookupOutput": {"retrievedReferences": _references},
+            }
+        elif _kind == "code":
+            self._sleep("tool_call")
+            _output = {"executionOutput": "count    10.0\nmean      4.5"}
+            if _profile.get("files"):
+                _files = [
+                    {
+                        "name": "chart.png",
+                        "type": "image/png",
+                        "bytes": b"\x89PNG\r\n\x1a\n",
+                    }
+                ]
+                _output["files"] = [_file["name"] for _file in _files]
+            _observation = {
+                "type": "ACTION_GROUP_CODE_INTERPRETER",
+                "codeInterpreterInvocationOutput": _output,
+            }
+        elif _kind == "collaborator":
+            _alias_arn = _tool["agentDescriptor"]["aliasArn"]
+            with self.service._lock:
+                _sub_agent = self.service.agents.get(_alias_arn.split("/")[-2])
+            _sub_answer = "No answer"
+            if _sub_agent is not None:
+                _sub_answer, _references, _files = yield from self._orchestrate(
+                    _sub_agent, chain + [{"agentAliasArn": _alias_arn}]
+                )
+            _observation = {
+                "type": "AGENT_COLLABORATOR",
+                "agentCollaboratorInvocationOutput": {
+                    "agentCollaboratorName": _tool["collaboratorName"],
+                    "agentCollaboratorAliasArn": _alias_arn,
+                    "output": {"type": "TEXT", "text": _sub_answer},
+                },
+            }
+        if _kind is not None:
+            if self.enable_trace:
+                yield _trace("observation", _observation)
+            yield from _model_step("")
+
+        _answer = _profile.get("answer") or self._compose_answer(agent, _kind)
+        if self.enable_trace:
+            yield _trace(
+                "observation", {"type": "FINISH", "finalResponse": {"text": _answer}}
+            )
+        return _answer, _references, _files
+
+    def _compose_answer(self, agent: Dict, kind: str) -> str:
+        _source = {
+            "action": "the tool results",
+            "kb": "the knowledge base",
+            "code": "the computed figures",
+            "collaborator": "my collaborator's findings",
+            None: "what I know",
+        }[kind]
+        _filler = (
+            "The figures are within the expected range and no further action is needed "
+            "unless the pattern persists over the coming days."
+        ).split()
+        _length = self.rng.randint(12, len(_filler))
+        return (
+            f"{agent['agentName']} here. Based on {_source}, regarding \"{self.text[:120]}\": "
+            + " ".join(_filler[:_length]).rstrip(".")
+            + "."
+        )
+
+    def _answer(self, answer: str, references: List[Dict]):
+        _pieces = [answer]
+        if self.streaming:
+            _words_of_answer = answer.split(" ")
+            _pieces = [
+                " ".join(_words_of_answer[_i : _i + 6])
+                + (" " if _i + 6 < len(_words_of_answer) else "")
+                for _i in range(0, len(_words_of_answer), 6)
+            ]
+        for _i, _piece in enumerate(_pieces):
+            if _i:
+                self._sleep("chunk")
+            _chunk = {"bytes": _piece.encode("utf-8")}
+            if references and _i == len(_pieces) - 1:
+                _chunk["attribution"] = {
+                    "citations": [
+                        {
+                            "generatedResponsePart": {
+                                "textResponsePart": {
+                                    "text": answer,
+                                    "span": {"start": 0, "end": len(answer)},
+                                }
+                            },
+                            "retrievedReferences": references,
+                        }
+                    ]
+                }
+            yield {"chunk": _chunk}
+
+
+def load_agents(service: LocalBedrockAgents, path: str) -> Dict[str, Dict]:
+    """Creates, prepares and aliases the agents described in a YAML file, settling them at once.
+
+    The file holds a list under "agents"; each entry has a name and optionally instruction,
+    collaboration (DISABLED, SUPERVISOR or SUPERVISOR_ROUTER), alias (defaults to DEFAULT_ALIAS_NAME),
+    action_groups (name and functions: list of names), knowledge_bases (list of ids),
+    code_interpreter (bool), files (bool, code interpreter turns return a file), answer (fixed answer
+    text) and collaborators (name and instruction; each names another agent of the file that has no
+    collaborators itself). Ids are derived
+    from the names, so every process loading the same file sees the same agents.
+
+    Returns:
+        Dict[str, Dict]: agent_id and agent_alias_id by agent name
+    """
+    with open(path, "r") as _file:
+        _spec = yaml.safe_load(_file) or {}
+
+    _resolved = {}
+    _latencies, service.latencies = service.latencies, LocalLatencies.instant()
+    try:
+        for _entry in _spec.get("agents", []):
+            _agent = service.create_agent(
+                agentName=_entry["name"],
+                instruction=_entry.get("instruction", ""),
+                agentCollaboration=_entry.get("collaboration", "DISABLED"),
+                foundationModel=_entry.get("foundation_model", "local.model"),
+            )["agent"]
+            _agent_id = _agent["agentId"]
+            service.agents[_agent_id]["_profile"] = {
+                _key: _entry[_key] for _key in ("files", "answer") if _key in _entry
+            }
+            for _group in _entry.get("action_groups", []):
+                service.create_agent_action_group(
+                    agentId=_agent_id,
+                    agentVersion="DRAFT",
+                    actionGroupName=_group["name"],
+                    actionGroupExecutor={
+                        "lambda": f"arn:aws:lambda:{service.region}:{service.account_id}:function:{_group['name']}"
+                    },
+                    functionSchema={
+                        "functions": [
+                            {
+                                "name": _name,
+                                "parameters": {"input_text": {"type": "string"}},
+                            }
+                            for _name in _group.get("functions", ["run"])
+                        ]
+                    },
+                )
+            if _entry.get("code_interpreter"):
+                service.create_agent_action_group(
+                    agentId=_agent_id,
+                    agentVersion="DRAFT",
+                    actionGroupName="CodeInterpreterAction",
+                    parentActionGroupSignature="AMAZON.CodeInterpreter",
+                )
+            for _kb_id in _entry.get("knowledge_bases", []):
+                service.associate_agent_knowledge_base(
+                    agentId=_agent_id, agentVersion="DRAFT", knowledgeBaseId=_kb_id
+                )
+            _resolved[_entry["name"]] = {"agent_id": _agent_id}
+
+        # collaborators refer to the aliases of other agents, so they are associated after every agent exists
+        for _entry in _spec.get("agents", []):
+            _agent_id = _resolved[_entry["name"]]["agent_id"]
+            if not _entry.get("collaborators"):
+                service.prepare_agent(agentId=_agent_id)
+                _alias = service.create_agent_alias(
+                    agentId=_agent_id,
+                    agentAliasName=_entry.get("alias", DEFAULT_ALIAS_NAME),
+                )["agentAlias"]
+                _resolved[_entry["name"]]["agent_alias_id"] = _alias["agentAliasId"]
+        for _entry in _spec.get("agents", []):
+            _agent_id = _resolved[_entry["name"]]["agent_id"]
+            if not _entry.get("collaborators"):
+                continue
+            for _collaborator in _entry["collaborators"]:
+                _target = _resolved[_collaborator["name"]]
+                service.associate_agent_collaborator(
+                    agentId=_agent_id,
+                    agentVersion="DRAFT",
+                    agentDescriptor={
+                        "aliasArn": service.alias_arn(
+                            _target["agent_id"], _target["agent_alias_id"]
+                        )
+                    },
+                    collaboratorName=_collaborator["name"],
+                    collaborationInstruction=_collaborator.get("instruction", ""),
+                )
+            service.prepare_agent(agentId=_agent_id)
+            _alias = service.create_agent_alias(
+                agentId=_agent_id,
+                agentAliasName=_entry.get("alias", DEFAULT_ALIAS_NAME),
+            )["agentAlias"]
+            _resolved[_entry["name"]]["agent_alias_id"] = _alias["agentAliasId"]
+    finally:
+        service.latencies = _latencies
+    return _resolved
+
+
+_installed = None
+# key of the request context entry that carries the API parameters to the before-send handler
+_PARAMS_CONTEXT_KEY = "local_bedrock_agents_params"
+
+
+def _wire_value(shape, value):
+    """Converts a response value of the local service to its JSON wire form for a botocore shape."""
+    if value is None:
+        return None
+    if shape.type_name == "structure":
+        if getattr(shape, "is_document_type", False):
+            return value
+        return {
+            _member.serialization.get("name", _name): _wire_value(_member, value[_name])
+            for _name, _member in shape.members.items()
+            if _name in value and "location" not in _member.serialization
+        }
+    if shape.type_name == "list":
+        return [_wire_value(shape.member, _item) for _item in value]
+    if shape.type_name == "map":
+        return {_key: _wire_value(shape.value, _item) for _key, _item in value.items()}
+    if shape.type_name == "timestamp" and isinstance(value, datetime.datetime):
+        if shape.serialization.get("timestampFormat") == "iso8601":
+            return value.isoformat()
+        return value.timestamp()
+    if shape.type_name == "blob":
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        return base64.b64encode(value).decode("ascii")
+    return value
+
+
+def _event_message(event_type: str, payload: bytes) -> bytes:
+    """One application/vnd.amazon.eventstream message carrying a JSON event."""
+    _headers = b"".join(
+        bytes([len(_name)])
+        + _name
+        + b"\x07"  # string header value
+        + struct.pack(">H", len(_value))
+        + _value
+        for _name, _value in (
+            (b":event-type", event_type.encode("utf-8")),
+            (b":message-type", b"event"),
+            (b":content-type", b"application/json"),
+        )
+    )
+    _prelude = struct.pack(">II", 16 + len(_headers) + len(payload), len(_headers))
+    _message = _prelude + struct.pack(">I", zlib.crc32(_prelude)) + _headers + payload
+    return _message + struct.pack(">I", zlib.crc32(_message))
+
+
+def _event_messages(shape, events: Iterable[Dict]) -> Iterator[bytes]:
+    """Encodes completion events, e.g. {"chunk": {...}}, as the messages of an event stream shape."""
+    for _event in events:
+        for _kind, _value in _event.items():
+            _payload = json.dumps(_wire_value(shape.members[_kind], _value))
+            yield _event_message(_kind, _payload.encode("utf-8"))
+
+
+class _LocalRawResponse:
+    """Raw body of a local HTTP response, read through stream() like urllib3's."""
+
+    def __init__(self, chunks: Iterable[bytes], on_close: Callable[[], None] = None):
+        self._chunks = chunks
+        self._on_close = on_close
+
+    def stream(self, *args, **kwargs) -> Iterator[bytes]:
+        yield from self._chunks
+
+    def close(self) -> None:
+        if self._on_close is not None:
+            self._on_close()
+
+
+def _http_response(request, operation_model, response: Dict):
+    """Serializes a response of the local service as the HTTP response of the real one."""
+    from botocore.awsrequest import AWSResponse
+
+    _headers = {"x-amzn-RequestId": str(uuid.uuid4())}
+    _output = operation_model.output_shape
+    if operation_model.service_model.protocol == "query":
+        # only sts GetCallerIdentity is served, whose result is flat
+        _name = operation_model.name
+        _fields = "".join(
+            f"<{_key}>{xml.sax.saxutils.escape(str(_value))}</{_key}>"
+            for _key, _value in response.items()
+            if _key != "ResponseMetadata"
+        )
+        _body = (
+            f"<{_name}Response><{_name}Result>{_fields}</{_name}Result>"
+            f"<ResponseMetadata><RequestId>{_headers['x-amzn-RequestId']}</RequestId>"
+            f"</ResponseMetadata></{_name}Response>"
+        ).encode("utf-8")
+        _headers["Content-Type"] = "text/xml"
+        return AWSResponse(request.url, 200, _headers, _LocalRawResponse([_body]))
+
+    _raw = None
+    _body = {}
+    for _name, _member in _output.members.items() if _output else ():
+        if _name not in response:
+            continue
+        if _member.serialization.get("location") == "header":
+            _headers[_member.serialization["name"]] = str(response[_name])
+        elif _member.serialization.get("eventstream"):
+            # events are encoded as they are generated, so the turn keeps its pacing
+            _stream = response[_name]
+            _raw = _LocalRawResponse(
+                _event_messages(_member, _stream),
+                on_close=getattr(_stream, "close", None),
+            )
+            _headers["Content-Type"] = "application/vnd.amazon.eventstream"
+        else:
+            _body[_member.serialization.get("name", _name)] = _wire_value(
+                _member, response[_name]
+            )
+    if _raw is None:
+        _headers["Content-Type"] = "application/json"
+        _raw = _LocalRawResponse([json.dumps(_body).encode("utf-8")])
+    return AWSResponse(
+        request.url, operation_model.http.get("responseCode", 200), _headers, _raw
+    )
+
+
+def _http_error(request, code: str, status_code: int, message: str):
+    """A rest-json error response, which botocore raises as the modeled exception of the code."""
+    from botocore.awsrequest import AWSResponse
+
+    _headers = {
+        "x-amzn-RequestId": str(uuid.uuid4()),
+        "x-amzn-ErrorType": code,
+        "Content-Type": "application/json",
+    }
+    _body = json.dumps({"message": message}).encode("utf-8")
+    return AWSResponse(request.url, status_code, _headers, _LocalRawResponse([_body]))
+
+
+def _serve_locally(client) -> None:
+    """Answers the calls of a bedrock-agent, bedrock-agent-runtime or sts client from the installed service.
+
+    The client still validates and serializes its parameters, runs its retry and event handlers, and
+    parses the response; only the HTTP exchange is replaced, by a before-send handler. Requests are
+    not signed, so no credentials are needed.
+    """
+    from botocore import UNSIGNED, xform_name
+
+    _service_model = client.meta.service_model
+    _service_id = _service_model.service_id.hyphenize()
+    _scope = _service_id
+    if _service_model.service_name == "sts":
+        _scope = f"{_service_id}.GetCallerIdentity"
+
+    def _remember_params(params, context, **kwargs):
+        context[_PARAMS_CONTEXT_KEY] = dict(params)
+
+    def _unsigned(**kwargs):
+        return UNSIGNED
+
+    def _send(request, event_name, **kwargs):
+        _operation_name = event_name.rsplit(".", 1)[-1]
+        _operation_model = _service_model.operation_model(_operation_name)
+        _method = getattr(_installed, xform_name(_operation_name), None)
+        if _method is None:
+            return _http_error(
+                request,
+                "UnsupportedOperation",
+                400,
+                f"{_operation_name} is not served locally",
+            )
+        try:
+            _response = _method(**request.context.get(_PARAMS_CONTEXT_KEY, {}))
+        except LocalServiceError as e:
+            return _http_error(request, e.code, e.status_code, e.message)
+        return _http_response(request, _operation_model, _response)
+
+    client.meta.events.register(f"before-parameter-build.{_scope}", _remember_params)
+    client.meta.events.register(f"choose-signer.{_scope}", _unsigned)
+    client.meta.events.register(f"before-send.{_scope}", _send)
+
+
+def install_local_bedrock_agents(
+    service: LocalBedrockAgents = None,
+) -> LocalBedrockAgents:
+    """Serves every bedrock-agent, bedrock-agent-runtime and sts client created from now on from a local service.
+
+    Calls of other services are untouched. Installing again swaps the service, also for the clients
+    created before.
+
+    Args:
+        service (LocalBedrockAgents, optional): Service to install. Defaults to a new LocalBedrockAgents.
+
+    Returns:
+        LocalBedrockAgents: The installed service
+    """
+    global _installed
+    from botocore.client import ClientCreator
+
+    if service is None:
+        service = LocalBedrockAgents()
+    # clients still need a region to be created, even though no request leaves the process
+    os.environ.setdefault("AWS_DEFAULT_REGION", service.region)
+
+    if _installed is None:
+        _create_client = ClientCreator.create_client
+
+        def _create_local_client(creator, service_name, *args, **kwargs):
+            _client = _create_client(creator, service_name, *args, **kwargs)
+            if service_name in LOCAL_SERVICES:
+                _serve_locally(_client)
+            return _client
+
+        ClientCreator.create_client = _create_local_client
+    _installed = service
+    return service
+
+
+def install_from_env() -> LocalBedrockAgents:
+    """Installs a local service if $BEDROCK_AGENTS_LOCAL is set, loading agents if it names a YAML file.
+
+    $BEDROCK_AGENTS_LOCAL_SPEED scales every simulated latency (0 for none), and unknown agent ids are
+    answered as plain agents so the hard-coded ids of config.bot_configs keep working.
+
+    Returns:
+        LocalBedrockAgents: The installed service, or None when the variable is not set
+    """
+    _setting = os.environ.get("BEDROCK_AGENTS_LOCAL", "")
+    if _setting.lower() in ("", "0", "false"):
+        return None
+    if _installed is not None:
+        return _installed
+    _latencies = LocalLatencies(
+        speed=float(os.environ.get("BEDROCK_AGENTS_LOCAL_SPEED", 1.0))
+    )
+    _service = LocalBedrockAgents(latencies=_latencies, unknown_agents=True)
+    if _setting.lower() not in ("1", "true"):
+        load_agents(_service, _setting)
+    return install_local_bedrock_agents(_service)
@@ -0,0 +1,224 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+This module contains the structured, non-blocking logging used on the agent streaming paths.
+Loggers returned by get_logger() are standard library loggers under the "bedrock_agents"
+namespace, so level checks happen before any message is built. Records are handed to a bounded
+queue, unformatted when their arguments are immutable or LazyJson wrappers, and a background
+listener formats and writes them to the configured sinks: NullSink, ConsoleSink (optionally
+colored) or JsonlSink. When the queue is full, records are dropped and counted rather than
+blocking the caller. The level and sink can
+be set with the AGENT_LOG_LEVEL and AGENT_LOG_SINK environment variables, or with
+configure_logging().
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, List
+
+from termcolor import colored
+
+LOGGER_NAMESPACE = "bedrock_agents"
+DEFAULT_LOG_LEVEL = "INFO"
+DEFAULT_LOG_SINK = "console"
+DEFAULT_QUEUE_SIZE = 10000
+
+_STANDARD_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {
+    "message",
+    "color",
+}
+
+# argument types that cannot change between the logging call and the listener thread
+_IMMUTABLE_ARG_TYPES = (str, int, float, bool, bytes, type(None))
+
+_exception_formatter = logging.Formatter()
+_lock = threading.Lock()
+_listener = None
+_handler = None
+
+
+class LazyJson:
+    """Defers json.dumps() of a value to the listener thread, when a sink renders the record.
+
+    The value is serialized after the logging call returns, so only wrap values the caller
+    no longer changes, such as the trace events of an agent response stream.
+    """
+
+    def __init__(self, value: Any, indent: int = None):
+        self.value = value
+        self.indent = indent
+
+    def __str__(self) -> str:
+        return json.dumps(self.value, indent=self.indent, default=str)
+
+
+class NullSink(logging.Handler):
+    """Discards every record."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        pass
+
+
+class ConsoleSink(logging.StreamHandler):
+    """Writes the message of each record to a stream, colored with its "color" extra field if enabled."""
+
+    def __init__(self, stream=None, use_color: bool = True):
+        super().__init__(stream if stream is not None else sys.stdout)
+        self._use_color = use_color
+
+    def format(self, record: logging.LogRecord) -> str:
+        _message = record.getMessage()
+        if record.exc_info:
+            _message += "\n" + _exception_formatter.formatException(record.exc_info)
+        _color = getattr(record, "color", None)
+        if self._use_color and _color is not None:
+            return colored(_message, _color)
+        return _message
+
+
+class JsonlSink(logging.Handler):
+    """Appends one JSON object per record to a file: time, level, logger, message and extra fields."""
+
+    def __init__(self, path: str):
+        super().__init__()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            _entry = {
+                "time": record.created,
+                "level": record.levelname,
+                "logger": record.name,
+                "message": record.getMessage(),
+            }
+            if record.exc_info:
+                _entry["exception"] = _exception_formatter.formatException(
+                    record.exc_info
+                )
+            for _key, _value in vars(record).items():
+                if _key not in _STANDARD_RECORD_ATTRIBUTES:
+                    _entry[_key] = _value
+            self._file.write(json.dumps(_entry, default=str) + "\n")
+            self._file.flush()
+        except Exception:
+            self.handleError(record)
+
+    def close(self) -> None:
+        self._file.close()
+        super().close()
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """Enqueues records unformatted when their arguments are immutable or LazyJson, so that
+    message formatting happens on the listener thread. Records with other arguments (dicts,
+    lists...) are formatted first, since the caller may change those objects before the
+    listener gets to them."""
+
+    def __init__(self, record_queue: queue.Queue):
+        super().__init__(record_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        _args = record.args
+        if isinstance(_args, dict):
+            _args = _args.values()
+        if _args and not all(
+            isinstance(_arg, _IMMUTABLE_ARG_TYPES) or isinstance(_arg, LazyJson)
+            for _arg in _args
+        ):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def sink_from_spec(spec: str) -> logging.Handler:
+    """Builds a sink from "null", "console", "console:nocolor" or "jsonl:<path>"."""
+    _kind, _, _arg = spec.partition(":")
+    if _kind == "null":
+        return NullSink()
+    if _kind == "console":
+        return ConsoleSink(use_color=_arg != "nocolor")
+    if _kind == "jsonl":
+        if not _arg:
+            raise ValueError(
+                "The jsonl sink needs a path, e.g. jsonl:logs/agents.jsonl"
+            )
+        return JsonlSink(_arg)
+    raise ValueError(f"Unknown log sink {spec}, expected null, console or jsonl:<path>")
+
+
+def configure_logging(
+    level: str = None,
+    sinks: List[logging.Handler] = None,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+) -> None:
+    """(Re)configures the level and the sinks of every logger returned by get_logger().
+
+    Args:
+        level (str, optional): Minimum level, e.g. "DEBUG" or "WARNING". Defaults to $AGENT_LOG_LEVEL or DEFAULT_LOG_LEVEL.
+        sinks (List[logging.Handler], optional): Handlers writing the records. Defaults to the comma separated
+        specs of $AGENT_LOG_SINK, or DEFAULT_LOG_SINK. See sink_from_spec().
+        queue_size (int, optional): Records buffered before new ones are dropped. Defaults to DEFAULT_QUEUE_SIZE.
+    """
+    global _listener, _handler
+    if level is None:
+        level = os.environ.get("AGENT_LOG_LEVEL", DEFAULT_LOG_LEVEL)
+    if sinks is None:
+        _specs = os.environ.get("AGENT_LOG_SINK", DEFAULT_LOG_SINK)
+        sinks = [sink_from_spec(_spec.strip()) for _spec in _specs.split(",")]
+
+    with _lock:
+        _root = logging.getLogger(LOGGER_NAMESPACE)
+        if _listener is not None:
+            _listener.stop()
+            _root.removeHandler(_handler)
+            for _sink in _listener.handlers:
+                _sink.close()
+        _handler = _DeferredQueueHandler(queue.Queue(maxsize=queue_size))
+        _listener = QueueListener(_handler.queue, *sinks, respect_handler_level=True)
+        _listener.start()
+        _root.addHandler(_handler)
+        _root.setLevel(level.upper() if isinstance(level, str) else level)
+        _root.propagate = False
+
+
+def shutdown_logging() -> None:
+    """Writes out the queued records, stops the listener thread and detaches the queue."""
+    global _listener, _handler
+    with _lock:
+        if _listener is not None:
+            logging.getLogger(LOGGER_NAMESPACE).removeHandler(_handler)
+            _listener.stop()
+            for _sink in _listener.handlers:
+                _sink.flush()
+            _listener = None
+            _handler = None
+
+
+def dropped_records() -> int:
+    """Number of records dropped because the queue was full."""
+    return _handler.dropped if _handler is not None else 0
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Returns the structured logger for a module, configuring logging from the environment on first use."""
+    if _listener is None:
+        configure_logging()
+    return logging.getLogger(f"{LOGGER_NAMESPACE}.{name}")
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,516 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+This module contains a planner that provisions a supervisor and its collaborator Agents in parallel.
+
+The ProvisioningPlan class runs a dependency graph of provisioning steps on a worker pool, starting
+each step as soon as the steps it depends on have finished, and reports the critical path of the run.
+
+The TeamProvisioningPlanner class builds that graph for a multi-agent team. Every collaborator gets its
+own chain of steps (delete -> create -> tool Lambdas -> action groups -> knowledge base -> prepare -> alias),
+tool Lambdas of the same agent are deployed concurrently, and the supervisor is created alongside the
+collaborators so that only the association step has to wait for all of them. Standing up a team takes
+roughly the time of the slowest collaborator plus the supervisor association, not the sum of all agents.
+"""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from textwrap import dedent
+from typing import Callable, Dict, List, Tuple
+
+from utils.bedrock_agent import (
+    DEFAULT_AGENT_MODEL,
+    DEFAULT_SUPERVISOR_MODEL,
+    MAX_DESCR_SIZE,
+    Agent,
+    SupervisorAgent,
+    Tool,
+    agents_helper,
+)
+from utils.lambda_profiles import LambdaProfile
+
+DEFAULT_MAX_WORKERS = 8
+
+
+@dataclass
+class ProvisioningStep:
+    name: str
+    fn: Callable[[], object]
+    depends_on: Tuple[str, ...] = ()
+    result: object = None
+    error: BaseException = None
+    started_at: float = None
+    finished_at: float = None
+
+    @property
+    def duration(self) -> float:
+        if self.started_at is None or self.finished_at is None:
+            return 0.0
+        return self.finished_at - self.started_at
+
+
+@dataclass
+class ProvisioningReport:
+    steps: Dict[str, ProvisioningStep]
+    total_seconds: float
+    critical_path: List[str] = field(default_factory=list)
+    critical_path_seconds: float = 0.0
+
+    @property
+    def serial_seconds(self) -> float:
+        """Time the same steps would have taken one after another."""
+        return sum(_step.duration for _step in self.steps.values())
+
+    def summary(self) -> str:
+        _lines = [
+            f"Provisioned {len(self.steps)} steps in {self.total_seconds:,.1f}s "
+            + f"(serial estimate: {self.serial_seconds:,.1f}s)",
+            f"Critical path ({self.critical_path_seconds:,.1f}s):",
+        ]
+        for _name in self.critical_path:
+            _lines.append(f"  {_name}: {self.steps[_name].duration:,.1f}s")
+        return "\n".join(_lines)
+
+
+class ProvisioningError(Exception):
+    """Raised when a provisioning step fails. The partial report is available as .report"""
+
+    def __init__(self, message: str, report: ProvisioningReport):
+        super().__init__(message)
+        self.report = report
+
+
+class ProvisioningPlan:
+    """A dependency graph of provisioning steps executed on a worker pool."""
+
+    def __init__(self):
+        self._steps: Dict[str, ProvisioningStep] = {}
+
+    @property
+    def steps(self) -> Dict[str, ProvisioningStep]:
+        return self._steps
+
+    def add_step(
+        self, name: str, fn: Callable[[], object], depends_on: List[str] = ()
+    ) -> str:
+        """Adds a step to the plan.
+
+        Args:
+            name (str): Unique name of the step
+            fn (Callable[[], object]): Work to perform, its return value is kept as the step result
+            depends_on (List[str], optional): Names of steps that must finish first. Defaults to ().
+
+        Returns:
+            str: The step name, to be used in depends_on of later steps
+        """
+        if name in self._steps:
+            raise ValueError(f"Step {name} already exists in the plan")
+        for _dep in depends_on:
+            if _dep not in self._steps:
+                raise ValueError(f"Step {name} depends on unknown step {_dep}")
+        self._steps[name] = ProvisioningStep(name, fn, tuple(depends_on))
+        return name
+
+    def result(self, name: str):
+        """Returns the result of a finished step."""
+        return self._steps[name].result
+
+    def run(
+        self, max_workers: int = DEFAULT_MAX_WORKERS, verbose: bool = False
+    ) -> ProvisioningReport:
+        """Runs every step as soon as its dependencies have finished.
+
+        Args:
+            max_workers (int, optional): Maximum number of steps running at once. Defaults to DEFAULT_MAX_WORKERS.
+            verbose (bool, optional): Whether to print each step as it starts and finishes. Defaults to False.
+
+        Returns:
+            ProvisioningReport: Timings of every step and the critical path of the run
+
+        Raises:
+            ProvisioningError: If any step raises. Steps already running are allowed to finish,
+            and no new steps are started.
+        """
+        _start = time.monotonic()
+        _remaining = dict(self._steps)
+        _done = set()
+        _running = {}
+        _failed = None
+
+        def _run_step(step: ProvisioningStep):
+            step.started_at = time.monotonic()
+            try:
+                step.result = step.fn()
+            finally:
+                step.finished_at = time.monotonic()
+            return step
+
+        with ThreadPoolExecutor(max_workers=max_workers) as _executor:
+            while _remaining or _running:
+                if _failed is None:
+                    _ready = [
+                        _step
+                        for _step in _remaining.values()
+                        if all(_dep in _done for _dep in _step.depends_on)
+                    ]
+                    for _step in _ready:
+                        if verbose:
+                            print(f"[plan] starting {_step.name}")
+                        del _remaining[_step.name]
+                        _running[_executor.submit(_run_step, _step)] = _step
+
+                if not _running:
+                    break
+
+                _finished, _ = wait(list(_running), return_when=FIRST_COMPLETED)
+                for _future in _finished:
+                    _step = _running.pop(_future)
+                    _error = _future.exception()
+                    if _error is not None:
+                        _step.error = _error
+                        _failed = _failed or _step
+                        print(f"[plan] step {_step.name} failed: {_error}")
+                    else:
+                        _done.add(_step.name)
+                        if verbose:
+                            print(
+                                f"[plan] finished {_step.name} in {_step.duration:,.1f}s"
+                            )
+
+        _report = ProvisioningReport(self._steps, time.monotonic() - _start)
+        _report.critical_path, _report.critical_path_seconds = self._critical_path()
+        if _failed is not None:
+            raise ProvisioningError(
+                f"Provisioning step {_failed.name} failed: {_failed.error}", _report
+            ) from _failed.error
+        return _report
+
+    def _critical_path(self) -> Tuple[List[str], float]:
+        """Finds the chain of dependent steps with the largest total duration."""
+        _longest: Dict[str, Tuple[float, str]] = {}
+        # steps were added after their dependencies, so insertion order is topological
+        for _name, _step in self._steps.items():
+            _best_dep = max(
+                _step.depends_on, key=lambda _dep: _longest[_dep][0], default=None
+            )
+            _base = _longest[_best_dep][0] if _best_dep is not None else 0.0
+            _longest[_name] = (_base + _step.duration, _best_dep)
+
+        if not _longest:
+            return [], 0.0
+        _end = max(_longest, key=lambda _name: _longest[_name][0])
+        _total = _longest[_end][0]
+        _path = []
+        while _end is not None:
+            _path.append(_end)
+            _end = _longest[_end][1]
+        return list(reversed(_path)), _total
+
+
+class TeamProvisioningPlanner:
+    """Provisions a set of collaborator Agents and their SupervisorAgent concurrently.
+
+    Each agent spec takes the same keyword arguments as Agent.create(): name, role, goal,
+    instructions, tools, tool_code, tool_defs, kb_id, kb_descr, llm, code_interpreter,
+    plus an optional lambda_profile applied to its tool Lambdas.
+    The supervisor spec takes the keyword arguments of SupervisorAgent.create(): name,
+    instructions, collaboration_type, collaborator_agents, routing_classifier_model,
+    llm, kb_id, kb_descr.
+    """
+
+    def __init__(
+        self,
+        agent_specs: List[Dict],
+        supervisor_spec: Dict = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        verbose: bool = False,
+    ):
+        self._agent_specs = agent_specs
+        self._supervisor_spec = supervisor_spec
+        self._max_workers = max_workers
+        self._verbose = verbose
+        self._created = {}
+        self._lambda_arns = {}
+
+    def build_plan(self) -> ProvisioningPlan:
+        """Builds the dependency graph for the whole team."""
+        _plan = ProvisioningPlan()
+        _alias_steps = []
+        for _spec in self._agent_specs:
+            _alias_steps.append(self._add_agent_steps(_plan, _spec))
+        if self._supervisor_spec is not None:
+            self._add_supervisor_steps(_plan, self._supervisor_spec, _alias_steps)
+        return _plan
+
+    def provision(self) -> Tuple[List[Agent], SupervisorAgent, ProvisioningReport]:
+        """Runs the plan and returns ready-to-use objects.
+
+        Returns:
+            Tuple[List[Agent], SupervisorAgent, ProvisioningReport]: the collaborator Agents, the
+            SupervisorAgent (or None if no supervisor spec was given), and the provisioning report
+        """
+        _plan = self.build_plan()
+        _report = _plan.run(max_workers=self._max_workers, verbose=self._verbose)
+        print(_report.summary())
+
+        _agents = [
+            Agent(
+                _spec["name"],
+                self._yaml_content(_spec),
+                verbose=self._verbose,
+                force_recreate=False,
+            )
+            for _spec in self._agent_specs
+        ]
+        _supervisor = None
+        if self._supervisor_spec is not None:
+            _supervisor = SupervisorAgent(
+                self._supervisor_spec["name"],
+                self._supervisor_yaml_content(self._supervisor_spec),
+                collaborator_objects=_agents,
+                verbose=self._verbose,
+                force_recreate=False,
+            )
+        return _agents, _supervisor, _report
+
+    @staticmethod
+    def _yaml_content(spec: Dict) -> Dict:
+        _name = spec["name"]
+        _content = {
+            "role": spec.get("role", ""),
+            "goal": spec.get("goal", ""),
+            "instructions": dedent(spec.get("instructions", "")),
+            "tool_code": spec.get("tool_code"),
+            "tool_defs": spec.get("tool_defs"),
+        }
+        if spec.get("llm") is not None:
+            _content["llm"] = spec["llm"]
+        if spec.get("code_interpreter"):
+            _content["code_interpreter"] = True
+        if spec.get("lambda_profile") is not None:
+            _content["lambda_profile"] = spec["lambda_profile"]
+        return {_name: _content}
+
+    @staticmethod
+    def _supervisor_yaml_content(spec: Dict) -> Dict:
+        _content = {
+            "role": spec.get("role", ""),
+            "goal": spec.get("goal", ""),
+            "instructions": spec.get("instructions"),
+            "collaboration_type": spec.get("collaboration_type", "SUPERVISOR"),
+            "collaborator_agents": spec.get("collaborator_agents", []),
+        }
+        if spec.get("routing_classifier_model") is not None:
+            _content["routing_classifier_model"] = spec["routing_classifier_model"]
+        return {spec["name"]: _content}
+
+    @staticmethod
+    def _tool_parts(
+        tool, default_profile: LambdaProfile
+    ) -> Tuple[str, Dict, LambdaProfile]:
+        if isinstance(tool, Tool):
+            return (
+                tool.code_file,
+                tool.to_action_group_definition(),
+                tool.lambda_profile or default_profile,
+            )
+        return (
+            tool["code"],
+            tool["definition"],
+            LambdaProfile.from_value(tool.get("lambda_profile", default_profile)),
+        )
+
+    def _add_agent_steps(self, plan: ProvisioningPlan, spec: Dict) -> str:
+        _name = spec["name"]
+        _tools = spec.get("tools")
+        _tool_code = spec.get("tool_code")
+        _tool_defs = spec.get("tool_defs")
+        _instructions = (
+            f"Role: {spec.get('role', '')}, \nGoal: {spec.get('goal', '')}, "
+            + f"\nInstructions: {dedent(spec.get('instructions', ''))}"
+        )
+        if _tools is None and _tool_code is None and _tool_defs is None:
+            _instructions += Agent.NO_TOOL_USE_INSTRUCTION
+
+        _profile = LambdaProfile.from_value(spec.get("lambda_profile"))
+
+        # (lambda function name, code file or ARN, function definitions, action group name, profile)
+        _lambda_jobs = []
+        if _tools is not None:
+            for _tool_num, _tool in enumerate(_tools, 1):
+                _code, _definition, _tool_profile = self._tool_parts(_tool, _profile)
+                _lambda_jobs.append(
+                    (
+                        (
+                            f"{_name}_ag"
+                            if len(_tools) == 1
+                            else f"{_name}_ag_{_tool_num}"
+                        ),
+                        _code,
+                        [_definition],
+                        f"actions_{_tool_num}_{_name}",
+                        _tool_profile,
+                    )
+                )
+        elif _tool_code is not None and _tool_code != "ROC":
+            _lambda_jobs.append(
+                (f"{_name}_ag", _tool_code, _tool_defs, f"actions_{_name}", _profile)
+            )
+
+        def _delete():
+            # tool Lambdas are kept, create_lambda redeploys them only if their code changed
+            return agents_helper.delete_agents(
+                [_name], delete_lambdas=False, verbose=self._verbose
+            )
+
+        def _create():
+            self._created[_name] = agents_helper.create_agent(
+                _name,
+                dedent(_instructions[0 : MAX_DESCR_SIZE - 1]),
+                dedent(_instructions),
+                [spec.get("llm") or DEFAULT_AGENT_MODEL],
+                code_interpretation=spec.get("code_interpreter", False),
+                verbose=self._verbose,
+            )
+            return self._created[_name]
+
+        _delete_step = plan.add_step(f"{_name}:delete", _delete)
+        _create_step = plan.add_step(f"{_name}:create", _create, [_delete_step])
+
+        # Tool Lambdas only need the agent to exist, so they deploy concurrently
+        _lambda_steps = []
+        for _lambda_name, _code, _, _, _tool_profile in _lambda_jobs:
+            if "arn:" in _code:
+                self._lambda_arns[_lambda_name] = _code
+                continue
+
+            def _deploy(
+                _lambda_name=_lambda_name, _code=_code, _tool_profile=_tool_profile
+            ):
+                self._lambda_arns[_lambda_name] = agents_helper.create_lambda(
+                    _name, _lambda_name, _code, lambda_profile=_tool_profile
+                )
+
+            _lambda_steps.append(
+                plan.add_step(f"{_name}:lambda:{_lambda_name}", _deploy, [_create_step])
+            )
+
+        # Action groups, KB association and prepare all update the same DRAFT agent,
+        # so they run one after another within the agent's own chain.
+        def _action_groups():
+            for _lambda_name, _, _defs, _group_name, _ in _lambda_jobs:
+                agents_helper.add_action_group_with_lambda(
+                    _name,
+                    _lambda_name,
+                    self._lambda_arns[_lambda_name],
+                    _defs,
+                    _group_name,
+                    f"Set of functions for {_name}",
+                    verbose=self._verbose,
+                )
+            if _tools is None and _tool_code == "ROC":
+                agents_helper.add_action_group_with_roc(
+                    self._created[_name][0],
+                    _tool_defs,
+                    f"actions_{_name}",
+                    f"Set of functions for {_name}",
+                )
+
+        _last_step = plan.add_step(
+            f"{_name}:action_groups", _action_groups, [_create_step] + _lambda_steps
+        )
+
+        if spec.get("kb_id") is not None:
+
+            def _attach_kb():
+                _agent_id = self._created[_name][0]
+                agents_helper.wait_agent_status_update(_agent_id)
+                agents_helper.associate_kb_with_agent(
+                    _agent_id, spec.get("kb_descr", " "), spec["kb_id"]
+                )
+
+            _last_step = plan.add_step(f"{_name}:kb", _attach_kb, [_last_step])
+
+        def _prepare():
+            agents_helper.prepare(_name)
+
+        _prepare_step = plan.add_step(f"{_name}:prepare", _prepare, [_last_step])
+
+        def _alias():
+            _agent_id = self._created[_name][0]
+            _alias_id, _alias_arn = agents_helper.create_agent_alias(
+                _agent_id, "with-code-ag"
+            )
+            agents_helper.wait_agent_alias_status_update(_agent_id, _alias_id)
+            return _alias_id, _alias_arn
+
+        return plan.add_step(f"{_name}:alias", _alias, [_prepare_step])
+
+    def _add_supervisor_steps(
+        self, plan: ProvisioningPlan, spec: Dict, collaborator_alias_steps: List[str]
+    ) -> None:
+        _name = spec["name"]
+        _instructions = spec.get("instructions")
+
+        def _delete():
+            return agents_helper.delete_agents(
+                [_name], delete_lambdas=False, verbose=self._verbose
+            )
+
+        def _create():
+            self._created[_name] = agents_helper.create_agent(
+                _name,
+                dedent(_instructions[0 : MAX_DESCR_SIZE - 1]),
+                dedent(_instructions),
+                model_ids=[spec.get("llm") or DEFAULT_SUPERVISOR_MODEL],
+                agent_collaboration=spec.get("collaboration_type", "SUPERVISOR"),
+                routing_classifier_model=spec.get("routing_classifier_model"),
+                verbose=self._verbose,
+            )
+
+        # The supervisor itself does not depend on any collaborator, only its association does
+        _delete_step = plan.add_step(f"{_name}:delete", _delete)
+        _create_step = plan.add_step(f"{_name}:create", _create, [_delete_step])
+
+        _alias_step_by_agent = {
+            _step.split(":", 1)[0]: _step for _step in collaborator_alias_steps
+        }
+
+        def _associate():
+            _collab_list = []
+            for _collab_agent in spec.get("collaborator_agents", []):
+                _collab_agent_name = _collab_agent.get("name", _collab_agent["agent"])
+                _alias_step = _alias_step_by_agent[_collab_agent["agent"]]
+                _collab_list.append(
+                    {
+                        "sub_agent_association_name": _collab_agent_name,
+                        "sub_agent_instruction": _collab_agent["instructions"],
+                        "sub_agent_alias_arn": plan.result(_alias_step)[1],
+                        "relay_conversation_history": _collab_agent.get(
+                            "relay_conversation_history", "DISABLED"
+                        ),
+                    }
+                )
+            _supervisor_id = self._created[_name][0]
+            _alias_id, _ = agents_helper.associate_sub_agents(
+                _supervisor_id, _collab_list
+            )
+            agents_helper.wait_agent_alias_status_update(_supervisor_id, _alias_id)
+
+        _last_step = plan.add_step(
+            f"{_name}:associate", _associate, [_create_step] + collaborator_alias_steps
+        )
+
+        if spec.get("kb_id") is not None:
+
+            def _attach_kb():
+                _supervisor_id = self._created[_name][0]
+                agents_helper.wait_agent_status_update(_supervisor_id)
+                agents_helper.associate_kb_with_agent(
+                    _supervisor_id, spec.get("kb_descr", " "), spec["kb_id"]
+                )
+                agents_helper.wait_agent_status_update(_supervisor_id)
+
+            plan.add_step(f"{_name}:kb", _attach_kb, [_last_step])
@@ -0,0 +1,315 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+This module contains a waiter engine for Amazon Bedrock and OpenSearch Serverless resources.
+The ResourceWaiter class polls any number of agents, agent aliases, Knowledge Bases, ingestion
+jobs and collections at once, runs the status checks concurrently, and backs off each resource
+independently with jittered exponential delays that start at sub-second intervals. Every resource
+is reported as soon as it reaches a terminal state. All sleeping goes through an injectable clock
+so that callers can be exercised without real waiting.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Tuple
+
+DEFAULT_INITIAL_DELAY = 0.25
+DEFAULT_MAX_DELAY = 1.5
+DEFAULT_MULTIPLIER = 1.6
+DEFAULT_JITTER = 0.2
+DEFAULT_TIMEOUT = 1800
+DEFAULT_MAX_WORKERS = 8
+# collections, Knowledge Bases and ingestion jobs take minutes, so their polls back off further
+SLOW_RESOURCE_MAX_DELAY = 10.0
+
+
+class SystemClock:
+    """Clock backed by the real monotonic time and time.sleep()."""
+
+    def now(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+
+class FakeClock:
+    """Clock whose sleep() advances time instantly, for offline runs and tests."""
+
+    def __init__(self, start: float = 0.0):
+        self._now = start
+        self._lock = threading.Lock()
+
+    def now(self) -> float:
+        with self._lock:
+            return self._now
+
+    def sleep(self, seconds: float) -> None:
+        with self._lock:
+            self._now += max(seconds, 0.0)
+
+
+def is_transitional_status(status: str) -> bool:
+    """Returns True for in-progress states such as CREATING, PREPARING, VERSIONING or IN_PROGRESS."""
+    return status.endswith("ING") or status in ("IN_PROGRESS", "STARTING")
+
+
+class WaitTarget:
+    """A single resource to wait for.
+
+    Args:
+        name (str): Display name, unique within one wait call (e.g. "agent:ABC123")
+        check (Callable[[], Tuple[str, Dict]]): Returns the current status and the raw describe response
+        is_done (Callable[[str], bool], optional): Returns True once a status is terminal.
+        Defaults to any non transitional status.
+        max_delay (float, optional): Overrides the waiter's maximum delay for this resource. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        check: Callable[[], Tuple[str, Dict]],
+        is_done: Callable[[str], bool] = None,
+        max_delay: float = None,
+    ):
+        self.name = name
+        self.check = check
+        self.is_done = is_done or (lambda status: not is_transitional_status(status))
+        self.max_delay = max_delay
+        self.status = None
+        self.last_response = None
+        self.polls = 0
+
+
+def agent_target(
+    bedrock_agent_client, agent_id: str, is_done: Callable[[str], bool] = None
+) -> WaitTarget:
+    """Waits for an agent to leave CREATING / UPDATING / PREPARING / VERSIONING / DELETING,
+    or until is_done(status) when given."""
+
+    def _check():
+        try:
+            _resp = bedrock_agent_client.get_agent(agentId=agent_id)
+        except bedrock_agent_client.exceptions.ResourceNotFoundException:
+            return "DELETED", None
+        return _resp["agent"]["agentStatus"], _resp
+
+    return WaitTarget(f"agent:{agent_id}", _check, is_done=is_done)
+
+
+def agent_alias_target(
+    bedrock_agent_client, agent_id: str, agent_alias_id: str
+) -> WaitTarget:
+    """Waits for an agent alias to leave CREATING / UPDATING / DELETING."""
+
+    def _check():
+        try:
+            _resp = bedrock_agent_client.get_agent_alias(
+                agentId=agent_id, agentAliasId=agent_alias_id
+            )
+        except bedrock_agent_client.exceptions.ResourceNotFoundException:
+            return "DELETED", None
+        return _resp["agentAlias"]["agentAliasStatus"], _resp
+
+    return WaitTarget(f"agent-alias:{agent_id}/{agent_alias_id}", _check)
+
+
+def knowledge_base_target(bedrock_agent_client, kb_id: str) -> WaitTarget:
+    """Waits for a Knowledge Base to leave CREATING / UPDATING / DELETING."""
+
+    def _check():
+        try:
+            _resp = bedrock_agent_client.get_knowledge_base(knowledgeBaseId=kb_id)
+        except bedrock_agent_client.exceptions.ResourceNotFoundException:
+            return "DELETED", None
+        return _resp["knowledgeBase"]["status"], _resp
+
+    return WaitTarget(
+        f"knowledge-base:{kb_id}", _check, max_delay=SLOW_RESOURCE_MAX_DELAY
+    )
+
+
+def ingestion_job_target(
+    bedrock_agent_client, kb_id: str, ds_id: str, ingestion_job_id: str
+) -> WaitTarget:
+    """Waits for an ingestion job to reach COMPLETE, FAILED or STOPPED."""
+
+    def _check():
+        _resp = bedrock_agent_client.get_ingestion_job(
+            knowledgeBaseId=kb_id,
+            dataSourceId=ds_id,
+            ingestionJobId=ingestion_job_id,
+        )
+        return _resp["ingestionJob"]["status"], _resp
+
+    return WaitTarget(
+        f"ingestion-job:{kb_id}/{ds_id}/{ingestion_job_id}",
+        _check,
+        is_done=lambda status: status in ("COMPLETE", "FAILED", "STOPPED"),
+        max_delay=SLOW_RESOURCE_MAX_DELAY,
+    )
+
+
+def lambda_function_target(
+    lambda_client, function_name: str, qualifier: str = None
+) -> WaitTarget:
+    """Waits for a Lambda function (or published version) to finish creating or updating."""
+
+    def _check():
+        _kwargs = {"FunctionName": function_name}
+        if qualifier is not None:
+            _kwargs["Qualifier"] = qualifier
+        _resp = lambda_client.get_function_configuration(**_kwargs)
+        if _resp.get("State") == "Pending":
+            return "Pending", _resp
+        return _resp.get("LastUpdateStatus", "Successful"), _resp
+
+    _name = function_name if qualifier is None else f"{function_name}:{qualifier}"
+    return WaitTarget(
+        f"lambda:{_name}",
+        _check,
+        is_done=lambda status: status not in ("Pending", "InProgress"),
+    )
+
+
+def collection_target(
+    aoss_client, collection_name: str = None, collection_id: str = None
+) -> WaitTarget:
+    """Waits for an OpenSearch Serverless collection, given by name or id, to leave CREATING / DELETING."""
+    if collection_id is not None:
+        _lookup = {"ids": [collection_id]}
+    else:
+        _lookup = {"names": [collection_name]}
+
+    def _check():
+        _resp = aoss_client.batch_get_collection(**_lookup)
+        if not _resp["collectionDetails"]:
+            return "DELETED", _resp
+        return _resp["collectionDetails"][0]["status"], _resp
+
+    return WaitTarget(
+        f"collection:{collection_id or collection_name}",
+        _check,
+        max_delay=SLOW_RESOURCE_MAX_DELAY,
+    )
+
+
+class ResourceWaiter:
+    """Polls many resources concurrently with per-resource jittered exponential backoff."""
+
+    def __init__(
+        self,
+        clock=None,
+        initial_delay: float = DEFAULT_INITIAL_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        multiplier: float = DEFAULT_MULTIPLIER,
+        jitter: float = DEFAULT_JITTER,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        rng: random.Random = None,
+    ):
+        """Constructs an instance.
+
+        Args:
+            clock (optional): Object with now() and sleep(seconds). Defaults to SystemClock().
+            initial_delay (float, optional): Delay before the second poll of a resource. Defaults to DEFAULT_INITIAL_DELAY.
+            max_delay (float, optional): Upper bound of the delay between polls. Defaults to DEFAULT_MAX_DELAY.
+            multiplier (float, optional): Growth factor of the delay after each poll. Defaults to DEFAULT_MULTIPLIER.
+            jitter (float, optional): Relative +/- randomization of each delay. Defaults to DEFAULT_JITTER.
+            timeout (float, optional): Seconds to wait before raising TimeoutError. Defaults to DEFAULT_TIMEOUT.
+            max_workers (int, optional): Maximum number of concurrent status checks. Defaults to DEFAULT_MAX_WORKERS.
+            rng (random.Random, optional): Source of jitter. Defaults to a new random.Random().
+        """
+        self._clock = clock or SystemClock()
+        self._initial_delay = initial_delay
+        self._max_delay = max_delay
+        self._multiplier = multiplier
+        self._jitter = jitter
+        self._timeout = timeout
+        self._max_workers = max_workers
+        self._rng = rng or random.Random()
+
+    @property
+    def clock(self):
+        return self._clock
+
+    def _next_delay(self, delay: float, target: WaitTarget) -> float:
+        _cap = target.max_delay if target.max_delay is not None else self._max_delay
+        _delay = min(delay * self._multiplier, _cap)
+        return _delay * self._rng.uniform(1 - self._jitter, 1 + self._jitter)
+
+    def iter_ready(self, targets: List[WaitTarget]) -> Iterator[WaitTarget]:
+        """Polls all targets and yields each one as soon as it reaches a terminal status.
+
+        Args:
+            targets (List[WaitTarget]): Resources to wait for
+
+        Yields:
+            WaitTarget: A finished target, with its final status and last_response set
+
+        Raises:
+            TimeoutError: If some targets are still in progress after the timeout
+        """
+        if not targets:
+            return
+
+        _start = self._clock.now()
+        # name -> [next poll time, current delay]
+        _schedule = {_target.name: [_start, self._initial_delay] for _target in targets}
+        _pending = {_target.name: _target for _target in targets}
+
+        with ThreadPoolExecutor(
+            max_workers=min(self._max_workers, len(targets))
+        ) as _executor:
+            while _pending:
+                _now = self._clock.now()
+                _due = [
+                    _target
+                    for _name, _target in _pending.items()
+                    if _schedule[_name][0] <= _now
+                ]
+                _results = _executor.map(lambda _target: _target.check(), _due)
+                for _target, (_status, _resp) in zip(_due, _results):
+                    _target.status = _status
+                    _target.last_response = _resp
+                    _target.polls += 1
+                    if _target.is_done(_status):
+                        del _pending[_target.name]
+                        yield _target
+                    else:
+                        _entry = _schedule[_target.name]
+                        _entry[0] = self._clock.now() + _entry[1]
+                        _entry[1] = self._next_delay(_entry[1], _target)
+
+                if not _pending:
+                    break
+
+                if self._clock.now() - _start > self._timeout:
+                    raise TimeoutError(
+                        f"Timed out after {self._timeout}s waiting for: "
+                        + ", ".join(
+                            f"{_name} ({_target.status})"
+                            for _name, _target in _pending.items()
+                        )
+                    )
+
+                _next_poll = min(_schedule[_name][0] for _name in _pending)
+                _sleep_for = _next_poll - self._clock.now()
+                if _sleep_for > 0:
+                    self._clock.sleep(_sleep_for)
+
+    def wait_all(self, targets: List[WaitTarget]) -> Dict[str, str]:
+        """Waits for every target to reach a terminal status.
+
+        Returns:
+            Dict[str, str]: Final status of each target, keyed by target name
+        """
+        return {_target.name: _target.status for _target in self.iter_ready(targets)}
+
+    def wait(self, target: WaitTarget) -> str:
+        """Waits for a single target and returns its final status."""
+        for _target in self.iter_ready([target]):
+            return _target.status
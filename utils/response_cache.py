@@ -0,0 +1,251 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+This module contains a persistent response cache for Agents for Amazon Bedrock.
+The AgentResponseCache class stores final agent answers, together with a condensed trace
+summary, in a local SQLite database. Entries are keyed on the agent id, alias id, normalized
+input text and the relevant session attributes, expire after a per-bot TTL, and are evicted
+in least-recently-used order once the cache grows past its size limit.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "agent_responses.sqlite3")
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_TTL_SECONDS = 3600
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_input_text(input_text: str) -> str:
+    """Normalizes an input text so that trivially different questions share a cache entry.
+
+    Args:
+        input_text (str): The raw text sent to the agent
+
+    Returns:
+        str: The text with collapsed whitespace, stripped and case-folded
+    """
+    return _WHITESPACE_PATTERN.sub(" ", input_text or "").strip().casefold()
+
+
+def make_cache_key(
+    agent_id: str,
+    agent_alias_id: str,
+    input_text: str,
+    session_attributes: Dict = None,
+    attribute_keys: List[str] = None,
+) -> str:
+    """Builds the cache key for an agent invocation.
+
+    Args:
+        agent_id (str): Id of the agent being invoked
+        agent_alias_id (str): Id of the agent alias being invoked
+        input_text (str): The text sent to the agent
+        session_attributes (Dict, optional): The sessionAttributes sent with the request. Defaults to None.
+        attribute_keys (List[str], optional): Subset of session attribute names that affect the answer.
+        Defaults to None, meaning all of them.
+
+    Returns:
+        str: Hex digest identifying the invocation
+    """
+    _attributes = dict(session_attributes or {})
+    if attribute_keys is not None:
+        _attributes = {k: v for k, v in _attributes.items() if k in attribute_keys}
+
+    _payload = json.dumps(
+        {
+            "agent_id": agent_id,
+            "agent_alias_id": agent_alias_id,
+            "input_text": normalize_input_text(input_text),
+            "session_attributes": _attributes,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(_payload.encode("utf-8")).hexdigest()
+
+
+class AgentResponseCache:
+    """SQLite backed cache of final agent answers with per-entry TTL and LRU size limits."""
+
+    def __init__(
+        self,
+        db_path: str = DEFAULT_CACHE_PATH,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        default_ttl_seconds: int = DEFAULT_TTL_SECONDS,
+        clock: Callable[[], float] = time.time,
+    ):
+        """Constructs an instance.
+
+        Args:
+            db_path (str, optional): Path of the SQLite database file, or ":memory:". Defaults to DEFAULT_CACHE_PATH.
+            max_entries (int, optional): Maximum number of answers to keep. Defaults to DEFAULT_MAX_ENTRIES.
+            default_ttl_seconds (int, optional): TTL used when put() is not given one. Defaults to DEFAULT_TTL_SECONDS.
+            clock (Callable[[], float], optional): Returns the current time in seconds. Defaults to time.time.
+        """
+        if db_path != ":memory:":
+            _cache_dir = os.path.dirname(db_path)
+            if _cache_dir:
+                os.makedirs(_cache_dir, exist_ok=True)
+
+        self._max_entries = max_entries
+        self._default_ttl_seconds = default_ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                cache_key TEXT PRIMARY KEY,
+                bot_name TEXT,
+                agent_id TEXT,
+                agent_alias_id TEXT,
+                answer TEXT NOT NULL,
+                trace_summary TEXT,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)"
+        )
+        self._conn.commit()
+
+    def get(self, cache_key: str) -> Optional[Dict]:
+        """Looks up a cached answer, refreshing its position in the LRU order.
+
+        Args:
+            cache_key (str): Key returned by make_cache_key()
+
+        Returns:
+            Dict: answer, trace_summary and created_at of the entry, or None on a miss or expired entry
+        """
+        _now = self._clock()
+        with self._lock:
+            _row = self._conn.execute(
+                "SELECT answer, trace_summary, created_at, expires_at FROM responses WHERE cache_key = ?",
+                (cache_key,),
+            ).fetchone()
+            if _row is None:
+                return None
+            if _row[3] <= _now:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE cache_key = ?", (cache_key,)
+                )
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE cache_key = ?",
+                (_now, cache_key),
+            )
+            self._conn.commit()
+
+        return {
+            "answer": _row[0],
+            "trace_summary": json.loads(_row[1]) if _row[1] else {},
+            "created_at": _row[2],
+        }
+
+    def put(
+        self,
+        cache_key: str,
+        answer: str,
+        trace_summary: Dict = None,
+        ttl_seconds: int = None,
+        bot_name: str = None,
+        agent_id: str = None,
+        agent_alias_id: str = None,
+    ) -> None:
+        """Stores an answer, evicting the least recently used entries if over the size limit.
+
+        Args:
+            cache_key (str): Key returned by make_cache_key()
+            answer (str): Final answer text to replay on a hit
+            trace_summary (Dict, optional): Condensed trace (collaborators, tools, tokens) to replay. Defaults to None.
+            ttl_seconds (int, optional): Lifetime of the entry. Defaults to the cache default TTL.
+            bot_name (str, optional): Bot the answer belongs to, used by purge(). Defaults to None.
+            agent_id (str, optional): Agent the answer belongs to, used by purge(). Defaults to None.
+            agent_alias_id (str, optional): Agent alias the answer belongs to. Defaults to None.
+        """
+        _now = self._clock()
+        _ttl = self._default_ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._conn.execute(
+                """INSERT OR REPLACE INTO responses
+                   (cache_key, bot_name, agent_id, agent_alias_id, answer, trace_summary,
+                    created_at, expires_at, last_access)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    cache_key,
+                    bot_name,
+                    agent_id,
+                    agent_alias_id,
+                    answer,
+                    json.dumps(trace_summary or {}, default=str),
+                    _now,
+                    _now + _ttl,
+                    _now,
+                ),
+            )
+            _count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if _count > self._max_entries:
+                self._conn.execute(
+                    """DELETE FROM responses WHERE cache_key IN (
+                        SELECT cache_key FROM responses ORDER BY last_access ASC LIMIT ?
+                    )""",
+                    (_count - self._max_entries,),
+                )
+            self._conn.commit()
+
+    def purge(
+        self, bot_name: str = None, agent_id: str = None, expired_only: bool = False
+    ) -> int:
+        """Manually removes cached answers.
+
+        Args:
+            bot_name (str, optional): Only purge entries for this bot. Defaults to None.
+            agent_id (str, optional): Only purge entries for this agent. Defaults to None.
+            expired_only (bool, optional): Only purge entries whose TTL has passed. Defaults to False.
+
+        Returns:
+            int: Number of entries removed
+        """
+        _clauses = []
+        _params = []
+        if bot_name is not None:
+            _clauses.append("bot_name = ?")
+            _params.append(bot_name)
+        if agent_id is not None:
+            _clauses.append("agent_id = ?")
+            _params.append(agent_id)
+        if expired_only:
+            _clauses.append("expires_at <= ?")
+            _params.append(self._clock())
+
+        _sql = "DELETE FROM responses"
+        if _clauses:
+            _sql += " WHERE " + " AND ".join(_clauses)
+
+        with self._lock:
+            _cursor = self._conn.execute(_sql, _params)
+            self._conn.commit()
+            return _cursor.rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self) -> None:
+        """Closes the underlying database connection."""
+        with self._lock:
+            self._conn.close()
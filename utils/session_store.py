@@ -0,0 +1,295 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+This module contains bounded per-session storage for the chat history of the Streamlit app.
+A SessionMemory owns list-like SpillingLog objects (chat messages, conversation records). The
+newest records of each log stay in memory as regular dicts; when a session goes over its memory
+budget, or has been idle for a while, its older records are encoded as compressed JSON (sets and
+datetimes included) and spilled to a per-process SQLite file. Spilled records are read back
+transparently when indexed or iterated, so the memory held by a session stays bounded however
+long it lives. Spilled rows are deleted when their session is garbage collected.
+"""
+
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+import zlib
+from typing import Any, Dict, Iterator, List
+
+DEFAULT_SPILL_DIR = os.path.join(".cache", "session_spill")
+DEFAULT_MAX_MEMORY_BYTES = 256 * 1024
+DEFAULT_MIN_HOT_ITEMS = 2
+DEFAULT_IDLE_SECONDS = 600
+IDLE_SWEEP_INTERVAL_SECONDS = 30
+_READ_PAGE_SIZE = 50
+
+
+def _json_default(value: Any):
+    if isinstance(value, (set, frozenset)):
+        return {"$set": sorted(value, key=str)}
+    if isinstance(value, datetime.datetime):
+        return {"$datetime": value.isoformat()}
+    return str(value)
+
+
+def _object_hook(value: Dict):
+    if len(value) == 1:
+        if "$set" in value:
+            return set(value["$set"])
+        if "$datetime" in value:
+            return datetime.datetime.fromisoformat(value["$datetime"])
+    return value
+
+
+def encode_record(record: Any) -> bytes:
+    """Returns the compact JSON encoding of a record, uncompressed."""
+    return json.dumps(
+        record, default=_json_default, separators=(",", ":"), ensure_ascii=False
+    ).encode("utf-8")
+
+
+def decode_record(payload: bytes) -> Any:
+    return json.loads(zlib.decompress(payload), object_hook=_object_hook)
+
+
+class SpillStore:
+    """SQLite file holding the spilled records of every session of this process."""
+
+    def __init__(self, path: str = None):
+        """Constructs an instance.
+
+        Args:
+            path (str, optional): SQLite file. Defaults to a file named after the process id in DEFAULT_SPILL_DIR,
+            since sessions do not outlive the process.
+        """
+        if path is None:
+            os.makedirs(DEFAULT_SPILL_DIR, exist_ok=True)
+            path = os.path.join(DEFAULT_SPILL_DIR, f"{os.getpid()}.sqlite3")
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "session_id TEXT, kind TEXT, seq INTEGER, payload BLOB, "
+            "PRIMARY KEY (session_id, kind, seq)) WITHOUT ROWID"
+        )
+        # rows left behind by a previous process with the same pid belong to dead sessions
+        self._conn.execute("DELETE FROM records")
+
+    def write(self, session_id: str, kind: str, rows: List) -> None:
+        """Stores (seq, record) pairs."""
+        _payloads = [
+            (session_id, kind, _seq, zlib.compress(encode_record(_record)))
+            for _seq, _record in rows
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?)", _payloads
+            )
+            self._conn.execute("COMMIT")
+
+    def read(self, session_id: str, kind: str, start: int, stop: int) -> List:
+        """Returns the records with start <= seq < stop, in order."""
+        with self._lock:
+            _rows = self._conn.execute(
+                "SELECT payload FROM records WHERE session_id = ? AND kind = ? "
+                "AND seq >= ? AND seq < ? ORDER BY seq",
+                (session_id, kind, start, stop),
+            ).fetchall()
+        return [decode_record(_payload) for (_payload,) in _rows]
+
+    def delete_session(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM records WHERE session_id = ?", (session_id,)
+            )
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            (_size,) = self._conn.execute(
+                "SELECT COALESCE(SUM(LENGTH(payload)), 0) FROM records"
+            ).fetchone()
+        return _size
+
+
+class SpillingLog:
+    """Append-only list whose oldest items can be moved to a SpillStore and are read back on access."""
+
+    def __init__(self, session_id: str, kind: str, store: SpillStore):
+        self._session_id = session_id
+        self._kind = kind
+        self._store = store
+        self._lock = threading.RLock()
+        self._spilled = 0
+        self._hot: List = []
+
+    def __len__(self) -> int:
+        return self._spilled + len(self._hot)
+
+    def append(self, item: Any) -> None:
+        with self._lock:
+            self._hot.append(item)
+
+    def window(self, start: int, stop: int) -> List:
+        """Returns the items with start <= index < stop, reading spilled ones back from disk."""
+        with self._lock:
+            start, stop = max(start, 0), min(stop, len(self))
+            if start >= stop:
+                return []
+            _items = []
+            if start < self._spilled:
+                _items = self._store.read(
+                    self._session_id, self._kind, start, min(stop, self._spilled)
+                )
+            _first_hot = max(start - self._spilled, 0)
+            return _items + self._hot[_first_hot : stop - self._spilled]
+
+    def tail(self, count: int) -> List:
+        """Returns the last count items, oldest first."""
+        return self.window(len(self) - count, len(self))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[_i] for _i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("SpillingLog index out of range")
+        return self.window(index, index + 1)[0]
+
+    def __iter__(self) -> Iterator:
+        for _start in range(0, len(self), _READ_PAGE_SIZE):
+            yield from self.window(_start, _start + _READ_PAGE_SIZE)
+
+    def hot_sizes(self) -> List[int]:
+        """Encoded size of every in-memory item, oldest first."""
+        with self._lock:
+            return [len(encode_record(_item)) for _item in self._hot]
+
+    @property
+    def hot_count(self) -> int:
+        return len(self._hot)
+
+    def spill_oldest(self, count: int) -> int:
+        """Moves up to count of the oldest in-memory items to disk and returns how many moved."""
+        with self._lock:
+            count = min(count, len(self._hot))
+            if count <= 0:
+                return 0
+            _rows = [(self._spilled + _i, self._hot[_i]) for _i in range(count)]
+            self._store.write(self._session_id, self._kind, _rows)
+            del self._hot[:count]
+            self._spilled += count
+            return count
+
+
+_sessions = weakref.WeakSet()
+_sessions_lock = threading.Lock()
+_last_idle_sweep = 0.0
+
+
+class SessionMemory:
+    """Memory-bounded history of one browser session."""
+
+    def __init__(
+        self,
+        session_id: str,
+        store: SpillStore,
+        max_memory_bytes: int = DEFAULT_MAX_MEMORY_BYTES,
+        min_hot_items: int = DEFAULT_MIN_HOT_ITEMS,
+        idle_seconds: float = DEFAULT_IDLE_SECONDS,
+        clock=time.monotonic,
+    ):
+        """Constructs an instance.
+
+        Args:
+            session_id (str): Unique id of the session
+            store (SpillStore): Where older records go
+            max_memory_bytes (int, optional): Budget for the encoded size of the in-memory records of all logs.
+            Defaults to DEFAULT_MAX_MEMORY_BYTES.
+            min_hot_items (int, optional): Newest items of each log that are never spilled, so that records
+            still being updated (e.g. the current conversation) stay live. Defaults to DEFAULT_MIN_HOT_ITEMS.
+            idle_seconds (float, optional): Inactivity after which everything but the newest items is spilled.
+            Defaults to DEFAULT_IDLE_SECONDS.
+            clock (optional): Returns the current time in seconds. Defaults to time.monotonic.
+        """
+        self.session_id = session_id
+        self._store = store
+        self._max_memory_bytes = max_memory_bytes
+        self._min_hot_items = min_hot_items
+        self._idle_seconds = idle_seconds
+        self._clock = clock
+        self._logs: Dict[str, SpillingLog] = {}
+        self.last_access = clock()
+        weakref.finalize(self, store.delete_session, session_id)
+        with _sessions_lock:
+            _sessions.add(self)
+
+    def log(self, kind: str) -> SpillingLog:
+        """Returns the log of the given kind, e.g. "messages" or "conversations"."""
+        if kind not in self._logs:
+            self._logs[kind] = SpillingLog(self.session_id, kind, self._store)
+        return self._logs[kind]
+
+    def touch(self) -> None:
+        """Marks the session as active, and spills the history of other sessions that went idle."""
+        self.last_access = self._clock()
+        sweep_idle_sessions(self._clock())
+
+    def hot_bytes(self) -> int:
+        return sum(sum(_log.hot_sizes()) for _log in self._logs.values())
+
+    def enforce_budget(self) -> int:
+        """Spills the oldest records until the in-memory records fit the budget.
+
+        Returns:
+            int: Number of records spilled
+        """
+        _sizes = {_kind: _log.hot_sizes() for _kind, _log in self._logs.items()}
+        _total = sum(sum(_s) for _s in _sizes.values())
+        _spilled = 0
+        while _total > self._max_memory_bytes:
+            # take from the log holding the most spillable bytes
+            _kind = max(
+                _sizes,
+                key=lambda _k: sum(
+                    _sizes[_k][: max(len(_sizes[_k]) - self._min_hot_items, 0)]
+                ),
+            )
+            _spillable = len(_sizes[_kind]) - self._min_hot_items
+            if _spillable <= 0:
+                break
+            self._logs[_kind].spill_oldest(1)
+            _total -= _sizes[_kind].pop(0)
+            _spilled += 1
+        return _spilled
+
+    def spill_idle(self, now: float) -> int:
+        """Spills all but the newest records if the session has been idle for idle_seconds."""
+        if now - self.last_access < self._idle_seconds:
+            return 0
+        return sum(
+            _log.spill_oldest(_log.hot_count - self._min_hot_items)
+            for _log in self._logs.values()
+        )
+
+
+def sweep_idle_sessions(now: float) -> int:
+    """Spills the history of every idle session, at most once per IDLE_SWEEP_INTERVAL_SECONDS."""
+    global _last_idle_sweep
+    with _sessions_lock:
+        if now - _last_idle_sweep < IDLE_SWEEP_INTERVAL_SECONDS:
+            return 0
+        _last_idle_sweep = now
+        _candidates = list(_sessions)
+    return sum(_session.spill_idle(now) for _session in _candidates)
@@ -0,0 +1,408 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+This module contains a renderer-agnostic reducer for the completion events of a Bedrock agent turn.
+reduce_event() folds one event (an answer chunk, a routing classifier trace or an orchestration
+trace) into an immutable TurnState: the current step and collaborator, the agents that took part
+and the tools they used, every tool call, token totals and timings. Each reduction also appends
+the renderable entries the event produced (RoutingDecision, ToolInvocation, Rationale, AnswerChunk,
+...) to TurnState.entries, so a view only has to draw state.entries[len(previous.entries):].
+Nothing here imports Streamlit or boto3; the Streamlit view lives in ui_utils, and headless runs
+can call reduce_turn() directly.
+"""
+
+import json
+import math
+import time
+from dataclasses import dataclass, replace
+from typing import Dict, Iterable, Optional, Tuple
+
+# Action group functions whose table_name parameter names the working-memory table
+WORKING_MEMORY_FUNCTIONS = ("set_value_for_key", "get_key_value")
+
+_TABLE_NAME_MARKERS = ("table name:", "table:", "dynamodb table:", "using table")
+
+
+@dataclass(frozen=True)
+class AgentActivity:
+    """An agent seen in the orchestration traces of a turn."""
+
+    name: str
+    first_seen: float
+    step: float
+    tools_used: Tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class ToolCall:
+    """A knowledge base lookup, action group function or code interpreter call."""
+
+    agent: Optional[str]
+    kind: str  # knowledge_base, action_group or code_interpreter
+    name: str
+    parameters: Tuple[Tuple[str, str], ...] = ()
+    time: float = None
+
+
+@dataclass(frozen=True)
+class AnswerChunk:
+    text: str
+    table_name: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class RoutingStarted:
+    time: float
+
+
+@dataclass(frozen=True)
+class RoutingDecision:
+    classification: str
+    outcome: str  # undecidable, keep_previous or switch
+    collaborator: str
+    duration_seconds: float
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+@dataclass(frozen=True)
+class KnowledgeBaseQuery:
+    knowledge_base_id: str
+    text: str
+
+
+@dataclass(frozen=True)
+class ToolInvocation:
+    function: str
+    execution_type: str
+    parameters: Tuple[Tuple[str, str], ...]
+    has_parameters: bool
+    # set when the function reads or writes the working-memory table
+    table_name: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class CodeInvocation:
+    code: str
+
+
+@dataclass(frozen=True)
+class Rationale:
+    agent: str
+    step: float
+    text: str
+    is_sub_agent: bool
+
+
+@dataclass(frozen=True)
+class KnowledgeBaseResults:
+    references: Tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class ToolResponse:
+    text: str
+
+
+@dataclass(frozen=True)
+class CodeResult:
+    output: Optional[str]
+    error: Optional[str]
+    files: Optional[Tuple[str, ...]]
+
+
+@dataclass(frozen=True)
+class FinalResponse:
+    text: str
+
+
+@dataclass(frozen=True)
+class TurnState:
+    """Everything known about a turn after some of its events."""
+
+    step: float = 0.0
+    collaborator: str = " "
+    routing_started_at: Optional[float] = None
+    agents: Tuple[AgentActivity, ...] = ()
+    tool_calls: Tuple[ToolCall, ...] = ()
+    input_tokens: int = 0
+    output_tokens: int = 0
+    llm_calls: int = 0
+    answer_chunks: Tuple[str, ...] = ()
+    table_name: Optional[str] = None
+    entries: Tuple[object, ...] = ()
+    started_at: Optional[float] = None
+    updated_at: Optional[float] = None
+
+    @property
+    def answer(self) -> str:
+        return "".join(self.answer_chunks)
+
+    @property
+    def tokens(self) -> Dict[str, int]:
+        """Token totals in the shape of the conversation records: input, output and llm_calls."""
+        return {
+            "input": self.input_tokens,
+            "output": self.output_tokens,
+            "llm_calls": self.llm_calls,
+        }
+
+    def agent(self, name: str) -> Optional[AgentActivity]:
+        return next((_agent for _agent in self.agents if _agent.name == name), None)
+
+
+def extract_table_name(text: str) -> Optional[str]:
+    """Returns the DynamoDB table an answer chunk mentions ("table name: x", "using table x", ...), if any."""
+    _lower = text.lower()
+    for _marker in _TABLE_NAME_MARKERS:
+        if _marker in _lower:
+            _words = _lower.split(_marker)[1].split()
+            if not _words:
+                return None
+            return _words[0].strip().strip(".,!?()[]{}'\"`") or None
+    return None
+
+
+def _add_usage(state: TurnState, usage: Dict) -> TurnState:
+    _in, _out = usage.get("inputTokens", 0), usage.get("outputTokens", 0)
+    # calls that report no input or no output tokens are not counted, as in the agent console
+    if not (_in and _out):
+        return state
+    return replace(
+        state,
+        input_tokens=state.input_tokens + _in,
+        output_tokens=state.output_tokens + _out,
+        llm_calls=state.llm_calls + 1,
+    )
+
+
+def _reduce_routing(state: TurnState, route: Dict, now: float) -> TurnState:
+    if "modelInvocationInput" in route:
+        return replace(
+            state,
+            routing_started_at=now,
+            entries=state.entries + (RoutingStarted(now),),
+        )
+    if "modelInvocationOutput" not in route or state.routing_started_at is None:
+        return state
+
+    _output = route["modelInvocationOutput"]
+    _usage = _output["metadata"]["usage"]
+    state = _add_usage(state, _usage)
+    _raw_resp = json.loads(_output["rawResponse"]["content"])
+    _classification = (
+        _raw_resp["content"][0]["text"].replace("<a>", "").replace("</a>", "")
+    )
+    _step, _collaborator = state.step, state.collaborator
+    if _classification == "undecidable":
+        _outcome = "undecidable"
+    elif _classification in (_collaborator, "keep_previous_agent"):
+        _outcome = "keep_previous"
+        _step = math.floor(_step + 1)
+    else:
+        _outcome = "switch"
+        _collaborator = _classification
+        _step = math.floor(_step + 1)
+    _decision = RoutingDecision(
+        _classification,
+        _outcome,
+        _collaborator,
+        now - state.routing_started_at,
+        _usage.get("inputTokens", 0),
+        _usage.get("outputTokens", 0),
+    )
+    return replace(
+        state,
+        step=_step,
+        collaborator=_collaborator,
+        entries=state.entries + (_decision,),
+    )
+
+
+def _use_tools(state: TurnState, agent_name: str, tools: Iterable[str]) -> TurnState:
+    _agent = state.agent(agent_name)
+    _new = tuple(
+        _tool for _tool in dict.fromkeys(tools) if _tool not in _agent.tools_used
+    )
+    if not _new:
+        return state
+    return _replace_agent(state, replace(_agent, tools_used=_agent.tools_used + _new))
+
+
+def _replace_agent(state: TurnState, agent: AgentActivity) -> TurnState:
+    return replace(
+        state,
+        agents=tuple(agent if _a.name == agent.name else _a for _a in state.agents),
+    )
+
+
+def _reduce_orchestration(
+    state: TurnState, trace: Dict, now: float, agent_name: Optional[str]
+) -> TurnState:
+    _orch = trace["trace"]["orchestrationTrace"]
+    _entries = []
+    _calls = []
+    _tools = []
+
+    if "invocationInput" in _orch:
+        _input = _orch["invocationInput"]
+        if "knowledgeBaseLookupInput" in _input:
+            _lookup = _input["knowledgeBaseLookupInput"]
+            _entries.append(
+                KnowledgeBaseQuery(_lookup["knowledgeBaseId"], _lookup["text"])
+            )
+            _calls.append(
+                ToolCall(
+                    agent_name, "knowledge_base", _lookup["knowledgeBaseId"], time=now
+                )
+            )
+            _tools.append("Knowledge Base")
+        if "actionGroupInvocationInput" in _input:
+            _group = _input["actionGroupInvocationInput"]
+            _function = _group["function"]
+            _params = tuple(
+                (_p["name"], _p["value"]) for _p in _group.get("parameters", [])
+            )
+            _table_name = None
+            if _function in WORKING_MEMORY_FUNCTIONS:
+                _table_name = dict(_params).get("table_name")
+                if _table_name:
+                    state = replace(state, table_name=_table_name)
+            _entries.append(
+                ToolInvocation(
+                    _function,
+                    _group.get("executionType", ""),
+                    _params,
+                    "parameters" in _group,
+                    _table_name,
+                )
+            )
+            _calls.append(ToolCall(agent_name, "action_group", _function, _params, now))
+            _tools.append(_function)
+        if "codeInterpreterInvocationInput" in _input:
+            _entries.append(
+                CodeInvocation(_input["codeInterpreterInvocationInput"]["code"])
+            )
+            _calls.append(
+                ToolCall(agent_name, "code_interpreter", "Code Interpreter", time=now)
+            )
+            _tools.append("Code Interpreter")
+
+    if "modelInvocationOutput" in _orch:
+        _usage = _orch["modelInvocationOutput"]["metadata"].get("usage")
+        if _usage:
+            state = _add_usage(state, _usage)
+
+    if "agentId" in trace:
+        if agent_name is None:
+            agent_name = trace["agentId"]
+        if state.agent(agent_name) is None:
+            state = replace(
+                state,
+                agents=state.agents + (AgentActivity(agent_name, now, state.step),),
+            )
+        _obs = _orch.get("observation", {})
+        if "knowledgeBaseLookupOutput" in _obs:
+            _tools.append("Knowledge Base")
+        if "codeInterpreterInvocationOutput" in _obs:
+            _tools.append("Code Interpreter")
+        state = _use_tools(state, agent_name, _tools)
+
+        if "rationale" in _orch:
+            _is_sub_agent = len(trace.get("callerChain", [])) > 1
+            _step = state.step + 0.1 if _is_sub_agent else math.floor(state.step + 1)
+            state = _replace_agent(state, replace(state.agent(agent_name), step=_step))
+            state = replace(state, step=_step)
+            _entries.append(
+                Rationale(agent_name, _step, _orch["rationale"]["text"], _is_sub_agent)
+            )
+
+    if "observation" in _orch:
+        _obs = _orch["observation"]
+        if "knowledgeBaseLookupOutput" in _obs:
+            _refs = _obs["knowledgeBaseLookupOutput"]["retrievedReferences"]
+            _entries.append(
+                KnowledgeBaseResults(tuple(_ref["content"]["text"] for _ref in _refs))
+            )
+        if "actionGroupInvocationOutput" in _obs:
+            _entries.append(ToolResponse(_obs["actionGroupInvocationOutput"]["text"]))
+        if "codeInterpreterInvocationOutput" in _obs:
+            _code = _obs["codeInterpreterInvocationOutput"]
+            _files = _code.get("files")
+            _entries.append(
+                CodeResult(
+                    _code.get("executionOutput"),
+                    _code.get("executionError"),
+                    tuple(_files) if _files is not None else None,
+                )
+            )
+        if "finalResponse" in _obs:
+            _entries.append(FinalResponse(_obs["finalResponse"]["text"]))
+
+    if _entries or _calls:
+        state = replace(
+            state,
+            entries=state.entries + tuple(_entries),
+            tool_calls=state.tool_calls + tuple(_calls),
+        )
+    return state
+
+
+def reduce_event(
+    state: TurnState, event: Dict, now: float = None, agent_name: str = None
+) -> TurnState:
+    """Folds one completion event of invoke_agent into the state of its turn.
+
+    Args:
+        state (TurnState): State after the previous events, TurnState() for the first one
+        event (Dict): Completion event, with a "chunk" or a "trace"
+        now (float, optional): Epoch time the event was received at. Defaults to time.time().
+        agent_name (str, optional): Display name of the agent in event["trace"]["agentId"], resolved by the
+        caller. Defaults to the agent id.
+
+    Returns:
+        TurnState: The new state; the input state is left unchanged
+    """
+    if now is None:
+        now = time.time()
+    if state.started_at is None:
+        state = replace(state, started_at=now)
+
+    if "chunk" in event:
+        _text = event["chunk"]["bytes"].decode("utf-8")
+        _table_name = extract_table_name(_text)
+        state = replace(
+            state,
+            answer_chunks=state.answer_chunks + (_text,),
+            table_name=_table_name or state.table_name,
+            entries=state.entries + (AnswerChunk(_text, _table_name),),
+        )
+
+    if "trace" in event:
+        _trace = event["trace"]
+        if "routingClassifierTrace" in _trace["trace"]:
+            state = _reduce_routing(
+                state, _trace["trace"]["routingClassifierTrace"], now
+            )
+        if "orchestrationTrace" in _trace["trace"]:
+            state = _reduce_orchestration(state, _trace, now, agent_name)
+
+    return replace(state, updated_at=now)
+
+
+def reduce_turn(
+    events: Iterable[Dict], agent_names: Dict[str, str] = None
+) -> TurnState:
+    """Reduces all the completion events of a turn, e.g. for headless batch runs.
+
+    Args:
+        events (Iterable[Dict]): Completion events, in order
+        agent_names (Dict[str, str], optional): Display names by agent id. Defaults to the ids.
+    """
+    _names = agent_names or {}
+    state = TurnState()
+    for _event in events:
+        _agent_id = _event.get("trace", {}).get("agentId")
+        state = reduce_event(state, _event, agent_name=_names.get(_agent_id))
+    return state
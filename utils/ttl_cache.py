@@ -0,0 +1,89 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+This module contains a small in-memory cache used by the helper classes to avoid
+repeating identical read-only calls to Amazon Bedrock. The TTLCache class bounds
+its size with least-recently-used eviction and expires entries after a fixed TTL.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a fixed number of seconds."""
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl_seconds: float = 300,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Constructs an instance.
+
+        Args:
+            max_entries (int, optional): Maximum number of entries to keep. Defaults to 512.
+            ttl_seconds (float, optional): Lifetime of each entry. Defaults to 300.
+            clock (Callable[[], float], optional): Returns the current time in seconds. Defaults to time.monotonic.
+        """
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns the cached value for key, or default if missing or expired."""
+        with self._lock:
+            _entry = self._entries.get(key, _MISSING)
+            if _entry is _MISSING or _entry[0] <= self._clock():
+                if _entry is not _MISSING:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return _entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Stores value under key, evicting the least recently used entry if full."""
+        with self._lock:
+            self._entries[key] = (self._clock() + self._ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Returns the cached value for key, calling loader() and caching its result on a miss."""
+        _value = self.get(key, _MISSING)
+        if _value is _MISSING:
+            _value = loader()
+            self.put(key, _value)
+        return _value
+
+    def invalidate(self, predicate: Callable[[Hashable], bool] = None) -> int:
+        """Removes entries whose key matches predicate, or all entries if no predicate is given.
+
+        Returns:
+            int: Number of entries removed
+        """
+        with self._lock:
+            if predicate is None:
+                _removed = len(self._entries)
+                self._entries.clear()
+                return _removed
+            _keys = [_key for _key in self._entries if predicate(_key)]
+            for _key in _keys:
+                del self._entries[_key]
+            return len(_keys)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
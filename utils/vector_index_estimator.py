@@ -0,0 +1,430 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+This module contains an offline recall / latency estimator for vector index profiles.
+estimate_profiles() builds an HNSW graph with the settings of every candidate profile over a
+sample of local embedding vectors, applies the profile quantization to the indexed vectors,
+and compares the top-k results of held-out queries with the exact neighbors found by NumPy
+brute force. Graphs are built with hnswlib when it is installed, and otherwise with a small
+NumPy implementation of HNSW that also counts distance computations, a latency proxy that
+does not depend on the machine. Run as a script on a .npy file of vectors to print a table:
+
+    python -m utils.vector_index_estimator vectors.npy --k 10 --sample-size 5000
+"""
+
+import argparse
+import heapq
+import math
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Union
+
+import numpy as np
+
+from utils.vector_index_profiles import INDEX_PROFILES, VectorIndexProfile
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+DEFAULT_SAMPLE_SIZE = 5000
+DEFAULT_NUM_QUERIES = 200
+DEFAULT_K = 10
+
+_HNSWLIB_SPACES = {"l2": "l2", "cosinesimil": "cosine", "innerproduct": "ip"}
+
+
+@dataclass
+class ProfileEstimate:
+    """Measured trade-offs of one index profile on a vector sample."""
+
+    profile_name: str
+    profile: VectorIndexProfile
+    backend: str
+    recall_at_k: float
+    mean_query_ms: float
+    p95_query_ms: float
+    mean_distance_computations: float
+    build_seconds: float
+    memory_bytes_per_vector: float
+
+    def memory_bytes(self, num_vectors: int) -> float:
+        """Estimated graph memory for an index of num_vectors vectors."""
+        return self.memory_bytes_per_vector * num_vectors
+
+
+def quantize(vectors: np.ndarray, quantization: str) -> np.ndarray:
+    """Returns the vectors as the index stores them, converted back to float32."""
+    if quantization is None:
+        return vectors
+    if quantization == "fp16":
+        return vectors.astype(np.float16).astype(np.float32)
+    if quantization == "byte":
+        _low = vectors.min(axis=0)
+        _scale = (vectors.max(axis=0) - _low) / 255.0
+        _scale[_scale == 0] = 1.0
+        _codes = np.round((vectors - _low) / _scale)
+        return (_codes * _scale + _low).astype(np.float32)
+    raise ValueError(f"Unknown quantization {quantization}")
+
+
+def _prepare(vectors: np.ndarray, space_type: str) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if space_type == "cosinesimil":
+        _norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        _norms[_norms == 0] = 1.0
+        vectors = vectors / _norms
+    return vectors
+
+
+def _distances(query: np.ndarray, vectors: np.ndarray, space_type: str) -> np.ndarray:
+    """Distance of one query to many vectors, lower is closer. Cosine expects normalized inputs."""
+    if space_type == "l2":
+        _diff = vectors - query
+        return np.einsum("ij,ij->i", _diff, _diff)
+    return -(vectors @ query)
+
+
+def exact_neighbors(
+    vectors: np.ndarray, queries: np.ndarray, k: int, space_type: str = "l2"
+) -> np.ndarray:
+    """Returns the ids of the k exact nearest neighbors of every query, by brute force."""
+    _vectors = _prepare(vectors, space_type)
+    _queries = _prepare(queries, space_type)
+    if space_type == "l2":
+        _dist = (
+            np.einsum("ij,ij->i", _queries, _queries)[:, None]
+            - 2 * _queries @ _vectors.T
+            + np.einsum("ij,ij->i", _vectors, _vectors)[None, :]
+        )
+    else:
+        _dist = -(_queries @ _vectors.T)
+    _k = min(k, len(_vectors))
+    _top = np.argpartition(_dist, _k - 1, axis=1)[:, :_k]
+    _order = np.take_along_axis(_dist, _top, axis=1).argsort(axis=1)
+    return np.take_along_axis(_top, _order, axis=1)
+
+
+class NumpyHNSW:
+    """Minimal HNSW graph (Malkov & Yashunin) over a fixed set of vectors, for offline estimates only."""
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        m: int,
+        ef_construction: int,
+        space_type: str = "l2",
+        seed: int = 0,
+    ):
+        self._vectors = vectors
+        self._space_type = space_type
+        self._m = m
+        self._m_max0 = 2 * m
+        self._level_mult = 1 / math.log(max(m, 2))
+        self._rng = np.random.default_rng(seed)
+        self._layers: List[Dict[int, List[int]]] = []
+        self._entry_point = None
+        self.distance_computations = 0
+        for _id in range(len(vectors)):
+            self._insert(_id, ef_construction)
+
+    def _distance_to(self, query: np.ndarray, ids: List[int]) -> np.ndarray:
+        self.distance_computations += len(ids)
+        return _distances(query, self._vectors[ids], self._space_type)
+
+    def _search_layer(
+        self, query: np.ndarray, entry_points: List[int], ef: int, layer: int
+    ) -> List:
+        """Returns up to ef (distance, id) pairs closest to the query, sorted by distance."""
+        _graph = self._layers[layer]
+        _visited = set(entry_points)
+        _dists = self._distance_to(query, entry_points)
+        _candidates = [(_d, _id) for _d, _id in zip(_dists, entry_points)]
+        heapq.heapify(_candidates)
+        _results = [(-_d, _id) for _d, _id in _candidates]
+        heapq.heapify(_results)
+        while len(_results) > ef:
+            heapq.heappop(_results)
+
+        while _candidates:
+            _dist, _current = heapq.heappop(_candidates)
+            if _dist > -_results[0][0]:
+                break
+            _neighbors = [_n for _n in _graph.get(_current, ()) if _n not in _visited]
+            if not _neighbors:
+                continue
+            _visited.update(_neighbors)
+            for _d, _n in zip(self._distance_to(query, _neighbors), _neighbors):
+                if len(_results) < ef or _d < -_results[0][0]:
+                    heapq.heappush(_candidates, (_d, _n))
+                    heapq.heappush(_results, (-_d, _n))
+                    if len(_results) > ef:
+                        heapq.heappop(_results)
+        return sorted((-_d, _id) for _d, _id in _results)
+
+    def _select_neighbors(self, candidates: List, m: int) -> List[int]:
+        """Keeps candidates that are closer to the new node than to any neighbor already kept."""
+        _selected = []
+        for _dist, _id in candidates:
+            if len(_selected) == m:
+                break
+            if _selected:
+                _to_selected = self._distance_to(self._vectors[_id], _selected)
+                if np.any(_to_selected < _dist):
+                    continue
+            _selected.append(_id)
+        return _selected
+
+    def _insert(self, node: int, ef_construction: int) -> None:
+        _level = int(-math.log(1.0 - self._rng.random()) * self._level_mult)
+        _top = len(self._layers) - 1
+        while len(self._layers) <= _level:
+            self._layers.append({})
+        for _layer in range(_level + 1):
+            self._layers[_layer][node] = []
+        if self._entry_point is None:
+            self._entry_point = node
+            return
+
+        _query = self._vectors[node]
+        _entry = [self._entry_point]
+        for _layer in range(_top, _level, -1):
+            _entry = [self._search_layer(_query, _entry, 1, _layer)[0][1]]
+
+        for _layer in range(min(_level, _top), -1, -1):
+            _candidates = self._search_layer(_query, _entry, ef_construction, _layer)
+            _candidates = [(_d, _id) for _d, _id in _candidates if _id != node]
+            _m_max = self._m_max0 if _layer == 0 else self._m
+            _graph = self._layers[_layer]
+            _graph[node] = self._select_neighbors(_candidates, self._m)
+            for _neighbor in _graph[node]:
+                _links = _graph[_neighbor]
+                _links.append(node)
+                if len(_links) > _m_max:
+                    _link_dists = self._distance_to(self._vectors[_neighbor], _links)
+                    _graph[_neighbor] = self._select_neighbors(
+                        sorted(zip(_link_dists, _links)), _m_max
+                    )
+            _entry = [_id for _, _id in _candidates]
+
+        if _level > _top:
+            self._entry_point = node
+
+    def search(self, query: np.ndarray, k: int, ef_search: int) -> List[int]:
+        """Returns the ids of the approximate k nearest neighbors of a query."""
+        _entry = [self._entry_point]
+        for _layer in range(len(self._layers) - 1, 0, -1):
+            _entry = [self._search_layer(query, _entry, 1, _layer)[0][1]]
+        _results = self._search_layer(query, _entry, max(ef_search, k), 0)
+        return [_id for _, _id in _results[:k]]
+
+
+def _run_numpy(indexed, queries, profile, k, seed):
+    _start = time.perf_counter()
+    _graph = NumpyHNSW(
+        indexed,
+        profile.effective_m,
+        profile.effective_ef_construction,
+        profile.space_type,
+        seed,
+    )
+    _build_seconds = time.perf_counter() - _start
+    _results, _latencies, _computations = [], [], []
+    for _query in queries:
+        _graph.distance_computations = 0
+        _start = time.perf_counter()
+        _results.append(_graph.search(_query, k, profile.ef_search))
+        _latencies.append(time.perf_counter() - _start)
+        _computations.append(_graph.distance_computations)
+    return _results, _latencies, float(np.mean(_computations)), _build_seconds
+
+
+def _run_hnswlib(indexed, queries, profile, k, seed):
+    _start = time.perf_counter()
+    _index = hnswlib.Index(
+        space=_HNSWLIB_SPACES[profile.space_type], dim=indexed.shape[1]
+    )
+    _index.init_index(
+        max_elements=len(indexed),
+        ef_construction=profile.effective_ef_construction,
+        M=profile.effective_m,
+        random_seed=seed,
+    )
+    _index.add_items(indexed, np.arange(len(indexed)), num_threads=1)
+    _build_seconds = time.perf_counter() - _start
+    _index.set_ef(max(profile.ef_search, k))
+    _results, _latencies = [], []
+    for _query in queries:
+        _start = time.perf_counter()
+        _labels, _ = _index.knn_query(_query[None, :], k=k, num_threads=1)
+        _latencies.append(time.perf_counter() - _start)
+        _results.append(list(_labels[0]))
+    return _results, _latencies, float("nan"), _build_seconds
+
+
+def estimate_profiles(
+    vectors: np.ndarray,
+    profiles: Dict[str, Union[str, Dict, VectorIndexProfile]] = None,
+    queries: np.ndarray = None,
+    sample_size: int = DEFAULT_SAMPLE_SIZE,
+    num_queries: int = DEFAULT_NUM_QUERIES,
+    k: int = DEFAULT_K,
+    backend: str = "auto",
+    seed: int = 0,
+) -> List[ProfileEstimate]:
+    """Measures recall@k, query latency and memory of candidate index profiles on local vectors.
+
+    Args:
+        vectors (np.ndarray): Embedding vectors, one per row
+        profiles (Dict[str, Union[str, Dict, VectorIndexProfile]], optional): Candidates keyed by display name.
+        Defaults to INDEX_PROFILES.
+        queries (np.ndarray, optional): Query vectors. Defaults to num_queries vectors held out of the sample.
+        sample_size (int, optional): Number of vectors to index. Defaults to DEFAULT_SAMPLE_SIZE.
+        num_queries (int, optional): Number of held-out queries when queries is None. Defaults to DEFAULT_NUM_QUERIES.
+        k (int, optional): Number of neighbors retrieved per query. Defaults to DEFAULT_K.
+        backend (str, optional): "hnswlib", "numpy", or "auto" to use hnswlib when installed. Defaults to "auto".
+        seed (int, optional): Seed of the sampling and of the graph construction. Defaults to 0.
+
+    Returns:
+        List[ProfileEstimate]: One estimate per profile, in the order of profiles
+    """
+    if backend == "auto":
+        backend = "hnswlib" if hnswlib is not None else "numpy"
+    if backend == "hnswlib" and hnswlib is None:
+        raise ImportError("The hnswlib backend requires `pip install hnswlib`")
+
+    _vectors = np.asarray(vectors, dtype=np.float32)
+    _rng = np.random.default_rng(seed)
+    _order = _rng.permutation(len(_vectors))
+    if queries is None:
+        _queries = _vectors[_order[:num_queries]]
+        _sample = _vectors[_order[num_queries : num_queries + sample_size]]
+    else:
+        _queries = np.asarray(queries, dtype=np.float32)
+        _sample = _vectors[_order[:sample_size]]
+
+    _profiles = {
+        _name: VectorIndexProfile.from_value(_profile)
+        for _name, _profile in (profiles or INDEX_PROFILES).items()
+    }
+    _truth_by_space = {}
+    _estimates = []
+    for _name, _profile in _profiles.items():
+        if _profile.space_type not in _truth_by_space:
+            _truth_by_space[_profile.space_type] = exact_neighbors(
+                _sample, _queries, k, _profile.space_type
+            )
+        _truth = _truth_by_space[_profile.space_type]
+        _indexed = quantize(
+            _prepare(_sample, _profile.space_type), _profile.quantization
+        )
+        _prepared_queries = _prepare(_queries, _profile.space_type)
+        _run = _run_hnswlib if backend == "hnswlib" else _run_numpy
+        _results, _latencies, _computations, _build_seconds = _run(
+            _indexed, _prepared_queries, _profile, k, seed
+        )
+        _hits = sum(
+            len(set(_found) & set(_expected.tolist()))
+            for _found, _expected in zip(_results, _truth)
+        )
+        _latencies_ms = np.array(_latencies) * 1000
+        _estimates.append(
+            ProfileEstimate(
+                profile_name=_name,
+                profile=_profile,
+                backend=backend,
+                recall_at_k=_hits / float(_truth.size),
+                mean_query_ms=float(_latencies_ms.mean()),
+                p95_query_ms=float(np.percentile(_latencies_ms, 95)),
+                mean_distance_computations=_computations,
+                build_seconds=_build_seconds,
+                memory_bytes_per_vector=_profile.memory_bytes_per_vector(
+                    _sample.shape[1]
+                ),
+            )
+        )
+    return _estimates
+
+
+def recommend_profile(
+    estimates: List[ProfileEstimate],
+    max_query_ms: float = None,
+    max_memory_bytes: float = None,
+    num_vectors: int = None,
+) -> ProfileEstimate:
+    """Picks the estimate with the best recall within a latency and memory budget.
+
+    Args:
+        estimates (List[ProfileEstimate]): Output of estimate_profiles()
+        max_query_ms (float, optional): Upper bound of the p95 query latency. Defaults to None.
+        max_memory_bytes (float, optional): Upper bound of the graph memory for num_vectors vectors. Defaults to None.
+        num_vectors (int, optional): Size of the production index, required with max_memory_bytes. Defaults to None.
+
+    Returns:
+        ProfileEstimate: Highest recall estimate within budget, ties going to the cheapest, or None
+    """
+    if max_memory_bytes is not None and num_vectors is None:
+        raise ValueError("max_memory_bytes requires num_vectors")
+    _eligible = [
+        _estimate
+        for _estimate in estimates
+        if (max_query_ms is None or _estimate.p95_query_ms <= max_query_ms)
+        and (
+            max_memory_bytes is None
+            or _estimate.memory_bytes(num_vectors) <= max_memory_bytes
+        )
+    ]
+    if not _eligible:
+        return None
+    return max(
+        _eligible,
+        key=lambda _e: (
+            round(_e.recall_at_k, 3),
+            -_e.p95_query_ms,
+            -_e.memory_bytes_per_vector,
+        ),
+    )
+
+
+def main():
+    _parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    _parser.add_argument(
+        "vectors", help="Path of a .npy file with one embedding per row"
+    )
+    _parser.add_argument("--k", type=int, default=DEFAULT_K)
+    _parser.add_argument("--sample-size", type=int, default=DEFAULT_SAMPLE_SIZE)
+    _parser.add_argument("--num-queries", type=int, default=DEFAULT_NUM_QUERIES)
+    _parser.add_argument(
+        "--backend", choices=("auto", "hnswlib", "numpy"), default="auto"
+    )
+    _parser.add_argument(
+        "--num-vectors", type=int, help="Production index size, for the memory column"
+    )
+    _args = _parser.parse_args()
+
+    _vectors = np.load(_args.vectors)
+    _estimates = estimate_profiles(
+        _vectors,
+        sample_size=_args.sample_size,
+        num_queries=_args.num_queries,
+        k=_args.k,
+        backend=_args.backend,
+    )
+    _num_vectors = _args.num_vectors or len(_vectors)
+    print(
+        f"{'profile':<12} {'recall@' + str(_args.k):>10} {'mean ms':>8} {'p95 ms':>8} "
+        f"{'dist/q':>8} {'build s':>8} {'memory MB':>10}"
+    )
+    for _e in _estimates:
+        print(
+            f"{_e.profile_name:<12} {_e.recall_at_k:>10.3f} {_e.mean_query_ms:>8.2f} "
+            f"{_e.p95_query_ms:>8.2f} {_e.mean_distance_computations:>8.0f} "
+            f"{_e.build_seconds:>8.1f} {_e.memory_bytes(_num_vectors) / 2**20:>10.1f}"
+        )
+    print(f"(backend: {_estimates[0].backend}, memory for {_num_vectors} vectors)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+This module contains named OpenSearch Serverless vector index profiles for Knowledge Bases.
+A VectorIndexProfile declares the HNSW graph parameters (m, ef_construction, ef_search), the
+engine, the distance space and an optional scalar quantization. INDEX_PROFILES holds the built-in
+fast / balanced / high_recall / compact trade-offs, and the default legacy profile that reproduces
+the index the Knowledge Base helper created before profiles existed (faiss, l2, ef_search 512 and
+the engine's own graph parameters). vector_index_body() turns a profile into
+the index definition, with the vector dimension taken from the embedding model. The recall and
+latency of candidate profiles can be compared offline with utils.vector_index_estimator.
+"""
+
+from dataclasses import dataclass, fields
+from typing import Dict, Union
+
+EMBEDDING_MODEL_DIMENSIONS = {
+    "cohere.embed-multilingual-v3": 1024,
+    "cohere.embed-english-v3": 1024,
+    "amazon.titan-embed-text-v1": 1536,
+    "amazon.titan-embed-text-v2:0": 1024,
+}
+
+ENGINES = ("faiss", "lucene")
+SPACE_TYPES = ("l2", "cosinesimil", "innerproduct")
+# fp16 is the faiss scalar quantizer, byte the lucene one (int7/int8 per dimension)
+QUANTIZATIONS = {"fp16": "faiss", "byte": "lucene"}
+_BYTES_PER_COMPONENT = {None: 4, "fp16": 2, "byte": 1}
+# graph parameters OpenSearch applies when the method definition leaves them out
+ENGINE_DEFAULT_M = 16
+ENGINE_DEFAULT_EF_CONSTRUCTION = 100
+
+DEFAULT_INDEX_PROFILE = "legacy"
+
+
+@dataclass(frozen=True)
+class VectorIndexProfile:
+    """HNSW settings of a Knowledge Base vector index; None for m or ef_construction leaves it to the engine."""
+
+    m: int = 16
+    ef_construction: int = 256
+    ef_search: int = 256
+    engine: str = "faiss"
+    space_type: str = "l2"
+    quantization: str = None
+
+    def __post_init__(self):
+        if self.engine not in ENGINES:
+            raise ValueError(f"engine must be one of {ENGINES}, not {self.engine}")
+        if self.space_type not in SPACE_TYPES:
+            raise ValueError(
+                f"space_type must be one of {SPACE_TYPES}, not {self.space_type}"
+            )
+        if self.quantization is not None:
+            if self.quantization not in QUANTIZATIONS:
+                raise ValueError(
+                    f"quantization must be one of {tuple(QUANTIZATIONS)}, not {self.quantization}"
+                )
+            if QUANTIZATIONS[self.quantization] != self.engine:
+                raise ValueError(
+                    f"{self.quantization} quantization requires the {QUANTIZATIONS[self.quantization]} engine"
+                )
+
+    @classmethod
+    def from_value(
+        cls, value: Union[str, Dict, "VectorIndexProfile"]
+    ) -> "VectorIndexProfile":
+        """Resolves a profile name, a YAML / dict declaration or a profile."""
+        if value is None:
+            value = DEFAULT_INDEX_PROFILE
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, str):
+            if value not in INDEX_PROFILES:
+                raise ValueError(
+                    f"Unknown index profile {value}, expected one of {sorted(INDEX_PROFILES)}"
+                )
+            return INDEX_PROFILES[value]
+        _known = {_field.name for _field in fields(cls)}
+        _unknown = set(value) - _known
+        if _unknown:
+            raise ValueError(f"Unknown index profile settings: {sorted(_unknown)}")
+        return cls(**value)
+
+    @property
+    def effective_m(self) -> int:
+        """m of the built graph, with the engine default filled in."""
+        return ENGINE_DEFAULT_M if self.m is None else self.m
+
+    @property
+    def effective_ef_construction(self) -> int:
+        """ef_construction of the built graph, with the engine default filled in."""
+        if self.ef_construction is None:
+            return ENGINE_DEFAULT_EF_CONSTRUCTION
+        return self.ef_construction
+
+    def method(self) -> Dict:
+        """Returns the knn_vector method definition of this profile."""
+        _parameters = {}
+        if self.m is not None:
+            _parameters["m"] = self.m
+        if self.ef_construction is not None:
+            _parameters["ef_construction"] = self.ef_construction
+        # with engine-default graph parameters ef_search stays in the index settings only
+        if self.engine == "faiss" and _parameters:
+            _parameters["ef_search"] = self.ef_search
+        if self.quantization is not None:
+            _encoder = {"name": "sq"}
+            if self.quantization == "fp16":
+                _encoder["parameters"] = {"type": "fp16"}
+            _parameters["encoder"] = _encoder
+        _method = {"name": "hnsw", "engine": self.engine, "space_type": self.space_type}
+        if _parameters:
+            _method["parameters"] = _parameters
+        return _method
+
+    def memory_bytes_per_vector(self, dimension: int) -> float:
+        """Estimates the native memory one vector takes in the HNSW graph, as 1.1 * (bytes * d + 8 * m)."""
+        return 1.1 * (
+            _BYTES_PER_COMPONENT[self.quantization] * dimension + 8 * self.effective_m
+        )
+
+
+INDEX_PROFILES = {
+    "legacy": VectorIndexProfile(m=None, ef_construction=None, ef_search=512),
+    "fast": VectorIndexProfile(m=16, ef_construction=128, ef_search=64),
+    "balanced": VectorIndexProfile(m=16, ef_construction=256, ef_search=256),
+    "high_recall": VectorIndexProfile(m=32, ef_construction=512, ef_search=512),
+    "compact": VectorIndexProfile(
+        m=8, ef_construction=256, ef_search=128, quantization="fp16"
+    ),
+}
+
+
+def embedding_dimension(embedding_model: str) -> int:
+    """Returns the vector dimension produced by a supported embedding model."""
+    if embedding_model not in EMBEDDING_MODEL_DIMENSIONS:
+        raise ValueError(
+            f"Unknown dimension for embedding model {embedding_model}, "
+            f"expected one of {sorted(EMBEDDING_MODEL_DIMENSIONS)}"
+        )
+    return EMBEDDING_MODEL_DIMENSIONS[embedding_model]
+
+
+def vector_index_body(
+    profile: Union[str, Dict, VectorIndexProfile], dimension: int
+) -> Dict:
+    """Builds the OpenSearch index definition of a Knowledge Base vector index.
+
+    Args:
+        profile (Union[str, Dict, VectorIndexProfile]): Profile name, declaration or profile
+        dimension (int): Dimension of the embedding vectors
+
+    Returns:
+        Dict: Index settings and mappings, with the field names the Knowledge Base is configured with
+    """
+    _profile = VectorIndexProfile.from_value(profile)
+    _settings = {
+        "index.knn": "true",
+        "number_of_shards": 1,
+        "number_of_replicas": 0,
+    }
+    if _profile.engine == "faiss":
+        _settings["knn.algo_param.ef_search"] = _profile.ef_search
+    return {
+        "settings": _settings,
+        "mappings": {
+            "properties": {
+                "vector": {
+                    "type": "knn_vector",
+                    "dimension": dimension,
+                    "method": _profile.method(),
+                },
+                "text": {"type": "text"},
+                "text-metadata": {"type": "text"},
+            }
+        },
+    }
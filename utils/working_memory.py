@@ -0,0 +1,163 @@
+# Copyright 2024 Amazon.com and its affiliates; all rights reserved.
+# This file is AWS Content and may not be duplicated or distributed without permission
+
+"""
+This module contains a cached, rate-limited reader for the DynamoDB working-memory tables
+that collaborator agents write to with set_value_for_key. The WorkingMemoryView class keeps a
+local copy of the table keyed by item key and version, and reads the table at most once per
+min_refresh_seconds however often the UI asks. Every read is a paginated, parallel-segment
+Scan of the whole table. When the items carry a version attribute, the scans between two full
+scans add a FilterExpression on it so that only items written since the last read come back;
+DynamoDB still reads, and charges read capacity for, every item, so the filter saves transfer
+and local work only. Tables without a version attribute are compared by content hash. A
+periodic unfiltered scan picks up deleted keys.
+"""
+
+import hashlib
+import json
+import time
+from typing import Callable, Dict, Iterable, List, Set
+
+DEFAULT_SEGMENTS = 4
+DEFAULT_MIN_REFRESH_SECONDS = 2.0
+DEFAULT_FULL_REFRESH_SECONDS = 30.0
+
+# attributes that, when present on every item, identify the latest write of each key
+VERSION_ATTRIBUTES = ("version", "updated_at", "last_updated", "timestamp")
+
+
+def _content_version(item: Dict) -> str:
+    _payload = json.dumps(item, sort_keys=True, default=str)
+    return hashlib.sha256(_payload.encode("utf-8")).hexdigest()
+
+
+class WorkingMemoryView:
+    """Local, rate-limited copy of a working-memory table."""
+
+    def __init__(
+        self,
+        table_name: str,
+        scan: Callable[..., Iterable[Dict]],
+        key_attributes: List[str],
+        version_attribute: str = None,
+        segments: int = DEFAULT_SEGMENTS,
+        min_refresh_seconds: float = DEFAULT_MIN_REFRESH_SECONDS,
+        full_refresh_seconds: float = DEFAULT_FULL_REFRESH_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Constructs an instance.
+
+        Args:
+            table_name (str): Name of the working-memory table
+            scan (Callable[..., Iterable[Dict]]): Scan function with the signature of AgentsForAmazonBedrock.scan_dynamodb
+            key_attributes (List[str]): Partition key name, followed by the sort key name if any
+            version_attribute (str, optional): Attribute that increases on every write. Defaults to auto-detection
+            among VERSION_ATTRIBUTES.
+            segments (int, optional): Parallel scan segments. Defaults to DEFAULT_SEGMENTS.
+            min_refresh_seconds (float, optional): Minimum time between two reads. Defaults to DEFAULT_MIN_REFRESH_SECONDS.
+            full_refresh_seconds (float, optional): Time between full scans that detect deleted keys.
+            Defaults to DEFAULT_FULL_REFRESH_SECONDS.
+            clock (Callable[[], float], optional): Returns the current time in seconds. Defaults to time.monotonic.
+        """
+        self.table_name = table_name
+        self._scan = scan
+        self._key_attributes = key_attributes
+        self._version_attribute = version_attribute
+        self._segments = segments
+        self._min_refresh_seconds = min_refresh_seconds
+        self._full_refresh_seconds = full_refresh_seconds
+        self._clock = clock
+
+        self._entries: Dict[str, Dict] = {}  # key -> {"version": ..., "item": ...}
+        self._max_version = None
+        self._last_refresh = None
+        self._last_full_refresh = None
+        self.changed_keys: Set[str] = set()
+        self.reads = 0
+        self.consumed_capacity = 0.0
+
+    @property
+    def items(self) -> Dict[str, Dict]:
+        """The current items, keyed by their key attribute values."""
+        return {_key: _entry["item"] for _key, _entry in self._entries.items()}
+
+    def _item_key(self, item: Dict) -> str:
+        return " / ".join(str(item.get(_attr)) for _attr in self._key_attributes)
+
+    def _item_version(self, item: Dict):
+        if self._version_attribute is not None:
+            return item.get(self._version_attribute)
+        return _content_version(item)
+
+    def _detect_version_attribute(self, items: List[Dict]) -> None:
+        if self._version_attribute is not None or not items:
+            return
+        for _attr in VERSION_ATTRIBUTES:
+            if all(_attr in _item for _item in items):
+                self._version_attribute = _attr
+                return
+
+    def refresh(self, force: bool = False) -> Set[str]:
+        """Reads the table if the refresh interval has passed.
+
+        Every read scans the whole table, filtered or not, so min_refresh_seconds is what
+        bounds the read capacity a polling view consumes.
+
+        Args:
+            force (bool, optional): Read even if the last read was less than min_refresh_seconds ago. Defaults to False.
+
+        Returns:
+            Set[str]: Keys added, changed or removed by this read, or None if the read was skipped
+        """
+        _now = self._clock()
+        if (
+            not force
+            and self._last_refresh is not None
+            and _now - self._last_refresh < self._min_refresh_seconds
+        ):
+            return None
+
+        _full = (
+            self._last_full_refresh is None
+            or self._version_attribute is None
+            or self._max_version is None
+            or _now - self._last_full_refresh >= self._full_refresh_seconds
+        )
+        _capacity = {}
+        _scan_kwargs = {"segments": self._segments, "capacity": _capacity}
+        if not _full:
+            _scan_kwargs.update(
+                filter_expression="#v > :since",
+                expression_names={"#v": self._version_attribute},
+                expression_values={":since": self._max_version},
+            )
+        _items = list(self._scan(self.table_name, **_scan_kwargs))
+        self.reads += 1
+        self.consumed_capacity += _capacity.get("consumed_capacity", 0.0)
+
+        if _full:
+            self._detect_version_attribute(_items)
+
+        _changed = set()
+        _seen = set()
+        for _item in _items:
+            _key = self._item_key(_item)
+            _version = self._item_version(_item)
+            _seen.add(_key)
+            _entry = self._entries.get(_key)
+            if _entry is None or _entry["version"] != _version:
+                _changed.add(_key)
+                self._entries[_key] = {"version": _version, "item": _item}
+            if self._version_attribute is not None and _version is not None:
+                if self._max_version is None or _version > self._max_version:
+                    self._max_version = _version
+
+        if _full:
+            for _key in set(self._entries) - _seen:
+                _changed.add(_key)
+                del self._entries[_key]
+            self._last_full_refresh = _now
+
+        self._last_refresh = _now
+        self.changed_keys = _changed
+        return _changed